@@ -1,9 +1,15 @@
 import lib.FilterBasedModule
 import lib.BatchAnalysis
 
+import ConfigParser
+import json
+import Logging
 import Modules.DynamicLoader
 import os
+import platform
 import scripting
+import time
+import traceback
 
 class BatchMainWindow:
 	"""
@@ -26,28 +32,28 @@ class BXDBatchApplication:
 	Initialize the batch processor app
 	"""
 	def __init__(self):
+		self.extToSource = lib.BatchAnalysis.getDataSourceClasses()
+		self.initializeDataUnit()
+		self.filterList = []
+		self.filterParams = {}
+		
+		self.mainwin = BatchMainWindow()
+		scripting.app = self
+		scripting.mainWindow = self.mainwin
+
+	def initializeDataUnit(self):
+		"""
+		Create the dataunit the files are processed with
+		"""
 		pluginLoader = Modules.DynamicLoader.getPluginLoader()
 		taskMod = pluginLoader.getPluginModule("Task", "Process")
 		unitType = taskMod.getDataUnit()
 		moduleType = pluginLoader.getPluginClass("Task","Process")
 
 		self.dataUnit = unitType()
-		self.readers = Modules.DynamicLoader.getReaders()
-
-		self.extToSource = {}
-		for modeclass, ign, module in self.readers.values():
-			exts = module.getExtensions()
-			for ext in exts:
-				self.extToSource[ext] = modeclass
-
 		module = moduleType()
-		
 		self.dataUnit.setModule(module)
 		
-		self.mainwin = BatchMainWindow()
-		scripting.app = self
-		scripting.mainWindow = self.mainwin
-		
 	def setFilters(self, filterList, filterParams):
 		"""
 		set the list of filters in the procedure stack, and 
@@ -59,84 +65,188 @@ class BXDBatchApplication:
 				
 	def loadFiles(self, filelist, selectedChannels = {}):
 		"""
-		load a list of files
+		load a list of files. The channels used from a file can be selected
+		by their names or indexes in selectedChannels, by default all the
+		channels are used.
 		"""
 		dataunits = []
 		for filename in filelist:
-			chls = []
-			try:
-				intchls = map(int,chls)
-			except:
-				intchls = []
-
-			if filename in selectedChannels:
-				chls = selectedChannels[filename]
 			name, ext = os.path.splitext(filename)
 			if ext:
 				ext=ext[1:].lower()
 			if ext not in self.extToSource: 
+				Logging.info("No reader for %s" % filename, kw = "io")
 				continue
 			datasource = self.extToSource[ext]()
 			newDataunits = datasource.loadFromFile(filename)
-			selectedUnits = []
-			if intchls:
-				for index in intchls and len(newDataunits)<=index:
-					print "Selecting ch",index,newDataunits[index].getName()
-					selectedUnits.append(newDataunits[index])
-			if chls:
-				for unit in newDataunits:
-					if unit.getName() in chls:
-						print "Selecting ch by name",unit.getName(),chls
-						selectedUnits.append(unit)
-					
-			if not selectedUnits: selectedUnits = newDataunits
-			dataunits += selectedUnits
+			dataunits += self.selectChannels(filename, newDataunits, selectedChannels.get(filename, []))
 		return dataunits
+
+	def selectChannels(self, filename, dataunits, channels):
+		"""
+		return the dataunits of the given channels, which are channel names
+		or indexes, or all the dataunits if no channels are given
+		"""
+		if not channels:
+			return dataunits
+		names = [x.getName() for x in dataunits]
+		selectedUnits = []
+		for channel in channels:
+			channel = str(channel).strip()
+			if channel in names:
+				index = names.index(channel)
+			elif channel.isdigit() and int(channel) < len(dataunits):
+				index = int(channel)
+			else:
+				raise ValueError("%s has no channel %s. The channels are %s" % (filename, channel, ", ".join(names)))
+			if dataunits[index] not in selectedUnits:
+				print "Selecting ch",index,names[index]
+				selectedUnits.append(dataunits[index])
+		return selectedUnits
 		
-	def executeBatchAnalysis(self, analysisFile, sourceDataUnits, outputFile, timepoints):
+	def executeBatchAnalysis(self, analysisFile, sourceDataUnits, outputFile, timepoints, processes = 0):
 		"""
-		Execute a BioImageXD Batch Analysis (BBA) file
+		Execute a BioImageXD Batch Analysis (BBA) file. The datasets are
+		processed in the given number of processes, or in the number of
+		processes read from the configuration. Returns the analysis.
 		"""
 		self.analysis = lib.BatchAnalysis.BatchAnalysis()
 		self.analysis.setInputDataUnits(sourceDataUnits)
-		self.analysis.readFromFile(analysisFile)
-		dirname = os.path.dirname(filename)
+		self.analysis.readAnalysisFrom(analysisFile)
+		dirname = os.path.dirname(os.path.abspath(outputFile))
 		namePart, ext = os.path.splitext(outputFile)
 		if ext.lower()==".bxd":
 			outputFile = namePart+".csv"
-		self.analysis.execute(outputFile, dirname, timepoints)
-		
-	
-	def run(self, files, scriptfile, name = "", outputFile = "output.bxd", timepoints = [], batchAnalysis = "",selectedChannels = {}):
+		self.analysis.execute(outputFile, dirname, timepoints, processes)
+		return self.analysis
+
+	def createFilterList(self, filterNames, filterParams, presetFile = ""):
 		"""
-		Run the procedure list
+		Create the procedure list of the given filters, or of the filters of
+		a procedure list saved as a preset, and set the parameters of the
+		filters
 		"""
-		dataunits = self.loadFiles(files, selectedChannels)
-		if not timepoints:
-			timepoints = range(0, max([x.getNumberOfTimepoints() for x in dataunits]))
-		if batchAnalysis:
-			return self.executeBatchAnalysis(batchAnalysis, dataunits, outputFile, timepoints)
-		for dataunit in dataunits:
-			self.dataUnit.addSourceDataUnit(dataunit)
+		parser = None
+		if presetFile:
+			parser = ConfigParser.RawConfigParser()
+			parser.optionxform = str
+			if not parser.read([presetFile]):
+				raise IOError("Cannot read the procedure list %s" % presetFile)
+			filterNames = eval(parser.get("FilterList", "FilterList"))
 			
 		filterList = lib.FilterBasedModule.FilterList()
 		filterList.setDataUnit(self.dataUnit)
-		filterList.populate(self.filterList)
-		for fname in self.filterList:
-			if fname not in self.filterParams:
+		filterList.populate(filterNames)
+		if parser:
+			filterList.readValuesFrom(parser)
+		for fname in filterNames:
+			if fname not in filterParams:
 				continue
 			
-			for key,val in self.filterParams[fname].items():
+			for key,val in filterParams[fname].items():
 				filterIndex = filterList.getIndexForName(fname)
 				currentFilter = filterList.getFilter(filterIndex)
 				currentFilter.setParameter(key, val)
+		return filterList
 
+	def processDataUnits(self, filterList, outputFile, name, timepoints, processes = 0):
+		"""
+		Run the source dataunits through the procedure list and write the
+		result to the given file
+		"""
 		self.dataUnit.getSettings().set("FilterList", filterList)
-		if not name:
-			name, ext = os.path.splitext(outputFile)
-			name = os.path.basename(name)
 		self.dataUnit.getSettings().set("Name",name)
 		print "Output file name",outputFile
-		filename = self.dataUnit.doProcessing(outputFile, timepoints = timepoints)
+		filename = self.dataUnit.doProcessing(outputFile, timepoints = timepoints, processes = processes)
 		print "Created",filename
+		return filename
 	
+	def run(self, files, scriptfile, name = "", outputFile = "output.bxd", timepoints = [], batchAnalysis = "",selectedChannels = {}, processes = 0):
+		"""
+		Run the procedure list
+		"""
+		dataunits = self.loadFiles(files, selectedChannels)
+		if not timepoints:
+			timepoints = range(0, max([x.getNumberOfTimepoints() for x in dataunits]))
+		if batchAnalysis:
+			return self.executeBatchAnalysis(batchAnalysis, dataunits, outputFile, timepoints, processes)
+		for dataunit in dataunits:
+			self.dataUnit.addSourceDataUnit(dataunit)
+			
+		filterList = self.createFilterList(self.filterList, self.filterParams)
+		if not name:
+			name, ext = os.path.splitext(outputFile)
+			name = os.path.basename(name)
+		self.processDataUnits(filterList, outputFile, name, timepoints, processes)
+
+	def runManifest(self, jobs, summaryFile = "", processes = 0, shard = None):
+		"""
+		Run the jobs of a manifest one after another and write a summary of
+		the run in JSON to summaryFile. Returns the exit status of the run,
+		0 if every job succeeded and 1 otherwise.
+		"""
+		startTime = time.time()
+		summaries = []
+		for i, job in enumerate(jobs):
+			Logging.info("Running job %d / %d: %s" % (i + 1, len(jobs), ", ".join(job["input"])), kw = "processing")
+			summary = self.runJob(job, processes)
+			Logging.info("Job %s %s in %.1f seconds" % (", ".join(job["input"]), summary["status"], summary["seconds"]), kw = "processing")
+			summaries.append(summary)
+		failed = len([x for x in summaries if x["status"] != "ok"])
+		if summaryFile:
+			summary = {"host": platform.node(), "shard": shard, "jobs": summaries, "failed": failed, \
+						"status": failed and "failed" or "ok", "seconds": time.time() - startTime}
+			fp = open(summaryFile, "w")
+			json.dump(summary, fp, indent = 1, sort_keys = True)
+			fp.close()
+		if failed:
+			return 1
+		return 0
+
+	def runJob(self, job, processes = 0):
+		"""
+		Run a single job of a manifest and return a summary of it: the
+		status, the output, the wall time of the job and the time spent in
+		each filter
+		"""
+		startTime = time.time()
+		summary = {"input": job["input"], "status": "ok", "filters": {}}
+		try:
+			self.initializeDataUnit()
+			selectedChannels = {}
+			if job["channels"]:
+				for filename in job["input"]:
+					selectedChannels[filename] = job["channels"]
+			dataunits = self.loadFiles(job["input"], selectedChannels)
+			if not dataunits:
+				raise IOError("None of %s could be read" % ", ".join(job["input"]))
+			summary["readSeconds"] = time.time() - startTime
+			timepoints = job["timepoints"] or range(0, max([x.getNumberOfTimepoints() for x in dataunits]))
+			if not os.path.isdir(job["output"]):
+				os.makedirs(job["output"])
+			name = job["name"] or os.path.splitext(os.path.basename(job["input"][0]))[0]
+
+			if job["bba"]:
+				outputFile = os.path.join(job["output"], name + ".csv")
+				analysis = self.executeBatchAnalysis(job["bba"], dataunits, outputFile, timepoints, processes)
+				summary["batchJobs"] = analysis.getJobSummaries()
+				for batchJob in summary["batchJobs"]:
+					for filterName, seconds in batchJob["filters"].items():
+						summary["filters"][filterName] = summary["filters"].get(filterName, 0.0) + seconds
+					if batchJob["status"] == "failed":
+						summary["status"] = "failed"
+			else:
+				outputFile = os.path.join(job["output"], name + ".bxd")
+				for dataunit in dataunits:
+					self.dataUnit.addSourceDataUnit(dataunit)
+				filterList = self.createFilterList(job["filters"] or [], job["parameters"], job["procedure"])
+				outputFile = self.processDataUnits(filterList, outputFile, name, timepoints, processes)
+				summary["filters"] = self.dataUnit.getModule().getFilterTimes()
+			summary["output"] = outputFile
+		except Exception, ex:
+			summary["status"] = "failed"
+			summary["error"] = str(ex)
+			summary["traceback"] = traceback.format_exc()
+			Logging.info("Job %s failed: %s" % (", ".join(job["input"]), str(ex)), kw = "processing")
+		summary["seconds"] = time.time() - startTime
+		return summary
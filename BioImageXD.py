@@ -64,6 +64,7 @@ import Configuration
 import scripting
 import Logging
 import glob
+import lib.BatchManifest
 
 
 try:
@@ -152,6 +153,14 @@ def usage():
 	print "-T 0,1,3-5  | --timepoints=<timepoints>\tSelect the timepoints to process"
 	print "-c 0,1	   | --channels=0,1\tSelect the channels to use from the input file"
 	print "-B 		   | --bba=<file>\tExecute the selected batch analysis file"
+	print "-j <n>      | --processes=<n>\tProcess the data in n processes"
+	print ""
+	print "Running a manifest of batch jobs without the user interface:"
+	print "-M <file>   | --manifest=<file>\tRun the jobs of a JSON or CSV manifest"
+	print "--shard=i/n\tRun only the shard i (0 <= i < n) of n shards of the jobs"
+	print "--summary=<file>\tWrite a JSON summary of the run to the given file"
+	print "The exit status is 0 if all the jobs succeeded, 1 if any job failed"
+	print "and 2 if the command line or the manifest is invalid."
 	sys.exit(2)
 
 if __name__ == '__main__':
@@ -162,8 +171,8 @@ if __name__ == '__main__':
 		#build()
 	else:
 		try:
-			parameterList = ["name=","channels=","help", "batch","execute=", "input=", "directory=", "tofile", "profile", "interpret", "logfile","load-filter","set-variable","output=","timepoints=","bba="]
-			opts, args = getopt.getopt(sys.argv[1:], 'n:c:hbx:i:d:tpPlf:s:o:T:B:', parameterList)
+			parameterList = ["name=","channels=","help", "batch","execute=", "input=", "directory=", "tofile", "profile", "interpret", "logfile","load-filter","set-variable","output=","timepoints=","bba=","processes=","manifest=","shard=","summary="]
+			opts, args = getopt.getopt(sys.argv[1:], 'n:c:hbx:i:d:tpPlf:s:o:T:B:j:M:', parameterList)
 		except getopt.GetoptError:
 			usage()
 
@@ -180,6 +189,8 @@ if __name__ == '__main__':
 		timepoints = []
 		outputName = ""
 		batchAnalysis = ""
+		processes = 0
+		manifest, shard, summaryFile = "", "", ""
 
 		for opt, arg in opts:
 			if opt in ["-h", "--help"]:
@@ -191,7 +202,7 @@ if __name__ == '__main__':
 			elif opt in ["-x", "--execute"]:
 				scriptFile = arg
 			elif opt in ["-d", "--directory"]:
-				dataFiles = glob.glob(3(arg, "*"))
+				dataFiles = glob.glob(os.path.join(arg, "*"))
 			elif opt in ["-B","--bba"]:
 				batchAnalysis = arg
 			elif opt in ["-i", "--input"]:
@@ -210,14 +221,23 @@ if __name__ == '__main__':
 			elif opt in ["-o","--output"]:
 				outputFile = arg
 			elif opt in ["-T","--timepoints"]:
-				tplist = arg.split(",")
-				timepoints = []
-				for iter in tplist:
-					if "-" not in iter:
-						timepoints.append(int(iter))
-					else:
-						interval = map(int,iter.split("-"))
-						timepoints.extend(range(interval[0],interval[1]+1))
+				try:
+					timepoints = lib.BatchManifest.parseTimepoints(arg)
+				except ValueError:
+					print "Invalid timepoints: %s" % arg
+					usage()
+			elif opt in ["-j","--processes"]:
+				try:
+					processes = int(arg)
+				except ValueError:
+					print "Invalid number of processes: %s" % arg
+					usage()
+			elif opt in ["-M","--manifest"]:
+				manifest = arg
+			elif opt == "--shard":
+				shard = arg
+			elif opt == "--summary":
+				summaryFile = arg
 			elif opt in ["-f","--load-filter"]:
 				currentFilter = arg
 				filterList.append(arg)
@@ -231,6 +251,18 @@ if __name__ == '__main__':
 						filterParams[currentFilter][key] = val
 				
 		
+		if manifest:
+			# A manifest is run without the user interface, and the jobs
+			# are read before anything is loaded so that errors show early
+			try:
+				jobs = lib.BatchManifest.readManifest(manifest)
+				if shard:
+					jobs = lib.BatchManifest.getShard(jobs, *lib.BatchManifest.parseShard(shard))
+			except (IOError, ValueError), ex:
+				print "Cannot run the manifest %s: %s" % (manifest, str(ex))
+				sys.exit(2)
+			doBatch = True
+
 		if doBatch:
 			import BatchApplication
 			app = BatchApplication.BXDBatchApplication()
@@ -276,6 +308,9 @@ if __name__ == '__main__':
 			sys.stderr = logFiles
 			Logging.outfile = logFiles
 
+		if manifest:
+			sys.exit(app.runManifest(jobs, summaryFile, processes, shard or None))
+
 		if doInterpret:
 			import pstats
 			p = pstats.Stats('prof.log')
@@ -303,5 +338,6 @@ if __name__ == '__main__':
 		else:
 			params = {}
 			if outputName:params["name"] = outputName
+			if processes:params["processes"] = processes
 			app.run(dataFiles, scriptFile, outputFile = outputFile, timepoints = timepoints,
 				selectedChannels = selectedChannels, batchAnalysis = batchAnalysis, **params)
@@ -147,6 +147,25 @@ class Configuration:
 		if configItem:
 			scripting.COLOR_EXPERIENCED = eval(configItem)
 		
+		self.setConfigItem("DataCacheSize", "Performance", 256, 0)
+		self.readConfigItem("DataCacheSize", "Performance")
+		self.setConfigItem("WriteQueueSize", "Performance", 0, 0)
+		self.readConfigItem("WriteQueueSize", "Performance")
+		self.setConfigItem("VTICompressor", "Performance", "zlib", 0)
+		self.readConfigItem("VTICompressor", "Performance")
+		self.setConfigItem("SyncWrittenFiles", "Performance", "False", 0)
+		self.readConfigItem("SyncWrittenFiles", "Performance")
+		self.setConfigItem("PreviewPyramid", "Performance", "True", 0)
+		self.readConfigItem("PreviewPyramid", "Performance")
+		self.setConfigItem("PreviewPyramidSize", "Performance", 512, 0)
+		self.readConfigItem("PreviewPyramidSize", "Performance")
+		self.setConfigItem("PrefetchTimepoints", "Performance", 2, 0)
+		self.readConfigItem("PrefetchTimepoints", "Performance")
+		self.setConfigItem("ThumbnailCacheSize", "Performance", 64, 0)
+		self.readConfigItem("ThumbnailCacheSize", "Performance")
+		self.setConfigItem("MaxOpenReaders", "Performance", 32, 0)
+		self.readConfigItem("MaxOpenReaders", "Performance")
+
 		self.setConfigItem("RemoveOldVTK", "VTK", 1, 0)
 		self.setConfigItem("VTKPath", "VTK", vtkpath, 0)
 		self.setConfigItem("ImageFormat", "Output", "png", 0)
@@ -32,7 +32,7 @@ import lib.ImageOperations
 import Logging
 import wx
 import lib.messenger
-import math
+import lib.HistogramEngine
 
 myEVT_SET_THRESHOLD = wx.NewEventType()
 EVT_SET_THRESHOLD = wx.PyEventBinder(myEVT_SET_THRESHOLD, 1)
@@ -468,13 +468,7 @@ class Histogram(wx.Panel):
 		dc.DrawBitmap(overlay, self.xoffset + int((lower1 - self.scalarMin) / self.scale), 0, 1)
 
 		if self.values:
-			tot = 0
-			totth = 0
-			for i, val in enumerate(self.values):
-				tot += val
-				if math.ceil(i + self.scalarMin) >= lower1 and math.floor(i + self.scalarMin) <= upper1:
-					totth += val
-			self.percent = totth / float(tot)
+			self.percent = lib.HistogramEngine.thresholdPercentage(self.values, lower1, upper1, self.scalarMin)
 
 		if not self.percent:
 			self.percent = 0.00
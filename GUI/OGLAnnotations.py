@@ -62,6 +62,13 @@ class OGLAnnotation(ogl.Shape):
 		"""
 		return []
 
+	def getMaskGeometry(self):
+		"""
+		return the geometry of this roi for rasterizing it to a mask, or None
+		if the mask is made of the covered points
+		"""
+		return None
+
 	def unoffset(self, attr, value):
 		"""
 		unoffset a given attribute
@@ -120,14 +127,9 @@ class OGLAnnotation(ogl.Shape):
 		"""
 		if not self.isROI():
 			return None
-		insideMap = {}
-		insideMap.update(self.getCoveredPoints())
-		insMap = {}
-		for x, y in insideMap.keys():
-			insMap[(x, y)] = 1
 		parent = self.GetCanvas()
 		mx, my, mz = parent.dataUnit.getDimensions()
-		return lib.ImageOperations.getMaskFromPoints(insMap, mx, my, mz)
+		return lib.ImageOperations.getMaskFromROIs([self], mx, my, mz)[1]
 
 	def setName(self, name):
 		"""
@@ -703,6 +705,9 @@ class MyRectangle(ShapeAnnotation, ogl.RectangleShape):
 		toy = int(math.floor(cy + h))
 		return [fromx, fromy, tox, toy]
 
+	def getMaskGeometry(self):
+		return ("RECTANGLE",) + tuple(self.getROICoordinates())
+
 	def getCoveredPoints(self):
 		pts = {}
 		fromx, fromy, tox, toy = self.getROICoordinates()
@@ -779,6 +784,10 @@ class MyCircle(ShapeAnnotation, ogl.CircleShape):
 		w, h, cx, cy = self.getFoo()[:-2]
 		return [int(cx - w // 2), int(cy - h // 2), int(cx + w // 2), int(cy + h // 2)]
 
+	def getMaskGeometry(self):
+		w, h, cx, cy = self.getFoo()[:4]
+		return ("ELLIPSE", w, h, cx, cy)
+
 	def getCoveredPoints(self):
 		w, h, cx, cy, c, a = self.getFoo()
 
@@ -1004,6 +1013,11 @@ class MyPolygon(ShapeAnnotation, ogl.PolygonShape):
 	def getROICoordinates(self):
 		return self.getFoo()[:-2]
 
+	def getMaskGeometry(self):
+		x0, y0, x1, y1, cx, cy = self.getFoo()
+		poly = tuple([(x // self.scaleFactor + cx, y // self.scaleFactor + cy) for x, y in self._points])
+		return ("POLYGON", poly, x0, y0, x1, y1)
+
 	def getCoveredPoints(self):
 		x0, y0, x1, y1, cx, cy = self.getFoo()
 
@@ -7,6 +7,9 @@
 
  A panel that can display previews of all the optical slices of
  volume data independent of a VTK render window,using the tools provided by wxPython.
+ Only the tiles in the visible part of the gallery are loaded. They are
+ loaded one at a time between user events and kept in a least recently
+ used cache of scaled bitmaps.
  
  Copyright (C) 2005  BioImageXD Project
  See CREDITS.txt for details
@@ -32,6 +35,7 @@ __date__ = "$Date: 2005/01/13 13:42:03 $"
 from GUI.InteractivePanel import InteractivePanel as InteractivePanel
 import lib.ImageOperations
 import lib.messenger
+import lib.LRUCache
 import Logging
 import math
 import optimize
@@ -39,6 +43,14 @@ import scripting
 import wx
 import vtk
 
+# The number of rows of tiles above and below the visible ones that are
+# loaded in advance
+MARGIN_ROWS = 1
+# The delay in milliseconds between loading two tiles
+LOAD_DELAY = 10
+# The smallest number of tiles kept in the cache
+MIN_CACHED_TILES = 32
+
 class GalleryPanel(InteractivePanel):
 	"""
 	A panel that can be used to preview volume data several slice at a time
@@ -53,7 +65,11 @@ class GalleryPanel(InteractivePanel):
 		self.bgcolor = (127, 127, 127)
 		Logging.info("Size of gallery =", size, kw = "preview")
 		self.enabled = 1
-		self.slices = []
+		self.count = 0
+		# The scaled bitmaps of the tiles
+		self.tiles = lib.LRUCache.LRUCache(MIN_CACHED_TILES)
+		self.pending = []
+		self.loadScheduled = 0
 		self.zoomx = 1
 		self.zoomy = 1
 		if kws.has_key("slicesize"):
@@ -88,6 +104,7 @@ class GalleryPanel(InteractivePanel):
 		self.paintPreview()
 		self.Bind(wx.EVT_PAINT, self.OnPaint)
 		self.Bind(wx.EVT_SIZE, self.onSize)
+		self.Bind(wx.EVT_SCROLLWIN, self.onScroll)
 		lib.messenger.connect(None, "zslice_changed", self.setPreviewedSlice)
 		
 	def deregister(self):
@@ -139,10 +156,8 @@ class GalleryPanel(InteractivePanel):
 		x *= factor
 		y *= factor
 		self.sizeChanged = True
-		self.calculateBuffer()
-
 		self.sliceSize = (int(x), int(y))
-		self.slices = []
+		self.calculateBuffer()
 		
 		
 	def setBackground(self, r, g, b):
@@ -162,6 +177,13 @@ class GalleryPanel(InteractivePanel):
 			self.calculateBuffer()
 			self.updatePreview()
 
+	def onScroll(self, event):
+		"""
+		Scroll event handler. Load the tiles that have become visible.
+		"""
+		event.Skip()
+		wx.CallAfter(self.updatePreview)
+
 	def setDataUnit(self, dataunit):
 		"""
 		Sets the dataunit to display
@@ -172,6 +194,7 @@ class GalleryPanel(InteractivePanel):
 		self.dims = dataunit.getDimensions()
 		self.voxelSize = dataunit.getVoxelSize()
 		InteractivePanel.setDataUnit(self, dataunit)
+		self.tiles.clear()
 		tp = self.timepoint
 		self.timepoint = -1
 		self.setTimepoint(tp)
@@ -186,7 +209,7 @@ class GalleryPanel(InteractivePanel):
 		"""
 		Sets the timepoint to display
 		"""
-		if self.timepoint == timepoint and self.slices:
+		if self.timepoint == timepoint and self.count:
 			return
 		
 		self.timepoint = timepoint
@@ -198,64 +221,166 @@ class GalleryPanel(InteractivePanel):
 		if self.showTimepoints:
 			return self.getTimepointSlicesAt(self.slice)
 
+		# The processed volume is needed as a whole, but the slices of
+		# unprocessed data are read only when their tiles are shown
+		self.imagedata = None
 		if self.visualizer.getProcessedMode():
 			image = self.dataUnit.doPreview(scripting.WHOLE_DATASET_NO_ALPHA, 1, self.timepoint)
 			self.ctf = self.dataUnit.getSourceDataUnits()[0].getColorTransferFunction()
 #			Logging.info("Using ", image, "for gallery", kw = "preview")
+			self.imagedata = image
+			self.imagedata.SetUpdateExtent(self.imagedata.GetWholeExtent())
+			self.imagedata.Update()
+			x, y, z = self.imagedata.GetDimensions()
 		else:
-			image = self.dataUnit.getTimepoint(timepoint)
 			self.ctf = self.dataUnit.getColorTransferFunction()
+			x, y, z = self.dataUnit.getDimensions()
 
-		#self.imagedata = lib.ImageOperations.imageDataTo3Component(image,ctf)
-		self.imagedata = image
-		self.imagedata.SetUpdateExtent(self.imagedata.GetWholeExtent())
-		self.imagedata.Update()
-		
-		x, y, z = self.dataUnit.getDimensions()
-		
-		self.slices = []
-
-		for i in range(z):
-			image = optimize.optimize(image = self.imagedata, updateExtent = (0, x - 1, 0, y - 1, i, i))
-			image = lib.ImageOperations.getSlice(image, i)
-			
-			lib.messenger.send(None, "update_progress", i / float(z), "Loading slice %d / %d for Gallery view" % (i + 1, z + 1))
-			self.slices.append(image)
-		
-		lib.messenger.send(None, "update_progress", 1.0, "All slices loaded.")  
+		self.count = z
+		self.pending = []
 		self.calculateBuffer()
 		if update:
 			print "Updating preview"
 			self.updatePreview()
 			self.Refresh()
 			
+	def getPreviewTimepoint(self, timepoint, zslice = -1):
+		"""
+		Return the timepoint, or its given z slice, reduced to the smallest
+		level of the preview pyramid that still covers the size of a slice
+		"""
+		factor = self.dataUnit.getPreviewFactor(*self.sliceSize)
+		image = None
+		if factor > 1:
+			image = self.dataUnit.getPreviewTimepoint(timepoint, factor, zslice)
+		if not image:
+			image = self.dataUnit.getTimepoint(timepoint)
+			if zslice != -1:
+				x, y, z = self.dataUnit.getDimensions()
+				image = optimize.optimize(image, updateExtent = (0, x - 1, 0, y - 1, zslice, zslice))
+		return image
+
+	def getSliceImage(self, sliceNum):
+		"""
+		Return the image data shown in a tile, which is a z slice of the
+		shown timepoint or the shown slice of a timepoint
+		"""
+		if self.showTimepoints:
+			timepoint, zslice = sliceNum, self.slice
+			if self.dataUnit.isProcessed():
+				image = self.dataUnit.doPreview(zslice, 1, timepoint)
+				image.Update()
+			else:
+				image = self.getPreviewTimepoint(timepoint, zslice)
+		else:
+			zslice = sliceNum
+			if self.imagedata:
+				x, y, z = self.imagedata.GetDimensions()
+				image = optimize.optimize(image = self.imagedata, updateExtent = (0, x - 1, 0, y - 1, zslice, zslice))
+			else:
+				image = self.getPreviewTimepoint(self.timepoint, zslice)
+		image = lib.ImageOperations.getSlice(image, zslice)
+		image.Update()
+		return image
+
 	def getScaledSlice(self, sliceNum):
 		"""
 		@param slice The number of the slice to return
 		"""
 		w, h = self.sliceSize
 		try:
-			sliceImg = lib.ImageOperations.imageDataTo3Component(self.slices[sliceNum], self.ctf)
-			sliceImg.Update()
+			sliceImg = self.getSliceImage(sliceNum)
 		except:
 			return
 		
-		x, y, z = sliceImg.GetDimensions()
-		factor = lib.ImageOperations.getZoomFactor(x, y, w, h)
-		
 		if self.interpolation:
+			sliceImg = lib.ImageOperations.imageDataTo3Component(sliceImg, self.ctf)
+			sliceImg.Update()
+			x, y, z = sliceImg.GetDimensions()
+			factor = lib.ImageOperations.getZoomFactor(x, y, w, h)
 			sliceImg = self.zoomImageWithInterpolation(sliceImg, factor, self.interpolation, 0)
 		else:
-			sliceImg = lib.ImageOperations.vtkImageDataToWxImage(sliceImg)
+			sliceImg = lib.ImageOperations.vtkImageDataToWxImage(sliceImg, ctf = self.ctf)
 			sliceImg.Rescale(w, h)
 		return sliceImg
-		
+
+	def getTileKey(self, sliceNum):
+		"""
+		Return the key of the bitmap of a tile in the tile cache
+		"""
+		if self.showTimepoints:
+			return (1, self.slice, sliceNum, tuple(self.sliceSize), self.interpolation)
+		return (0, self.timepoint, sliceNum, tuple(self.sliceSize), self.interpolation)
+
+	def getTilePosition(self, sliceNum):
+		"""
+		Return the position of the upper left corner of a tile in the buffer
+		"""
+		xs, ys, x1, y1 = self.GetClientRect()
+		row, col = divmod(sliceNum, max(self.cols, 1))
+		return (xs + 9 + col * (3 + self.sliceSize[0]), ys + 9 + row * (3 + self.sliceSize[1]))
+
+	def getVisibleTiles(self):
+		"""
+		Return the numbers of the tiles in the visible part of the gallery
+		and the rows of tiles next to it
+		"""
+		if not self.count:
+			return []
+		cols = max(self.cols, 1)
+		height = 3 + self.sliceSize[1]
+		ux, uy = self.GetScrollPixelsPerUnit()
+		vx, vy = self.GetViewStart()
+		w, h = self.GetClientSize()
+		top = vy * uy - 9
+		first = max(int(top // height) - MARGIN_ROWS, 0)
+		last = int((top + h) // height) + MARGIN_ROWS
+		return range(first * cols, min((last + 1) * cols, self.count))
+
+	def loadTiles(self):
+		"""
+		Load the next pending tile and draw it
+		"""
+		self.loadScheduled = 0
+		if not self.pending:
+			return
+		sliceNum = self.pending.pop(0)
+		key = self.getTileKey(sliceNum)
+		bmp = self.tiles.get(key)
+		if bmp is None:
+			image = self.getScaledSlice(sliceNum)
+			if image:
+				bmp = image.ConvertToBitmap()
+				self.tiles.add(key, bmp)
+		dc = wx.MemoryDC()
+		dc.SelectObject(self.buffer)
+		dc.BeginDrawing()
+		if bmp:
+			x, y = self.getTilePosition(sliceNum)
+			dc.DrawBitmap(bmp, x, y, False)
+		if not self.pending:
+			self.makeBackgroundBuffer(dc)
+		dc.EndDrawing()
+		dc.SelectObject(wx.NullBitmap)
+		self.bmp = self.buffer
+		self.Refresh()
+		self.scheduleLoading()
+
+	def scheduleLoading(self):
+		"""
+		Load the pending tiles after the pending user events have been handled
+		"""
+		if self.pending and not self.loadScheduled:
+			self.loadScheduled = 1
+			wx.FutureCall(LOAD_DELAY, self.loadTiles)
+
 	def forceUpdate(self):
 		"""
 		force update of the preview
 		"""
 		tp = self.timepoint
-		self.slices = []
+		self.count = 0
+		self.tiles.clear()
 		self.timepoint = -1
 		self.setTimepoint(tp)
 
@@ -268,29 +393,16 @@ class GalleryPanel(InteractivePanel):
 		# if we're showing each slice of one timepoint
 		# instead of one slice of each timepoint, call the
 		# appropriate function
-		self.slices = []
+		self.count = 0
 		if not self.showTimepoints:
 			return self.setTimepoint(self.timepoint)
 		
-		count = self.dataUnit.getNumberOfTimepoints()
-		for tp in range(0, count):
-			if self.dataUnit.isProcessed():
-				image = self.dataUnit.doPreview(self.slice, 1, tp)
-				image.Update()
-				self.ctf = self.dataUnit.getSourceDataUnits()[0].getColorTransferFunction()
-				Logging.info("Using ", image, "for gallery", kw = "preview")
-			else:
-				image = self.dataUnit.getTimepoint(tp)
-				x, y, z = self.dataUnit.getDimensions()
-				image = optimize.optimize(image, updateExtent = (0, x - 1, 0, y - 1, self.slice, self.slice))
-				self.ctf = self.dataUnit.getColorTransferFunction()
-
-			image = lib.ImageOperations.getSlice(image, self.slice)
-			image.Update()
-			tp = vtk.vtkImageData()
-			tp.DeepCopy(image)
-			self.slices.append(tp)
-			
+		if self.dataUnit.isProcessed():
+			self.ctf = self.dataUnit.getSourceDataUnits()[0].getColorTransferFunction()
+		else:
+			self.ctf = self.dataUnit.getColorTransferFunction()
+		self.count = self.dataUnit.getNumberOfTimepoints()
+		self.pending = []
 		self.calculateBuffer()
 		self.updatePreview()
 
@@ -298,7 +410,7 @@ class GalleryPanel(InteractivePanel):
 		"""
 		Calculate the drawing buffer required
 		"""
-		if not self.imagedata:
+		if not self.count:
 			return
 
 		x, y, z = self.dataUnit.getDimensions()
@@ -311,9 +423,9 @@ class GalleryPanel(InteractivePanel):
 		maxY = self.maxClientSizeY
 
 		n = z
-		if len(self.slices) > z:
-			Logging.info("Using number of slices (%d) instead of z dim (%d)" % (len(self.slices), z), kw = "preview")
-			n = len(self.slices)
+		if self.count > z:
+			Logging.info("Using number of slices (%d) instead of z dim (%d)" % (self.count, z), kw = "preview")
+			n = self.count
 
 		self.oldBufferDims = (x, y, z)
 		self.oldBufferMaxXY = (maxX, maxY)
@@ -388,7 +500,7 @@ class GalleryPanel(InteractivePanel):
 			return
 		if not self.dataUnit:
 			return			
-		if not self.slices:
+		if not self.count:
 			print "Updating slices"
 			self.setTimepoint(self.timepoint, update = 0)
 		self.paintPreview()
@@ -432,42 +544,35 @@ class GalleryPanel(InteractivePanel):
 		xs, ys, x1, y1 = self.GetClientRect()
 		dc.DrawRectangle(xs, ys, w, h)
 		
-		if not self.slices:
+		if not self.count:
 			Logging.info("Haven't got any slices", kw = "preview")
 			self.makeBackgroundBuffer(dc)
 			dc.EndDrawing()
 			return
-		row, col = 0, 0
-	
-		xs += 9
-		ys += 9
-		for i,slice in enumerate(self.slices):
-			w, h = self.sliceSize
-#			slice.Rescale(w, h)
-			slice = self.getScaledSlice(i)
-			bmp = slice.ConvertToBitmap()
-			if bmp.GetWidth()>w:
-				print "\n\nTOO WIDE, slice size=",(w,h), "current=",bmp.GetWidth(),bmp.GetHeight()
-			if bmp.GetHeight()>h:
-				print "\n\nTOOHIGH,  slice size=",(w,h), "current=",bmp.GetWidth(),bmp.GetHeight()
 
-			x = xs + col * (3 + self.sliceSize[0])
-			y = xs + row * (3 + self.sliceSize[1])
-
-			
-			dc.DrawBitmap(bmp, x, y, False)
-			col += 1
-			if col >= self.cols:
-				col = 0
-				row += 1
+		# Draw the tiles that are cached and queue the visible ones that are not
+		visible = self.getVisibleTiles()
+		self.tiles.setLimit(max(2 * len(visible), MIN_CACHED_TILES))
+		self.pending = []
+		self.drawableRects = []
+		w, h = self.sliceSize
+		dc.SetBrush(wx.Brush(wx.Colour(*[c // 2 for c in self.bgcolor])))
+		for i in range(self.count):
+			x, y = self.getTilePosition(i)
 			# Mark the rectangle as drawable
-			x0, x1 = x, x + w
-			y0, y1 = y, y + h
-			self.drawableRects.append((x0, x1, y0, y1))
+			self.drawableRects.append((x, x + w, y, y + h))
+			if not visible or i < visible[0] or i > visible[-1]:
+				continue
+			bmp = self.tiles.get(self.getTileKey(i))
+			if bmp:
+				dc.DrawBitmap(bmp, x, y, False)
+			else:
+				dc.DrawRectangle(x, y, w, h)
+				self.pending.append(i)
 		
-		y = 9 + (self.rows) * (3 + self.sliceSize[1])
 		self.bmp = self.buffer
 
 		self.makeBackgroundBuffer(dc)
 		dc.EndDrawing()
-	
+		dc.SelectObject(wx.NullBitmap)
+		self.scheduleLoading()
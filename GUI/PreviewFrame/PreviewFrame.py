@@ -68,6 +68,8 @@ class PreviewFrame(InteractivePanel):
 		self.show = {}
 		self.rawImages = []
 		self.rawImage = None
+		# The factor by which the previewed data is reduced from the dataset
+		self.previewFactor = 1
 		
 		self.oldx, self.oldy = 0, 0
 		self.curPos = (-1,-1)
@@ -314,6 +316,11 @@ class PreviewFrame(InteractivePanel):
 			x = self.dataDimX - 1
 		if y >= self.dataDimY:
 			y = self.dataDimY - 1
+		if self.previewFactor > 1:
+			# The previewed data is reduced, so read the voxel from that
+			ix, iy, iz = self.rawImage.GetDimensions()
+			x = min(x / self.previewFactor, ix - 1)
+			y = min(y / self.previewFactor, iy - 1)
 
 		#Logging.info("Returning x,y,z=(%d,%d,%d)" % (rx, ry, rz), kw = "preview")
 		ncomps = self.rawImage.GetNumberOfScalarComponents()
@@ -433,6 +440,7 @@ class PreviewFrame(InteractivePanel):
 			renew = 1
 			self.running = 1
 		
+		self.previewFactor = 1
 		if self.dataUnit.isProcessed():
 			try:
 				z = self.z
@@ -446,7 +454,20 @@ class PreviewFrame(InteractivePanel):
 				ex.show()
 				return
 		else:
-			preview = self.dataUnit.getTimepoint(self.timePoint)
+			preview = None
+			# Use the smallest level of the preview pyramid that covers the
+			# zoomed slice, and read only the shown slice if possible
+			if self.z != -1 and self.zoomFactor < 1:
+				factor = self.dataUnit.getPreviewFactor(self.dataDimX * self.zoomFactor, self.dataDimY * self.zoomFactor)
+				if factor > 1:
+					preview = self.dataUnit.getPreviewTimepoint(self.timePoint, factor, self.z)
+					if preview:
+						self.previewFactor = factor
+			if not preview and self.z != -1:
+				extent = (0, self.dataDimX - 1, 0, self.dataDimY - 1, self.z, self.z)
+				preview = self.dataUnit.getTimepointSubVolume(self.timePoint, extent)
+			if not preview:
+				preview = self.dataUnit.getTimepoint(self.timePoint)
 			self.rawImage = preview
 			Logging.info("Using timepoint %d as preview" % self.timePoint, kw = "preview")
 
@@ -468,7 +489,7 @@ class PreviewFrame(InteractivePanel):
 		usedUpdateExt = 0
 		uext = None
 		if self.z != -1:
-			x, y = self.dataDimX, self.dataDimY
+			x, y = self.dataDimX / self.previewFactor, self.dataDimY / self.previewFactor
 			usedUpdateExt = 1
 			uext = (0, x - 1, 0, y - 1, self.z, self.z)
 
@@ -699,11 +720,13 @@ class PreviewFrame(InteractivePanel):
 		Logging.info("Zoom factor for painting =", self.zoomFactor, kw = "preview")
 		if self.zoomFactor != 1 or self.zoomFactor != self.oldZoomFactor:
 			self.oldZoomFactor = self.zoomFactor
+			# A reduced preview is scaled less to get the same size
+			zoomFactor = self.zoomFactor * self.previewFactor
 			if self.interpolation != 0:
-				bmp = self.zoomImageWithInterpolation(self.imagedata, self.zoomFactor, self.interpolation, self.z)
+				bmp = self.zoomImageWithInterpolation(self.imagedata, zoomFactor, self.interpolation, self.z)
 			if not self.interpolation or not bmp:
 				Logging.info("Using no interpolation",kw="preview")
-				img = lib.ImageOperations.scaleImage(self.imagedata, self.zoomFactor, self.z, self.interpolation)
+				img = lib.ImageOperations.scaleImage(self.imagedata, zoomFactor, self.z, self.interpolation)
 				bmp = lib.ImageOperations.vtkImageDataToWxImage(img)
 			w, h = bmp.GetWidth(), bmp.GetHeight()
 
@@ -48,6 +48,7 @@ class SectionsPanel(GUI.InteractivePanel.InteractivePanel):
 		Initialization
 		"""
 		self.imagedata = None
+		self.readPlanes = False
 		self.fitLater = 0
 		self.visualizer = visualizer
 		self.noUpdate = 0
@@ -172,7 +173,7 @@ class SectionsPanel(GUI.InteractivePanel.InteractivePanel):
 		#x /= float(self.zoomFactor)
 		#y /= float(self.zoomFactor)
 
-		dims = self.imagedata.GetDimensions()
+		dims = self.getVolumeDimensions()
 		
 		# the yz plane
 		# calculate scaled margins, because the click coordinates are scaled as well
@@ -291,12 +292,28 @@ class SectionsPanel(GUI.InteractivePanel.InteractivePanel):
 		GUI.InteractivePanel.InteractivePanel.setDataUnit(self, dataUnit)
 		self.dataUnitChanged = True
 		
+	def getVolumeDimensions(self):
+		"""
+		Return the dimensions of the shown volume
+		"""
+		if self.readPlanes:
+			return tuple(self.dataUnit.getDimensions())
+		return self.imagedata.GetDimensions()
+
 	def getPlane(self, data, plane, xCoordinate, yCoordinate, zCoordinate, applyZScaling = 0):
 		"""
 		Get a plane from given the volume
 		"""   
 		xAxis, yAxis, zAxis = 0, 1, 2
 		dataWidth, dataHeight, dataDepth = data.GetDimensions()
+		if self.readPlanes and plane in ["zy", "xz"]:
+			# Read only the plane from the data source
+			dataWidth, dataHeight, dataDepth = self.dataUnit.getDimensions()
+			if plane == "zy":
+				extent = (xCoordinate, xCoordinate, 0, dataHeight - 1, 0, dataDepth - 1)
+			else:
+				extent = (0, dataWidth - 1, yCoordinate, yCoordinate, 0, dataDepth - 1)
+			data = self.dataUnit.getTimepointSubVolume(self.timepoint, extent)
 		if not self.voi:
 			self.voi = vtk.vtkExtractVOI()
 		else:
@@ -367,13 +384,24 @@ class SectionsPanel(GUI.InteractivePanel.InteractivePanel):
 			return
 
 		if recalculate or not self.imagedata:
+			self.readPlanes = False
 			if self.dataUnit.isProcessed():
 				image = self.dataUnit.doPreview(scripting.WHOLE_DATASET_NO_ALPHA, 1, self.timepoint)
 				image.ReleaseDataFlagOff()
 			else:
-				image = self.dataUnit.getTimepoint(tp)
-				image.UpdateInformation()
-				image.SetUpdateExtent(image.GetWholeExtent())
+				# If the data source can read parts of a timepoint, only the
+				# shown xy slice is read here and the other planes in getPlane
+				x, y, z = self.dataUnit.getDimensions()
+				# self.z is scaled by zoomZ, the extent is in data coordinates
+				zslice = max(0, min(int(self.z / self.zoomZ), z - 1))
+				extent = (0, x - 1, 0, y - 1, zslice, zslice)
+				image = self.dataUnit.getTimepointSubVolume(tp, extent)
+				if image:
+					self.readPlanes = True
+				else:
+					image = self.dataUnit.getTimepoint(tp)
+					image.UpdateInformation()
+					image.SetUpdateExtent(image.GetWholeExtent())
 			self.ctf = self.dataUnit.getColorTransferFunction()
 			image.Update()
 			self.cachedImage = image
@@ -386,7 +414,7 @@ class SectionsPanel(GUI.InteractivePanel.InteractivePanel):
 			self.zoomToFit()
 			return
 
-		self.dims = self.imagedata.GetDimensions()
+		self.dims = self.getVolumeDimensions()
 		self.slices = []
 
 		# obtain the slices
@@ -557,7 +585,7 @@ class SectionsPanel(GUI.InteractivePanel.InteractivePanel):
 			self.fitLater = 1
 			return
 
-		x, y, z = self.imagedata.GetDimensions()
+		x, y, z = self.getVolumeDimensions()
 		x += z * self.zspacing + 3 * self.xmargin
 		y += z * self.zspacing + 3 * self.ymargin
 		f = self.maxClientSizeX / x
@@ -33,6 +33,7 @@ __date__ = "$Date: 2005/01/13 14:36:20 $"
 
 import scripting
 import ChannelTray
+import lib.DataUnit.DataUnit
 import lib.ImageOperations
 import lib.messenger
 import Logging
@@ -258,6 +259,7 @@ class TaskPanel(ScrolledPanel):
 			return
 
 		self.itemMips = []
+		lib.DataUnit.DataUnit.computeMIPs(sourceUnits, 0, (TOOL_W, TOOL_H))
 		for i, dataunit in enumerate(sourceUnits):
 			#color = dataunit.getColor()
 			ctf = dataunit.getColorTransferFunction()
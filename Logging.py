@@ -31,7 +31,6 @@ __date__ = "$Date: 2005/01/11 14:36:00 $"
 import codecs
 import os.path
 import sys
-import wx
 
 outfile = sys.stdout
 
@@ -131,13 +130,15 @@ class GUIError(Exception):
 		Exception.__init__(self)
 		self.msg = msg
 		self.title = title
-		self.wx = wx
 
 	def show(self):
 		"""
 		Displays the error message in a tkMessageBox.
 		"""
-		dlg = self.wx.MessageDialog(None, self.msg, self.title, wx.OK|wx.ICON_ERROR)
+		# wx is imported only when a message is shown, so that logging does
+		# not require wx in the batch processing without a display
+		import wx
+		dlg = wx.MessageDialog(None, self.msg, self.title, wx.OK|wx.ICON_ERROR)
 		dlg.ShowModal()
 		dlg.Destroy()
 
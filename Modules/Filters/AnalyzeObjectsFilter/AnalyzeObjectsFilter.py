@@ -48,6 +48,7 @@ import platform
 import lib.ParticleWriter
 import sys
 import lib.Progress
+import lib.ObjectSurface
 
 class AnalyzeObjectsFilter(lib.ProcessingFilter.ProcessingFilter):
 	"""
@@ -449,32 +450,40 @@ class AnalyzeObjectsFilter(lib.ProcessingFilter.ProcessingFilter):
 		self.progressObj.setProgress(0.2)
 		self.updateProgress(None, "ProgressEvent")
 
-		# Area calculation pipeline
+		# Area calculation. Every object is meshed only inside its own
+		# padded bounding box, optionally in several processes.
+		objSurfaces = {}
 		if self.parameters["Area"]:
 			voxelArea = x*y*2 + x*z*2 + y*z*2
 			largestSize = labelITK.GetLargestPossibleRegion().GetSize()
 			# if 2D image, calculate area using volume
 			if largestSize.GetSizeDimension() > 2 and largestSize.GetElement(2) > 1:
 				areaSpacing = labelVTK.GetSpacing()
-				objectThreshold = vtk.vtkImageThreshold()
-				objectThreshold.SetInput(labelVTK)
-				objectThreshold.SetOutputScalarTypeToUnsignedChar()
-				objectThreshold.SetInValue(255)
-				objectThreshold.SetOutValue(0)
-				marchingCubes = vtk.vtkMarchingCubes()
-				#marchingCubes.SetInput(labelVTK)
-				marchingCubes.SetInput(objectThreshold.GetOutput())
-				massProperties = vtk.vtkMassProperties()
-				massProperties.SetInput(marchingCubes.GetOutput())
 				areaDiv = (areaSpacing[0] / x)**2
-				
-				if self.parameters["Smoothness"]:
-					smoothDecimate = vtk.vtkDecimatePro()
-					smoothProperties = vtk.vtkMassProperties()
-					smoothDecimate.SetTargetReduction(0.9)
-					smoothDecimate.PreserveTopologyOff()
-					smoothDecimate.SetInput(marchingCubes.GetOutput())
-					smoothProperties.SetInput(smoothDecimate.GetOutput())
+				labelVTK.SetUpdateExtent(labelVTK.GetWholeExtent())
+				labelVTK.Update()
+				wholeExtent = labelVTK.GetWholeExtent()
+				labelExtents = []
+				for i in range(startIntensity, numberOfLabels+1):
+					if newITKStatistics:
+						try:
+							labelObj = labelMap.GetLabelObject(i)
+						except:
+							continue
+						extent = lib.ObjectSurface.getLabelObjectExtent(labelObj, wholeExtent)
+					else:
+						if not labelShape.HasLabel(i):
+							continue
+						try:
+							extent = lib.ObjectSurface.getRegionExtent(labelShape.GetRegion(i), wholeExtent)
+						except AttributeError:
+							extent = tuple(wholeExtent)
+					labelExtents.append((i, extent))
+
+				t0 = time.time()
+				smoothness = newITKStatistics and self.parameters["Smoothness"]
+				objSurfaces = lib.ObjectSurface.calculateSurfaces(labelVTK, labelExtents, smoothness)
+				print "Surface calculations took", time.time()-t0
 
 		# Filter needed for axes calculations
 		if self.parameters["Axes"] and newITKStatistics:
@@ -536,13 +545,9 @@ class AnalyzeObjectsFilter(lib.ProcessingFilter.ProcessingFilter):
 				# working
 				if self.parameters["Area"]:
 					if largestSize.GetSizeDimension() > 2 and largestSize.GetElement(2) > 1:
-						objectThreshold.ThresholdBetween(i,i)
-						marchingCubes.SetValue(0,255)
-						polydata = marchingCubes.GetOutput()
-						polydata.Update()
-						if polydata.GetNumberOfPolys() > 0:
-							massProperties.Update()
-							areaInUm = massProperties.GetSurfaceArea() / areaDiv
+						surfaceArea, smoothArea = objSurfaces[i]
+						if surfaceArea is not None:
+							areaInUm = surfaceArea / areaDiv
 						else:
 							areaInUm = voxelArea
 
@@ -551,15 +556,10 @@ class AnalyzeObjectsFilter(lib.ProcessingFilter.ProcessingFilter):
 						hypersphereArea = 3 * volume * vol / hypersphereR
 						roundness = hypersphereArea / areaInUm
 					
-						# Calculate surface smoothness
-						if self.parameters["Smoothness"]:
-							# Smooth surface with vtkDecimatePro.
-							polydata = smoothDecimate.GetOutput()
-							polydata.Update()
-							if polydata.GetNumberOfPolys() > 0:
-								smoothProperties.Update()
-								smoothArea = smoothProperties.GetSurfaceArea() / areaDiv
-								smoothness = smoothArea / areaInUm
+						# Calculate surface smoothness from the surface
+						# smoothed with vtkDecimatePro.
+						if self.parameters["Smoothness"] and smoothArea is not None:
+							smoothness = (smoothArea / areaDiv) / areaInUm
 					else:
 						areaInUm = volume * x * y
 
@@ -641,13 +641,9 @@ class AnalyzeObjectsFilter(lib.ProcessingFilter.ProcessingFilter):
 				# Get area of object
 				if self.parameters["Area"]:
 					if largestSize.GetSizeDimension() > 2 and largestSize.GetElement(2) > 1:
-						objectThreshold.ThresholdBetween(i,i)
-						marchingCubes.SetValue(0,255)
-						polydata = marchingCubes.GetOutput()
-						polydata.Update()
-						if polydata.GetNumberOfPolys() > 0:
-							massProperties.Update()
-							areaInUm = massProperties.GetSurfaceArea() / areaDiv
+						surfaceArea, smoothArea = objSurfaces[i]
+						if surfaceArea is not None:
+							areaInUm = surfaceArea / areaDiv
 						else:
 							areaInUm = voxelArea
 
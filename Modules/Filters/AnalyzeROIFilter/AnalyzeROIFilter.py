@@ -25,6 +25,8 @@ __date__ = "$Date: 2005/01/13 14:52:39 $"
 
 import lib.ProcessingFilter
 import lib.FilterTypes
+import lib.ImageOperations
+import lib.LabelStatistics
 import GUI.GUIBuilder
 import types
 import scripting
@@ -129,47 +131,66 @@ class AnalyzeROIFilter(lib.ProcessingFilter.ProcessingFilter):
 		mx, my, mz = self.dataUnit.getDimensions()
 		values = []
 
-		itkOrig = self.convertVTKtoITK(imagedata)
-		#coms = []
-		for mask in rois:
-			if not mask:
+		volume = None
+		if lib.LabelStatistics.numpy and not self.parameters["SecondInput"]:
+			if None in rois:
 				return imagedata
-			if self.parameters["SecondInput"]:
-				itkLabel = self.convertVTKtoITK(mask)
+			volume = lib.LabelStatistics.getVolume(imagedata)
+		if volume is not None:
+			# All the ROIs are measured in one pass over the voxels
+			statistics = {}
+			for labels, indices in lib.LabelStatistics.getROILabels(rois, mx, my):
+				labelStats = lib.LabelStatistics.LabelIndex(labels).getStatistics(volume)
+				for i in indices:
+					statistics[i] = labelStats
+			for i, roi in enumerate(rois):
+				labelStats = statistics[i]
+				label = i + 1
+				values.append((roi.getName(), labelStats.getCount(label), labelStats.getSum(label), \
+								labelStats.getMinimum(label), labelStats.getMaximum(label), \
+								labelStats.getMean(label), labelStats.getSigma(label)))
+		else:
+			itkOrig = self.convertVTKtoITK(imagedata)
+			#coms = []
+			for mask in rois:
+				if not mask:
+					return imagedata
+				if self.parameters["SecondInput"]:
+					itkLabel = self.convertVTKtoITK(mask)
 
-				roiName = None
-				if mask.GetScalarType() == 9:
-					a, b = mask.GetScalarRange()
-					statValues = range(int(a), int(b))
+					roiName = None
+					if mask.GetScalarType() == 9:
+						a, b = mask.GetScalarRange()
+						statValues = range(int(a), int(b))
+					else:
+						statValues = [255]
 				else:
-					statValues = [255]
-			else:
-				n, maskImage = lib.ImageOperations.getMaskFromROIs([mask], mx, my, mz)
+					n, maskImage = lib.ImageOperations.getMaskFromROIs([mask], mx, my, mz)
 
-				itkLabel =	self.convertVTKtoITK(maskImage)
-				statValues = [255]
-				roiName = mask.getName()
+					itkLabel =	self.convertVTKtoITK(maskImage)
+					statValues = [255]
+					roiName = mask.getName()
 
-			labelStats = itk.LabelStatisticsImageFilter[itkOrig, itkLabel].New()
-			
-			labelStats.SetInput(0, itkOrig)
-			labelStats.SetLabelInput(itkLabel)
-			labelStats.Update()
+				labelStats = itk.LabelStatisticsImageFilter[itkOrig, itkLabel].New()
+				
+				labelStats.SetInput(0, itkOrig)
+				labelStats.SetLabelInput(itkLabel)
+				labelStats.Update()
 
-			for statval in statValues:
-				n = labelStats.GetCount(statval)
-				#x1,x2,y1,y2 = labelStats.GetBoundingBox(statval)
-				#coms.append((int((x2+x1)/2.0), int((y2+y1)/2.0)))
-				totint = labelStats.GetSum(statval)
-				maxval = labelStats.GetMaximum(statval)
-				minval = labelStats.GetMinimum(statval)
-				mean = labelStats.GetMean(statval)
-				sigma = labelStats.GetSigma(statval)
-				if not roiName:
-					name = "%d"%statval
-				else:
-					name = roiName
-				values.append((name, n, totint, minval, maxval, mean, sigma))
+				for statval in statValues:
+					n = labelStats.GetCount(statval)
+					#x1,x2,y1,y2 = labelStats.GetBoundingBox(statval)
+					#coms.append((int((x2+x1)/2.0), int((y2+y1)/2.0)))
+					totint = labelStats.GetSum(statval)
+					maxval = labelStats.GetMaximum(statval)
+					minval = labelStats.GetMinimum(statval)
+					mean = labelStats.GetMean(statval)
+					sigma = labelStats.GetSigma(statval)
+					if not roiName:
+						name = "%d"%statval
+					else:
+						name = roiName
+					values.append((name, n, totint, minval, maxval, mean, sigma))
 		if self.reportGUI:
 			self.reportGUI.setMeasurements(values)
 			self.reportGUI.Refresh()
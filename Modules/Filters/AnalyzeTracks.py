@@ -31,6 +31,7 @@ __date__ = "$Date: 2005/01/13 14:52:39 $"
 
 import lib.ProcessingFilter
 import lib.FilterTypes
+import lib.Track
 import GUI.GUIBuilder
 import GUI.CSVListView
 import types
@@ -237,8 +238,7 @@ class AnalyzeTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 			readers = Modules.DynamicLoader.getReaders()
 			bxcReader = readers['BXCDataSource'][0]()
 			bxcReader.loadFromFile(inputFile)
-			for track in self.tracks:
-				track.calculateFrontAndRear(bxcReader, 10.0, 0.01)
+			lib.Track.calculateFrontsAndRears(self.tracks, bxcReader)
 
 #		track length
 #		Directional persistance = distance to starting point / path length
@@ -258,18 +258,20 @@ class AnalyzeTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 		self.rearSpeeds = []
 		self.frontCoordinates = []
 		self.rearCoordinates = []
+		# The kinematics of all the tracks are computed at once
+		statistics = lib.Track.getTrackStatistics(tracks)
 		for i, track in enumerate(tracks):
 			tps = track.getNumberOfTimepoints()
 			#if tps < self.parameters["MinLength"]:
 			#	continue
-			length = track.getLength()
-			speed = track.getSpeed()
-			dp = track.getDirectionalPersistence()
+			length = statistics["Length"][i]
+			speed = statistics["Speed"][i]
+			dp = statistics["DirectionalPersistence"][i]
 			if tps not in dpsPerTp:
 				dpsPerTp[tps] = []
 			dpsPerTp[tps].append(dp)
-			frontSpeed = track.getFrontSpeed()
-			rearSpeed = track.getRearSpeed()
+			frontSpeed = statistics["FrontSpeed"][i]
+			rearSpeed = statistics["RearSpeed"][i]
 			frontCoords = track.getFrontCoordinates()
 			rearCoords = track.getRearCoordinates()
 			
@@ -277,7 +279,7 @@ class AnalyzeTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 			self.speeds.append(speed)
 			self.tpCount.append(tps)
 			self.dps.append(dp)
-			avgang,avgangstd,avgangstderr = track.getAverageAngle()
+			avgang,avgangstd,avgangstderr = statistics["Angle"][i]
 			self.angles.append((avgang,avgangstderr))
 			self.frontSpeeds.append(frontSpeed)
 			self.rearSpeeds.append(rearSpeed)
@@ -27,6 +27,9 @@ import scripting
 import lib.ProcessingFilter
 import lib.FilterTypes
 import lib.messenger
+import lib.ColocalizationStatistics
+import lib.ColocalizationTest
+import lib.LabelStatistics
 import GUI.GUIBuilder
 import vtk
 import vtkbxd
@@ -53,6 +56,8 @@ class ColocalizationFilter(lib.ProcessingFilter.ProcessingFilter):
 		self.listctrl = None
 		self.emissionWavelength = 520
 		self.oldThresholds = None
+		self.histogram = None
+		self.histogramKey = None
 		lib.ProcessingFilter.ProcessingFilter.__init__(self, (2,2), requireWholeDataset = 1)
 		for i in range(1, 3):
 			self.setInputChannel(i, i)
@@ -243,19 +248,50 @@ class ColocalizationFilter(lib.ProcessingFilter.ProcessingFilter):
 		
 		return gui
 
+	def getJointHistogram(self, images):
+		"""
+		Return the joint histogram of the input channels, which is built again
+		only when their data have changed, or None if the statistics cannot be
+		computed from it
+		"""
+		if not lib.ColocalizationStatistics.numpy:
+			return None
+		ch1 = lib.LabelStatistics.getVolume(images[0])
+		ch2 = lib.LabelStatistics.getVolume(images[1])
+		if not (lib.ColocalizationStatistics.isSupported(ch1) and lib.ColocalizationStatistics.isSupported(ch2)):
+			return None
+		if ch1.shape != ch2.shape or ch1.dtype != ch2.dtype:
+			return None
+		key = (tuple(map(id, images)), lib.ColocalizationStatistics.getImageKey(images))
+		if key != self.histogramKey:
+			self.histogram = lib.ColocalizationStatistics.JointHistogram(ch1, ch2)
+			self.histogramKey = key
+		return self.histogram
+
 	def calculatePValue(self, images):
 		"""
 		Calculate the P-value
 		"""
-		coloctest = vtkbxd.vtkImageColocalizationTest()
 		self.eventDesc = "Calculating P-Value"
 		method = 2
 		if self.parameters["Costes"]: method = 1
 		if self.parameters["Fay"]: method = 0
-		coloctest.SetMethod(method)
 		Logging.info("Calculating P-value, method = %d"%method)
 
-		
+		if lib.ColocalizationTest.numpy:
+			ch1 = lib.LabelStatistics.getVolume(images[0])
+			ch2 = lib.LabelStatistics.getVolume(images[1])
+			if ch1 is not None and ch2 is not None:
+				psf = lib.ColocalizationTest.getPSFSize(int(self.parameters["PSF"]))
+				results = lib.ColocalizationTest.calculatePValue(ch1, ch2, method, self.parameters["Iterations"], psf)
+				for i in ["PValue", "RObserved", "RRandMean", "RRandSD",
+						  "NumIterations", "ColocCount", "Method"]:
+					self.setResultVariable(i, results[i])
+				lib.messenger.send(None, "update_progress", 100, "Done.")
+				return
+
+		coloctest = vtkbxd.vtkImageColocalizationTest()
+		coloctest.SetMethod(method)
 		if self.parameters["PSF"]:
 			Logging.info("Using manual PSF size %d"%int(self.parameters["PSF"]))
 			coloctest.SetManualPSFSize(int(self.parameters["PSF"]))
@@ -314,22 +350,29 @@ class ColocalizationFilter(lib.ProcessingFilter.ProcessingFilter):
 
 		ch1Lower, ch1Upper, ch2Lower, ch2Upper = self.parameters["LowerThresholdCh1"], self.parameters["UpperThresholdCh1"], self.parameters["LowerThresholdCh2"], self.parameters["UpperThresholdCh2"]
 		
-		self.colocAutoThreshold.AddInput(images[0])
-		self.colocAutoThreshold.AddInput(images[1])
+		histogram = self.getJointHistogram(images)
+		if histogram:
+			results = histogram.getStatistics(ch1Lower, ch1Upper, ch2Lower, ch2Upper)
+			for variable in self.resultVariables.keys():
+				if variable in results:
+					self.setResultVariable(variable, results[variable])
+		else:
+			self.colocAutoThreshold.AddInput(images[0])
+			self.colocAutoThreshold.AddInput(images[1])
+			
+			# When we set the lower thresholds, then the given thresholds will be used
+			self.colocAutoThreshold.SetLowerThresholdCh1(self.parameters["LowerThresholdCh1"])
+			self.colocAutoThreshold.SetLowerThresholdCh2(self.parameters["LowerThresholdCh2"])
+			self.colocAutoThreshold.SetUpperThresholdCh1(self.parameters["UpperThresholdCh1"])
+			self.colocAutoThreshold.SetUpperThresholdCh2(self.parameters["UpperThresholdCh2"])
 		
-		# When we set the lower thresholds, then the given thresholds will be used
-		self.colocAutoThreshold.SetLowerThresholdCh1(self.parameters["LowerThresholdCh1"])
-		self.colocAutoThreshold.SetLowerThresholdCh2(self.parameters["LowerThresholdCh2"])
-		self.colocAutoThreshold.SetUpperThresholdCh1(self.parameters["UpperThresholdCh1"])
-		self.colocAutoThreshold.SetUpperThresholdCh2(self.parameters["UpperThresholdCh2"])
-	
-		#if self.oldThresholds != (ch1Lower, ch1Upper, ch2Lower, ch2Upper):
-		#	Logging.info("Calculating statistics")
-		self.colocAutoThreshold.Update()
+			#if self.oldThresholds != (ch1Lower, ch1Upper, ch2Lower, ch2Upper):
+			#	Logging.info("Calculating statistics")
+			self.colocAutoThreshold.Update()
 
-		for variable in self.resultVariables.keys():
-			if hasattr(self.colocAutoThreshold, "Get%s"%variable):
-				self.setResultVariable(variable, eval("self.colocAutoThreshold.Get%s()"%variable))
+			for variable in self.resultVariables.keys():
+				if hasattr(self.colocAutoThreshold, "Get%s"%variable):
+					self.setResultVariable(variable, eval("self.colocAutoThreshold.Get%s()"%variable))
 
 		self.oldThresholds = self.parameters["LowerThresholdCh1"], self.parameters["UpperThresholdCh1"], self.parameters["LowerThresholdCh2"], self.parameters["UpperThresholdCh2"]
 		
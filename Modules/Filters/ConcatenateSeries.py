@@ -37,6 +37,7 @@ class ConcatenateSeriesFilter(lib.ProcessingFilter.ProcessingFilter):
 	name = "Combine time series"
 	category = lib.FilterTypes.CONVERSION
 	level = scripting.COLOR_EXPERIENCED
+	sequentialOnly = True
 	
 	def __init__(self):
 		"""
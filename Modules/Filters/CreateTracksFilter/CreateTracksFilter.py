@@ -52,6 +52,7 @@ class CreateTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 	name = "Create motion tracks"
 	category = lib.FilterTypes.TRACKING
 	level = scripting.COLOR_EXPERIENCED
+	sequentialOnly = True
 	
 	def __init__(self):
 		"""
@@ -88,6 +89,8 @@ class CreateTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 			"ResultsFile": "File to store the results:",
 			"Track": "Track to visualize",
 			"UseROI": "Select seed objects using ROI:",
+			"GlobalLinking": "Link all objects between timepoints optimally",
+			"GapFrames": "Max. # of missing timepoints in a track",
 			"ROI": "ROI for tracking:"}
 			
 		lib.messenger.connect(None, "selected_objects", self.onSetSelectedObjects)
@@ -195,6 +198,7 @@ class CreateTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 		"MaxSizeChange", "SizeWeight",
 		"MaxIntensityChange", "IntensityWeight",
 		"MaxDirectionChange", "DirectionWeight", "MinLength", "MinSize")],
+				["Linking", ("GlobalLinking", "GapFrames")],
 		["Tracking Results", (("ResultsFile", "Select track file that contains the results", "*.csv"), )]
 		]
 
@@ -230,8 +234,10 @@ class CreateTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 			return GUI.GUIBuilder.SLICE     
 		elif parameter == "ROI":
 			return GUI.GUIBuilder.ROISELECTION
-		elif parameter == "UseROI":
+		elif parameter in ["UseROI", "GlobalLinking"]:
 			return types.BooleanType
+		elif parameter == "GapFrames":
+			return GUI.GUIBuilder.SPINCTRL
 		return GUI.GUIBuilder.FILENAME
 		
 	def getRange(self, parameter):
@@ -250,6 +256,8 @@ class CreateTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 			return 0, 1000
 		if parameter == "MaxDirectionChange":
 			return (0, 180)
+		if parameter == "GapFrames":
+			return (0, 10)
 		return (0, 100)
 				
 	def getDefaultValue(self, parameter):
@@ -283,6 +291,10 @@ class CreateTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 			return "track_results.csv"
 		if parameter == "UseROI":
 			return 0
+		if parameter == "GlobalLinking":
+			return False
+		if parameter == "GapFrames":
+			return 0
 		if parameter == "ROI":
 			n = scripting.visualizer.getRegionsOfInterest()
 			if n:
@@ -481,7 +493,7 @@ class CreateTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 		if not self.particleFile:
 			return
 		if not self.tracker:
-			self.tracker = lib.Particle.ParticleTracker()
+			self.tracker = lib.ParticleTracker.ParticleTracker()
 
 		try:
 			datasource = self.dataUnit.sourceunits[0].getDataSource()
@@ -565,6 +577,8 @@ class CreateTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 		w3 = self.parameters["IntensityWeight"]
 		w4 = self.parameters["DirectionWeight"]
 		self.tracker.setWeights(w1, w2, w3, w4)
+		self.tracker.setGlobalLinking(self.parameters["GlobalLinking"])
+		self.tracker.setGapFrames(self.parameters["GapFrames"])
 
 		objVals = []
 		if self.parameters["UseROI"]:
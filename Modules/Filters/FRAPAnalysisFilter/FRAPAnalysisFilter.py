@@ -25,6 +25,8 @@ __date__ = "$Date$"
 
 import lib.ProcessingFilter
 import lib.FilterTypes
+import lib.ImageOperations
+import lib.LabelStatistics
 import scripting
 import GUI.GUIBuilder
 import wx
@@ -43,6 +45,7 @@ class FRAPAnalysisFilter(lib.ProcessingFilter.ProcessingFilter):
 	name = "FRAP analysis"
 	category = lib.FilterTypes.VOXELANALYSE
 	level = scripting.COLOR_EXPERIENCED
+	sequentialOnly = True
 	
 	def __init__(self):
 		"""
@@ -187,38 +190,55 @@ class FRAPAnalysisFilter(lib.ProcessingFilter.ProcessingFilter):
 		radius = 0.0
 		timeStamps = self.dataUnit.getSettings().get("TimeStamps")
 		numPixels = 0
-		for tp in range(timePoints):
-			image = self.dataUnit.getSourceDataUnits()[0].getTimepoint(tp)
-			itkImage = self.convertVTKtoITK(image)
-
-			maskValue = 255
-			if self.parameters["SecondInput"]:
-				itkMask = self.convertVTKtoITK(mask)
-				minValue, maskValue = mask.GetScalarRange()
-			else:
-				n, mask = lib.ImageOperations.getMaskFromROIs([roi], dx, dy, dz)
-				itkMask = self.convertVTKtoITK(mask)
-				minValue, maskValue = mask.GetScalarRange()
-
-			maskValue = int(maskValue)
-			labelStats = itk.LabelStatisticsImageFilter[itkImage, itkMask].New()
-			labelStats.SetInput(0, itkImage)
-			labelStats.SetLabelInput(itkMask)
-			labelStats.Update()
-
-			numPixels = labelStats.GetCount(maskValue)
-			totInt = labelStats.GetSum(maskValue)
-			maxInt = labelStats.GetMaximum(maskValue)
-			minInt = labelStats.GetMinimum(maskValue)
-			meanInt = labelStats.GetMean(maskValue)
-			sigma = labelStats.GetSigma(maskValue)
-			self.timePointMeasurements.append({"TotInt": totInt,
-											   "MaxInt": maxInt,
-											   "MinInt": minInt,
-											   "MeanInt": meanInt,
-											   "Sigma": sigma})
-			if radius <= 0.0:
-				radius = math.sqrt(numPixels / math.pi)
+		self.timePointMeasurements = []
+		dataUnit = self.dataUnit.getSourceDataUnits()[0]
+		if lib.LabelStatistics.numpy and not self.parameters["SecondInput"] \
+				and lib.LabelStatistics.hasSingleComponent(dataUnit):
+			# The ROI is rasterized once and every timepoint is read in one pass
+			labels = lib.LabelStatistics.getROILabels([roi], dx, dy)[0][0]
+			index = lib.LabelStatistics.LabelIndex(labels)
+			for labelStats in lib.LabelStatistics.imapTimepointStatistics(dataUnit, index, range(timePoints)):
+				numPixels = labelStats.getCount(1)
+				self.timePointMeasurements.append({"TotInt": labelStats.getSum(1),
+												   "MaxInt": labelStats.getMaximum(1),
+												   "MinInt": labelStats.getMinimum(1),
+												   "MeanInt": labelStats.getMean(1),
+												   "Sigma": labelStats.getSigma(1)})
+				if radius <= 0.0:
+					radius = math.sqrt(numPixels / math.pi)
+		else:
+			for tp in range(timePoints):
+				image = dataUnit.getTimepoint(tp)
+				itkImage = self.convertVTKtoITK(image)
+
+				maskValue = 255
+				if self.parameters["SecondInput"]:
+					itkMask = self.convertVTKtoITK(roi)
+					minValue, maskValue = roi.GetScalarRange()
+				else:
+					n, mask = lib.ImageOperations.getMaskFromROIs([roi], dx, dy, dz)
+					itkMask = self.convertVTKtoITK(mask)
+					minValue, maskValue = mask.GetScalarRange()
+
+				maskValue = int(maskValue)
+				labelStats = itk.LabelStatisticsImageFilter[itkImage, itkMask].New()
+				labelStats.SetInput(0, itkImage)
+				labelStats.SetLabelInput(itkMask)
+				labelStats.Update()
+
+				numPixels = labelStats.GetCount(maskValue)
+				totInt = labelStats.GetSum(maskValue)
+				maxInt = labelStats.GetMaximum(maskValue)
+				minInt = labelStats.GetMinimum(maskValue)
+				meanInt = labelStats.GetMean(maskValue)
+				sigma = labelStats.GetSigma(maskValue)
+				self.timePointMeasurements.append({"TotInt": totInt,
+												   "MaxInt": maxInt,
+												   "MinInt": minInt,
+												   "MeanInt": meanInt,
+												   "Sigma": sigma})
+				if radius <= 0.0:
+					radius = math.sqrt(numPixels / math.pi)
 
 		if self.timePointGUI:
 			self.timePointGUI.setStats(self.timePointMeasurements)
@@ -25,6 +25,7 @@ __date__ = "$Date: 2005/01/13 14:52:39 $"
 
 import lib.ProcessingFilter
 import lib.ImageOperations
+import lib.ROIMask
 import scripting
 import vtk
 import GUI.GUIBuilder
@@ -101,6 +102,12 @@ class MaskROIFilter(lib.ProcessingFilter.ProcessingFilter):
 		else:
 			maxx, maxy, maxz = self.dataUnit.getDimensions()
 			roi = self.parameters["ROI"][1]
+			if lib.ROIMask.numpy:
+				# The mask of the ROI is applied to every slice without
+				# building a mask volume
+				mask = lib.ROIMask.getShapeMask(roi, maxx, maxy)
+				scripting.wantWholeDataset = 1
+				return lib.ROIMask.applyMask(self.getInput(1), mask, self.parameters["OutputValue"])
 			n, maskImage = lib.ImageOperations.getMaskFromROIs([roi], maxx, maxy, maxz)
 
 		scripting.wantWholeDataset=1
@@ -39,13 +39,194 @@ import lib.ParticleReader
 import lib.Particle
 import lib.ParticleWriter
 import lib.Math
+import lib.messenger
+import lib.ProcessPool
 import lib.Progress
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 DIST_UNIFORM = 0
 DIST_NORM = 1
 DIST_POSNORM = 2
 DIST_NEGNORM = 3
 
+# The filter whose timepoints are rendered by the worker processes. The
+# workers are forked, so they inherit it together with its time series.
+renderContext = {}
+
+def renderTimepoint(timepoint):
+	"""
+	Render a timepoint of the filter in renderContext. This is run in the
+	worker processes.
+	"""
+	return renderContext["filter"].renderTimepoint(timepoint)
+
+def getObjectBounds(x0, y0, z0, size, dims):
+	"""
+	Return the radius, the center and the bounding box (xs, xe, ys, ye, zs, ze)
+	of the spherical core of an object of size voxels. The box is moved
+	inside the image of the given dimensions, and the center with it.
+	"""
+	origr = math.pow(size*0.23561944901923448, 0.333333)
+	maxx, maxy, maxz = [n - 1 for n in dims]
+	minx, miny, minz = 0, 0, 0
+
+	xsInt = int(math.ceil(x0-origr))
+	ysInt = int(math.ceil(y0-origr))
+	zsInt = int(math.ceil(z0-origr))
+	xeInt = int(math.floor(x0+origr))
+	yeInt = int(math.floor(y0+origr))
+	zeInt = int(math.floor(z0+origr))
+
+	# Be sure that whole object is inside image range
+	if xsInt < minx:
+		xeInt += (minx - xsInt)
+		xsInt = 0
+		x0 = (xeInt + xsInt) / 2.0
+	if ysInt < miny:
+		yeInt += (miny - ysInt)
+		ysInt = 0
+		y0 = (yeInt + ysInt) / 2.0
+	if zsInt < minz:
+		zeInt += (minz - zsInt)
+		zsInt = 0
+		z0 = (zeInt + zsInt) / 2.0
+	if xeInt > maxx:
+		xsInt -= (xeInt - maxx)
+		xeInt = maxx
+		x0 = (xeInt + xsInt) / 2.0
+	if yeInt > maxy:
+		ysInt -= (yeInt - maxy)
+		yeInt = maxy
+		y0 = (yeInt + ysInt) / 2.0
+	if zeInt > maxz:
+		zsInt -= (zeInt - maxz)
+		zeInt = maxz
+		z0 = (zeInt + zsInt) / 2.0
+
+	# Create only core and randomize other voxels
+	coreSize = (xeInt-xsInt)*(yeInt-ysInt)*(zeInt-zsInt)
+	if coreSize > size:
+		xeInt -= 1
+		xsInt += 1
+		yeInt -= 1
+		ysInt += 1
+		zeInt -= 1
+		zsInt += 1
+
+	# Objects larger than the image are cut at its borders
+	bounds = (max(xsInt, minx), xeInt, max(ysInt, miny), yeInt, max(zsInt, minz), zeInt)
+	return origr, (x0, y0, z0), bounds
+
+def getIntensityRange(objInt):
+	"""
+	Return the range of voxel intensities of an object, which is -5% to +5%
+	of the intensity of the object
+	"""
+	minInt = int(round(0.95 * objInt))
+	if minInt < 0: minInt = 0
+	if minInt > 255: minInt = 255
+	maxInt = int(round(1.05 * objInt))
+	if maxInt < 0: maxInt = 20
+	if maxInt > 255: maxInt = 255
+	return minInt, maxInt
+
+def getNearestVoxel(x0, y0, z0, dims):
+	"""
+	Return the voxel of the image nearest to the given point
+	"""
+	return tuple([min(max(int(round(c)), 0), n - 1) for c, n in zip((x0, y0, z0), dims)])
+
+def growObject(voxels, count, dims, randomIndex):
+	"""
+	Grow an object by count voxels. Every new voxel is picked at random from
+	the voxels of the image that are 6-connected to the object, which are
+	kept in a frontier that is updated as the object grows.
+	@param voxels the (x, y, z) voxels of the object
+	@param dims the dimensions of the image
+	@param randomIndex a function that returns a random integer 0 <= i < n
+	@return the list of added voxels
+	"""
+	maxx, maxy, maxz = dims
+	inside = set(voxels)
+	frontier = []
+	positions = {}
+	added = []
+	current = list(voxels)
+	while 1:
+		for (x, y, z) in current:
+			for voxel in ((x-1,y,z), (x+1,y,z), (x,y-1,z), (x,y+1,z), (x,y,z-1), (x,y,z+1)):
+				if voxel in inside or voxel in positions:
+					continue
+				if 0 <= voxel[0] < maxx and 0 <= voxel[1] < maxy and 0 <= voxel[2] < maxz:
+					positions[voxel] = len(frontier)
+					frontier.append(voxel)
+		if len(added) >= count or not frontier:
+			return added
+		# Remove a random voxel from the frontier by moving the last one in its place
+		i = int(randomIndex(len(frontier)))
+		voxel = frontier[i]
+		last = frontier.pop()
+		if i < len(frontier):
+			frontier[i] = last
+			positions[last] = i
+		del positions[voxel]
+		inside.add(voxel)
+		added.append(voxel)
+		current = [voxel]
+
+def stampObject(volume, x0, y0, z0, size, objInt, randomState):
+	"""
+	Create an object in a volume indexed by [z, y, x] at the given position.
+	The spherical core of the object is stamped at once and the object is
+	then grown at random to its size.
+	@param x0, y0, z0 the coordinates of the object
+	@param size the size of the object in pixels
+	@param randomState the numpy.random.RandomState of the timepoint
+	@return the center of mass, the intensities and the (x, y, z) voxels
+	"""
+	dims = volume.shape[::-1]
+	origr, (x0, y0, z0), (xs, xe, ys, ye, zs, ze) = getObjectBounds(x0, y0, z0, size, dims)
+	z, y, x = numpy.mgrid[zs:ze+1, ys:ye+1, xs:xe+1]
+	# Do not use spacing to get real looking objects
+	core = (x0-x)**2 + (y0-y)**2 + (z0-z)**2 <= origr*origr
+	voxels = numpy.column_stack((x[core], y[core], z[core]))
+	if not len(voxels):
+		voxels = numpy.array([getNearestVoxel(x0, y0, z0, dims)])
+	if len(voxels) < size:
+		added = growObject(map(tuple, voxels.tolist()), size - len(voxels), dims, randomState.randint)
+		if added:
+			voxels = numpy.vstack((voxels, added))
+
+	minInt, maxInt = getIntensityRange(objInt)
+	intensities = randomState.randint(minInt, maxInt + 1, len(voxels))
+	volume[voxels[:, 2], voxels[:, 1], voxels[:, 0]] = intensities
+	totalInt = float(intensities.sum())
+	if totalInt:
+		com = (voxels * intensities[:, numpy.newaxis]).sum(axis = 0) / totalInt
+	else:
+		com = voxels.mean(axis = 0)
+	return tuple(map(float, com)), intensities, voxels
+
+def generateDistributionValues(distr, minValue, maxValue, count, randomState):
+	"""
+	Generate count values for specified distribution inside specified range,
+	like ParticleSimulationFilter.generateDistributionValue
+	"""
+	mu = (maxValue + minValue) / 2.0
+	sigma = (maxValue - mu) / 3.0
+	if distr == DIST_UNIFORM:
+		return randomState.randint(minValue, maxValue + 1, count)
+	if distr == DIST_NORM:
+		values = randomState.normal(mu, sigma, count)
+	elif distr == DIST_POSNORM:
+		values = numpy.round(numpy.abs(randomState.normal(0.0, 2*sigma, count)) + minValue)
+	elif distr == DIST_NEGNORM:
+		values = numpy.round(maxValue - numpy.abs(randomState.normal(0.0, 2*sigma, count)))
+	return numpy.clip(values, minValue, maxValue)
+
 class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 	"""
 	A filter for generating Particle simulation data
@@ -53,6 +234,7 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 	name = "4D particle simulation"
 	category = lib.FilterTypes.SIMULATION
 	level = scripting.COLOR_EXPERIENCED
+	sequentialOnly = True
 
 	def __init__(self):
 		"""
@@ -60,6 +242,7 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 		"""
 		lib.ProcessingFilter.ProcessingFilter.__init__(self, (1, 1))
 		self.objects = []
+		self.objectLayouts = []
 		self.readObjects = []
 		self.polydata = None
 		self.objPolydata = []
@@ -69,6 +252,8 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 		self.voxelSize = (1.0, 1.0, 1.0)
 		self.cellCOM = None
 		self.modified = 1
+		self.random = random.Random()
+		self.seed = 0
 		self.progressObj = lib.Progress.Progress()
 		self.descs = {"X":"X:", "Y":"Y:", "Z":"Z:","Time":"Number of timepoints",
 		"Coloc":"Create colocalization between channels", 
@@ -112,7 +297,8 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 		"ObjectsCreateSource":"Create objects close to surface from source",
 		"SigmaDistSurface":"Sigma of Gaussian distance to surface (in x,y px size)",
 		"TimeDifference":"Time difference between time points",
-		"TargetPointsInside":"Target points inside radius (in x,y px size)"}
+		"TargetPointsInside":"Target points inside radius (in x,y px size)",
+		"Seed":"Random seed (0 for a new seed every time)"}
 
 		self.filterDesc = "Generate 4D particle simulation data. In addition to image data, produces also ground truth object and track statistics.\nInput: None (optional cell surface)\nOutput: Grayscale image"
 	
@@ -126,6 +312,7 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 			#["Colocalization",("Coloc","ColocAmountStart","ColocAmountEnd")],
 			["Movement strategy",("RandomMovement","MoveTowardsPoint","TargetPoints","TargetPointsInside","MovePercentage","SpeedStart","SpeedEnd")],
 			["Clustering",("Clustering","ClusterPercentage","ClusterDistance")],
+			["Random numbers",("Seed",)],
 		]
 		
 	def setParameter(self, parameter, value):
@@ -234,7 +421,14 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 		"""
 		self.modified = 0
 		x,y,z = self.parameters["X"],self.parameters["Y"], self.parameters["Z"]
-		self.majorAxis = random.randint(int(0.55*y), int(0.85*y))
+		# Every timepoint is rendered with random numbers of its own that are
+		# derived from the seed, so a seed gives the same data however the
+		# timepoints are created
+		self.seed = self.parameters["Seed"]
+		if not self.seed:
+			self.seed = random.randint(1, 2**31 - 1)
+		self.random.seed(self.seed)
+		self.majorAxis = self.random.randint(int(0.55*y), int(0.85*y))
 		
 		for image in self.imageCache.values():
 			image.ReleaseData()
@@ -320,6 +514,8 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 					self.tracks[objN-1].append(p)
 
 
+		self.objectLayouts = [list(objs) for objs in self.objects]
+
 		if self.parameters["ObjectsCreateSource"]:
 			for tp, objs in enumerate(self.objects):
 				self.objPolydata.append([])
@@ -348,7 +544,7 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 					if (tp,objN1) in clustered or (tp,objN2) in clustered: continue
 					d = math.sqrt(((x2-x1) * self.spacing[0])**2 + ((y2-y1) * self.spacing[1])**2 + ((z2-z1) * self.spacing[2])**2)
 					if d < self.parameters["ClusterDistance"]:
-						if random.random()*100 < self.parameters["ClusterPercentage"]:
+						if self.random.random()*100 < self.parameters["ClusterPercentage"]:
 							# Mark as combined in this and coming time points
 							#for combTP in range(tp,len(objects)):
 							#	combine.append((combTP,objN,i,objN2,j))
@@ -441,11 +637,11 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 		"""
 		Create fluctuations in the number of objects
 		"""
-		removeN = random.randint(self.parameters["ObjectFluctuationStart"],self.parameters["ObjectFluctuationEnd"])
-		addN = random.randint(self.parameters["ObjectFluctuationStart"],self.parameters["ObjectFluctuationEnd"])
+		removeN = self.random.randint(self.parameters["ObjectFluctuationStart"],self.parameters["ObjectFluctuationEnd"])
+		addN = self.random.randint(self.parameters["ObjectFluctuationStart"],self.parameters["ObjectFluctuationEnd"])
 		
 		for i in range(0, removeN):
-			obj = random.choice(objects)
+			obj = self.random.choice(objects)
 			objects.remove(obj)
 		print "Removed",removeN,"objects"
 		for i in range(0, addN):
@@ -475,14 +671,14 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 			if self.readObjects:
 				self.numberOfObjects = len(self.readObjects)
 			else:
-				self.numberOfObjects = random.randint(self.parameters["NumberOfObjectsStart"],self.parameters["NumberOfObjectsEnd"])
+				self.numberOfObjects = self.random.randint(self.parameters["NumberOfObjectsStart"],self.parameters["NumberOfObjectsEnd"])
 			
 			for obj in range(1, self.numberOfObjects+1):
 				self.createObject(obj,objs)
 		else:
 			for objN, objCom, size, objInt in self.objects[tp-1]:
 				rx,ry,rz = objCom
-				if self.parameters["MoveTowardsPoint"] and random.random() < self.parameters["MovePercentage"] / 100.0:
+				if self.parameters["MoveTowardsPoint"] and self.random.random() < self.parameters["MovePercentage"] / 100.0:
 					nearest = None
 					smallest = 2**31
 					for (x,y,z) in self.towardsPoints:
@@ -497,7 +693,7 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 						length += direction[i]*direction[i]
 					length = math.sqrt(length)
 					direction = [i / length for i in direction]
-					speed = random.randint(self.parameters["SpeedStart"], self.parameters["SpeedEnd"])
+					speed = self.random.randint(self.parameters["SpeedStart"], self.parameters["SpeedEnd"])
 					speedx = direction[0] * speed
 					speedy = direction[1] * speed
 					speedz = direction[2] * speed * coeff
@@ -516,15 +712,15 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 					#speedy = random.choice([-1,1])*random.randint(self.parameters["SpeedStart"], self.parameters["SpeedEnd"])
 					#speedz = random.choice([-1,1])*coeff*random.randint(self.parameters["SpeedStart"], self.parameters["SpeedEnd"])
 					direction = []
-					direction.append(random.choice([-1,1]) * random.random())
-					direction.append(random.choice([-1,1]) * random.random())
-					direction.append(random.choice([-1,1]) * coeff * random.random())
+					direction.append(self.random.choice([-1,1]) * self.random.random())
+					direction.append(self.random.choice([-1,1]) * self.random.random())
+					direction.append(self.random.choice([-1,1]) * coeff * self.random.random())
 					length = 0.0
 					for i in range(3):
 						length += direction[i]*direction[i]
 					length = math.sqrt(length)
 					direction = [i / length for i in direction]
-					speed = random.randint(self.parameters["SpeedStart"], self.parameters["SpeedEnd"])
+					speed = self.random.randint(self.parameters["SpeedStart"], self.parameters["SpeedEnd"])
 					speedx = direction[0] * speed
 					speedy = direction[1] * speed
 					speedz = direction[2] * speed
@@ -536,8 +732,8 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 				if ry < 0: ry = 0
 				if rz < 0: rz = 0
 				if rx > self.parameters["X"] - 1: rx = self.parameters["X"] - 1
-				if ry > self.parameters["Y"] - 1: rx = self.parameters["Y"] - 1
-				if rz > self.parameters["Z"] - 1: rx = self.parameters["Z"] - 1
+				if ry > self.parameters["Y"] - 1: ry = self.parameters["Y"] - 1
+				if rz > self.parameters["Z"] - 1: rz = self.parameters["Z"] - 1
 				
 				if self.parameters["SizeChange"]:
 					negative = 1.0
@@ -545,7 +741,7 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 
 					if maxchange < 0:
 						negative = -1
-					change = random.randint(0, maxchange)
+					change = self.random.randint(0, maxchange)
 					change *= negative
 					size += change
 
@@ -554,7 +750,7 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 					maxchange = int(round(objInt*(self.parameters["IntChange"]/100.0)))
 					if maxchange < 0:
 						negative = -1
-					change = random.randint(0, maxchange)
+					change = self.random.randint(0, maxchange)
 					change *= negative
 					objInt += change
 
@@ -577,14 +773,14 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 			rx, ry, rz = self.getPointInsideCell()
 
 		# Select intensity for object, voxel intensity will be -5% to +5%
-		objInt = random.randint(self.parameters["ObjMinInt"],self.parameters["ObjMaxInt"])
+		objInt = self.random.randint(self.parameters["ObjMinInt"],self.parameters["ObjMaxInt"])
 		objs.append((objNum, (rx,ry,rz), size, objInt))
 		
 	def getPointInsideCell(self):
 		x,y,z = self.parameters["X"],self.parameters["Y"], self.parameters["Z"]
 		while 1:
 			# Set couple pixel buffer
-			rx,ry,rz = random.randint(6,x-7), random.randint(6,y-7), random.randint(6,z-7)
+			rx,ry,rz = self.random.randint(6,x-7), self.random.randint(6,y-7), self.random.randint(6,z-7)
 			if self.pointInsideEllipse((rx,ry,rz), self.majorAxis):
 				break
 		return rx,ry,rz
@@ -593,17 +789,13 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 		"""
 		Create a test dataset within the parameters defined
 		"""
-		x,y,z = self.parameters["X"], self.parameters["Y"], self.parameters["Z"]
 		if self.modified:
 			print "Creating the time series data"
 			self.createTimeSeries()
 			if self.parameters["CreateAll"]:
 				n = min(self.parameters["CacheAmount"], self.parameters["Time"])
-				for i in range(0, n):
-					if i == currentTimepoint: 
-						print "Won't create timepoint %d, it'll be last"%i
-						continue
-					self.createData(i)
+				timepoints = [i for i in range(0, n) if i != currentTimepoint]
+				self.createTimepoints(timepoints + [currentTimepoint])
 
 		print "\n\nGenerating timepoint %d"%currentTimepoint
 		
@@ -611,10 +803,100 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 			print "Returning cached image"
 			return self.imageCache[currentTimepoint]
 
+		# Render the next timepoints together with this one, so that the
+		# worker processes have something to do
+		timepoints = [currentTimepoint]
+		if numpy:
+			n = min(lib.ProcessPool.getNumberOfWorkers(), self.parameters["CacheAmount"])
+			for tp in range(currentTimepoint + 1, self.parameters["Time"]):
+				if len(timepoints) >= n:
+					break
+				if tp not in self.imageCache:
+					timepoints.append(tp)
+		self.createTimepoints(timepoints)
+		return self.imageCache[currentTimepoint]
+
+	def createTimepoints(self, timepoints):
+		"""
+		Create the images of the given timepoints and add them to the cache.
+		With NumPy, the timepoints are rendered in a pool of worker processes
+		when more than one process is configured.
+		"""
+		if not numpy:
+			for timepoint in timepoints:
+				image, objects = self.createImageData(timepoint)
+				self.addTimepoint(timepoint, image, objects, timepoints)
+			return
+
+		renderContext["filter"] = self
+		try:
+			results = lib.ProcessPool.imapOrdered(renderTimepoint, timepoints, initializer = lib.ProcessPool.initializeWorker)
+			for i, (volume, objects) in enumerate(results):
+				self.addTimepoint(timepoints[i], self.getImageData(volume), objects, timepoints)
+		finally:
+			renderContext.clear()
+
+	def renderTimepoint(self, timepoint):
+		"""
+		Render the objects of a timepoint to a volume indexed by [z, y, x].
+		Returns the volume and the objects with their real center of mass,
+		size and mean intensity. The filter is not modified, so that this can
+		be run in a worker process.
+		"""
+		x, y, z = self.parameters["X"], self.parameters["Y"], self.parameters["Z"]
+		randomState = numpy.random.RandomState([self.seed, timepoint])
+		if self.parameters["CreateNoise"]:
+			print "Creating background noise"
+			volume = randomState.randint(self.parameters["BackgroundNoiseMin"], \
+											self.parameters["BackgroundNoiseMax"] + 1, (z, y, x))
+			volume = numpy.clip(volume, 0, 255).astype(numpy.uint8)
+
+			print "Creating shot noise"
+			noiseAmount = int(math.ceil((self.parameters["ShotNoiseAmount"] / 100.0) * (x*y*z)))
+			positions = randomState.randint(0, volume.size, noiseAmount)
+			volume.flat[positions] = generateDistributionValues(self.parameters["ShotNoiseDistribution"], \
+											self.parameters["ShotNoiseMin"], self.parameters["ShotNoiseMax"], \
+											noiseAmount, randomState)
+		else:
+			volume = numpy.zeros((z, y, x), numpy.uint8)
+
+		print "Creating objects",timepoint
+		objects = []
+		for objN, (rx,ry,rz), size, objInt in self.objectLayouts[timepoint]:
+			com, intensities, voxels = stampObject(volume, rx, ry, rz, size, objInt, randomState)
+			objMean = float(intensities.mean())
+			objStdErr = float(intensities.std()) / math.sqrt(len(intensities))
+			objects.append((objN, com, len(voxels), (objMean, objStdErr), voxels))
+		return volume, objects
+
+	def getImageData(self, volume):
+		"""
+		Return a volume indexed by [z, y, x] as vtkImageData
+		"""
+		z, y, x = volume.shape
+		data = volume.tostring()
+		importer = vtk.vtkImageImport()
+		importer.CopyImportVoidPointer(data, len(data))
+		importer.SetDataScalarTypeToUnsignedChar()
+		importer.SetNumberOfScalarComponents(1)
+		importer.SetDataExtent(0, x - 1, 0, y - 1, 0, z - 1)
+		importer.SetWholeExtent(0, x - 1, 0, y - 1, 0, z - 1)
+		importer.SetDataSpacing(self.spacing)
+		importer.Update()
+		return importer.GetOutput()
+
+	def createImageData(self, timepoint):
+		"""
+		Create the image of a timepoint without NumPy. Returns the image and
+		the objects like renderTimepoint.
+		"""
+		x,y,z = self.parameters["X"], self.parameters["Y"], self.parameters["Z"]
+		rand = random.Random(self.seed * 65536 + timepoint)
 		print "Allocating image"
 
 		if self.parameters["CreateNoise"]:
 			print "Creating background noise"
+			vtk.vtkMath.RandomSeed(self.seed * 65536 + timepoint)
 			noiseSource = vtk.vtkImageNoiseSource()
 			noiseSource.SetWholeExtent(0,x-1,0,y-1,0,z-1)
 			noiseSource.SetMinimum(self.parameters["BackgroundNoiseMin"])
@@ -630,16 +912,10 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 		else:
 			image = vtk.vtkImageData()
 			image.SetScalarTypeToUnsignedChar()
-			x,y,z = self.parameters["X"], self.parameters["Y"], self.parameters["Z"]
 			image.SetDimensions((x,y,z))
 			image.AllocateScalars()
 			image.SetSpacing(self.spacing)
-			
-			print "Initializing image"
-			for iz in range(0,z):
-				for iy in range(0,y):
-					for ix in range(0,x):
-						image.SetScalarComponentFromDouble(ix,iy,iz,0,0)
+			image.GetPointData().GetScalars().FillComponent(0, 0)
 
 		if self.parameters["CreateNoise"]:
 			noisePercentage = self.parameters["ShotNoiseAmount"]
@@ -653,23 +929,27 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 		shotNoiseDistr = self.parameters["ShotNoiseDistribution"]
 
 		while noiseAmount > 0:
-			rx,ry,rz = random.randint(0,x-1), random.randint(0,y-1), random.randint(0,z-1)
-			shotInt = self.generateDistributionValue(shotNoiseDistr, shotNoiseMin, shotNoiseMax)				
+			rx,ry,rz = rand.randint(0,x-1), rand.randint(0,y-1), rand.randint(0,z-1)
+			shotInt = self.generateDistributionValue(shotNoiseDistr, shotNoiseMin, shotNoiseMax, rand)
 			image.SetScalarComponentFromDouble(rx,ry,rz,0,shotInt)
 			noiseAmount -= 1
 
-		#shiftx, shifty, shiftz = self.shifts[currentTimepoint]
-		
-		print "Creating objects",currentTimepoint
-		for oIter, (objN, (rx,ry,rz), size, objInt) in enumerate(self.objects[currentTimepoint]):
-			#rx += shiftx
-			#ry += shifty
-			#rz += shiftz
-
-			(rx,ry,rz), realSize, intList, voxelList = self.createObjectAt(image, rx,ry,rz, size, objInt)
+		print "Creating objects",timepoint
+		objects = []
+		for objN, (rx,ry,rz), size, objInt in self.objectLayouts[timepoint]:
+			(rx,ry,rz), realSize, intList, voxelList = self.createObjectAt(image, rx,ry,rz, size, objInt, rand)
 			objMean, objStd, objStdErr = lib.Math.meanstdeverr(intList)
-			# Change possible new size and com to object
-			self.objects[currentTimepoint][oIter] = (objN, (rx,ry,rz), realSize, (objMean, objStdErr), voxelList)
+			objects.append((objN, (rx,ry,rz), realSize, (objMean, objStdErr), voxelList))
+		return image, objects
+
+	def addTimepoint(self, currentTimepoint, image, objects, keep):
+		"""
+		Add the image of a timepoint to the cache and store the real
+		properties of its objects. The timepoints in keep are not removed
+		from the cache to make room.
+		"""
+		# Change possible new size and com to object
+		self.objects[currentTimepoint] = objects
 
 		if self.parameters["ObjectsCreateSource"]:
 			locator = vtk.vtkOBBTree()
@@ -711,20 +991,17 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 				objPolyTP.append((objN, (cx,cy,cz), distToSurf, distToCom, inside, percVoxelsInside))
 			self.objPolydata[currentTimepoint] = objPolyTP
 		
-		n = len(self.imageCache.items())
-		if n > self.parameters["CacheAmount"]:
-			items = self.imageCache.keys()
-			items.sort()
+		items = [tp for tp in sorted(self.imageCache.keys()) if tp not in keep]
+		if len(self.imageCache) > self.parameters["CacheAmount"] and items:
 			print "Removing ", items[0], "from cache"
 			self.imageCache[items[0]].ReleaseData()
 			del self.imageCache[items[0]]
 		self.imageCache[currentTimepoint] = image
 
-		self.progressObj.setProgress(currentTimepoint/self.parameters["Time"])
+		self.progressObj.setProgress(float(currentTimepoint) / self.parameters["Time"])
 		self.updateProgress(None, "ProgressEvent")
-
-		return image
 		
+
 	def pointInsideEllipse(self, pt, majorAxis, f1 = None, f2 = None):
 		"""
 		@param pt Point to be tested
@@ -752,93 +1029,16 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 		d1 = math.sqrt(p1[0]*p1[0]+p1[1]*p1[1])+math.sqrt(p2[0]*p2[0]+p2[1]*p2[1])
 		return d1 < majorAxis
 		
-	def createObjectAt(self, imageData, x0, y0, z0, size, objInt):
+	def createObjectAt(self, imageData, x0, y0, z0, size, objInt, rand):
 		"""
-		Create an object in the image at the give position
+		Create an object in the image at the give position without NumPy
 		@param imageData the image to modify
 		@param x0, y0, z0 the coordinates of the object
 		@param size the size of the object in pixels
+		@param rand the random number generator of the timepoint
 		"""
-		origr = math.pow(size*0.23561944901923448, 0.333333)
-		#r = int(1+math.sqrt(size/math.pi))
-		#r = int(round(origr))
-		#if r < 1:
-		#	r = 1
-		maxx,maxy,maxz = imageData.GetDimensions()
-		minx,miny,minz = [0 for i in range(3)]
-		maxx -= 1
-		maxy -= 1
-		maxz -= 1
-
-		xs = x0-origr
-		ys = y0-origr
-		zs = z0-origr
-		xe = x0+origr
-		ye = y0+origr
-		ze = z0+origr
-		xsInt = int(math.ceil(xs))
-		ysInt = int(math.ceil(ys))
-		zsInt = int(math.ceil(zs))
-		xeInt = int(math.floor(xe))
-		yeInt = int(math.floor(ye))
-		zeInt = int(math.floor(ze))
-
-		# Be sure that whole object is inside image range
-		if xsInt < minx:
-			xeInt += (minx - xsInt)
-			xsInt = 0
-			x0 = (xeInt + xsInt) / 2.0
-		if ysInt < miny:
-			yeInt += (miny - ysInt)
-			ysInt = 0
-			y0 = (yeInt + ysInt) / 2.0
-		if zsInt < minz:
-			zeInt += (minz - zsInt)
-			zsInt = 0
-			z0 = (zeInt + zsInt) / 2.0
-		if xeInt > maxx:
-			xsInt -= (xeInt - maxx)
-			xeInt = maxx
-			x0 = (xeInt + xsInt) / 2.0
-		if yeInt > maxy:
-			ysInt -= (yeInt - maxy)
-			yeInt = maxy
-			y0 = (yeInt + ysInt) / 2.0
-		if zeInt > maxz:
-			zsInt -= (zeInt - maxz)
-			zeInt = maxz
-			z0 = (zeInt + zsInt) / 2.0
-
-		# Create only core and randomize other voxels
-		coreSize = (xeInt-xsInt)*(yeInt-ysInt)*(zeInt-zsInt)
-		if coreSize > size:
-			xeInt -= 1
-			xsInt += 1
-			yeInt -= 1
-			ysInt += 1
-			zeInt -= 1
-			zsInt += 1
-
-		# Calculate approximation of area of object to be created
-		#a = ((xe-xs)/2.0) * self.voxelSize[0] * 1000000 # convert to um
-		#b = ((ye-ys)/2.0) * self.voxelSize[1] * 1000000 # convert to um
-		#c = ((ze-zs)/2.0) * self.voxelSize[2] * 1000000 # convert to um
-		#ap = a**1.6
-		#bp = b**1.6
-		#cp = c**1.6
-		#area = 4*math.pi*((ap*bp + ap*cp + bp*cp)/3)**(1/1.6)
-		
-		count = 0
-		intList = []
-		totalInt = 0.0
-		coms = [0.0, 0.0, 0.0]
-		# Select intensity for object, voxel intensity will be -5% to +5%
-		minInt = int(round(0.95 * objInt))
-		if minInt < 0: minInt = 0
-		if minInt > 255: minInt = 255
-		maxInt = int(round(1.05 * objInt))
-		if maxInt < 0: maxInt = 20
-		if maxInt > 255: maxInt = 255
+		dims = imageData.GetDimensions()
+		origr, (x0, y0, z0), (xsInt, xeInt, ysInt, yeInt, zsInt, zeInt) = getObjectBounds(x0, y0, z0, size, dims)
 
 		voxelList = []
 		for x in range(xsInt,xeInt+1):
@@ -847,43 +1047,35 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 					# Do not use spacing to get real looking objects
 					d = math.sqrt((x0-x)**2 + (y0-y)**2 + (z0-z)**2)
 					if d <= origr:
-						voxelInt = random.randint(minInt,maxInt)
-						imageData.SetScalarComponentFromDouble(x,y,z,0,voxelInt)
-						count += 1
-						intList.append(voxelInt)
-						totalInt += voxelInt
-						coms[0] += voxelInt * x
-						coms[1] += voxelInt * y
-						coms[2] += voxelInt * z
 						voxelList.append((x,y,z))
+		if not voxelList:
+			voxelList.append(getNearestVoxel(x0, y0, z0, dims))
+		if len(voxelList) < size: # Mark some random pixels
+			voxelList.extend(growObject(voxelList, size - len(voxelList), dims, rand.randrange))
 
-		if count < size: # Mark some random pixels
-			maxTry = 100
-			while count < size and maxTry > 0:
-				maxTry -= 1
-				xRand = random.choice(range(xsInt-1,xeInt+2))
-				yRand = random.choice(range(ysInt-1,yeInt+2))
-				zRand = random.choice(range(zsInt-1,zsInt+2))
-				if (xRand,yRand,zRand) not in voxelList and xRand >= 0 and xRand <= maxx and yRand >= 0 and yRand <= maxy and zRand >= 0 and zRand <= maxz and ((xRand-1,yRand,zRand) in voxelList or (xRand+1,yRand,zRand) in voxelList or (xRand,yRand-1,zRand) in voxelList or (xRand,yRand+1,zRand) in voxelList or (xRand,yRand,zRand-1) in voxelList or (xRand,yRand,zRand+1) in voxelList):
-					voxelInt = random.randint(minInt,maxInt)
-					imageData.SetScalarComponentFromDouble(xRand,yRand,zRand,0,voxelInt)
-					count += 1
-					intList.append(voxelInt)
-					totalInt += voxelInt
-					coms[0] += voxelInt * xRand
-					coms[1] += voxelInt * yRand
-					coms[2] += voxelInt * zRand
-					voxelList.append((xRand,yRand,zRand))
-
-		x0, y0, z0 = [coms[i] / (totalInt) for i in range(3)]
-		return (x0,y0,z0), count, intList, voxelList
+		intList = []
+		totalInt = 0.0
+		coms = [0.0, 0.0, 0.0]
+		minInt, maxInt = getIntensityRange(objInt)
+		for (x,y,z) in voxelList:
+			voxelInt = rand.randint(minInt,maxInt)
+			imageData.SetScalarComponentFromDouble(x,y,z,0,voxelInt)
+			intList.append(voxelInt)
+			totalInt += voxelInt
+			coms[0] += voxelInt * x
+			coms[1] += voxelInt * y
+			coms[2] += voxelInt * z
+
+		if totalInt:
+			x0, y0, z0 = [coms[i] / totalInt for i in range(3)]
+		return (x0,y0,z0), len(voxelList), intList, voxelList
 
 	def getPointCloseToSurface(self):
 		"""
 		Select random point close to surface provided by user as parameter
 		"""
 		numOfPolys = self.polydata.GetNumberOfPolys()
-		randPolyID = random.randint(0, numOfPolys-1)
+		randPolyID = self.random.randint(0, numOfPolys-1)
 		pdata = self.polydata.GetPolys().GetData()
 		pointIDs = [int(pdata.GetTuple1(i)) for i in range(4*randPolyID+1,4*randPolyID+4)]
 		points = [self.polydata.GetPoint(i) for i in pointIDs]
@@ -897,7 +1089,7 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 			center[i] = center[i] / 3
 
 		sigma = self.parameters["SigmaDistSurface"]
-		randomCOM = [random.gauss(center[i], sigma / self.spacing[i]) for i in range(3)]
+		randomCOM = [self.random.gauss(center[i], sigma / self.spacing[i]) for i in range(3)]
 		dims = (self.parameters["X"], self.parameters["Y"], self.parameters["Z"])
 
 		for i in range(3):
@@ -1109,22 +1301,25 @@ class ParticleSimulationFilter(lib.ProcessingFilter.ProcessingFilter):
 
 		return math.sqrt(distanceX * distanceX + distanceY * distanceY + distanceZ * distanceZ)
 	
-	def generateDistributionValue(self, distr, minValue, maxValue):
+	def generateDistributionValue(self, distr, minValue, maxValue, rand = None):
 		"""
 		Generate value for specified distribution inside specified range
+		@param rand the random number generator to use instead of the one of the time series
 		"""
+		if not rand:
+			rand = self.random
 		mu = (maxValue + minValue) / 2.0
 		sigma = (maxValue - mu) / 3.0
 		if distr == DIST_UNIFORM:
-			value = random.randint(minValue,maxValue)
+			value = rand.randint(minValue,maxValue)
 		else:
 			if distr == DIST_NORM:
-				value = random.gauss(mu,sigma)
+				value = rand.gauss(mu,sigma)
 			elif distr == DIST_POSNORM:
-				value = random.gauss(0.0, 2*sigma)
+				value = rand.gauss(0.0, 2*sigma)
 				value = int(round(abs(value) + minValue))
 			elif distr == DIST_NEGNORM:
-				value = random.gauss(0.0, 2*sigma)
+				value = rand.gauss(0.0, 2*sigma)
 				if value > 0:
 					value *= -1.0
 				value = int(round(value + maxValue))
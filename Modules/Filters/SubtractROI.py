@@ -27,6 +27,7 @@ import lib.ProcessingFilter
 import itk
 import scripting
 import lib.ImageOperations
+import lib.LabelStatistics
 import GUI.GUIBuilder
 import vtk
 
@@ -82,24 +83,32 @@ class SubtractROIFilter(lib.ProcessingFilter.ProcessingFilter):
 		imagedata.SetUpdateExtent(imagedata.GetWholeExtent())
 		imagedata.Update()
 
-		itkOrig = self.convertVTKtoITK(imagedata)
-		itkOrig.DisconnectPipeline()
-
 		mx, my, mz = self.dataUnit.getDimensions()
-		n, maskImage = lib.ImageOperations.getMaskFromROIs([roi], mx, my, mz)
-		itkLabel = self.convertVTKtoITK(maskImage)
-		itkLabel = self.castITKImage(itkLabel, itkOrig)
-		#vtkToItk2 = itk.VTKImageToImageFilter.IUC3.New()
-		#vtkToItk2.SetInput(maskImage)
-		#itkLabel = vtkToItk2.GetOutput()
-		#itkLabel.Update()
+		volume = None
+		if lib.LabelStatistics.numpy:
+			volume = lib.LabelStatistics.getVolume(imagedata)
+		if volume is not None:
+			# The ROI is measured slice by slice without a mask volume
+			labels = lib.LabelStatistics.getROILabels([roi], mx, my)[0][0]
+			avgint = lib.LabelStatistics.LabelIndex(labels).getStatistics(volume).getMean(1)
+		else:
+			itkOrig = self.convertVTKtoITK(imagedata)
+			itkOrig.DisconnectPipeline()
 
-		labelStats = itk.LabelStatisticsImageFilter[itkOrig, itkLabel].New()
-		labelStats.SetInput(0, itkOrig)
-		labelStats.SetInput(1, itkLabel)
-		labelStats.Update()
-		
-		avgint = labelStats.GetMean(255)
+			n, maskImage = lib.ImageOperations.getMaskFromROIs([roi], mx, my, mz)
+			itkLabel = self.convertVTKtoITK(maskImage)
+			itkLabel = self.castITKImage(itkLabel, itkOrig)
+			#vtkToItk2 = itk.VTKImageToImageFilter.IUC3.New()
+			#vtkToItk2.SetInput(maskImage)
+			#itkLabel = vtkToItk2.GetOutput()
+			#itkLabel.Update()
+
+			labelStats = itk.LabelStatisticsImageFilter[itkOrig, itkLabel].New()
+			labelStats.SetInput(0, itkOrig)
+			labelStats.SetInput(1, itkLabel)
+			labelStats.Update()
+
+			avgint = labelStats.GetMean(255)
 		print "Subtract from image:",avgint
 
 		shift = vtk.vtkImageShiftScale()
@@ -31,6 +31,12 @@ import GUI.GUIBuilder
 import lib.FilterTypes
 import scripting
 import wx
+import os
+import csv
+import codecs
+import Logging
+import lib.LabelStatistics
+import lib.LagCorrelation
 
 class TimepointCorrelationFilter(lib.ProcessingFilter.ProcessingFilter):
 	"""
@@ -38,6 +44,7 @@ class TimepointCorrelationFilter(lib.ProcessingFilter.ProcessingFilter):
 	"""		
 	name = "Timepoint correlation"
 	category = lib.FilterTypes.VOXELANALYSE
+	sequentialOnly = True
 	
 	def __init__(self):
 		"""
@@ -46,16 +53,23 @@ class TimepointCorrelationFilter(lib.ProcessingFilter.ProcessingFilter):
 		lib.ProcessingFilter.ProcessingFilter.__init__(self, (1, 1))
 		
 		self.box = None
-		self.descs = {"Timepoint1": "First timepoint:", "Timepoint2": "Second timepoint:"}
+		self.sweep = None
+		self.sweepKey = None
+		self.descs = {"Timepoint1": "First timepoint:", "Timepoint2": "Second timepoint:",
+		"Sweep": "Correlate all timepoints at every lag", "MaxLag": "Largest lag:",
+		"Downsample": "Use every nth voxel in x and y:", "ResultsFile": "Correlation curve file"}
 		self.resultVariables = {"Correlation": "Correlation between timepoints", 
-		"Timepoint1": "First timepoint", "Timepoint2":"Second timepoint"}
+		"Timepoint1": "First timepoint", "Timepoint2":"Second timepoint",
+		"Lags": "Lags between timepoints", "LagCorrelation": "Mean correlation at each lag"}
 		self.filterDesc = "Analyzes correlation between two timepoints in a timeseries\nInputs: Any image, any image\nOutput: Result (first input for pipeline)";
 	
 	def getParameters(self):
 		"""
 		Return the list of parameters needed for configuring this GUI
 		"""			   
-		return [["", ("Timepoint1", "Timepoint2")]]
+		return [["", ("Timepoint1", "Timepoint2")],
+			["Lag sweep", ("Sweep", "MaxLag", "Downsample", \
+				("ResultsFile", "File to write the correlation curve to", "*.csv"))]]
 		
 	def getGUI(self, parent, taskPanel):
 		"""
@@ -77,6 +91,12 @@ class TimepointCorrelationFilter(lib.ProcessingFilter.ProcessingFilter):
 		"""
 		Return the type of the parameter
 		"""	   
+		if parameter == "Sweep":
+			return types.BooleanType
+		if parameter in ["MaxLag", "Downsample"]:
+			return types.IntType
+		if parameter == "ResultsFile":
+			return GUI.GUIBuilder.SAVEFILE
 		return GUI.GUIBuilder.SLICE
 		
 	def getDefaultValue(self, parameter):
@@ -85,6 +105,12 @@ class TimepointCorrelationFilter(lib.ProcessingFilter.ProcessingFilter):
 		"""		
 		if parameter == "Timepoint1":
 			return 1
+		if parameter == "Sweep":
+			return False
+		if parameter == "MaxLag":
+			return 10
+		if parameter == "ResultsFile":
+			return "TimepointCorrelation.csv"
 		return 1
 		
 	def getRange(self, parameter):
@@ -93,15 +119,10 @@ class TimepointCorrelationFilter(lib.ProcessingFilter.ProcessingFilter):
 		"""				
 		return (1, self.dataUnit.getNumberOfTimepoints())
 
-	def execute(self, inputs, update = 0, last = 0):
+	def getCorrelation(self, tp1, tp2):
+		"""
+		Return the Pearson correlation between two timepoints
 		"""
-		Execute the filter with given inputs and return the output
-		"""			   
-		if not lib.ProcessingFilter.ProcessingFilter.execute(self, inputs):
-			return None
-
-		tp1 = self.parameters["Timepoint1"] - 1
-		tp2 = self.parameters["Timepoint2"] - 1
 		self.vtkfilter = vtkbxd.vtkImageAutoThresholdColocalization()
 		units = self.dataUnit.getSourceDataUnits()
 		data1 = units[0].getTimepoint(tp1)
@@ -125,10 +146,94 @@ class TimepointCorrelationFilter(lib.ProcessingFilter.ProcessingFilter):
 		self.vtkfilter.SetUpperThresholdCh1(255)
 		self.vtkfilter.SetUpperThresholdCh2(255)
 		self.vtkfilter.Update()
-		correlation = self.vtkfilter.GetPearsonWholeImage()
+		return self.vtkfilter.GetPearsonWholeImage()
+
+	def getSweep(self):
+		"""
+		Return the correlations of all pairs of timepoints up to the largest
+		lag. Every timepoint is read once. The sweep is computed again only
+		when the data or its parameters change.
+		"""
+		units = self.dataUnit.getSourceDataUnits()
+		n = units[0].getNumberOfTimepoints()
+		maxLag = min(max(self.parameters["MaxLag"], 1), max(n - 1, 1))
+		key = (id(units[0]), n, maxLag, self.parameters["Downsample"])
+		if self.sweep and self.sweepKey == key:
+			return self.sweep
+
+		sweep = lib.LagCorrelation.LagCorrelation(maxLag, self.parameters["Downsample"])
+		for tp in range(n):
+			Logging.info("Correlating timepoint %d with the %d previous timepoints" % (tp, min(tp, maxLag)), \
+							kw = "processing")
+			if lib.LagCorrelation.numpy:
+				volume = lib.LabelStatistics.getVolume(units[0].getTimepoint(tp))
+				if volume is not None:
+					try:
+						sweep.add(tp, volume)
+					except MemoryError, ex:
+						Logging.error("Lag sweep does not fit in memory", str(ex))
+					if tp == 0 and sweep.downsample > self.parameters["Downsample"]:
+						Logging.info("Using every %dth voxel in x and y to fit the lag sweep in memory" % \
+										sweep.downsample, kw = "processing")
+					continue
+			# Without NumPy, or for images with several components, every pair
+			# is correlated separately
+			for tp1 in range(max(tp - maxLag, 0), tp):
+				sweep.setCorrelation(tp1, tp, self.getCorrelation(tp1, tp))
+		self.sweep = sweep
+		self.sweepKey = key
+		return sweep
+
+	def execute(self, inputs, update = 0, last = 0):
+		"""
+		Execute the filter with given inputs and return the output
+		"""			   
+		if not lib.ProcessingFilter.ProcessingFilter.execute(self, inputs):
+			return None
+
+		if self.parameters["Sweep"]:
+			curve = self.getSweep().getCurve()
+			self.setResultVariable("Lags", [lag for lag, correlation, pairs in curve])
+			self.setResultVariable("LagCorrelation", [correlation for lag, correlation, pairs in curve])
+			if self.box and curve:
+				self.corrLbl2.SetLabel("%.5f (lag 1)" % curve[0][1])
+			return self.getInput(1)
+
+		tp1 = self.parameters["Timepoint1"] - 1
+		tp2 = self.parameters["Timepoint2"] - 1
+		correlation = self.getCorrelation(tp1, tp2)
 		self.setResultVariable("Timepoint1",tp1)
 		self.setResultVariable("Timepoint2",tp2)
 		self.setResultVariable("Correlation",correlation)
 		
-		self.corrLbl2.SetLabel("%.5f" % correlation)
+		if self.box:
+			self.corrLbl2.SetLabel("%.5f" % correlation)
 		return self.getInput(1)
+
+	def writeOutput(self, dataUnit, timepoint):
+		"""
+		Write the correlation curve of the lag sweep during the processing
+		"""
+		if not self.parameters["Sweep"] or not self.sweep:
+			return
+		filename = self.parameters["ResultsFile"] or "TimepointCorrelation.csv"
+		if not os.path.dirname(filename):
+			filename = os.path.join(dataUnit.getOutputDirectory(), filename)
+		self.writeToFile(filename)
+
+	def writeToFile(self, filename):
+		"""
+		Write the mean correlation at each lag and the correlations of all
+		pairs of timepoints to a file
+		"""
+		f = codecs.open(filename, "wb", "latin1")
+		Logging.info("Saving timepoint correlations to file %s" % filename, kw = "processing")
+		w = csv.writer(f, dialect = "excel", delimiter = ";")
+		w.writerow(["Lag", "Mean correlation", "Number of pairs"])
+		for lag, correlation, pairs in self.sweep.getCurve():
+			w.writerow([lag, correlation, pairs])
+		w.writerow([])
+		w.writerow(["Timepoint 1", "Timepoint 2", "Correlation"])
+		for tp1, tp2, correlation in self.sweep.getCorrelations():
+			w.writerow([tp1, tp2, correlation])
+		f.close()
@@ -142,6 +142,13 @@ class BXCDataSource(DataSource):
 			i = len(self.dataSets) - 1
 
 		self.setCurrentTimepoint(i)
+		return self.getCachedDataSet(i, raw, self.readDataSet)
+
+	def readDataSet(self, i, raw = 0):
+		"""
+		Reads the DataSet at the specified index from its vti-file
+		@param i  The index
+		"""
 		data = self.loadVti(self.dataSets[i])
 		self.originalScalarRange = self.getOriginalScalarRange()
 		#self.scalarRange = data.GetScalarRange()
@@ -155,6 +162,24 @@ class BXCDataSource(DataSource):
 		
 		return data
 
+	def getFileTimeStamp(self, i):
+		"""
+		Return the modification time of the vti-file of timepoint i
+		"""
+		try:
+			return os.path.getmtime(os.path.join(self.path, self.dataSets[i]))
+		except (OSError, IndexError):
+			return None
+
+	def getFileSize(self, i):
+		"""
+		Return the size of the vti-file of timepoint i
+		"""
+		try:
+			return os.path.getsize(os.path.join(self.path, self.dataSets[i]))
+		except (OSError, IndexError):
+			return None
+
 	def readInfo(self, data):
 		"""
 		Read various bits of info from the dataset
@@ -0,0 +1,245 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: ChunkedDataSource
+ Project: BioImageXD
+ Description:
+
+ A datasource for reading BioImageXD chunked volume (.bxv) files, which
+ store all the timepoints of a channel as fixed size chunks. Parts of a
+ timepoint, such as a single slice, can be read without reading the rest
+ of it.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import ConfigParser
+import StringIO
+from lib.DataSource.DataSource import DataSource
+from lib.DataSource.ChunkedVolume import ChunkedVolume
+from lib.DataUnit.DataUnit import DataUnit
+from lib.DataUnit.DataUnitSetting import DataUnitSettings
+import os.path
+import Logging
+import scripting
+import vtk
+
+def getExtensions():
+	return ["bxv"]
+
+def getFileType():
+	return "BioImageXD chunked volume (*.bxv)"
+
+def getClass():
+	return ChunkedDataSource
+
+class ChunkedDataSource(DataSource):
+	"""
+	Manages 4D data stored in a chunked volume file
+	"""
+	def __init__(self, filename = ""):
+		"""
+		Constructor
+		"""
+		DataSource.__init__(self)
+		self.filename = filename
+		self.setPath(filename)
+		self.volume = None
+		self.parser = None
+		self.settings = None
+		self.ctf = None
+		self.dimensions = None
+		self.spacing = None
+		self.subVolumeShift = None
+		if filename:
+			self.volume = ChunkedVolume(self.convertFileName(filename))
+
+	def getFileName(self):
+		"""
+		Return the file name
+		"""
+		return self.filename
+
+	def getParser(self):
+		"""
+		Returns the parser of the settings stored in the file
+		"""
+		return self.parser
+
+	def getDataSetCount(self):
+		"""
+		Returns the number of individual DataSets (= time points)
+		managed by this DataSource
+		"""
+		return self.volume.getNumberOfTimepoints()
+
+	def getDataSet(self, i, raw = 0):
+		"""
+		Returns the DataSet at the specified index
+		@param i  The index
+		"""
+		i = max(0, min(i, self.getDataSetCount() - 1))
+		self.setCurrentTimepoint(i)
+		return self.getCachedDataSet(i, raw, self.readDataSet)
+
+	def readDataSet(self, i, raw = 0):
+		"""
+		Reads the DataSet at the specified index from the file
+		@param i  The index
+		"""
+		data = self.volume.getImageData(i)
+		self.originalScalarRange = self.getOriginalScalarRange()
+		if raw:
+			return data
+		data = self.getResampledData(data, i)
+		return self.getIntensityScaledData(data)
+
+	def getSubVolume(self, i, extent):
+		"""
+		Return the part of the DataSet at the specified index inside extent,
+		reading only the chunks that intersect it
+		"""
+		if self.mask or (self.resampling and self.resampleDims and not scripting.resamplingDisabled):
+			return None
+		i = max(0, min(i, self.getDataSetCount() - 1))
+		data = self.volume.getImageData(i, extent)
+		if not self.explicitScale or self.intensityScale == -1:
+			return data
+		# A filter of our own is used, so that the pipeline of the whole
+		# DataSet is left untouched
+		if not self.subVolumeShift:
+			self.subVolumeShift = vtk.vtkImageShiftScale()
+			self.subVolumeShift.SetOutputScalarTypeToUnsignedChar()
+			self.subVolumeShift.SetClampOverflow(1)
+		self.subVolumeShift.SetInputConnection(data.GetProducerPort())
+		scale = self.intensityScale
+		if not scale:
+			scale = 255.0 / self.getOriginalScalarRange()[1]
+		self.subVolumeShift.SetScale(scale)
+		self.subVolumeShift.SetShift(self.intensityShift)
+		self.subVolumeShift.Update()
+		return self.subVolumeShift.GetOutput()
+
+	def getFileTimeStamp(self, i):
+		"""
+		Return the modification time of the file
+		"""
+		try:
+			return os.path.getmtime(self.filename)
+		except OSError:
+			return None
+
+	def getFileSize(self, i):
+		"""
+		Return the size of the file
+		"""
+		try:
+			return os.path.getsize(self.filename)
+		except OSError:
+			return None
+
+	def internalGetDimensions(self):
+		"""
+		Returns the (x, y, z) dimensions of the datasets this
+					 dataunit contains
+		"""
+		return tuple(self.volume.getDimensions())
+
+	def getSpacing(self):
+		"""
+		Returns the spacing of the datasets this
+					 dataunit contains
+		"""
+		if not self.spacing:
+			self.spacing = tuple(self.volume.getSpacing())
+		return self.spacing
+
+	def getVoxelSize(self):
+		"""
+		Returns the voxel size of the datasets this
+					 dataunit contains
+		"""
+		try:
+			vsiz = self.parser.get("VoxelSize", "VoxelSize")
+		except ConfigParser.NoOptionError:
+			vsiz = self.parser.get("VoxelSize", "voxelsize")
+		if type(vsiz) == type(""):
+			return eval(vsiz)
+		return vsiz
+
+	def loadFromFile(self, filename):
+		"""
+		Loads the specified .bxv-file and returns the dataunits in it
+		"""
+		self.filename = filename
+		self.shortname = os.path.basename(filename)
+		self.setPath(filename)
+		if not self.volume:
+			try:
+				self.volume = ChunkedVolume(self.convertFileName(filename))
+			except IOError, ex:
+				Logging.error("Failed to open file for reading", \
+							"ChunkedDataSource failed to open %s for reading. Reason: %s" % (filename, str(ex)))
+				return []
+		self.parser = scripting.MyConfigParser()
+		try:
+			self.parser.readfp(StringIO.StringIO(self.volume.getSettings()))
+		except ConfigParser.ParsingError, ex:
+			Logging.info("Failed to parse the settings in %s: %s" % (filename, str(ex)), kw = "datasource")
+
+		dataunit = DataUnit()
+		settings = DataUnitSettings()
+		settings.setType("")
+		settings = settings.readFrom(self.parser)
+		self.originalDimensions = self.internalGetDimensions()
+		self.settings = settings
+		dataunit.setDataSource(self)
+		dataunit.setSettings(settings)
+		return [dataunit]
+
+	def getName(self):
+		"""
+		Returns the name of the dataset series which this datasource
+					 operates on
+		"""
+		name = None
+		if self.settings:
+			name = self.settings.get("Name")
+		if not name:
+			name = os.path.splitext(os.path.basename(self.filename))[0]
+		return name
+
+	def getColorTransferFunction(self):
+		"""
+		Returns the ctf of the dataset series which this datasource
+					 operates on
+		"""
+		if not self.ctf:
+			ctf = None
+			if self.settings:
+				ctf = self.settings.get("ColorTransferFunction")
+			if not ctf:
+				minval, maxval = self.getScalarRange()
+				ctf = vtk.vtkColorTransferFunction()
+				ctf.AddRGBPoint(minval, 0, 0, 0)
+				ctf.AddRGBPoint(maxval, 1, 1, 1)
+			self.ctf = ctf
+		return self.ctf
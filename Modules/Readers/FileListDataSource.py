@@ -28,6 +28,7 @@ __version__ = "$Revision: 1.37 $"
 __date__ = "$Date: 2005 / 01 / 13 13:42:03 $"
 
 from lib.DataSource.DataSource import DataSource
+import lib.DataSource.ReaderPool
 import Logging
 import os.path
 import vtk
@@ -76,7 +77,10 @@ class FileListDataSource(DataSource):
 		self.imageDims = {}
 		
 		self.numberOfImages = 0
-		self.readers = []
+		# The files read by the reader of each timepoint (or each file of 3D
+		# images), and how the reader reads them. The readers are created when
+		# they are needed and kept in the reader pool.
+		self.readerFiles = []
 		self.slicesPerTimepoint = 1
 		self.is3D = 0
 		self.rdrstr = ""
@@ -126,10 +130,10 @@ class FileListDataSource(DataSource):
 		self.getReadersFromFilenames()
 		self.numberOfImages = len(filenames)
 		if self.is3D:
-			if self.readers:
+			if self.readerFiles:
 				self.numberOfImages = 0
-				for rdr in self.readers:
-					self.numberOfImages += rdr.GetNumberOfSubFiles()
+				for i in range(len(self.readerFiles)):
+					self.numberOfImages += self.getReader(i).GetNumberOfSubFiles()
 		
 	def setVerticalFlip(self, flag):
 		"""
@@ -215,11 +219,10 @@ class FileListDataSource(DataSource):
 
 	def getReadersFromFilenames(self):
 		"""
-		create the reader list from a given set of file names and parameters
+		Determine the files read by each reader from a given set of file names
+		and parameters. The readers themselves are created by getReader.
 		"""
-		for i in self.readers:
-			del i
-		self.readers = []
+		self.readerFiles = []
 
 		if not self.filenames:
 			raise Logging.GUIError("No files could be found", \
@@ -257,23 +260,15 @@ class FileListDataSource(DataSource):
 		self.ext = files[0].split(".")[-1].lower()
 		
 		if dim == 3:
-			totalFiles = len(files)
-			for i, file in enumerate(files):
-				rdr = self.getReaderByExtension(self.ext, isRGB)
-				rdr.SetFileName(file)
-				self.readers.append(rdr)
+			for file in files:
+				self.readerFiles.append(("file", [file]))
 			return
 			
 		totalFiles = len(files) / self.slicesPerTimepoint
 
 		imgAmnt = len(files)
 		if totalFiles == 1:
-			rdr = self.getReaderByExtension(self.ext, isRGB)
-			arr = vtk.vtkStringArray()
-			for fileName in files:
-				arr.InsertNextValue(os.path.join(dirName, fileName))
-			rdr.SetFileNames(arr)
-			self.readers.append(rdr)
+			self.readerFiles.append(("files", [os.path.join(dirName, fileName) for fileName in files]))
 			return
 			
 		if imgAmnt > 1:
@@ -281,32 +276,54 @@ class FileListDataSource(DataSource):
 			# the given filenames and allocate them to timepoints
 			# using  slicesPerTimepoint slices per timepoint
 			ntps = len(files) / self.slicesPerTimepoint
-			filelst = files[:]
-			# dirn #TODO: what was this?
 			for tp in range(0, ntps):
-				rdr = self.getReaderByExtension(self.ext, isRGB)
-				arr = vtk.vtkStringArray()
-				for i in range(0, self.slicesPerTimepoint):
-					arr.InsertNextValue(filelst[0])
-					filelst = filelst[1:]
-				rdr.SetFileNames(arr)
-				rdr.SetDataExtent(0, self.x - 1, 0, self.y - 1, 0, self.slicesPerTimepoint - 1)
-				rdr.SetDataSpacing(self.spacing)
-				rdr.SetDataOrigin(0, 0, 0)
-				self.readers.append(rdr)
+				first = tp * self.slicesPerTimepoint
+				self.readerFiles.append(("slices", files[first:first + self.slicesPerTimepoint]))
 			return
 		
 		elif imgAmnt == 1:
 			# If only one file
-			rdr = self.getReaderByExtension(self.ext, isRGB)
+			self.readerFiles.append(("stack", [files[0]]))
+
+	def getReaderKey(self, n):
+		"""
+		Return the key of the nth reader in the reader pool. The key includes
+		the settings the reader is created with.
+		"""
+		mode, files = self.readerFiles[n]
+		return (files[0], "FileList", mode, files[-1], len(files), self.isRGB, self.flipVertically, \
+				self.x, self.y, self.slicesPerTimepoint, tuple(self.spacing))
+
+	def createReader(self, n):
+		"""
+		Create the nth reader of the files
+		"""
+		mode, files = self.readerFiles[n]
+		rdr = self.getReaderByExtension(self.ext, self.isRGB)
+		if mode == "file":
+			rdr.SetFileName(files[0])
+		elif mode == "stack":
 			rdr.SetDataExtent(0, self.x - 1, 0, self.y - 1, 0, self.slicesPerTimepoint - 1)
 			rdr.SetDataSpacing(self.spacing)
 			rdr.SetDataOrigin(0, 0, 0)
 			rdr.SetFileName(files[0])
-
 			Logging.info("Reader = ", rdr, kw = "io")
-			self.readers.append(rdr)
-			
+		else:
+			arr = vtk.vtkStringArray()
+			for fileName in files:
+				arr.InsertNextValue(fileName)
+			rdr.SetFileNames(arr)
+			if mode == "slices":
+				rdr.SetDataExtent(0, self.x - 1, 0, self.y - 1, 0, self.slicesPerTimepoint - 1)
+				rdr.SetDataSpacing(self.spacing)
+				rdr.SetDataOrigin(0, 0, 0)
+		return rdr
+
+	def getReader(self, n):
+		"""
+		Return the nth reader of the files from the reader pool
+		"""
+		return self.getPooledReader(self.getReaderKey(n), lambda: self.createReader(n))
 
 	def getSlicesPerTimepoint(self):
 		"""
@@ -322,7 +339,7 @@ class FileListDataSource(DataSource):
 		print "Setting slices per timepoint to ", n
 		self.slicesPerTimepoint = n
 		self.z = n
-		self.readers = []
+		self.readerFiles = []
 		
 	def getDataSetCount(self):
 		"""
@@ -420,13 +437,13 @@ class FileListDataSource(DataSource):
 		"""
 		Return the nth timepoint
 		"""
-		if not self.readers:
+		if not self.readerFiles:
 			self.getReadersFromFilenames()
 
 		if self.is3DImage():
-			if not self.readers:
+			if not self.readerFiles:
 				raise Logging.GUIError("Attempt to read bad timepoint", "Timepoint %d is not defined by the given filenames" % n)
-			self.reader = self.readers[0]
+			self.reader = self.getReader(0)
 			minZ = n * self.slicesPerTimepoint
 			maxZ = (n+1) * self.slicesPerTimepoint - 1
 			extract = vtk.vtkExtractVOI()
@@ -438,11 +455,11 @@ class FileListDataSource(DataSource):
 			changeInfo.SetExtentTranslation((0,0,-minZ))
 			data = changeInfo.GetOutput()
 		else:
-			if n >= len(self.readers):
+			if n >= len(self.readerFiles):
 				n = 0
 				raise Logging.GUIError("Attempt to read bad timepoint", "Timepoint %d is not defined by the given filenames" % n)
 			
-			self.reader = self.readers[n]
+			self.reader = self.getReader(n)
 			data = self.reader.GetOutput()
 
 		if not self.voxelsize:
@@ -33,6 +33,7 @@ import scripting
 import vtkbxd
 import vtk
 import lib.messenger
+import lib.DataSource.ReaderPool
 
 def getExtensions(): return ["lif"]
 def getFileType(): return "Leica Image File Format (*.lif)"
@@ -60,31 +61,51 @@ class LIFDataSource(DataSource):
 		self.voxelSize = None
 		self.ctf = None
 
-		# Use vtkLIFReader
-		self.reader = vtkbxd.vtkLIFReader()
-		self.reader.AddObserver('ProgressEvent', lib.messenger.send)
-		lib.messenger.connect(self.reader, 'ProgressEvent', self.updateProgress)
-
-		# Open file if defined
+		# Open file if defined. All the images and channels of the file share
+		# a vtkLIFReader from the reader pool, so the header is read once.
 		if self.filename:
-			self.reader.SetFileName(self.convertFileName(self.filename))
-			if self.reader.OpenFile():
-				if reader:
-					self.reader.CopyHeaderInfo(reader)
-				if self.reader.ReadLIFHeader():
-					self.reader.SetCurrentImage(self.imageNum)
-					self.reader.SetCurrentChannel(self.channelNum)
-					self.imageName = self.reader.GetImageName(self.imageNum)
-					self.createTimeStamps()
-					self.originalDimensions = self.internalGetDimensions()[0:3]
-				else:
-					Logging.error("Failed to read the header of the LIF file correctly",
-								  "Error in LIFDataSource.py in __init__, failed to read the header of the LIF file: %s" %(self.filename))
-					return
-			else:
-				Logging.error("Failed to open file",
-							  "Error in LIFDataSource.py in __init__, failed to open file: %s" %(self.filename))
+			if reader:
+				lib.DataSource.ReaderPool.getReaderPool().add(self.getReaderKey(), reader)
+			reader = self.getReader()
+			if not reader:
 				return
+			self.imageName = reader.GetImageName(self.imageNum)
+			self.createTimeStamps()
+			self.originalDimensions = self.internalGetDimensions()[0:3]
+
+	def getReaderKey(self):
+		"""
+		Returns the key of the reader of the file in the reader pool
+		"""
+		return (self.filename, "LIF")
+
+	def openReader(self):
+		"""
+		Opens a reader of the LIF file and reads the header of the file
+		"""
+		reader = vtkbxd.vtkLIFReader()
+		reader.AddObserver('ProgressEvent', lib.messenger.send)
+		reader.SetFileName(self.convertFileName(self.filename))
+		if not reader.OpenFile():
+			Logging.error("Failed to open file",
+						  "Error in LIFDataSource.py in openReader, failed to open file: %s" %(self.filename))
+			return None
+		if not reader.ReadLIFHeader():
+			reader.CloseFile()
+			Logging.error("Failed to read the header of the LIF file correctly",
+						  "Error in LIFDataSource.py in openReader, failed to read the header of the LIF file: %s" %(self.filename))
+			return None
+		return reader
+
+	def getReader(self):
+		"""
+		Returns the shared reader of the LIF file, set to the image and
+		channel of this DataSource
+		"""
+		reader = self.getPooledReader(self.getReaderKey(), self.openReader)
+		if reader and self.imageNum >= 0 and self.channelNum >= 0:
+			reader.SetCurrentImageAndChannel(self.imageNum, self.channelNum)
+		return reader
 
 	def getDataSetCount(self):
 		"""
@@ -117,17 +138,26 @@ class LIFDataSource(DataSource):
 			return None
 
 		self.setCurrentTimepoint(i)
+		return self.getCachedDataSet(i, raw, self.readDataSet)
+
+	def readDataSet(self, i, raw = 0):
+		"""
+		Reads the defined timepoint of current image and channel from the file
+		@param i The timepoint of data to return
+		@param raw A flag indicating that the data is not to be processed in any way
+		"""
+		reader = self.getReader()
 		# Check correct channel to be fetched if rgb data included
 		cNum = 0
-		for i in range(0,self.channelNum):
-			if self.reader.isRGB(self.imageNum, i):
+		for ch in range(0,self.channelNum):
+			if reader.isRGB(self.imageNum, ch):
 				cNum += 3
 			else:
 				cNum += 1
 		
-		self.reader.SetCurrentImageAndChannel(self.imageNum, cNum)
-		self.reader.SetCurrentTimePoint(i)
-		data = self.reader.GetOutput()
+		reader.SetCurrentImageAndChannel(self.imageNum, cNum)
+		reader.SetCurrentTimePoint(i)
+		data = self.getPooledOutput(reader)
 		if raw:
 			return data
 
@@ -152,7 +182,7 @@ class LIFDataSource(DataSource):
 		Returns the (x,y,z,t) dimensions of the dataset this dataunit contains
 		@return 4-tuple of dimensions of the dataset	
 		"""
-		dimensions = self.reader.GetImageDims()
+		dimensions = self.getReader().GetImageDims()
 		# Make sure that every dimension is at least 1. This prevents
 		# software from crashing with weird datasets like xt-series.
 		dimensions = list(dimensions)
@@ -179,25 +209,19 @@ class LIFDataSource(DataSource):
 		"""
 		self.filename = filename
 		dataUnits = []
-		self.reader.SetFileName(self.convertFileName(self.filename))
-
-		if self.reader.OpenFile():
-			if self.reader.ReadLIFHeader():
-				imageCount = self.reader.GetImageCount()
-				for i in range(imageCount):
-					imageName = self.reader.GetImageName(i)
-					imageChannels = self.reader.GetChannelCount(i)
-					for c in range(imageChannels):
-						dataSource = LIFDataSource(filename,i,c,self.reader)
-						dataUnit = DataUnit.DataUnit()
-						dataUnit.setDataSource(dataSource)
-						dataUnits.append((imageName,dataUnit))
-			else:
-				Logging.error("Failed to read the LIF header",
-							  "Error in LIFDataSource.py in loadFromFile, failed to read the LIF header from file: %s"%(self.filename))
-		else:
-			Logging.error("Failed to open the LIF file",
-						  "Error in LIFDataSource.py in loadFromFile, failed to open the LIF file: %s"%(self.filename))
+		# The reader that read the header is shared by the DataSources of the file
+		reader = self.openReader()
+		if reader:
+			lib.DataSource.ReaderPool.getReaderPool().add(self.getReaderKey(), reader)
+			imageCount = reader.GetImageCount()
+			for i in range(imageCount):
+				imageName = reader.GetImageName(i)
+				imageChannels = reader.GetChannelCount(i)
+				for c in range(imageChannels):
+					dataSource = LIFDataSource(filename,i,c)
+					dataUnit = DataUnit.DataUnit()
+					dataUnit.setDataSource(dataSource)
+					dataUnits.append((imageName,dataUnit))
 
 		return dataUnits
 
@@ -219,7 +243,7 @@ class LIFDataSource(DataSource):
 		@return Size of voxel as 3-tuple
 		"""
 		if not self.voxelSize:
-			self.voxelSize = self.reader.GetImageVoxels()
+			self.voxelSize = self.getReader().GetImageVoxels()
 		return self.voxelSize
 
 	def getColorTransferFunction(self):
@@ -230,7 +254,7 @@ class LIFDataSource(DataSource):
 		if not self.ctf:
 			ctf = vtk.vtkColorTransferFunction()
 			minval,maxval = self.getScalarRange()
-			LUTName = self.reader.GetImageChannelLUTName(self.imageNum,self.channelNum)
+			LUTName = self.getReader().GetImageChannelLUTName(self.imageNum,self.channelNum)
 			LUTName = LUTName.lower()
 			r,g,b = (0,0,0)
 			if LUTName == "red":
@@ -265,7 +289,7 @@ class LIFDataSource(DataSource):
 				Logging.error("No image or channel number specified",
 							  "Error in LIFDataSource.py in getBitDepth, image or channel number not specified.")
 				return 0
-			self.bitDepth = self.reader.GetImageChannelResolution(self.imageNum, self.channelNum)
+			self.bitDepth = self.getReader().GetImageChannelResolution(self.imageNum, self.channelNum)
 		return self.bitDepth
 
 	def getScalarRange(self):
@@ -273,8 +297,9 @@ class LIFDataSource(DataSource):
 		Returns pair that contains range of data values
 		"""
 		if not self.scalarRange:
-			minScalar = self.reader.GetImageChannelMin(self.imageNum,self.channelNum)
-			maxScalar = self.reader.GetImageChannelMax(self.imageNum,self.channelNum)
+			reader = self.getReader()
+			minScalar = reader.GetImageChannelMin(self.imageNum,self.channelNum)
+			maxScalar = reader.GetImageChannelMax(self.imageNum,self.channelNum)
 			self.scalarRange = (int(minScalar),int(maxScalar))
 		return self.scalarRange
 
@@ -282,14 +307,15 @@ class LIFDataSource(DataSource):
 		"""
 		Creates time stamps for setTimeStamps and setAbsoluteTimeStamps methods
 		"""
-		timeStamps = self.reader.GetTimeStamps(self.imageNum)
+		reader = self.getReader()
+		timeStamps = reader.GetTimeStamps(self.imageNum)
 		absoluteTimeStamps = []
 		relativeTimeStamps = [0.00]
 		if timeStamps.GetSize() > 0:
 			absoluteTimeStamps = [timeStamps.GetValue(0)]
 
 		timePoints = self.getDataSetCount()
-		framesPerTimePoint = self.reader.GetFramesPerTimePoint(self.imageNum)
+		framesPerTimePoint = reader.GetFramesPerTimePoint(self.imageNum)
 		if timePoints * framesPerTimePoint > timeStamps.GetSize():
 			timePoints = timeStamps.GetSize() / framesPerTimePoint
 
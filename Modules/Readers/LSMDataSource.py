@@ -75,11 +75,8 @@ class LsmDataSource(DataSource):
 		self.spacing = None
 		self.origin = None
 		self.voxelsize = None
-		# vtkLSMReader is used to do the actual reading:
-		self.reader = vtkbxd.vtkLSMReader()
-		#self.reader.DebugOn()
-		self.reader.AddObserver("ProgressEvent", lib.messenger.send)
-		lib.messenger.connect(self.reader, 'ProgressEvent', self.updateProgress)
+		# vtkLSMReader is used to do the actual reading. The reader of the
+		# channel is opened when it is needed and kept in the reader pool.
 		# If a filename was specified, the file is loaded
 		if self.filename:
 			self.path = os.path.dirname(filename)
@@ -93,26 +90,49 @@ class LsmDataSource(DataSource):
 				"Failed to open file %s for reading: %s" % (filename, str(ex)))
 				return
 				
-			self.reader.SetFileName(self.convertFileName(self.filename))
-			self.reader.SetUpdateChannel(channelNum)
-			self.reader.UpdateInformation()
 			self.originalScalarRange = None
 			self.getBitDepth()
-			self.originalDimensions = self.reader.GetDimensions()[0:3]
+			self.originalDimensions = self.getReader().GetDimensions()[0:3]
 			self.readTimeStamps()
+
+	def getReaderKey(self):
+		"""
+		Returns the key of the reader of this channel in the reader pool
+		"""
+		return (self.filename, "LSM", self.channelNum)
+
+	def openReader(self):
+		"""
+		Opens a reader of the LSM file and reads the information of the channel.
+		The channels have readers of their own, because a reader reads the
+		data type of the output only for the channel it was opened for.
+		"""
+		reader = vtkbxd.vtkLSMReader()
+		reader.AddObserver("ProgressEvent", lib.messenger.send)
+		reader.SetFileName(self.convertFileName(self.filename))
+		reader.SetUpdateChannel(self.channelNum)
+		reader.UpdateInformation()
+		return reader
+
+	def getReader(self):
+		"""
+		Returns the reader of the channel from the reader pool
+		"""
+		return self.getPooledReader(self.getReaderKey(), self.openReader)
 			
 
 	def readTimeStamps(self):
 		"""
 		return the timestamp for given timepoint
 		"""
-		if not self.reader:
+		if not self.filename:
 			return
-		timestamps = self.reader.GetTimeStampInformation()
+		reader = self.getReader()
+		timestamps = reader.GetTimeStampInformation()
 		stamps = []
 		absStamps = []
 		if not timestamps.GetSize():
-			timeInterval = self.reader.GetTimeInterval()
+			timeInterval = reader.GetTimeInterval()
 			if timeInterval != 0:
 				for i in range(0, self.getDataSetCount()):
 					stamps.append(i*timeInterval)
@@ -142,7 +162,8 @@ class LsmDataSource(DataSource):
 		Return the bit depth of data
 		"""
 		if not self.bitdepth:
-			data = self.reader.GetOutput()
+			reader = self.getReader()
+			data = reader.GetOutput()
 			data.UpdateInformation()
 			d = data.GetScalarType()
 			if d == 3:
@@ -150,7 +171,7 @@ class LsmDataSource(DataSource):
 				if not self.originalScalarRange:
 					self.originalScalarRange = (0, 255)
 			if d == 5:
-				if self.reader.GetDataTypeForChannel(self.channelNum) == 2:
+				if reader.GetDataTypeForChannel(self.channelNum) == 2:
 					self.singleBitDepth = 12
 					if not self.originalScalarRange:
 						self.originalScalarRange = (0, 4095)
@@ -183,12 +204,12 @@ class LsmDataSource(DataSource):
 		"""
 		Return the original dimensions of the dataset
 		"""
-		return self.reader.GetDimensions()
+		return self.getReader().GetDimensions()
 
 	def getSpacing(self):
 		
 		if not self.spacing:
-			a, b, c = self.reader.GetVoxelSizes()
+			a, b, c = self.getReader().GetVoxelSizes()
 			Logging.info("Voxel sizes = ", a, b, c, kw = "lsmreader")
 			self.spacing = [1, b / a, c / a]
 		return self.spacing
@@ -196,7 +217,7 @@ class LsmDataSource(DataSource):
 		
 	def getVoxelSize(self):
 		if not self.voxelsize:
-			self.voxelsize = self.reader.GetVoxelSizes()
+			self.voxelsize = self.getReader().GetVoxelSizes()
 		return self.voxelsize
 			
 		
@@ -216,9 +237,17 @@ class LsmDataSource(DataSource):
 			return None
 	
 		self.timepoint = i
-		self.reader.SetUpdateChannel(self.channelNum)
-		self.reader.SetUpdateTimePoint(i)
-		data = self.reader.GetOutput()
+		return self.getCachedDataSet(i, raw, self.readDataSet)
+
+	def readDataSet(self, i, raw = 0):
+		"""
+		Reads the timepoint at the specified index from the file
+		Parameters:	  i		  The timepoint to retrieve
+					  raw	  A flag indicating that the data is not to be processed in any way
+		"""
+		reader = self.getReader()
+		reader.SetUpdateTimePoint(i)
+		data = self.getPooledOutput(reader)
 
 		if raw:
 			return data
@@ -251,13 +280,14 @@ class LsmDataSource(DataSource):
 		self.shortname = os.path.basename(filename)
 		self.path = os.path.dirname(filename)
 
-		self.reader.SetFileName(self.convertFileName(filename))
-
-		#self.reader.Update()
-		self.reader.UpdateInformation()
+		# The channels are counted with a reader that is closed afterwards
+		reader = vtkbxd.vtkLSMReader()
+		reader.SetFileName(self.convertFileName(filename))
+		reader.UpdateInformation()
 
 		dataunits = []
-		channelNum = self.reader.GetNumberOfChannels()
+		channelNum = reader.GetNumberOfChannels()
+		del reader
 		self.timepointAmnt = channelNum
 		Logging.info("There are %d channels" % channelNum, kw = "lsmreader")
 		for i in range(channelNum):
@@ -280,9 +310,10 @@ class LsmDataSource(DataSource):
 		if not self.ctf:
 			Logging.info("Using ctf based on LSM Color", kw = "lsmreader")
 			ctf = vtk.vtkColorTransferFunction()
-			r = self.reader.GetChannelColorComponent(self.channelNum, 0)
-			g = self.reader.GetChannelColorComponent(self.channelNum, 1)
-			b = self.reader.GetChannelColorComponent(self.channelNum, 2)
+			reader = self.getReader()
+			r = reader.GetChannelColorComponent(self.channelNum, 0)
+			g = reader.GetChannelColorComponent(self.channelNum, 1)
+			b = reader.GetChannelColorComponent(self.channelNum, 2)
 			#print "Got color components=",r,g,b
 			r /= 255.0
 			g /= 255.0
@@ -315,7 +346,7 @@ class LsmDataSource(DataSource):
 		managed by this DataSource
 		"""
 		if not self.numericalAperture:
-			objective = self.reader.GetObjective()
+			objective = self.getReader().GetObjective()
 			if objective == None:
 				objective = ""
 			print "\n\nObjective for file",self.getName(),"is",objective 
@@ -332,7 +363,7 @@ class LsmDataSource(DataSource):
 		managed by this DataSource
 		"""
 		if not self.excitationWavelength:
-			name = self.reader.GetChannelName(self.channelNum)
+			name = self.getReader().GetChannelName(self.channelNum)
 			if name == None:
 				name = ""
 			trackRE=re.compile('.*-T(\d+)')
@@ -342,7 +373,7 @@ class LsmDataSource(DataSource):
 			else:
 				currentTrack = int(m.group(1))
 
-			wavelengths = self.reader.GetTrackWavelengths()
+			wavelengths = self.getReader().GetTrackWavelengths()
 			if wavelengths.GetNumberOfTuples() >= currentTrack and wavelengths.GetNumberOfTuples() > 0:
 				wavelength = wavelengths.GetValue(currentTrack - 1)
 			else:
@@ -362,7 +393,7 @@ class LsmDataSource(DataSource):
 			"but no channel number has been specified")
 			return ""
 
-		channelName = self.reader.GetChannelName(self.channelNum)
+		channelName = self.getReader().GetChannelName(self.channelNum)
 		if channelName == "" or channelName == None:
 			channelName = "Ch"+str(self.channelNum+1)
 		return channelName
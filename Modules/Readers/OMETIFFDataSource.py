@@ -32,6 +32,7 @@ import Logging
 import vtk
 import vtkbxd
 import lib.messenger
+import lib.DataSource.ReaderPool
 
 def getExtensions():
 	return ["ome.tif", "ome.tiff"]
@@ -59,31 +60,52 @@ class OMETIFFDataSource(DataSource):
 		self.currentChannel = channelNum
 		self.currentTimepoint = 0
 		self.imageName = ""
-		self.reader = vtkbxd.vtkOMETIFFReader()
-		self.reader.AddObserver('ProgressEvent', lib.messenger.send)
-		lib.messenger.connect(self.reader, 'ProgressEvent', self.updateProgress)
-
 		self.ctf = None
 		
+		# All the images and channels of the file share a vtkOMETIFFReader
+		# from the reader pool, so the OME header is read once
 		if self.filename:
-			self.reader.SetFileName(self.convertFileName(self.filename))
-			if not self.reader.ReadOMEHeader():
-				Logging.error("Failed to open OME-TIFF file",
-							"Failed to open file %s for reading: %s"%(filename, str(ex)))
+			reader = self.getReader()
+			if not reader:
 				return
-			
-			self.numImages = self.reader.GetNumberOfImages()
-			if self.currentImage < self.numImages:
-				self.reader.SetCurrentImage(self.currentImage)
-			self.numChannels = self.reader.GetNumberOfChannels()
-			if self.currentChannel < self.numChannels:
-				self.reader.SetCurrentChannel(self.currentChannel)
-			self.imageName = self.reader.GetImageName()
+			self.numImages = reader.GetNumberOfImages()
+			self.numChannels = reader.GetNumberOfChannels()
+			self.imageName = reader.GetImageName()
 			if self.imageName == "":
 				self.imageName = "Image-%d"%(self.currentImage+1)
-			self.numTimePoints = self.reader.GetNumberOfTimePoints()
+			self.numTimePoints = reader.GetNumberOfTimePoints()
 			self.createTimeStamps()
 
+	def getReaderKey(self):
+		"""
+		Returns the key of the reader of the file in the reader pool
+		"""
+		return (self.filename, "OME-TIFF")
+
+	def openReader(self):
+		"""
+		Opens a reader of the OME-TIFF file and reads the OME header
+		"""
+		reader = vtkbxd.vtkOMETIFFReader()
+		reader.AddObserver('ProgressEvent', lib.messenger.send)
+		reader.SetFileName(self.convertFileName(self.filename))
+		if not reader.ReadOMEHeader():
+			Logging.error("Failed to open OME-TIFF file",
+						"Failed to read the OME header from file %s"%self.filename)
+			return None
+		return reader
+
+	def getReader(self):
+		"""
+		Returns the shared reader of the OME-TIFF file, set to the image and
+		channel of this DataSource
+		"""
+		reader = self.getPooledReader(self.getReaderKey(), self.openReader)
+		if reader:
+			reader.SetCurrentImage(self.currentImage)
+			reader.SetCurrentChannel(self.currentChannel)
+		return reader
+
 	def getDataSetCount(self):
 		"""
 		Returns the count of time points of the selected OME image
@@ -108,8 +130,9 @@ class OMETIFFDataSource(DataSource):
 			return None
 
 		self.currentTimepoint = i
-		self.reader.SetCurrentTimePoint(i)
-		data = self.reader.GetOutput()
+		reader = self.getReader()
+		reader.SetCurrentTimePoint(i)
+		data = self.getPooledOutput(reader)
 		if raw:
 			return data
 
@@ -123,7 +146,7 @@ class OMETIFFDataSource(DataSource):
 		"""
 		Returns the name of the dataset
 		"""
-		channelName = self.reader.GetChannelName()
+		channelName = self.getReader().GetChannelName()
 		if channelName == "":
 			return "Ch-%d"%(self.currentChannel + 1)
 		return channelName
@@ -132,22 +155,23 @@ class OMETIFFDataSource(DataSource):
 		"""
 		Returns excitation wavelength of this channel
 		"""
-		return self.reader.GetExcitationWavelength()
+		return self.getReader().GetExcitationWavelength()
 
 	def getEmissionWavelength(self):
 		"""
 		Returns emission wavelength of this channel
 		"""
-		return self.reader.GetEmissionWavelength()
+		return self.getReader().GetEmissionWavelength()
 		
 	def internalGetDimensions(self):
 		"""
 		Returns the (x,y,z,t) dimensions of the dataset this dataunit contains
 		@return 4-tuple of dimensions of the dataset
 		"""
-		dim = self.reader.GetImageDimensions()
+		reader = self.getReader()
+		dim = reader.GetImageDimensions()
 		dim = list(dim)
-		dim.append(self.reader.GetNumberOfTimePoints())
+		dim.append(reader.GetNumberOfTimePoints())
 		for i in range(4):
 			if dim[i] <= 0:
 				dim[i] = 1
@@ -164,13 +188,14 @@ class OMETIFFDataSource(DataSource):
 		"""
 		self.filename = filename
 		dataUnits = []
-		self.reader.SetFileName(self.convertFileName(self.filename))
-
-		if self.reader.ReadOMEHeader():
-			imageNum = self.reader.GetNumberOfImages()
+		# The reader that read the header is shared by the DataSources of the file
+		reader = self.openReader()
+		if reader:
+			lib.DataSource.ReaderPool.getReaderPool().add(self.getReaderKey(), reader)
+			imageNum = reader.GetNumberOfImages()
 			imageNames = []
 			for i in range(imageNum):
-				imageName = self.reader.GetImageName()
+				imageName = reader.GetImageName()
 				if imageName == "":
 					imageName = "Image-%d"%(i+1)
 				if imageName in imageNames:
@@ -178,17 +203,14 @@ class OMETIFFDataSource(DataSource):
 				imageNames.append(imageName)
 			
 			for i,imageName in enumerate(imageNames):
-				self.reader.SetCurrentImage(i)
-				channelNum = self.reader.GetNumberOfChannels()
+				reader.SetCurrentImage(i)
+				channelNum = reader.GetNumberOfChannels()
 				for c in range(channelNum):
 					datasource = OMETIFFDataSource(filename,i,c)
 					dataunit = DataUnit.DataUnit()
 					dataunit.setDataSource(datasource)
 					dataunit.updateSettings()
 					dataUnits.append((imageName,dataunit))
-		else:
-			Logging.error("Failed to read OME header",
-						  "Error in OMETIFFDataSource.py in loadFromFile, failed to read OME header from file: %s"%self.filename)
 
 		return dataUnits
 
@@ -205,7 +227,7 @@ class OMETIFFDataSource(DataSource):
 		"""
 		Returns physical size of voxels as micrometers
 		"""
-		voxelSize = self.reader.GetVoxelSize()
+		voxelSize = self.getReader().GetVoxelSize()
 		voxelSize = list(voxelSize)
 		for i in range(3):
 			voxelSize[i] = voxelSize[i] * 10**-6
@@ -229,7 +251,7 @@ class OMETIFFDataSource(DataSource):
 		Return the bit depth of data
 		"""
 		if not self.bitdepth:
-			scalartype = self.reader.GetPixelType()
+			scalartype = self.getReader().GetPixelType()
 			self.scalarRange = (0,0)
 
 			if scalartype in [2,3]:
@@ -258,7 +280,7 @@ class OMETIFFDataSource(DataSource):
 		Creates time stamps for setTimeStamps and setAbsoluteTimeStamps methods
 		Currently supports only relative timestamps
 		"""
-		timeIncrement = self.reader.GetTimeIncrement()
+		timeIncrement = self.getReader().GetTimeIncrement()
 		if timeIncrement == 0.0:
 			return
 
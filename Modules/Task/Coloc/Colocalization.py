@@ -33,9 +33,22 @@ STATISTICS_ONLY = 2
 THRESHOLDS_ONLY = 1
 import vtkbxd
 import lib.messenger
+import lib.ColocalizationStatistics
+import lib.LabelStatistics
 from lib.Module import Module
 import Logging
 
+STATISTICS = ["Ch1ThresholdMax", "Ch2ThresholdMax", "PearsonImageAbove",
+			"PearsonImageBelow", "PearsonWholeImage", "M1", "M2",
+			"K1", "K2", "DiffStainIntCh1", "DiffStainIntCh2",
+			"DiffStainVoxelsCh1", "DiffStainVoxelsCh2",
+			"ThresholdM1", "ThresholdM2",
+			"ColocAmount", "ColocPercent", "PercentageVolumeCh1",
+			"PercentageTotalCh1", "PercentageTotalCh2",
+			"PercentageVolumeCh2", "PercentageMaterialCh1", "PercentageMaterialCh2",
+			"SumOverThresholdCh1", "SumOverThresholdCh2", "SumCh1", "SumCh2",
+			"NonZeroCh1", "NonZeroCh2", "OverThresholdCh2", "OverThresholdCh1"]
+
 class Colocalization(Module):
 	"""
 	Creates a colocalization map
@@ -47,6 +60,11 @@ class Colocalization(Module):
 		Module.__init__(self, **kws)
 		self.running = 0
 		self.depth = 8
+		# The joint histogram of the channels outlives the resets, so that the
+		# statistics of new thresholds are computed without reading the voxels
+		self.histogram = None
+		self.histogramKey = None
+		self.histogramImages = []
 		self.reset()
 
 	def reset(self):
@@ -82,6 +100,55 @@ class Colocalization(Module):
 		self.thresholds.append((th0, th1))
 		self.depth = self.settings.get("ColocalizationDepth")
 
+	def getJointHistogram(self):
+		"""
+		Return the joint histogram of the two channels, which is built again
+		only when the timepoint or the data have changed, or None if the
+		statistics cannot be computed from it
+		"""
+		if not lib.ColocalizationStatistics.numpy or len(self.images) != 2:
+			return None
+		ch1 = lib.LabelStatistics.getVolume(self.images[0])
+		ch2 = lib.LabelStatistics.getVolume(self.images[1])
+		if not (lib.ColocalizationStatistics.isSupported(ch1) and lib.ColocalizationStatistics.isSupported(ch2)):
+			return None
+		if ch1.shape != ch2.shape or ch1.dtype != ch2.dtype:
+			return None
+		key = (self.timepoint, tuple(map(id, self.dataunits)), lib.ColocalizationStatistics.getImageKey(self.images))
+		if key != self.histogramKey:
+			Logging.info("Building the joint histogram of timepoint %d" % self.timepoint, kw = "processing")
+			self.histogram = lib.ColocalizationStatistics.JointHistogram(ch1, ch2)
+			self.histogramKey = key
+			self.histogramImages = self.images[:]
+		return self.histogram
+
+	def setStatistics(self, settings, thresholds):
+		"""
+		Set the statistics of the given thresholds from the joint histogram
+		"""
+		(lower1, upper1), (lower2, upper2) = thresholds
+		results = self.histogram.getStatistics(int(lower1), int(upper1), int(lower2), int(upper2))
+		for i in STATISTICS:
+			settings.set(i, results[i])
+
+	def updateStatistics(self, timepoint, dataunits):
+		"""
+		Set the statistics of the current thresholds of the given dataunits,
+		if the joint histogram of the timepoint has already been built.
+		Returns whether the statistics were set.
+		"""
+		if not self.histogram:
+			return False
+		key = (timepoint, tuple(map(id, dataunits)), lib.ColocalizationStatistics.getImageKey(self.histogramImages))
+		if key != self.histogramKey:
+			return False
+		thresholds = []
+		for dataunit in dataunits:
+			settings = dataunit.getSettings()
+			thresholds.append((settings.get("ColocalizationLowerThreshold"), settings.get("ColocalizationUpperThreshold")))
+		self.setStatistics(dataunits[0].getSettings(), thresholds)
+		return True
+
 	def getPreview(self, z):
 		"""
 		Does a preview calculation for the x-y plane at depth z
@@ -104,7 +171,15 @@ class Colocalization(Module):
 		Logging.info("Maximum value = %d"%maxval, kw="processing") 
 		settings = self.settingsLst[0]
 		calcVal = settings.get("CalculateThresholds")
-		if calcVal:
+		histogram = None
+		if calcVal == STATISTICS_ONLY:
+			histogram = self.getJointHistogram()
+		if histogram:
+			self.eventDesc = "Calculating statistics"
+			Logging.info("Calculating statistics from the joint histogram", kw = "processing")
+			self.setStatistics(settings, self.thresholds)
+			self.settings.set("CalculateThresholds", 0)
+		elif calcVal:
 			self.eventDesc = "Calculating thresholds"
 			Logging.info("Calculating thresholds, calcval=%d" % calcVal, kw = "processing")
 			self.colocAutoThreshold.AddInput(self.images[0])
@@ -158,16 +233,7 @@ class Colocalization(Module):
 				Logging.info("Threshold for Ch1 =", t1, " and Ch2 =", t2, kw = "processing")
 				self.thresholds = [(t1, maxval), (t2, maxval)]
 			else:
-				for i in ["Ch1ThresholdMax", "Ch2ThresholdMax", "PearsonImageAbove",
-						  "PearsonImageBelow", "PearsonWholeImage", "M1", "M2",
-						  "K1", "K2", "DiffStainIntCh1", "DiffStainIntCh2",
-						  "DiffStainVoxelsCh1", "DiffStainVoxelsCh2",
-						  "ThresholdM1", "ThresholdM2",
-						  "ColocAmount", "ColocPercent", "PercentageVolumeCh1",
-						  "PercentageTotalCh1", "PercentageTotalCh2",
-						  "PercentageVolumeCh2", "PercentageMaterialCh1", "PercentageMaterialCh2",
-						  "SumOverThresholdCh1", "SumOverThresholdCh2", "SumCh1", "SumCh2",
-						  "NonZeroCh1", "NonZeroCh2", "OverThresholdCh2", "OverThresholdCh1"]:
+				for i in STATISTICS:
 					method = "self.colocAutoThreshold.Get%s()" % i
 	
 					val = eval(method)
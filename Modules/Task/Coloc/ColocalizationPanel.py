@@ -407,6 +407,7 @@ class ColocalizationPanel(TaskPanel):
 		sources[0].getSettings().set("ColocalizationUpperThreshold", ch1upper)
 		sources[1].getSettings().set("ColocalizationLowerThreshold", ch2lower)
 		sources[1].getSettings().set("ColocalizationUpperThreshold", ch2upper)
+		self.updateStatistics()
 		lib.messenger.send(None, "threshold_changed", (ch1lower, ch1upper), (ch2lower, ch2upper))
 		lib.messenger.send(None, "data_changed", True)
 		
@@ -571,7 +572,6 @@ class ColocalizationPanel(TaskPanel):
 		# We might get called before any channel has been selected.
 		# In that case, do nothing
 		if self.settings:
-			self.clearVariables()
 			oldlthreshold1 = self.settings.getCounted("ColocalizationLowerThreshold", 0)
 			olduthreshold1 = self.settings.getCounted("ColocalizationUpperThreshold", 0)
 			newlthreshold1 = int(self.lowerthreshold1.GetValue())
@@ -585,11 +585,22 @@ class ColocalizationPanel(TaskPanel):
 			newuthreshold2 = int(self.upperthreshold2.GetValue())
 			self.settings.setCounted("ColocalizationLowerThreshold", 1, newlthreshold2)
 			self.settings.setCounted("ColocalizationUpperThreshold", 1, newuthreshold2)
+			self.updateStatistics()
 			if (oldlthreshold1 != newlthreshold1) or (olduthreshold1 != newuthreshold1) or (oldlthreshold2 != newlthreshold2) or (olduthreshold2 != newuthreshold2):
 				lib.messenger.send(None, "threshold_changed")
 				self.doPreviewCallback()
 				
 
+	def updateStatistics(self):
+		"""
+		Update the statistics for the current thresholds from the joint
+		histogram of the channels, or clear them if it has not been built
+		"""
+		module = self.dataUnit.getModule()
+		if not module or not module.updateStatistics(self.timePoint, self.dataUnit.getSourceDataUnits()):
+			self.clearVariables()
+		self.listctrl.updateListCtrl(self.getVariables())
+
 	def updateSettings(self, force = 0, *args):
 		"""
 		A method used to set the GUI widgets to their proper values
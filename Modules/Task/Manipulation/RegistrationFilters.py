@@ -42,6 +42,7 @@ class RegistrationFilter(lib.ProcessingFilter.ProcessingFilter):
 	name = "3D Registration filter"
 	category = lib.FilterTypes.REGISTRATION
 	level = scripting.COLOR_EXPERIENCED
+	sequentialOnly = True
 	
 	def __init__(self, inputs = (1, 1)):
 		"""
@@ -41,6 +41,7 @@ import GUI.GUIBuilder as GUIBuilder
 import lib.ImageOperations
 import lib.messenger
 from lib import Particle
+from lib import ParticleTracker
 import lib.ProcessingFilter
 import lib.Track
 import os
@@ -809,7 +810,7 @@ class CreateTracksFilter(lib.ProcessingFilter.ProcessingFilter):
 		if not self.particleFile:
 			return
 		if not self.tracker:
-			self.tracker = Particle.ParticleTracker()
+			self.tracker = ParticleTracker.ParticleTracker()
 			#self.tracker = lib.Particle.ParticleTracker()
 		self.tracker.setFilterObjectSize(self.parameters["MinSize"])
 		if not os.path.exists(self.particleFile):
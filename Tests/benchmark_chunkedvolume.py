@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+# Benchmark for reading parts of a volume from the chunked volume (.bxv)
+# format compared to the VTK XML image data (.vti) files written by
+# BXCDataWriter. A synthetic 16-bit volume is written in both formats, and
+# a single slice, a small region of interest and the whole volume are read
+# from each. The voxels read must be identical.
+import sys
+import os
+import os.path
+import time
+import struct
+import tempfile
+import random
+sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), ".."))
+
+import vtk
+import lib.DataSource.ChunkedVolume
+
+DIMS = (512, 512, 64)
+ROI = (200, 263, 300, 363, 20, 35)
+REPEATS = 5
+
+def createVolume():
+	"""
+	Create a volume of random 16-bit noise
+	"""
+	xdim, ydim, zdim = DIMS
+	row = [random.randint(0, 4095) for i in range(xdim * ydim)]
+	plane = struct.pack("%dH" % len(row), *row)
+	data = plane * zdim
+
+	importer = vtk.vtkImageImport()
+	importer.CopyImportVoidPointer(data, len(data))
+	importer.SetDataScalarTypeToUnsignedShort()
+	importer.SetNumberOfScalarComponents(1)
+	importer.SetDataExtent(0, xdim - 1, 0, ydim - 1, 0, zdim - 1)
+	importer.SetWholeExtent(0, xdim - 1, 0, ydim - 1, 0, zdim - 1)
+	importer.SetDataSpacing(1.0, 1.0, 2.0)
+	importer.Update()
+	return importer.GetOutput()
+
+def writeVTI(image, filename):
+	"""
+	Write the volume the way BXCDataWriter does
+	"""
+	writer = vtk.vtkXMLImageDataWriter()
+	writer.SetFileName(filename)
+	writer.SetInput(image)
+	writer.Write()
+
+def writeChunked(image, filename, compression):
+	"""
+	Write the volume as a chunked volume
+	"""
+	writer = lib.DataSource.ChunkedVolume.ChunkedVolumeWriter(filename, image.GetDimensions(), \
+				image.GetScalarType(), image.GetScalarSize(), image.GetNumberOfScalarComponents(), \
+				image.GetSpacing(), image.GetOrigin(), compression = compression)
+	writer.writeImageData(0, image)
+	writer.close()
+
+def readVTI(filename, extent):
+	"""
+	Read extent from a .vti file
+	"""
+	reader = vtk.vtkXMLImageDataReader()
+	reader.SetFileName(filename)
+	voi = vtk.vtkExtractVOI()
+	voi.SetInputConnection(reader.GetOutputPort())
+	voi.SetVOI(extent)
+	voi.Update()
+	return voi.GetOutput()
+
+def readChunked(filename, extent):
+	"""
+	Read extent from a chunked volume
+	"""
+	volume = lib.DataSource.ChunkedVolume.ChunkedVolume(filename)
+	data = volume.getImageData(0, extent)
+	volume.close()
+	return data
+
+def getVoxels(image):
+	"""
+	Return the voxels of image as a string
+	"""
+	return lib.DataSource.ChunkedVolume.exportImageData(image)
+
+def timeRead(function, filename, extent):
+	"""
+	Return the best time of REPEATS reads and the data read
+	"""
+	best = None
+	for i in range(REPEATS):
+		t = time.time()
+		data = function(filename, extent)
+		elapsed = time.time() - t
+		if best is None or elapsed < best:
+			best = elapsed
+	return best, data
+
+if __name__ == "__main__":
+	directory = tempfile.mkdtemp()
+	image = createVolume()
+	vti = os.path.join(directory, "volume.vti")
+	raw = os.path.join(directory, "volume.bxv")
+	compressed = os.path.join(directory, "volume_zlib.bxv")
+	writeVTI(image, vti)
+	writeChunked(image, raw, "none")
+	writeChunked(image, compressed, "zlib:1")
+	for filename in [vti, raw, compressed]:
+		print "%s: %.1f MB" % (os.path.basename(filename), os.path.getsize(filename) / 1048576.0)
+
+	xdim, ydim, zdim = DIMS
+	extents = [("slice", (0, xdim - 1, 0, ydim - 1, zdim / 2, zdim / 2)),
+				("roi", ROI),
+				("volume", (0, xdim - 1, 0, ydim - 1, 0, zdim - 1))]
+	try:
+		for name, extent in extents:
+			vtiTime, expected = timeRead(readVTI, vti, extent)
+			expected = getVoxels(expected)
+			print "%s: vti %.3fs" % (name, vtiTime),
+			for filename in [raw, compressed]:
+				chunkedTime, data = timeRead(readChunked, filename, extent)
+				assert getVoxels(data) == expected, "%s read from %s differs from vti" % (name, filename)
+				print "| %s %.3fs (%.1fx)" % (os.path.basename(filename), chunkedTime, vtiTime / max(chunkedTime, 1e-9)),
+			print
+	finally:
+		for filename in [vti, raw, compressed]:
+			os.remove(filename)
+		os.rmdir(directory)
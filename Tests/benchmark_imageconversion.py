@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# Benchmark for converting image slices to wx.Images and PNG strings. Slices
+# of 512 x 512, 2048 x 2048 and 4096 x 4096 pixels are converted both the
+# old way (mapping the colors with VTK, exporting into a string made with
+# struct.pack and copying that to the image, or building the PNG string one
+# character at a time) and with lib.ImageOperations, which uses
+# lib.ImageConversion. The resulting images must be identical.
+import sys
+import os.path
+import time
+import struct
+sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), ".."))
+
+import numpy
+import vtk
+import wx
+from vtk.util import numpy_support
+import lib.ImageOperations
+
+SIZES = (512, 2048, 4096)
+# Building the PNG string a character at a time is too slow for the largest slice
+MAX_OLD_PNG_SIZE = 2048
+
+def createSlice(size):
+	"""
+	Create a slice of 12-bit noise with a gradient
+	"""
+	randomState = numpy.random.RandomState(size)
+	values = randomState.randint(0, 1024, (size, size)) + numpy.arange(size)[numpy.newaxis, :] * 3072 // size
+	scalars = numpy_support.numpy_to_vtk(values.astype(numpy.uint16).ravel(), deep = 1)
+	data = vtk.vtkImageData()
+	data.SetDimensions(size, size, 1)
+	data.SetScalarTypeToUnsignedShort()
+	data.GetPointData().SetScalars(scalars)
+	data.Update()
+	return data
+
+def createColorTransferFunction():
+	"""
+	Create a green color transfer function over 12-bit values
+	"""
+	ctf = vtk.vtkColorTransferFunction()
+	ctf.AddRGBPoint(0, 0, 0, 0)
+	ctf.AddRGBPoint(4095, 0, 1, 0)
+	return ctf
+
+def oldWxImage(data, ctf):
+	"""
+	The conversion to wx.Image as it was done before lib.ImageConversion
+	"""
+	data = lib.ImageOperations.imageDataTo3Component(data, ctf)
+	exporter = vtk.vtkImageExport()
+	data.SetUpdateExtent(data.GetWholeExtent())
+	data.Update()
+	exporter.SetInputConnection(data.GetProducerPort())
+	structString = struct.pack("%ds" % exporter.GetDataMemorySize(), "")
+	exporter.SetExportVoidPointer(structString)
+	exporter.Export()
+	width, height = data.GetDimensions()[0:2]
+	image = wx.EmptyImage(width, height)
+	image.SetData(structString)
+	return image
+
+def oldPngString(data):
+	"""
+	The PNG string as it was built before lib.ImageConversion
+	"""
+	pngwriter = vtk.vtkPNGWriter()
+	pngwriter.WriteToMemoryOn()
+	pngwriter.SetInputConnection(data.GetProducerPort())
+	pngwriter.Write()
+	result = pngwriter.GetResult()
+	data = ""
+	for i in range(result.GetNumberOfTuples()):
+		data += chr(result.GetValue(i))
+	return data
+
+def timeCall(function, *args):
+	"""
+	Return the result of a call and the time it took
+	"""
+	start = time.time()
+	result = function(*args)
+	return result, time.time() - start
+
+def main():
+	app = wx.PySimpleApp()
+	ctf = createColorTransferFunction()
+	print "%10s %12s %12s %12s %12s" % ("slice", "old wx", "new wx", "old png", "new png")
+	for size in SIZES:
+		data = createSlice(size)
+		oldImage, oldTime = timeCall(oldWxImage, data, ctf)
+		newImage, newTime = timeCall(lib.ImageOperations.vtkImageDataToWxImage, data, -1, None, None, ctf)
+		if oldImage.GetData() != newImage.GetData():
+			print "The images of %d x %d pixels differ" % (size, size)
+
+		rgb = lib.ImageOperations.imageDataTo3Component(data, ctf)
+		rgb.Update()
+		oldPng, oldPngTime = None, float("nan")
+		if size <= MAX_OLD_PNG_SIZE:
+			oldPng, oldPngTime = timeCall(oldPngString, rgb)
+		newPng, newPngTime = timeCall(lib.ImageOperations.vtkImageDataToPngString, rgb)
+		if oldPng is not None and oldPng != newPng:
+			print "The PNG strings of %d x %d pixels differ" % (size, size)
+		print "%10s %11.3fs %11.3fs %11.3fs %11.3fs" % ("%dx%d" % (size, size), oldTime, newTime, oldPngTime, newPngTime)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+# Regression benchmark for the per-object surface area calculation of
+# AnalyzeObjectsFilter. A synthetic label volume with a grid of ball shaped
+# objects is meshed both the old way (thresholding and meshing the whole
+# volume once per label) and with lib.ObjectSurface, which meshes only the
+# padded bounding box of each label. The areas must be identical.
+import sys
+import os.path
+import time
+import struct
+sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), ".."))
+
+import vtk
+import lib.ObjectSurface
+
+DIMS = (160, 160, 40)
+RADIUS = 5
+STEP = 14
+
+def createLabelVolume():
+	"""
+	Create a label volume with balls of radius RADIUS every STEP voxels
+	"""
+	xdim, ydim, zdim = DIMS
+	centers = []
+	for cz in range(STEP / 2, zdim - RADIUS, STEP):
+		for cy in range(STEP / 2, ydim - RADIUS, STEP):
+			for cx in range(STEP / 2, xdim - RADIUS, STEP):
+				centers.append((cx, cy, cz))
+	voxels = [0] * (xdim * ydim * zdim)
+	boxes = []
+	r2 = RADIUS * RADIUS
+	for label, (cx, cy, cz) in enumerate(centers):
+		label += 1
+		for z in range(cz - RADIUS, cz + RADIUS + 1):
+			for y in range(cy - RADIUS, cy + RADIUS + 1):
+				for x in range(cx - RADIUS, cx + RADIUS + 1):
+					if (x - cx)**2 + (y - cy)**2 + (z - cz)**2 <= r2:
+						voxels[(z * ydim + y) * xdim + x] = label
+		boxes.append((label, (cx - RADIUS, cy - RADIUS, cz - RADIUS), (2 * RADIUS + 1,) * 3))
+	data = struct.pack("%dH" % len(voxels), *voxels)
+
+	importer = vtk.vtkImageImport()
+	importer.CopyImportVoidPointer(data, len(data))
+	importer.SetDataScalarTypeToUnsignedShort()
+	importer.SetNumberOfScalarComponents(1)
+	importer.SetDataExtent(0, xdim - 1, 0, ydim - 1, 0, zdim - 1)
+	importer.SetWholeExtent(0, xdim - 1, 0, ydim - 1, 0, zdim - 1)
+	importer.SetDataSpacing(1.0, 1.0, 2.0)
+	importer.Update()
+	return importer.GetOutput(), boxes
+
+def wholeVolumeSurfaces(labelImage, labels, smoothness):
+	"""
+	The surface area calculation as it was done before lib.ObjectSurface
+	"""
+	objectThreshold = vtk.vtkImageThreshold()
+	objectThreshold.SetInput(labelImage)
+	objectThreshold.SetOutputScalarTypeToUnsignedChar()
+	objectThreshold.SetInValue(255)
+	objectThreshold.SetOutValue(0)
+	marchingCubes = vtk.vtkMarchingCubes()
+	marchingCubes.SetInput(objectThreshold.GetOutput())
+	massProperties = vtk.vtkMassProperties()
+	massProperties.SetInput(marchingCubes.GetOutput())
+	smoothDecimate = vtk.vtkDecimatePro()
+	smoothProperties = vtk.vtkMassProperties()
+	smoothDecimate.SetTargetReduction(0.9)
+	smoothDecimate.PreserveTopologyOff()
+	smoothDecimate.SetInput(marchingCubes.GetOutput())
+	smoothProperties.SetInput(smoothDecimate.GetOutput())
+
+	results = {}
+	for i in labels:
+		objectThreshold.ThresholdBetween(i, i)
+		marchingCubes.SetValue(0, 255)
+		polydata = marchingCubes.GetOutput()
+		polydata.Update()
+		area = smoothArea = None
+		if polydata.GetNumberOfPolys() > 0:
+			massProperties.Update()
+			area = massProperties.GetSurfaceArea()
+		if smoothness:
+			polydata = smoothDecimate.GetOutput()
+			polydata.Update()
+			if polydata.GetNumberOfPolys() > 0:
+				smoothProperties.Update()
+				smoothArea = smoothProperties.GetSurfaceArea()
+		results[i] = (area, smoothArea)
+	return results
+
+def compare(expected, results):
+	"""
+	Return the largest relative difference between two sets of areas
+	"""
+	largest = 0.0
+	for label, areas in expected.items():
+		for a, b in zip(areas, results[label]):
+			if a is None or b is None:
+				assert a == b, "Label %d: %s != %s" % (label, str(a), str(b))
+				continue
+			largest = max(largest, abs(a - b) / max(abs(a), 1e-9))
+	return largest
+
+if __name__ == "__main__":
+	t = time.time()
+	labelImage, boxes = createLabelVolume()
+	print "Created %d objects in a %s volume in %.2fs" % (len(boxes), str(DIMS), time.time() - t)
+	wholeExtent = labelImage.GetWholeExtent()
+	labelExtents = [(label, lib.ObjectSurface.getPaddedExtent(index, size, wholeExtent)) for label, index, size in boxes]
+	labels = [label for label, extent in labelExtents]
+
+	t = time.time()
+	expected = wholeVolumeSurfaces(labelImage, labels, True)
+	wholeTime = time.time() - t
+	print "Whole volume meshing: %.2fs" % wholeTime
+
+	t = time.time()
+	cropped = lib.ObjectSurface.calculateSurfaces(labelImage, labelExtents, True, workers = 1)
+	croppedTime = time.time() - t
+	print "Bounding box meshing: %.2fs (%.1fx), largest difference %g" % \
+			(croppedTime, wholeTime / max(croppedTime, 1e-9), compare(expected, cropped))
+
+	workers = lib.ProcessPool.getNumberOfCPUs()
+	t = time.time()
+	parallel = lib.ObjectSurface.calculateSurfaces(labelImage, labelExtents, True, workers = workers)
+	parallelTime = time.time() - t
+	print "Bounding box meshing with %d processes: %.2fs (%.1fx), largest difference %g" % \
+			(workers, parallelTime, wholeTime / max(parallelTime, 1e-9), compare(expected, parallel))
+
+	assert compare(expected, cropped) < 1e-9
+	assert compare(expected, parallel) < 1e-9
+	assert croppedTime < wholeTime, "Bounding box meshing should be faster than whole volume meshing"
@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+# Benchmark for linking particles into tracks. The objects of a time series
+# are generated with the particle simulation filter, a part of the
+# detections is dropped to simulate missed objects, and the detections are
+# tracked with greedy linking and with global linking, with and without
+# gap closing. The runtime and the precision and recall of the links
+# against the simulated ground truth are reported.
+import sys
+import os.path
+import time
+import random
+sys.path.insert(0, os.path.join(os.path.dirname(sys.argv[0]), ".."))
+
+import lib.Particle
+import lib.ParticleTracker
+from Modules.Filters.ParticleSimulation import ParticleSimulationFilter
+
+TIMEPOINTS = 20
+OBJECTS = 1500
+DROPOUT = 0.05
+
+def simulateDetections():
+	"""
+	Create the objects of a time series with the particle simulation filter
+	and return them as particles, with some of them dropped
+	"""
+	simulation = ParticleSimulationFilter()
+	for parameter, value in [("Time", TIMEPOINTS), ("NumberOfObjectsStart", OBJECTS), \
+							("NumberOfObjectsEnd", OBJECTS), ("Clustering", False), \
+							("SpeedStart", 2), ("SpeedEnd", 6)]:
+		simulation.setParameter(parameter, value)
+	simulation.createTimeSeries()
+	rand = random.Random(1)
+	particles = []
+	for tp, objects in enumerate(simulation.objects):
+		current = []
+		for objN, com, size, objInt in objects:
+			if tp and rand.random() < DROPOUT:
+				continue
+			particle = lib.Particle.Particle(com, com, tp, size, objInt, objN)
+			particle.setVoxelSize([1.0, 1.0, 1.0])
+			current.append(particle)
+		particles.append(current)
+	return particles
+
+def getTrueLinks(particles):
+	"""
+	Return the links between the consecutive detections of each object
+	"""
+	lastSeen = {}
+	links = {}
+	for tp, current in enumerate(particles):
+		for particle in current:
+			if particle.intval in lastSeen:
+				links[(particle.intval, lastSeen[particle.intval], tp)] = 1
+			lastSeen[particle.intval] = tp
+	return links
+
+def getAccuracy(tracks, trueLinks):
+	"""
+	Return the precision and recall of the links of the tracks
+	"""
+	correct = 0
+	total = 0
+	for track in tracks:
+		detections = [particle for particle in track if particle.intval]
+		for previous, particle in zip(detections, detections[1:]):
+			total += 1
+			if (particle.intval, previous.timePoint, particle.timePoint) in trueLinks \
+					and previous.intval == particle.intval:
+				correct += 1
+	return correct / float(max(total, 1)), correct / float(max(len(trueLinks), 1))
+
+def runTracker(particles, globalLinking, gapFrames):
+	"""
+	Track the particles and return the tracks and the time taken
+	"""
+	tracker = lib.ParticleTracker.ParticleTracker()
+	tracker.particles = particles
+	tracker.setMinSpeed(0)
+	tracker.setMaxSpeed(6)
+	tracker.setSpeedDeviation(0.3)
+	tracker.setSizeChange(0.5)
+	tracker.setIntensityChange(0.5)
+	tracker.setAngleChange(180)
+	tracker.setWeights(25, 25, 25, 25)
+	tracker.setGlobalLinking(globalLinking)
+	tracker.setGapFrames(gapFrames)
+	t = time.time()
+	tracker.track()
+	return tracker.getTracks(), time.time() - t
+
+if __name__ == "__main__":
+	particles = simulateDetections()
+	trueLinks = getTrueLinks(particles)
+	print "%d timepoints, %d detections, %d true links" % \
+			(len(particles), sum([len(current) for current in particles]), len(trueLinks))
+	for name, globalLinking, gapFrames in [("greedy", False, 0), ("global", True, 0), ("global, 2 gap frames", True, 2)]:
+		for current in particles:
+			for particle in current:
+				particle.inTrack = False
+		tracks, elapsed = runTracker(particles, globalLinking, gapFrames)
+		precision, recall = getAccuracy(tracks, trueLinks)
+		print "%s: %.2fs, %d tracks, precision %.3f, recall %.3f" % (name, elapsed, len(tracks), precision, recall)
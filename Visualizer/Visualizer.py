@@ -49,6 +49,9 @@ import GUI.UIElements
 import wx.lib.buttons
 import bxdevents
 visualizerInstance = None
+# The delay in milliseconds between the steps of prefetching timepoints,
+# which is also how often a running worker process is polled
+PREFETCH_DELAY = 20
 
 def getVisualizer():
 	global visualizerInstance
@@ -440,7 +443,6 @@ class Visualizer:
 		"""
 		Go to next timepoint
 		"""
-		lib.messenger.send(None, "clear_cache_dataunits")
 		undo_cmd = "scripting.visualizer.prevTimepoint()"
 		do_cmd = "scripting.visualizer.nextTimepoint()"
 		cmd = lib.Command.Command(lib.Command.GUI_CMD, None, None, do_cmd, undo_cmd, desc = "Switch to next timepoint")
@@ -450,7 +452,6 @@ class Visualizer:
 		"""
 		Go to previous timepoint
 		"""
-		lib.messenger.send(None, "clear_cache_dataunits")
 		undo_cmd = "scripting.visualizer.nextTimepoint()"
 		do_cmd = "scripting.visualizer.prevTimepoint()"
 		cmd = lib.Command.Command(lib.Command.GUI_CMD, None, None, do_cmd, undo_cmd, desc = "Switch to previous timepoint")
@@ -1478,6 +1479,28 @@ class Visualizer:
 		if hasattr(self.currentWindow, "setTimepoint"):
 			self.currentWindow.setTimepoint(self.timepoint)
 		self.currentMode.setTimepoint(self.timepoint)
+		self.prefetchTimepoints()
+
+	def prefetchTimepoints(self):
+		"""
+		Start processing the timepoints around the shown one in a worker
+		process, so that moving to them is served from memory
+		"""
+		if not self.dataUnit or not self.dataUnit.isProcessed() or not scripting.renderingEnabled:
+			return
+		prefetcher = self.dataUnit.getPrefetcher()
+		prefetcher.setScheduler(self.schedulePrefetch)
+		prefetcher.setTimepoint(self.timepoint, self.dataUnit.getNumberOfTimepoints())
+
+	def schedulePrefetch(self, step):
+		"""
+		Take a step of the prefetcher when the visualizer is not rendering. The
+		steps start the worker processes and collect the processed timepoints.
+		"""
+		if self.in_vtk:
+			wx.FutureCall(PREFETCH_DELAY, self.schedulePrefetch, step)
+		else:
+			wx.FutureCall(PREFETCH_DELAY, step)
 
 	def onUpdateTimepoint(self, evt = None):
 		"""
@@ -1485,7 +1508,6 @@ class Visualizer:
 		"""
 		# if this call is not from a user caused event, and there has been a request
 		# to change the timepoint 1/100 of a second ago, then wait a bit
-		lib.messenger.send(None, "clear_cache_dataunits")
 		if not evt:
 			diff = abs(time.time() - self.changing)
 			if diff < 0.01:
@@ -31,24 +31,155 @@ __date__ = "$Date: 2005/01/13 13:42:03 $"
 
 import Modules.DynamicLoader
 import lib.FilterBasedModule
+import lib.messenger
+import lib.ProcessPool
+import Logging
 import codecs
+import cPickle
 import csv
 import ConfigParser
+import hashlib
 import os
 import re
 import scripting
 import time
+import traceback
 
 PROCESS_SEPARATELY = 0
 PROCESS_TOGETHER = 1
 
+# The state shared with the worker processes of a parallel batch analysis.
+# The workers are forked, so they inherit it, but every job reads its
+# datasets and the analysis again so that the workers share no readers
+# or filters with the main process.
+jobContext = {}
+
+def getDataSourceClasses():
+	"""
+	@return a dictionary of the data source classes of the readers by the
+			file extensions they read
+	"""
+	extToSource = {}
+	for modeclass, ign, module in Modules.DynamicLoader.getReaders().values():
+		for ext in module.getExtensions():
+			extToSource[ext] = modeclass
+	return extToSource
+
+def loadDataUnits(units, extToSource):
+	"""
+	Read the dataunits given as (filename, name of the dataunit) pairs.
+	Each file is read only once.
+	"""
+	loaded = {}
+	dataUnits = []
+	for filename, name in units:
+		if filename not in loaded:
+			ext = os.path.splitext(filename)[1][1:].lower()
+			if ext not in extToSource:
+				raise IOError("No reader for %s" % filename)
+			loaded[filename] = extToSource[ext]().loadFromFile(filename)
+		for dataUnit in loaded[filename]:
+			if dataUnit.getName() == name:
+				dataUnits.append(dataUnit)
+				break
+		else:
+			raise IOError("No channel %s in %s" % (name, filename))
+	return dataUnits
+
+def getJobKey(procListName, dataUnits):
+	"""
+	@return the key of the job that runs the dataunits through a procedure list
+	"""
+	return (procListName, tuple([(x.getFileName(), x.getName()) for x in dataUnits]))
+
+def executeJob(job):
+	"""
+	Read the datasets and the analysis of a job from their files and run the
+	datasets through the procedure list. This is run in the worker processes.
+	Returns the index of the job with either its results or the error.
+	"""
+	index, procListName, units = job
+	try:
+		dataUnits = loadDataUnits(units, jobContext["dataSources"])
+		analysis = BatchAnalysis()
+		analysis.setInputDataUnits(dataUnits)
+		analysis.readAnalysisFrom(jobContext["analysisFile"])
+		# The worker is already one of a pool, so timepoints are processed serially
+		result = analysis.processDataUnits(procListName, dataUnits, jobContext["directory"], \
+											jobContext["timepoints"], jobContext["varHeaders"], processes = 1)
+	except Exception:
+		return index, None, traceback.format_exc()
+	return index, result, None
+
+class BatchJournal:
+	"""
+	A journal of the completed jobs of a batch analysis, from which an
+	interrupted analysis is resumed. The journal starts with a signature of
+	the analysis, and is ignored if the analysis has changed since.
+	"""
+	def __init__(self, filename, signature):
+		"""
+		Initialization
+		"""
+		self.filename = filename
+		self.signature = signature
+		self.fp = None
+
+	def read(self):
+		"""
+		@return the results of the completed jobs by their key
+		"""
+		completed = {}
+		if not os.path.exists(self.filename):
+			return completed
+		fp = open(self.filename, "rb")
+		try:
+			try:
+				if cPickle.load(fp) != self.signature:
+					return {}
+				while 1:
+					key, result = cPickle.load(fp)
+					completed[key] = result
+			except (EOFError, cPickle.UnpicklingError, ValueError, TypeError):
+				# The record that was being written when the analysis stopped
+				pass
+		finally:
+			fp.close()
+		return completed
+
+	def open(self, completed):
+		"""
+		Start the journal anew with the results of the already completed jobs
+		"""
+		self.fp = open(self.filename, "wb")
+		cPickle.dump(self.signature, self.fp, 2)
+		for key, result in completed.items():
+			cPickle.dump((key, result), self.fp, 2)
+		self.fp.flush()
+
+	def add(self, key, result):
+		"""
+		Record a completed job
+		"""
+		cPickle.dump((key, result), self.fp, 2)
+		self.fp.flush()
+		os.fsync(self.fp.fileno())
+
+	def close(self, remove = 0):
+		"""
+		Close the journal and remove it if the analysis was completed
+		"""
+		if self.fp:
+			self.fp.close()
+			self.fp = None
+		if remove and os.path.exists(self.filename):
+			os.remove(self.filename)
+
 class BatchAnalysis:
 	"""
 	Description: A batch analysis model
 	"""
 	def __init__(self, filename = ""):
-		if filename:
-			self.readAnalysisFrom(filename)
 		self.filename = filename
 		self.dataUnit = None
 		
@@ -64,6 +195,9 @@ class BatchAnalysis:
 		self.channelProcessing = 0
 		self.procListGrouping = 0
 		self.filterIndexes = {}
+		self.jobSummaries = []
+		if filename:
+			self.readAnalysisFrom(filename)
 		
 	def renameList(self, name, newName):
 		"""
@@ -233,30 +367,25 @@ the name '%s' was found. Existing lists are: %s"""%(name, ", ".join(self.procedu
 				fp.write("%s\n"%os.path.join(bxcDir,bxcFile))
 			fp.close()
 			
-	def execute(self, csvfile, directory, timepoints):
+	def execute(self, csvfile, directory, timepoints, workers = 0):
 		"""
-		execute the analysis
+		execute the analysis. Each procedure list and group of dataunits is
+		a job, and the jobs are run in a pool of worker processes when more
+		than one process is configured. The completed jobs are recorded in a
+		journal, so that an interrupted analysis continues where it stopped
+		when it is executed again.
 		"""
 		stime = time.time()
-		# Create a CSV file writer
-		csvfp = codecs.open(csvfile, "wb", "latin-1")
-		csvwriter = csv.writer(csvfp, dialect = "excel", delimiter = ";")
-		
 		# Get the selected variables
 		variables = self.getAllSelectedVariables()
 		# variables is a dict where keys are the user assigned names of the result variables
 		# and the values are the variables' real names.  We use as headers for the csv file the
 		# user given names
 		varHeaders = variables.keys()
-		# we also write the filename and channels used to produce each of the variables
-		csvwriter.writerow(["Filename","Channels","Timepoint"]+varHeaders)
 		
-		writtenOutDataunits = []
+		jobs = []
 		# Go through each procedure list
 		for procListName in self.procedureLists.keys():
-			# get the procedure list
-			procList = self.procedureLists[procListName]
-
 			# If each of the channels of an image are processed separately, but they are
 			# grouped to resulting BXD files that have similiar channel structure as the input
 			# files, then we sort the dataunits according to the filenames (getDataUnitsByFilename())
@@ -266,48 +395,99 @@ the name '%s' was found. Existing lists are: %s"""%(name, ", ".join(self.procedu
 				for units in groupedUnits:
 					self.createSingleGroupedBXDFile(directory, procListName, units)
 
-			# then go through each dataunit and apply the procedure list
+			# then each group of dataunits is run through the procedure list.
+			# The division of what channels should be used as source dataunits is
+			# affected by the channel processing option, and determined in getGroupedDataUnits()
 			for dataUnits in self.getGroupedDataUnits():
-				self.initializeDataUnit()
-				#self.dataUnit.removeAllInputs()
-				
-				# The division of what channels should be used as source dataunits is
-				# affected by the channel processing option, and determined in getGroupedDataUnits()
-				# here we just add the selected dataunits as source dataunits
-				for du in dataUnits:
-					print "Adding",du,"as input"
-					self.dataUnit.addSourceDataUnit(du)
-	
-				scripting.combinedDataUnit = self.dataUnit
-				# We pass a flag directing the procedure list to not re-intialize the filters
-				# since that would reset their settings
-				procList.setDataUnit(self.dataUnit, initializeFilters = 0)
-				self.dataUnit.getSettings().set("FilterList", procList)
-				self.dataUnit.getSettings().set("ColorTransferFunction", self.determineColorTransferFunction(procList, dataUnits))
+				jobs.append((procListName, dataUnits))
 
-				if self.channelProcessing == PROCESS_TOGETHER:
-					nameBase = procListName+"_"+os.path.basename(dataUnits[0].getFileName())
+		# The workers read the analysis from a file, which is also used to
+		# recognize the journal of an interrupted run of the same analysis
+		analysisFile = csvfile + ".bba"
+		self.writeAnalysis(analysisFile)
+		fp = open(analysisFile, "rb")
+		signature = hashlib.md5(fp.read() + repr((directory, list(timepoints), varHeaders))).hexdigest()
+		fp.close()
+		journal = BatchJournal(csvfile + ".journal", signature)
+		completed = journal.read()
+		
+		results = {}
+		pending = []
+		self.jobSummaries = []
+		for i, (procListName, dataUnits) in enumerate(jobs):
+			self.jobSummaries.append({"procedureList": procListName, \
+				"files": [x.getFileName() for x in dataUnits], "channels": [x.getName() for x in dataUnits], \
+				"status": "resumed", "seconds": 0.0, "filters": {}})
+			key = getJobKey(procListName, dataUnits)
+			if key in completed:
+				results[i] = completed[key]
+			else:
+				pending.append(i)
+		if results:
+			Logging.info("Resuming batch analysis, %d of %d jobs already done" % (len(results), len(jobs)), kw = "processing")
 
-				else:
-					filenames = "_".join([x.getName().split("_")[-1] for x in dataUnits])
-					nameBase = procListName+"_"+os.path.basename(dataUnits[0].getFileName())+"_"+filenames
+		workers = lib.ProcessPool.getNumberOfWorkers(workers)
+		if not hasattr(os, "fork"):
+			workers = 1
+		failed = []
+		journal.open(completed)
+		try:
+			if workers > 1 and len(pending) > 1:
+				Logging.info("Running %d batch jobs in %d processes" % (len(pending), workers), kw = "processing")
+				jobContext["dataSources"] = getDataSourceClasses()
+				jobContext["analysisFile"] = analysisFile
+				jobContext["directory"] = directory
+				jobContext["timepoints"] = timepoints
+				jobContext["varHeaders"] = varHeaders
+				workerJobs = []
+				for i in pending:
+					procListName, dataUnits = jobs[i]
+					workerJobs.append((i, procListName, list(getJobKey(procListName, dataUnits)[1])))
+				try:
+					for i, result, error in lib.ProcessPool.imapUnordered(executeJob, workerJobs, workers, \
+																			initializer = lib.ProcessPool.initializeWorker):
+						if error:
+							Logging.info("Batch job %s failed:\n%s" % (jobs[i][0], error), kw = "processing")
+							failed.append(i)
+							self.jobSummaries[i]["status"] = "failed"
+							self.jobSummaries[i]["error"] = error
+							continue
+						results[i] = result
+						journal.add(getJobKey(*jobs[i]), result)
+						self.setJobTiming(i, result)
+						self.reportProgress(len(results), len(jobs))
+				finally:
+					jobContext.clear()
+			else:
+				for i in pending:
+					procListName, dataUnits = jobs[i]
+					results[i] = self.processDataUnits(procListName, dataUnits, directory, timepoints, varHeaders)
+					journal.add(getJobKey(procListName, dataUnits), results[i])
+					self.setJobTiming(i, results[i])
+					self.reportProgress(len(results), len(jobs))
+		finally:
+			journal.close(remove = not failed and len(results) == len(jobs))
 
-				self.dataUnit.getSettings().set("Name",nameBase)
-				bxdFile = nameBase+".bxd"
-				filename = os.path.join(directory, bxdFile)
-				
-				# Then we do the actual processing
-				filename = self.dataUnit.doProcessing(filename, timepoints = timepoints, writebxd = not(self.channelGrouping or self.procListGrouping))
-				# Store the filename we got as a result along with the filename of the source
-				# dataunit. This is done to make it possible to apply the second grouping action
-				# where the output of the procedure lists are grouped to bxd files based on
-				# their original channel layout. This is done to facilitate, for example,
-				# processing each channel with separate procedure list
-				writtenOutDataunits.append((dataUnits[0].getFileName(), filename))
-		
-				# padding is the filename and channel information
-				padding = [", ".join([os.path.basename(x.getFileName()) for x in dataUnits]), ", ".join(x.getName().split("_")[-1] for x in dataUnits)]
-				self.writeResults(padding, csvwriter, procListName, procList, varHeaders, timepoints)
+		# The results are merged in the order of the jobs, regardless of the
+		# order in which they were completed
+		csvfp = codecs.open(csvfile, "wb", "latin-1")
+		csvwriter = csv.writer(csvfp, dialect = "excel", delimiter = ";")
+		# we also write the filename and channels used to produce each of the variables
+		csvwriter.writerow(["Filename","Channels","Timepoint"]+varHeaders)
+		writtenOutDataunits = []
+		for i in range(len(jobs)):
+			if i not in results:
+				continue
+			filename, rows, timing = results[i]
+			# Store the filename we got as a result along with the filename of the source
+			# dataunit. This is done to make it possible to apply the second grouping action
+			# where the output of the procedure lists are grouped to bxd files based on
+			# their original channel layout. This is done to facilitate, for example,
+			# processing each channel with separate procedure list
+			writtenOutDataunits.append((jobs[i][1][0].getFileName(), filename))
+			for row in rows:
+				csvwriter.writerow(row)
+		csvfp.close()
 
 		# If the channels are processed so that all the channels of a file are given as input
 		# to a procedure list, and the results should be grouped  so that the output of the
@@ -315,18 +495,99 @@ the name '%s' was found. Existing lists are: %s"""%(name, ", ".join(self.procedu
 		# necessary .bxd files (calling createProcListGroupedBXDFile())
 		if self.channelProcessing == PROCESS_TOGETHER and self.procListGrouping:
 			self.createProcListGroupedBXDFile(directory, writtenOutDataunits)
-			
-		csvfp.close()
+
+		if failed:
+			Logging.info("%d batch jobs failed, execute the analysis again to retry them" % len(failed), kw = "processing")
+		else:
+			os.remove(analysisFile)
 		scripting.combinedDataUnit = None
 		ftime = time.time()
 		print "BBA took %f secs"%(ftime - stime)
+
+	def setJobTiming(self, index, result):
+		"""
+		Record the time a job that was just completed took
+		"""
+		timing = result[2]
+		self.jobSummaries[index]["status"] = "done"
+		self.jobSummaries[index]["seconds"] = timing["seconds"]
+		self.jobSummaries[index]["filters"] = timing["filters"]
+
+	def getJobSummaries(self):
+		"""
+		return a summary of each job of the last execution: the procedure
+		list, files and channels of the job, whether it was done, resumed
+		from the journal or failed, and the time spent in the job and in
+		each of the filters
+		"""
+		return self.jobSummaries
+
+	def reportProgress(self, done, total):
+		"""
+		Report the number of completed jobs
+		"""
+		text = "Batch analysis: %d of %d jobs done" % (done, total)
+		Logging.info(text, kw = "processing")
+		lib.messenger.send(None, "update_progress", done / float(total), text)
+
+	def processDataUnits(self, procListName, dataUnits, directory, timepoints, varHeaders, processes = 0):
+		"""
+		Run the dataunits through a procedure list and return the name of the
+		written file, the rows of results for the csv file and the time spent
+		in the job and in each of the filters
+		"""
+		startTime = time.time()
+		procList = self.procedureLists[procListName]
+		self.initializeDataUnit()
+		#self.dataUnit.removeAllInputs()
+		
+		# here we just add the selected dataunits as source dataunits
+		for du in dataUnits:
+			print "Adding",du,"as input"
+			self.dataUnit.addSourceDataUnit(du)
+
+		scripting.combinedDataUnit = self.dataUnit
+		# We pass a flag directing the procedure list to not re-intialize the filters
+		# since that would reset their settings
+		procList.setDataUnit(self.dataUnit, initializeFilters = 0)
+		self.dataUnit.getSettings().set("FilterList", procList)
+		self.dataUnit.getSettings().set("ColorTransferFunction", self.determineColorTransferFunction(procList, dataUnits))
+
+		if self.channelProcessing == PROCESS_TOGETHER:
+			nameBase = procListName+"_"+os.path.basename(dataUnits[0].getFileName())
+
+		else:
+			filenames = "_".join([x.getName().split("_")[-1] for x in dataUnits])
+			nameBase = procListName+"_"+os.path.basename(dataUnits[0].getFileName())+"_"+filenames
+
+		self.dataUnit.getSettings().set("Name",nameBase)
+		bxdFile = nameBase+".bxd"
+		filename = os.path.join(directory, bxdFile)
+		
+		# Then we do the actual processing
+		filename = self.dataUnit.doProcessing(filename, timepoints = timepoints, processes = processes, \
+												writebxd = not(self.channelGrouping or self.procListGrouping))
+
+		# padding is the filename and channel information
+		padding = [", ".join([os.path.basename(x.getFileName()) for x in dataUnits]), ", ".join(x.getName().split("_")[-1] for x in dataUnits)]
+		rows = self.getResultRows(padding, procListName, procList, varHeaders, timepoints)
+		timing = {"seconds": time.time() - startTime, "filters": self.dataUnit.getModule().getFilterTimes()}
+		return filename, rows, timing
 	
 	def writeResults(self, fileNames, csvwriter, procListName, procedureList, varHeaders, timepoints):
 		"""
 		write the csv results out
 		"""
+		for row in self.getResultRows(fileNames, procListName, procedureList, varHeaders, timepoints):
+			csvwriter.writerow(row)
+
+	def getResultRows(self, fileNames, procListName, procedureList, varHeaders, timepoints):
+		"""
+		return the csv rows of the results of each timepoint
+		"""
 		selectedVars = self.getSelectedVariables(procListName)
 		row=[""]*len(varHeaders)
+		rows = []
 
 		for tp in timepoints:
 			for var in selectedVars.keys():
@@ -345,8 +606,8 @@ the name '%s' was found. Existing lists are: %s"""%(name, ", ".join(self.procedu
 					row[i] = value
 				else:
 					print var,"not found"
-			csvwriter.writerow(fileNames + [tp+1] + row)
-		
+			rows.append(fileNames + [tp+1] + row)
+		return rows
 		
 	def getDataUnit(self):
 		"""
@@ -371,6 +632,12 @@ the name '%s' was found. Existing lists are: %s"""%(name, ", ".join(self.procedu
 		save the batch analysis with the given filename
 		"""
 		self.filename = filename
+		self.writeAnalysis(filename)
+
+	def writeAnalysis(self, filename):
+		"""
+		write the batch analysis to the given file
+		"""
 		parser = ConfigParser.RawConfigParser()
 		parser.optionxform = str
 
@@ -0,0 +1,184 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: BatchManifest
+ Project: BioImageXD
+ Description:
+
+ Job manifests for the command line batch mode. A manifest lists the jobs
+ of a batch run. Each job has its input files, the channels to use, the
+ batch analysis or procedure list to run them through, the timepoints and
+ the output directory. Settings given at the top level of a manifest apply
+ to every job that does not set them itself. Manifests are written either
+ in JSON, as an object with a "jobs" list or as a plain list of jobs, or
+ as CSV files with a header row and one job per row. The jobs of a
+ manifest can be split into shards, so that a cluster scheduler can run
+ one campaign as an array of independent batch runs.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import csv
+import json
+import os.path
+
+# The settings of a job. input, channels and filters are lists, parameters
+# is a dictionary of filter parameters by filter name
+JOB_KEYS = ("input", "channels", "bba", "procedure", "filters", "parameters", "timepoints", "output", "name")
+LIST_KEYS = ("input", "channels", "filters")
+
+def toString(value):
+	"""
+	Return a value read from a manifest as a plain string
+	"""
+	if type(value) == unicode:
+		return value.encode("utf-8")
+	return str(value)
+
+def parseTimepoints(text):
+	"""
+	Parse a list of timepoints such as "0,1,3-5"
+	"""
+	timepoints = []
+	for item in str(text).split(","):
+		item = item.strip()
+		if not item:
+			continue
+		if "-" not in item:
+			timepoints.append(int(item))
+		else:
+			first, last = map(int, item.split("-"))
+			timepoints.extend(range(first, last + 1))
+	return timepoints
+
+def parseShard(text):
+	"""
+	Parse a shard given as "i/n", where 0 <= i < n, to (i, n)
+	"""
+	try:
+		index, count = map(int, text.split("/"))
+	except ValueError:
+		raise ValueError("The shard needs to be given as i/n, not %s" % text)
+	if count < 1 or not 0 <= index < count:
+		raise ValueError("Shard %s is not one of 0/%d ... %d/%d" % (text, count, count - 1, count))
+	return index, count
+
+def getShard(jobs, index, count):
+	"""
+	Return the jobs of the shard index of count shards. The jobs are dealt
+	to the shards in turn, so that the shards get about as many jobs each
+	even if the manifest is sorted by the size of the inputs.
+	"""
+	return jobs[index::count]
+
+def readManifest(filename):
+	"""
+	Read the jobs of a JSON or CSV manifest. Returns a list of jobs, which
+	are dictionaries with the keys of JOB_KEYS. Relative paths are relative
+	to the directory of the manifest.
+	"""
+	if os.path.splitext(filename)[1].lower() == ".csv":
+		defaults, jobs = readCSVManifest(filename)
+	else:
+		defaults, jobs = readJSONManifest(filename)
+	directory = os.path.dirname(os.path.abspath(filename))
+	return [makeJob(job, defaults, directory) for job in jobs]
+
+def readJSONManifest(filename):
+	"""
+	Return the settings common to the jobs and the jobs of a JSON manifest
+	"""
+	fp = open(filename, "r")
+	try:
+		manifest = json.load(fp)
+	finally:
+		fp.close()
+	if type(manifest) == list:
+		return {}, manifest
+	if type(manifest) != dict or type(manifest.get("jobs")) != list:
+		raise ValueError("The manifest %s does not have a list of jobs" % filename)
+	defaults = dict(manifest)
+	del defaults["jobs"]
+	return defaults, manifest["jobs"]
+
+def readCSVManifest(filename):
+	"""
+	Return the jobs of a CSV manifest. Lists are given in a single cell,
+	separated by commas.
+	"""
+	fp = open(filename, "rb")
+	try:
+		reader = csv.DictReader(fp)
+		jobs = []
+		for row in reader:
+			job = {}
+			for key, value in row.items():
+				if key is None or value is None or not value.strip():
+					continue
+				key = key.strip()
+				if key in LIST_KEYS:
+					value = [x.strip() for x in value.split(",") if x.strip()]
+				else:
+					value = value.strip()
+				job[key] = value
+			jobs.append(job)
+	finally:
+		fp.close()
+	return {}, jobs
+
+def makeJob(settings, defaults, directory):
+	"""
+	Complete the settings of a job with the defaults of the manifest
+	"""
+	if type(settings) in [str, unicode]:
+		settings = {"input": settings}
+	if type(settings) != dict:
+		raise ValueError("A job needs to be given as a dictionary, not %r" % (settings,))
+	unknown = [key for key in settings.keys() + defaults.keys() if key not in JOB_KEYS]
+	if unknown:
+		raise ValueError("Unknown job settings: %s" % ", ".join(sorted(set(unknown))))
+	job = {}
+	for key in JOB_KEYS:
+		value = settings.get(key, defaults.get(key))
+		if type(value) == unicode:
+			value = toString(value)
+		if key in LIST_KEYS and value is not None:
+			if type(value) != list:
+				value = [value]
+			value = map(toString, value)
+		job[key] = value
+	if not job["input"]:
+		raise ValueError("A job has no input files")
+	if not (job["bba"] or job["procedure"] or job["filters"]):
+		raise ValueError("The job of %s has no batch analysis, procedure list or filters" % job["input"][0])
+	for key in ("bba", "procedure", "output"):
+		if job[key]:
+			job[key] = os.path.join(directory, job[key])
+	job["input"] = [os.path.join(directory, x) for x in job["input"]]
+	job["output"] = job["output"] or directory
+	if job["timepoints"] is None or job["timepoints"] == "":
+		job["timepoints"] = []
+	elif type(job["timepoints"]) == list:
+		job["timepoints"] = map(int, job["timepoints"])
+	else:
+		job["timepoints"] = parseTimepoints(job["timepoints"])
+	job["parameters"] = job["parameters"] or {}
+	return job
@@ -0,0 +1,356 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: ColocalizationStatistics
+ Project: BioImageXD
+ Description:
+
+ The colocalization statistics of vtkImageAutoThresholdColocalization for
+ given thresholds, computed with NumPy from the joint histogram of the two
+ channels. The histogram is built once, in a single pass over the voxels.
+ The statistics of any thresholds are then computed from the occupied bins
+ of the histogram and the cumulative sums of its rows and columns without
+ going through the voxels again, so that they can be updated while the
+ thresholds are being changed.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import math
+import lib.messenger
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# The largest joint histogram that is counted in a dense array. Larger
+# histograms, such as those of 16-bit data, are collected bin by bin.
+DENSE_SIZE = 2 ** 24
+# The number of voxels that are binned at a time
+CHUNK_SIZE = 2 ** 22
+# The largest number of bins of the coarse histogram along either channel
+COARSE_BINS = 512
+
+# The result variables of vtkImageAutoThresholdColocalization
+VARIABLES = ["Ch1ThresholdMax", "Ch2ThresholdMax", "PearsonImageAbove",
+			"PearsonImageBelow", "PearsonWholeImage", "M1", "M2",
+			"K1", "K2", "DiffStainIntCh1", "DiffStainIntCh2",
+			"DiffStainVoxelsCh1", "DiffStainVoxelsCh2",
+			"ThresholdM1", "ThresholdM2", "C1", "C2",
+			"ColocAmount", "ColocPercent", "PercentageVolumeCh1",
+			"PercentageTotalCh1", "PercentageTotalCh2",
+			"PercentageVolumeCh2", "PercentageMaterialCh1", "PercentageMaterialCh2",
+			"SumOverThresholdCh1", "SumOverThresholdCh2", "SumCh1", "SumCh2",
+			"NonZeroCh1", "NonZeroCh2", "OverThresholdCh2", "OverThresholdCh1",
+			"Slope", "Intercept"]
+
+def isSupported(volume):
+	"""
+	Return whether the statistics of a channel, given as an array, can be
+	computed from a joint histogram
+	"""
+	return volume is not None and volume.dtype.kind == "u" and volume.size > 0
+
+def getImageKey(images):
+	"""
+	Return a key that changes when the data of the images changes, for
+	telling whether a joint histogram is still valid
+	"""
+	return tuple([(image.GetMTime(), image.GetUpdateTime()) for image in images])
+
+def getPearson(n, sumX, sumY, sumXX, sumYY, sumXY):
+	"""
+	Return the Pearson correlation of n voxels from their sums
+	"""
+	if n <= 0:
+		return 0.0
+	covariance = sumXY - sumX * sumY / n
+	variance = (sumXX - sumX * sumX / n) * (sumYY - sumY * sumY / n)
+	if variance <= 0:
+		return 0.0
+	return covariance / math.sqrt(variance)
+
+def getRatio(numerator, denominator):
+	"""
+	Return the ratio of two sums, or zero if the denominator is zero
+	"""
+	if not denominator:
+		return 0.0
+	return float(numerator) / denominator
+
+def getRange(cumulative, lower, upper):
+	"""
+	Return the sum of the values lower ... upper from the cumulative sums
+	of a histogram
+	"""
+	first = max(int(math.ceil(lower)), 0)
+	last = min(int(math.floor(upper)), len(cumulative) - 2)
+	if last < first:
+		return 0.0
+	return float(cumulative[last + 1] - cumulative[first])
+
+def getCumulative(bins, weights, size):
+	"""
+	Return the cumulative sums of a histogram, starting from zero
+	"""
+	histogram = numpy.bincount(bins, weights, size)
+	return numpy.concatenate([[0.0], numpy.cumsum(histogram)])
+
+def getBinWidth(maximum):
+	"""
+	Return the number of values in a bin of the coarse histogram of a channel
+	"""
+	width = 1
+	while maximum // width >= COARSE_BINS:
+		width *= 2
+	return width
+
+def getMoments(x, y, counts):
+	"""
+	Return the number of voxels and the sums of x, y, x * x, y * y and x * y
+	over the bins of a joint histogram
+	"""
+	x, y = x.astype(numpy.float64), y.astype(numpy.float64)
+	counts = counts.astype(numpy.float64)
+	countX, countY = counts * x, counts * y
+	return numpy.array([counts.sum(), countX.sum(), countY.sum(), numpy.dot(countX, x), \
+						numpy.dot(countY, y), numpy.dot(countX, y)])
+
+def countPairs(ch1, ch2):
+	"""
+	Return the values of the occupied bins of the joint histogram of two
+	channels, as the codes ch1 * (max(ch2) + 1) + ch2, and their counts
+	"""
+	width = int(ch2.max()) + 1
+	size = (int(ch1.max()) + 1) * width
+	dense = size <= DENSE_SIZE
+	if dense:
+		counts = numpy.zeros(size, numpy.int64)
+	else:
+		parts = []
+	values1 = ch1.reshape(-1)
+	values2 = ch2.reshape(-1)
+	step = max(CHUNK_SIZE, min(size, DENSE_SIZE))
+	for start in range(0, len(values1), step):
+		codes = values1[start:start + step].astype(numpy.int64)
+		codes *= width
+		codes += values2[start:start + step]
+		if dense:
+			counts += numpy.bincount(codes, minlength = size)
+		else:
+			parts.append(numpy.unique(codes, return_counts = True))
+		lib.messenger.send(None, "update_progress", min(float(start + step) / len(values1), 1.0), \
+							"Building the joint histogram")
+	if dense:
+		codes = numpy.flatnonzero(counts)
+		return codes, counts[codes], width
+	codes, inverse = numpy.unique(numpy.concatenate([part[0] for part in parts]), return_inverse = True)
+	counts = numpy.bincount(inverse, numpy.concatenate([part[1] for part in parts]))
+	return codes, counts.astype(numpy.int64), width
+
+class JointHistogram:
+	"""
+	The joint histogram of two channels of unsigned integers. The sums over
+	the voxels in a range of both channels are taken from the cumulative
+	sums of a coarse histogram, where every bin covers a block of values,
+	and from the occupied bins of the full histogram in the blocks at the
+	edges of the range. The occupied bins are kept in the order of both
+	channels, so that the bins of the values at the edges are found directly.
+	"""
+	def __init__(self, ch1, ch2):
+		"""
+		Initialization
+		@param ch1, ch2 the channels as arrays of the same shape
+		"""
+		self.voxels = ch1.size
+		self.maxval = int(numpy.iinfo(ch1.dtype).max)
+		codes, counts, width = countPairs(ch1, ch2)
+		self.x = (codes // width).astype(numpy.int32)
+		self.y = (codes % width).astype(numpy.int32)
+		self.counts = counts
+		order = numpy.argsort(self.y, kind = "mergesort")
+		self.xByY, self.yByY, self.countsByY = self.x[order], self.y[order], self.counts[order]
+		self.max1, self.max2 = int(self.x[-1]), int(self.yByY[-1])
+		# The first occupied bin of every value of either channel
+		self.rows = numpy.concatenate([[0], numpy.bincount(self.x, minlength = self.max1 + 1).cumsum()])
+		self.columns = numpy.concatenate([[0], numpy.bincount(self.y, minlength = self.max2 + 1).cumsum()])
+		self.zero = 0
+		if codes[0] == 0:
+			self.zero = int(counts[0])
+
+		self.total = getMoments(self.x, self.y, self.counts)
+		self.sumX, self.sumY, self.sumXX, self.sumYY, self.sumXY = self.total[1:]
+		self.width1, self.width2 = getBinWidth(self.max1), getBinWidth(self.max2)
+		self.coarse = self.getCoarseHistogram()
+
+		# The histograms of either channel and the sums of both channels over
+		# the voxels of every bin, cumulated
+		weights = self.counts.astype(numpy.float64)
+		countX, countY = weights * self.x, weights * self.y
+		self.countsCh1 = getCumulative(self.x, weights, self.max1 + 1)
+		self.sumsCh1 = getCumulative(self.x, countX, self.max1 + 1)
+		self.otherSumsCh1 = getCumulative(self.x, countY, self.max1 + 1)
+		self.countsCh2 = getCumulative(self.y, weights, self.max2 + 1)
+		self.sumsCh2 = getCumulative(self.y, countY, self.max2 + 1)
+		self.otherSumsCh2 = getCumulative(self.y, countX, self.max2 + 1)
+
+	def getCoarseHistogram(self):
+		"""
+		Return the sums of getMoments over the bins of the coarse histogram,
+		cumulated along both channels, as an array indexed by [sum, ch1, ch2]
+		"""
+		rows, columns = self.max1 // self.width1 + 1, self.max2 // self.width2 + 1
+		bins = (self.x // self.width1) * columns + self.y // self.width2
+		x, y = self.x.astype(numpy.float64), self.y.astype(numpy.float64)
+		counts = self.counts.astype(numpy.float64)
+		coarse = numpy.zeros((6, rows + 1, columns + 1), numpy.float64)
+		for i, weights in enumerate([counts, counts * x, counts * y, counts * x * x, counts * y * y, counts * x * y]):
+			histogram = numpy.bincount(bins, weights, rows * columns).reshape(rows, columns)
+			coarse[i, 1:, 1:] = histogram.cumsum(0).cumsum(1)
+		return coarse
+
+	def getRows(self, first, last, lower, upper):
+		"""
+		Return the sums of getMoments over the voxels with first <= ch1 <= last
+		and lower <= ch2 <= upper from the occupied bins
+		"""
+		if last < first:
+			return numpy.zeros(6)
+		start, end = self.rows[first], self.rows[last + 1]
+		y = self.y[start:end]
+		inside = (y >= lower) & (y <= upper)
+		return getMoments(self.x[start:end][inside], y[inside], self.counts[start:end][inside])
+
+	def getColumns(self, first, last, lower, upper):
+		"""
+		Return the sums of getMoments over the voxels with first <= ch2 <= last
+		and lower <= ch1 <= upper from the occupied bins
+		"""
+		if last < first:
+			return numpy.zeros(6)
+		start, end = self.columns[first], self.columns[last + 1]
+		x = self.xByY[start:end]
+		inside = (x >= lower) & (x <= upper)
+		return getMoments(x[inside], self.yByY[start:end][inside], self.countsByY[start:end][inside])
+
+	def getSums(self, lower1, upper1, lower2, upper2):
+		"""
+		Return the number of voxels with lower1 <= ch1 <= upper1 and
+		lower2 <= ch2 <= upper2, and the sums of ch1, ch2, ch1 * ch1,
+		ch2 * ch2 and ch1 * ch2 over them
+		"""
+		first1, last1 = max(int(math.ceil(lower1)), 0), min(int(math.floor(upper1)), self.max1)
+		first2, last2 = max(int(math.ceil(lower2)), 0), min(int(math.floor(upper2)), self.max2)
+		if last1 < first1 or last2 < first2:
+			return numpy.zeros(6)
+		# The bins of the coarse histogram that are inside the range
+		row0, row1 = -(-first1 // self.width1), (last1 + 1) // self.width1
+		column0, column1 = -(-first2 // self.width2), (last2 + 1) // self.width2
+		if row0 >= row1:
+			return self.getRows(first1, last1, first2, last2)
+		if column0 >= column1:
+			return self.getColumns(first2, last2, first1, last1)
+		coarse = self.coarse
+		sums = coarse[:, row1, column1] - coarse[:, row0, column1] - coarse[:, row1, column0] + coarse[:, row0, column0]
+
+		# The values at the edges of the range that are in partly covered bins
+		inner1, inner2 = row0 * self.width1, row1 * self.width1 - 1
+		sums += self.getRows(first1, inner1 - 1, first2, last2)
+		sums += self.getRows(inner2 + 1, last1, first2, last2)
+		sums += self.getColumns(first2, column0 * self.width2 - 1, inner1, inner2)
+		sums += self.getColumns(column1 * self.width2, last2, inner1, inner2)
+		return sums
+
+	def getRegression(self):
+		"""
+		Return the slope and intercept of the regression line of the channels
+		like vtkImageAutoThresholdColocalization, which uses the means rounded
+		down to integers
+		"""
+		n = self.voxels - self.zero
+		if n <= 1:
+			return 0.0, 0.0
+		mean1 = float(int(self.sumX) // n)
+		mean2 = float(int(self.sumY) // n)
+		mean3 = float(int(self.sumX + self.sumY) // n)
+		var1 = (self.sumXX - 2 * mean1 * self.sumX + self.voxels * mean1 * mean1) / (n - 1)
+		var2 = (self.sumYY - 2 * mean2 * self.sumY + self.voxels * mean2 * mean2) / (n - 1)
+		var3 = (self.sumXX + 2 * self.sumXY + self.sumYY - 2 * mean3 * (self.sumX + self.sumY) \
+				+ self.voxels * mean3 * mean3) / (n - 1)
+		covariance = 0.5 * (var3 - (var1 + var2))
+		if not covariance:
+			return 0.0, mean2
+		slope = (var2 - var1 + math.sqrt((var2 - var1) ** 2 + 4 * covariance * covariance)) / (2 * covariance)
+		return slope, mean2 - slope * mean1
+
+	def getStatistics(self, lower1, upper1, lower2, upper2):
+		"""
+		Return the result variables of vtkImageAutoThresholdColocalization for
+		the given thresholds in a dictionary
+		"""
+		threshold1 = min(lower1, self.maxval)
+		threshold2 = min(lower2, self.maxval)
+		over1 = getRange(self.countsCh1, threshold1, upper1)
+		over2 = getRange(self.countsCh2, threshold2, upper2)
+		sumOver1 = getRange(self.sumsCh1, threshold1, upper1)
+		sumOver2 = getRange(self.sumsCh2, threshold2, upper2)
+		colocX = getRange(self.otherSumsCh2, threshold2, upper2)
+		colocY = getRange(self.otherSumsCh1, threshold1, upper1)
+
+		n, sumX, sumY, sumXX, sumYY, sumXY = self.getSums(threshold1, upper1, threshold2, upper2)
+		coloc, sumColoc1, sumColoc2 = n, sumX, sumY
+		above = getPearson(n, sumX, sumY, sumXX, sumYY, sumXY)
+
+		# The voxels below either threshold are those that are not above both,
+		# not counting the voxels that are zero in both channels
+		n, sumX, sumY, sumXX, sumYY, sumXY = self.total - self.getSums(math.floor(lower1) + 1, self.maxval, \
+																		math.floor(lower2) + 1, self.maxval)
+		if lower1 >= 0 or lower2 >= 0:
+			n -= self.zero
+		below = getPearson(n, sumX, sumY, sumXX, sumYY, sumXY)
+		whole = getPearson(self.voxels - self.zero, self.sumX, self.sumY, self.sumXX, self.sumYY, self.sumXY)
+
+		# The sums of either channel where the other channel is nonzero
+		sum1, sum2 = self.sumX, self.sumY
+		manders1 = sum1 - self.otherSumsCh2[1]
+		manders2 = sum2 - self.otherSumsCh1[1]
+		slope, intercept = self.getRegression()
+		return {"Ch1ThresholdMax": threshold1, "Ch2ThresholdMax": threshold2,
+				"PearsonImageAbove": above, "PearsonImageBelow": below, "PearsonWholeImage": whole,
+				"M1": getRatio(manders1, sum1), "M2": getRatio(manders2, sum2),
+				"K1": getRatio(math.sqrt(sum1 * sum2), sum1), "K2": getRatio(math.sqrt(sum1 * sum2), sum2),
+				"DiffStainIntCh1": getRatio(sumOver1, sumOver2 - sumColoc2),
+				"DiffStainIntCh2": getRatio(sumOver2, sumOver1 - sumColoc1),
+				"DiffStainVoxelsCh1": getRatio(over1, over2 - coloc),
+				"DiffStainVoxelsCh2": getRatio(over2, over1 - coloc),
+				"ThresholdM1": getRatio(colocX, sum1), "ThresholdM2": getRatio(colocY, sum2),
+				"C1": getRatio(sumOver1, sum1), "C2": getRatio(sumOver2, sum2),
+				"ColocAmount": int(coloc), "ColocPercent": getRatio(coloc, self.voxels),
+				"PercentageVolumeCh1": getRatio(coloc, over1), "PercentageVolumeCh2": getRatio(coloc, over2),
+				"PercentageTotalCh1": getRatio(sumColoc1, sum1), "PercentageTotalCh2": getRatio(sumColoc2, sum2),
+				"PercentageMaterialCh1": getRatio(sumColoc1, sumOver1),
+				"PercentageMaterialCh2": getRatio(sumColoc2, sumOver2),
+				"SumOverThresholdCh1": int(sumOver1), "SumOverThresholdCh2": int(sumOver2),
+				"SumCh1": sum1, "SumCh2": sum2,
+				"NonZeroCh1": int(self.voxels - self.countsCh1[1]),
+				"NonZeroCh2": int(self.voxels - self.countsCh2[1]),
+				"OverThresholdCh1": int(over1), "OverThresholdCh2": int(over2),
+				"Slope": slope, "Intercept": intercept}
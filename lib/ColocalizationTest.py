@@ -0,0 +1,284 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: ColocalizationTest
+ Project: BioImageXD
+ Description:
+
+ The statistical significance of colocalization computed with NumPy, using
+ the randomizations of Fay, Costes and van Steensel like
+ vtkImageColocalizationTest. Every randomization is done slice by slice
+ and reduced to its correlation, so that only the correlations of the
+ iterations are kept in memory. The iterations are run in a pool of worker
+ processes when more than one process is configured. The random numbers of
+ each iteration are drawn from a stream of its own, so the results do not
+ depend on how the iterations are divided between the workers.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import math
+import time
+import lib.messenger
+import lib.ProcessPool
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+METHOD_FAY = 0
+METHOD_COSTES = 1
+METHOD_STEENSEL = 2
+
+# The channels and settings shared with the worker processes of
+# calculatePValue. The workers are forked, so they inherit the channels.
+testContext = {}
+
+def erf(z):
+	"""
+	Return an approximation of the error function of z. This is the
+	approximation used by vtkImageColocalizationTest, because math.erf
+	requires Python 2.7.
+	"""
+	t = 1.0 / (1.0 + 0.5 * abs(z))
+	# Horner's method
+	ans = 1 - t * math.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + \
+		t * (-0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + \
+		t * (-0.82215223 + t * 0.17087277)))))))))
+	if z >= 0:
+		return ans
+	return -ans
+
+def getPSFSize(manualSize = 0, wavelength = 520, aperture = 1.4, pixelSize = 0.10):
+	"""
+	Return the radius of the PSF in pixels. The defaults are those of
+	vtkImageColocalizationTest.
+	@param pixelSize the size of a pixel in micrometers
+	"""
+	if manualSize:
+		return float(manualSize)
+	return (0.61 * wavelength / aperture) / (pixelSize * 1000)
+
+def getKernel(psf):
+	"""
+	Return the Gaussian kernel that the randomized slices are smoothed with
+	in Costes' method, indexed by [y, x], and its offsets along both axes.
+	As in vtkImageColocalizationTest, the values below 0.0005 are set to zero
+	before the kernel is normalized.
+	"""
+	radius = psf + 1
+	size = int(radius) * 2 + 1
+	t = numpy.arange(size, dtype = numpy.float64)
+	weights = numpy.exp(-0.5 * ((t - radius) / (radius * 2)) ** 2 / 0.04)
+	kernel = numpy.outer(weights, weights)
+	kernel[kernel < 0.0005] = 0
+	return kernel / kernel.sum(), numpy.arange(size) - size / 2
+
+def smoothSlice(image, kernel, offsets):
+	"""
+	Smooth a slice with the kernel of getKernel. Pixels outside the slice
+	are taken from the nearest edge.
+	"""
+	height, width = image.shape
+	before, after = -offsets[0], offsets[-1]
+	padded = numpy.hstack([image[:, :1]] * before + [image] + [image[:, -1:]] * after)
+	padded = numpy.vstack([padded[:1]] * before + [padded] + [padded[-1:]] * after)
+	result = numpy.zeros(image.shape, numpy.float64)
+	product = numpy.empty(image.shape, numpy.float64)
+	if kernel.all():
+		# Without cut values the kernel is the product of its center row and
+		# column, so it is applied along x and y separately
+		center = before
+		rows = numpy.zeros((padded.shape[0], width), numpy.float64)
+		rowProduct = numpy.empty(rows.shape, numpy.float64)
+		for i, weight in enumerate(kernel[center] / kernel[center, center]):
+			numpy.multiply(padded[:, i:i + width], weight, rowProduct)
+			rows += rowProduct
+		for i, weight in enumerate(kernel[:, center]):
+			numpy.multiply(rows[i:i + height], weight, product)
+			result += product
+	else:
+		for y, x in zip(*numpy.nonzero(kernel)):
+			numpy.multiply(padded[y:y + height, x:x + width], kernel[y, x], product)
+			result += product
+	# The smoothed voxels are rounded to integers like in vtkImageColocalizationTest
+	result += 0.5
+	return numpy.floor(result, result)
+
+def shiftSlice(image, dx, dy):
+	"""
+	Return a slice where the pixel (x, y) is the pixel (x + dx, y + dy) of
+	the image, or zero if that is outside of it
+	"""
+	height, width = image.shape
+	result = numpy.zeros(image.shape, image.dtype)
+	if abs(dx) >= width or abs(dy) >= height:
+		return result
+	result[max(-dy, 0):height - max(dy, 0), max(-dx, 0):width - max(dx, 0)] = \
+		image[max(dy, 0):height - max(-dy, 0), max(dx, 0):width - max(-dx, 0)]
+	return result
+
+def getShifts(method, slices):
+	"""
+	Return the slices of the first channel that are compared and the shifts
+	(dx, dy, dz) of the second channel in every iteration of the methods of
+	Fay and van Steensel, as in vtkImageColocalizationTest
+	"""
+	shifts = []
+	if method == METHOD_STEENSEL:
+		for dx in range(-20, 21):
+			shifts.append((dx, 0, 0))
+		return range(slices), shifts
+
+	dx, dy, dz = -15, -10, -1
+	for c in range(1, 76):
+		if c in (26, 51):
+			dz += 1
+			dx, dy = -15, -10
+		if dx < 10:
+			dx += 5
+		else:
+			dx = -15
+			dy += 5
+		shifts.append((dx, dy, dz))
+	# The slices at the ends are left out so that the second channel can be
+	# shifted by one slice in both directions
+	if slices > 2:
+		return range(1, slices - 1), shifts
+	return range(slices), [(dx, dy, 0) for (dx, dy, dz) in shifts]
+
+class Correlation:
+	"""
+	The Pearson correlation of two channels accumulated slice by slice. The
+	voxels that are zero in both channels are ignored.
+	"""
+	def __init__(self):
+		"""
+		Initialization
+		"""
+		self.n = 0
+		self.sumX = self.sumY = self.sumXY = self.sumXX = self.sumYY = 0.0
+
+	def add(self, ch1, ch2):
+		"""
+		Add a slice of both channels
+		"""
+		x = ch1.astype(numpy.float64).ravel()
+		y = ch2.astype(numpy.float64).ravel()
+		self.n += int(numpy.count_nonzero((x + y) != 0))
+		self.sumX += x.sum()
+		self.sumY += y.sum()
+		self.sumXY += numpy.dot(x, y)
+		self.sumXX += numpy.dot(x, x)
+		self.sumYY += numpy.dot(y, y)
+
+	def getPearson(self):
+		"""
+		@return the Pearson correlation of the slices added so far
+		"""
+		if not self.n:
+			return 0.0
+		covariance = self.sumXY - self.sumX * self.sumY / self.n
+		variance = (self.sumXX - self.sumX * self.sumX / self.n) * (self.sumYY - self.sumY * self.sumY / self.n)
+		if variance <= 0:
+			return 0.0
+		return covariance / math.sqrt(variance)
+
+def getRandomCorrelation(iteration):
+	"""
+	Randomize the second channel in testContext for an iteration and return
+	its correlation with the first channel. This is run in the worker
+	processes.
+	"""
+	ch1, ch2 = testContext["ch1"], testContext["ch2"]
+	correlation = Correlation()
+	if testContext["method"] != METHOD_COSTES:
+		dx, dy, dz = testContext["shifts"][iteration]
+		for z in testContext["slices"]:
+			correlation.add(ch1[z], shiftSlice(ch2[z + dz], dx, dy))
+		return correlation.getPearson()
+
+	# Costes: the voxels of every slice of the second channel are scattered
+	# at random and smoothed with a Gaussian of the size of the PSF
+	randomState = numpy.random.RandomState([testContext["seed"], iteration])
+	kernel, offsets = testContext["kernel"]
+	for z in testContext["slices"]:
+		values = testContext["values"][z]
+		scrambled = numpy.zeros(ch2[z].size, numpy.float64)
+		scrambled[randomState.permutation(ch2[z].size)[:len(values)]] = values
+		correlation.add(ch1[z], smoothSlice(scrambled.reshape(ch2[z].shape), kernel, offsets))
+	return correlation.getPearson()
+
+def calculatePValue(ch1, ch2, method, iterations = 100, psf = None, workers = 0, seed = None):
+	"""
+	Test the significance of the correlation of two channels, given as
+	arrays indexed by [z, y, x]. Returns a dictionary with the result
+	variables of vtkImageColocalizationTest. The methods of Fay and van
+	Steensel have a fixed number of iterations.
+	"""
+	observed = Correlation()
+	for z in range(len(ch1)):
+		observed.add(ch1[z], ch2[z])
+	r = observed.getPearson()
+
+	if psf is None:
+		psf = getPSFSize()
+	slices = range(len(ch1))
+	shifts = []
+	if method == METHOD_COSTES:
+		# The nonzero voxels and the kernel are the same in every iteration
+		values = [plane[plane != 0].astype(numpy.float64) for plane in ch2]
+		testContext["values"] = values
+		testContext["kernel"] = getKernel(psf)
+	else:
+		slices, shifts = getShifts(method, len(ch1))
+		iterations = len(shifts)
+	if seed is None:
+		seed = int(time.time())
+	testContext.update({"ch1": ch1, "ch2": ch2, "method": method, "slices": slices,
+						"shifts": shifts, "seed": seed})
+
+	correlations = []
+	try:
+		for r2 in lib.ProcessPool.imapOrdered(getRandomCorrelation, range(iterations), workers, \
+												initializer = lib.ProcessPool.initializeWorker):
+			correlations.append(r2)
+			lib.messenger.send(None, "update_progress", float(len(correlations)) / iterations, \
+								"Calculating P-Value (iteration %d / %d)" % (len(correlations), iterations))
+	finally:
+		testContext.clear()
+
+	n = len(correlations)
+	mean = 0.0
+	if n:
+		mean = sum(correlations) / n
+	sd = 0.0
+	if n > 1:
+		sd = math.sqrt(max(sum([(r2 - mean) ** 2 for r2 in correlations]) / (n - 1), 0.0))
+	# This is the formula of vtkImageColocalizationTest, which divides the
+	# erf of the difference by the standard deviation, not its argument
+	if sd:
+		pvalue = 0.5 * (1 + erf(r - mean) / (math.sqrt(2.0) * sd))
+	else:
+		pvalue = float(r > mean)
+	pvalue = min(max(pvalue, 0.0), 1.0)
+	return {"PValue": pvalue, "RObserved": r, "RRandMean": mean, "RRandSD": sd, "NumIterations": n,
+			"ColocCount": len([r2 for r2 in correlations if r > r2]), "Method": method, "PSF": psf}
@@ -30,6 +30,8 @@ __date__ = "$Date: 2005/01/13 14:52:39 $"
 
 from ConfigParser import RawConfigParser
 from DataSource import DataWriter
+import WriteQueue
+import Configuration
 import vtk
 import os.path
 import scripting
@@ -37,6 +39,23 @@ import lib.messenger
 import Logging
 import codecs
 
+def getWriteSettings():
+	"""
+	@return the size of the write-behind queue (0 for writing synchronously),
+			the compressor of the .vti files and whether written files are
+			synced to disk, as set in the configuration
+	"""
+	conf = Configuration.getConfiguration()
+	try:
+		queueSize = int(eval(str(conf.getConfigItem("WriteQueueSize", "Performance"))))
+	except:
+		queueSize = 0
+	compressor = conf.getConfigItem("VTICompressor", "Performance")
+	if not compressor:
+		compressor = "zlib"
+	syncFiles = str(conf.getConfigItem("SyncWrittenFiles", "Performance")) in ["True", "1"]
+	return queueSize, str(compressor), syncFiles
+
 class BXCDataWriter(DataWriter):
 	"""
 	A writer of BioImageXD dataset channel (.bxc) files
@@ -66,6 +85,35 @@ class BXCDataWriter(DataWriter):
 
 		self.dataUnitSettings = {}
 		self.parser = None
+		self.outputDims = None
+
+		queueSize, self.compressor, self.syncFiles = getWriteSettings()
+		self.writeQueue = None
+		self.setWriteQueueSize(queueSize)
+
+	def setWriteQueueSize(self, size):
+		"""
+		Set the number of datasets that can wait to be written by a background
+		thread. If size is zero, the datasets are written synchronously.
+		"""
+		self.flush()
+		self.writeQueue = None
+		if size > 0:
+			self.writeQueue = WriteQueue.WriteQueue(size)
+
+	def setCompressor(self, compressor):
+		"""
+		Set the compressor of the written .vti files: zlib, lz4 or none, 
+		optionally followed by a compression level, as in zlib:1
+		"""
+		self.compressor = compressor
+
+	def setSyncFiles(self, flag):
+		"""
+		Set whether each written file is synced to disk before the next one
+		is written
+		"""
+		self.syncFiles = flag
 		
 	def getFilename(self):
 		"""
@@ -91,33 +139,43 @@ class BXCDataWriter(DataWriter):
 		"""
 		Writes all datasets pending a write to disk
 		"""
-		ret = 0
 		npoly = n
-		toRemove = []
-		for item in self.imagesToWrite:
-			imagedata, path = item
-			if n == 0:
-				break
-			self.writeImageData(imagedata, path)
-			toRemove.append(item)
-			n = n - 1
-			ret += 1
-		for item in toRemove:
-			self.imagesToWrite.remove(item)
-			
-		toRemove = []
-		for item in self.polyDataToWrite:
-			polydata, path = item
-			if npoly == 0:
-				break
-			self.writePolyData(polydata, path)
-			toRemove.append(item)
-			npoly -= 1
-		for item in toRemove:
-			self.polyDataToWrite.remove(item)
-		toRemove = []
-			
-		return ret
+		if n < 0:
+			n = len(self.imagesToWrite)
+		if npoly < 0:
+			npoly = len(self.polyDataToWrite)
+		images = self.imagesToWrite[:n]
+		del self.imagesToWrite[:n]
+		polydatas = self.polyDataToWrite[:npoly]
+		del self.polyDataToWrite[:npoly]
+
+		for imagedata, path in images:
+			if self.writeQueue:
+				# The data is copied, because the pipeline that produced it
+				# may be run again for the next timepoint before it is written
+				imagedata.Update()
+				copy = vtk.vtkImageData()
+				copy.DeepCopy(imagedata)
+				self.outputDims = copy.GetDimensions()
+				self.writeQueue.put(self.writeImageData, copy, path, None, 0)
+			else:
+				self.writeImageData(imagedata, path)
+		for polydata, path in polydatas:
+			if self.writeQueue:
+				polydata.Update()
+				copy = vtk.vtkPolyData()
+				copy.DeepCopy(polydata)
+				self.writeQueue.put(self.writePolyData, copy, path, None, 0)
+			else:
+				self.writePolyData(polydata, path)
+		return len(images)
+
+	def flush(self):
+		"""
+		Wait until the datasets queued for writing have been written
+		"""
+		if self.writeQueue:
+			self.writeQueue.flush()
 		
 	def write(self):
 		"""
@@ -156,35 +214,23 @@ class BXCDataWriter(DataWriter):
 		parser.write(fp)
 		fp.close()
 		self.sync()
+		self.flush()
 		
 	def addPolyData(self, polyData):
 		"""
 		Add a vtkPolyData object to be written to the disk
 		"""
-		# We find out the path to the directory where the image data is written
-		if not self.path:
-			# This is determined from self.filename which is the name of the 
-			# .du file this datasource has been loaded from
-			self.path = os.path.dirname(self.filename)
-
-		# Next we determine the name for the .vti file we are writing
-		# We take the name of the .du file this datasource is associated with
-		duFileName = os.path.basename(self.filename)
-		# and strip the .du from the end
-		i = duFileName.rfind(".")
-		imageDataName = duFileName[:i]
-		fileName = "%s_%d.vtp" % (imageDataName, self.polycounter)
-		fileName = fileName.encode("ascii")
+		fileName, filepath = self.getDataFileName(self.polycounter, "vtp")
 		self.polycounter += 1
 		# Add the file name to our internal list of datasets
 		self.polyDataFiles.append(fileName)
-		filepath = os.path.join(self.path, fileName)
 		# Add data to waiting queue
 		self.polyDataToWrite.append((polyData, filepath))
 		
-	def addImageData(self, imageData):
+	def getDataFileName(self, n, extension):
 		"""
-		Add a vtkImageData object to be written to the disk.
+		Return the name of the nth data file with the given extension and
+		the path it is written to
 		"""
 		# We find out the path to the directory where the image data is written
 		if not self.path:
@@ -192,21 +238,43 @@ class BXCDataWriter(DataWriter):
 			# .du file this datasource has been loaded from
 			self.path = os.path.dirname(self.filename)
 
-		# Next we determine the name for the .vti file we are writing
+		# Next we determine the name for the file we are writing
 		# We take the name of the .du file this datasource is associated with
 		duFileName = os.path.basename(self.filename)
 		# and strip the .du from the end
 		i = duFileName.rfind(".")
 		imageDataName = duFileName[:i]
-		fileName = "%s_%d.vti" % (imageDataName, self.counter)
+		fileName = "%s_%d.%s" % (imageDataName, n, extension)
 		fileName = fileName.encode("ascii")
+		return fileName, os.path.join(self.path, fileName)
+
+	def addImageData(self, imageData):
+		"""
+		Add a vtkImageData object to be written to the disk.
+		"""
+		fileName, filepath = self.getDataFileName(self.counter, "vti")
 		self.counter += 1
 		# Add the file name to our internal list of datasets
 		self.dataSets.append(fileName)
-		filepath = os.path.join(self.path, fileName)
 		# Add data to waiting queue
 		self.imagesToWrite.append((imageData, filepath))
 
+	def addWrittenImageData(self, fileName, dimensions):
+		"""
+		Add a .vti file that has already been written, for example by
+		another process, as the next dataset
+		"""
+		self.counter += 1
+		self.dataSets.append(fileName)
+		self.outputDims = dimensions
+
+	def addWrittenPolyData(self, fileName):
+		"""
+		Add a .vtp file that has already been written as the next polydata
+		"""
+		self.polycounter += 1
+		self.polyDataFiles.append(fileName)
+
 
 	def addImageDataObjects(self, imageDataList):
 		"""
@@ -216,15 +284,44 @@ class BXCDataWriter(DataWriter):
 		for i in range(0, len(imageDataList)):
 			self.addImageData(imageDataList[i])
 
-	def writeImageData(self, imageData, filename, callback = None):
+	def setupCompressor(self, writer):
+		"""
+		Set the compressor of a VTK XML writer
+		"""
+		name = self.compressor
+		level = None
+		if ":" in name:
+			name, level = name.split(":", 1)
+		name = name.strip().lower()
+		if name == "none":
+			writer.SetCompressor(None)
+			return
+		if name == "lz4":
+			if hasattr(vtk, "vtkLZ4DataCompressor"):
+				compressor = vtk.vtkLZ4DataCompressor()
+				if level and hasattr(compressor, "SetCompressionLevel"):
+					compressor.SetCompressionLevel(int(level))
+				writer.SetCompressor(compressor)
+				return
+			Logging.info("LZ4 compression is not available, using zlib", kw = "io")
+		if level:
+			compressor = vtk.vtkZLibDataCompressor()
+			if hasattr(compressor, "SetCompressionLevel"):
+				compressor.SetCompressionLevel(int(level))
+			writer.SetCompressor(compressor)
+
+	def writeImageData(self, imageData, filename, callback = None, reportProgress = 1):
 		"""
 		Writes the given vtkImageData-instance to disk
 					 as .vti-file with the given filename
 		Parameters:   imageData  vtkImageData-instance to be written
 					  filename	filename to be used
+					  reportProgress  whether the progress is shown, which
+					  must not be done outside the main thread
 		"""
 		writer = vtk.vtkXMLImageDataWriter()
 		writer.SetFileName(filename)
+		self.setupCompressor(writer)
 		#imageData.Update()
 		#imageData.UpdateInformation()
 		x, y, z = imageData.GetDimensions()
@@ -239,8 +336,9 @@ class BXCDataWriter(DataWriter):
 				callback(obj.GetProgress())
 			if scripting.mainWindow:
 				scripting.mainWindow.updateProgressBar(obj, evt, obj.GetProgress(),"Writing %s"%os.path.basename(filename), 0)
-		writer.AddObserver("ProgressEvent", lib.messenger.send)
-		lib.messenger.connect(writer, "ProgressEvent", f)
+		if reportProgress:
+			writer.AddObserver("ProgressEvent", lib.messenger.send)
+			lib.messenger.connect(writer, "ProgressEvent", f)
 		Logging.info("Performing the write",kw="pipeline")
 		try:
 			ret = writer.Write()
@@ -255,22 +353,26 @@ class BXCDataWriter(DataWriter):
 			Logging.error("Failed to write image data",
 			"Failed to write vtkImageData object to file %s" % self.filename, ex)
 			return
+		if self.syncFiles:
+			WriteQueue.syncFile(filename)
 
-	def writePolyData(self, polyData, filename, callback = None):
+	def writePolyData(self, polyData, filename, callback = None, reportProgress = 1):
 		"""
 		Writes the given vtkPolyData instance to disk
 					 as .vtp-file with the given filename
 		"""
 		writer = vtk.vtkXMLPolyDataWriter()
 		writer.SetFileName(filename)
+		self.setupCompressor(writer)
 		writer.SetInput(polyData)
 		def f(obj, evt):
 			if obj and callback:
 				callback(obj.GetProgress())
 			if scripting.mainWindow:
 				scripting.mainWindow.updateProgressBar(obj, evt, obj.GetProgress(),"Writing surface %s"%os.path.basename(filename), 0)
-		writer.AddObserver("ProgressEvent", lib.messenger.send)
-		lib.messenger.connect(writer, "ProgressEvent", f)
+		if reportProgress:
+			writer.AddObserver("ProgressEvent", lib.messenger.send)
+			lib.messenger.connect(writer, "ProgressEvent", f)
 		Logging.info("Writing polydata to file %s"%filename,kw="pipeline")
 		try:
 			ret = writer.Write()
@@ -283,4 +385,6 @@ class BXCDataWriter(DataWriter):
 			Logging.error("Failed to write poly data",
 			"Failed to write vtkPolyData object to file %s" % filename, ex)
 			return
+		if self.syncFiles:
+			WriteQueue.syncFile(filename)
 			
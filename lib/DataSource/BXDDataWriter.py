@@ -91,6 +91,9 @@ class BXDDataWriter(DataWriter):
 		"""
 		Writes the given datasets and their information to a du file
 		"""
+		# Make sure the channels are complete before they are referred to
+		for writer in self.writers:
+			writer.flush()
 		try:
 			fp = codecs.open(self.filename, "w", "latin1")
 		except IOError, ex:
@@ -0,0 +1,133 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: ChunkedDataWriter
+ Project: BioImageXD
+ Description:
+
+ A writer of BioImageXD chunked volume (.bxv) files. It has the same
+ interface as BXCDataWriter, but stores all the timepoints of a channel,
+ together with the settings, in a single chunked file.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+from DataSource import DataWriter
+import ChunkedVolume
+import StringIO
+import scripting
+import Logging
+
+class ChunkedDataWriter(DataWriter):
+	"""
+	A writer of BioImageXD chunked volume (.bxv) files
+	"""
+	def __init__(self, filename, chunkSize = ChunkedVolume.DEFAULT_CHUNK_SIZE, compression = "none"):
+		"""
+		Constructor
+		"""
+		DataWriter.__init__(self)
+		self.filename = filename
+		self.chunkSize = chunkSize
+		self.compression = compression
+		self.writer = None
+		self.imagesToWrite = []
+		self.counter = 0
+		self.parser = None
+		self.outputDims = None
+
+	def getFilename(self):
+		"""
+		return the filename
+		"""
+		return self.filename
+
+	def getParser(self):
+		"""
+		Returns the parser of the settings that are stored in the file
+		"""
+		if not self.parser:
+			self.parser = scripting.MyConfigParser()
+		return self.parser
+
+	def getOutputDimensions(self):
+		"""
+		return the output dimensions
+		"""
+		return self.outputDims
+
+	def addImageData(self, imageData):
+		"""
+		Add a vtkImageData object as the next timepoint
+		"""
+		self.imagesToWrite.append((imageData, self.counter))
+		self.counter += 1
+
+	def addPolyData(self, polyData):
+		"""
+		Polygonal data cannot be stored in chunked volume files
+		"""
+		Logging.info("Polygonal data is not stored in chunked volume files", kw = "io")
+
+	def sync(self, n = -1):
+		"""
+		Writes the timepoints pending a write to disk
+		"""
+		if n < 0:
+			n = len(self.imagesToWrite)
+		images = self.imagesToWrite[:n]
+		del self.imagesToWrite[:n]
+		for imageData, timepoint in images:
+			imageData.UpdateInformation()
+			imageData.SetUpdateExtent(imageData.GetWholeExtent())
+			imageData.Update()
+			dims = imageData.GetDimensions()
+			if not self.writer:
+				self.writer = ChunkedVolume.ChunkedVolumeWriter(self.filename, dims, \
+							imageData.GetScalarType(), imageData.GetScalarSize(), \
+							imageData.GetNumberOfScalarComponents(), imageData.GetSpacing(), \
+							imageData.GetOrigin(), self.chunkSize, self.compression)
+			elif tuple(dims) != self.writer.dimensions:
+				Logging.error("Failed to write image data", \
+							"Timepoint %d has dimensions %s, expected %s" % (timepoint, str(dims), str(self.writer.dimensions)))
+			self.writer.writeImageData(timepoint, imageData)
+			self.outputDims = dims
+		return len(images)
+
+	def write(self):
+		"""
+		Writes the pending timepoints, the index and the settings to disk
+		"""
+		self.sync()
+		if not self.writer:
+			Logging.info("No timepoints were written to %s" % self.filename, kw = "io")
+			return
+		parser = self.getParser()
+		# Don't write annotations, can cause problems in Windows
+		if parser.has_section("Annotations"):
+			parser.remove_section("Annotations")
+		settings = StringIO.StringIO()
+		parser.write(settings)
+		settings = settings.getvalue()
+		if type(settings) == type(u""):
+			settings = settings.encode("latin1")
+		self.writer.close(settings)
+		self.writer = None
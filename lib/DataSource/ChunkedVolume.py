@@ -0,0 +1,417 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: ChunkedVolume
+ Project: BioImageXD
+ Description:
+
+ A container for 4D data that stores every timepoint of a channel as fixed
+ size XYZ chunks in a single file. Reading a slice or a region of interest
+ only touches the chunks it intersects. Uncompressed chunks are read
+ through a memory map of the file, compressed chunks are decoded when they
+ are needed.
+
+ The file consists of a fixed header, the chunks and at the end an index
+ with the offset and length of every chunk, followed by the settings of the
+ dataset as ConfigParser text. A chunk at the edge of the volume only holds
+ the voxels that are inside the volume. The voxels of a chunk are stored
+ with x changing fastest, as in vtkImageData.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import struct
+import mmap
+import zlib
+import vtk
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+MAGIC = "BXDCHUNK"
+VERSION = 1
+# magic, version, dimensions, chunk size, number of timepoints, scalar type,
+# scalar size, number of components, compression, a reserved field, spacing,
+# origin, offset of the index and length of the settings text
+HEADER = "<8sI3I3IIIIIII3d3dQQ"
+HEADER_SIZE = struct.calcsize(HEADER)
+INDEX_ENTRY = "<QQ"
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+DEFAULT_CHUNK_SIZE = (64, 64, 16)
+# The number of decoded compressed chunks kept in memory
+DECODED_CHUNKS = 64
+
+def getChunkCounts(dimensions, chunkSize):
+	"""
+	Return the number of chunks along each axis
+	"""
+	return tuple([(dimensions[i] + chunkSize[i] - 1) / chunkSize[i] for i in range(3)])
+
+def clipExtent(extent, dimensions):
+	"""
+	Clip an extent to a volume with the given dimensions
+	"""
+	x0, x1, y0, y1, z0, z1 = [int(i) for i in extent]
+	return (max(x0, 0), min(x1, dimensions[0] - 1), max(y0, 0), min(y1, dimensions[1] - 1), \
+			max(z0, 0), min(z1, dimensions[2] - 1))
+
+def exportImageData(imageData):
+	"""
+	Return the voxels of the whole extent of imageData as a string
+	"""
+	exporter = vtk.vtkImageExport()
+	imageData.SetUpdateExtent(imageData.GetWholeExtent())
+	imageData.Update()
+	exporter.SetInputConnection(imageData.GetProducerPort())
+	dataMemorySize = exporter.GetDataMemorySize()
+	structString = struct.pack("%ds" % dataMemorySize, "")
+	exporter.SetExportVoidPointer(structString)
+	exporter.Export()
+	return structString
+
+def parseCompression(compression):
+	"""
+	Return the compression method and level given as none, zlib or
+	zlib:level
+	"""
+	level = 6
+	if ":" in compression:
+		compression, level = compression.split(":", 1)
+		level = int(level)
+	compression = compression.strip().lower()
+	if compression in ("", "none"):
+		return COMPRESSION_NONE, 0
+	if compression == "zlib":
+		return COMPRESSION_ZLIB, level
+	raise ValueError("Unknown compression %s" % compression)
+
+class ChunkedVolumeWriter:
+	"""
+	Writes timepoints of a channel to a chunked volume file
+	"""
+	def __init__(self, filename, dimensions, scalarType, scalarSize, components, \
+					spacing = (1.0, 1.0, 1.0), origin = (0.0, 0.0, 0.0), \
+					chunkSize = DEFAULT_CHUNK_SIZE, compression = "none"):
+		"""
+		Initialization
+		"""
+		self.filename = filename
+		self.dimensions = tuple([int(i) for i in dimensions])
+		self.chunkSize = tuple([max(1, min(int(chunkSize[i]), self.dimensions[i])) for i in range(3)])
+		self.chunkCounts = getChunkCounts(self.dimensions, self.chunkSize)
+		self.scalarType = scalarType
+		self.scalarSize = scalarSize
+		self.components = components
+		self.spacing = tuple(spacing)
+		self.origin = tuple(origin)
+		self.compression, self.level = parseCompression(compression)
+		self.index = []
+		self.file = open(filename, "wb")
+		self.file.write(self.packHeader(0, 0))
+
+	def packHeader(self, indexOffset, settingsLength):
+		"""
+		Return the file header
+		"""
+		args = [MAGIC, VERSION] + list(self.dimensions) + list(self.chunkSize) + \
+				[len(self.index), self.scalarType, self.scalarSize, self.components, self.compression, 0] + \
+				list(self.spacing) + list(self.origin) + [indexOffset, settingsLength]
+		return struct.pack(HEADER, *args)
+
+	def writeImageData(self, timepoint, imageData):
+		"""
+		Write a vtkImageData object as the given timepoint
+		"""
+		self.writeTimepoint(timepoint, exportImageData(imageData))
+
+	def writeTimepoint(self, timepoint, data):
+		"""
+		Write the voxels of a whole timepoint, given as a string, as chunks
+		"""
+		voxelSize = self.scalarSize * self.components
+		xdim, ydim, zdim = self.dimensions
+		if len(data) != xdim * ydim * zdim * voxelSize:
+			raise ValueError("Expected %d bytes of data for timepoint %d, got %d" % \
+								(xdim * ydim * zdim * voxelSize, timepoint, len(data)))
+		while len(self.index) <= timepoint:
+			self.index.append(None)
+		chunks = []
+		volume = None
+		if numpy:
+			volume = numpy.frombuffer(data, numpy.uint8).reshape(zdim, ydim, xdim * voxelSize)
+		cw, ch, cd = self.chunkSize
+		nx, ny, nz = self.chunkCounts
+		for cz in range(nz):
+			z0, z1 = cz * cd, min((cz + 1) * cd, zdim)
+			for cy in range(ny):
+				y0, y1 = cy * ch, min((cy + 1) * ch, ydim)
+				for cx in range(nx):
+					x0, x1 = cx * cw, min((cx + 1) * cw, xdim)
+					if volume is not None:
+						chunk = volume[z0:z1, y0:y1, x0 * voxelSize:x1 * voxelSize].tostring()
+					else:
+						rows = []
+						for z in range(z0, z1):
+							for y in range(y0, y1):
+								start = ((z * ydim + y) * xdim + x0) * voxelSize
+								rows.append(data[start:start + (x1 - x0) * voxelSize])
+						chunk = "".join(rows)
+					if self.compression == COMPRESSION_ZLIB:
+						chunk = zlib.compress(chunk, self.level)
+					chunks.append((self.file.tell(), len(chunk)))
+					self.file.write(chunk)
+		self.index[timepoint] = chunks
+
+	def close(self, settings = ""):
+		"""
+		Write the index and the settings text and close the file
+		"""
+		if not self.file:
+			return
+		empty = [(0, 0)] * (self.chunkCounts[0] * self.chunkCounts[1] * self.chunkCounts[2])
+		indexOffset = self.file.tell()
+		for chunks in self.index:
+			for offset, length in (chunks or empty):
+				self.file.write(struct.pack(INDEX_ENTRY, offset, length))
+		self.file.write(settings)
+		self.file.seek(0)
+		self.file.write(self.packHeader(indexOffset, len(settings)))
+		self.file.close()
+		self.file = None
+
+class ChunkedVolume:
+	"""
+	Reads timepoints, or parts of them, from a chunked volume file
+	"""
+	def __init__(self, filename):
+		"""
+		Initialization
+		"""
+		self.filename = filename
+		self.file = open(filename, "rb")
+		header = self.file.read(HEADER_SIZE)
+		if len(header) != HEADER_SIZE:
+			raise IOError("%s is not a chunked volume file" % filename)
+		values = struct.unpack(HEADER, header)
+		if values[0] != MAGIC:
+			raise IOError("%s is not a chunked volume file" % filename)
+		if values[1] > VERSION:
+			raise IOError("%s has an unsupported version %d" % (filename, values[1]))
+		self.dimensions = values[2:5]
+		self.chunkSize = values[5:8]
+		self.numberOfTimepoints, self.scalarType, self.scalarSize, self.components, \
+			self.compression = values[8:13]
+		self.spacing = values[14:17]
+		self.origin = values[17:20]
+		indexOffset, settingsLength = values[20:22]
+		self.chunkCounts = getChunkCounts(self.dimensions, self.chunkSize)
+		self.voxelSize = self.scalarSize * self.components
+
+		n = self.numberOfTimepoints * self.chunkCounts[0] * self.chunkCounts[1] * self.chunkCounts[2]
+		self.file.seek(indexOffset)
+		self.index = struct.unpack("<%dQ" % (2 * n), self.file.read(2 * n * struct.calcsize("<Q")))
+		self.settings = self.file.read(settingsLength)
+
+		self.map = None
+		if self.compression == COMPRESSION_NONE:
+			try:
+				self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+			except (mmap.error, EnvironmentError, OverflowError):
+				# For example files larger than the address space of the process
+				self.map = None
+		self.decoded = {}
+		self.decodedOrder = []
+
+	def getDimensions(self):
+		"""
+		@return the dimensions of a timepoint
+		"""
+		return self.dimensions
+
+	def getChunkSize(self):
+		"""
+		@return the dimensions of a chunk
+		"""
+		return self.chunkSize
+
+	def getNumberOfTimepoints(self):
+		"""
+		@return the number of timepoints
+		"""
+		return self.numberOfTimepoints
+
+	def getScalarType(self):
+		"""
+		@return the VTK scalar type of the data
+		"""
+		return self.scalarType
+
+	def getNumberOfScalarComponents(self):
+		"""
+		@return the number of scalar components of the data
+		"""
+		return self.components
+
+	def getSpacing(self):
+		"""
+		@return the spacing of the data
+		"""
+		return self.spacing
+
+	def getOrigin(self):
+		"""
+		@return the origin of the data
+		"""
+		return self.origin
+
+	def getSettings(self):
+		"""
+		@return the settings stored with the data as ConfigParser text
+		"""
+		return self.settings
+
+	def getChunkExtent(self, cx, cy, cz):
+		"""
+		Return the extent of a chunk
+		"""
+		cw, ch, cd = self.chunkSize
+		return (cx * cw, min((cx + 1) * cw, self.dimensions[0]) - 1, \
+				cy * ch, min((cy + 1) * ch, self.dimensions[1]) - 1, \
+				cz * cd, min((cz + 1) * cd, self.dimensions[2]) - 1)
+
+	def getChunksForExtent(self, extent):
+		"""
+		Return the indices (cx, cy, cz) of the chunks that intersect extent
+		"""
+		x0, x1, y0, y1, z0, z1 = clipExtent(extent, self.dimensions)
+		cw, ch, cd = self.chunkSize
+		chunks = []
+		for cz in range(z0 / cd, z1 / cd + 1):
+			for cy in range(y0 / ch, y1 / ch + 1):
+				for cx in range(x0 / cw, x1 / cw + 1):
+					chunks.append((cx, cy, cz))
+		return chunks
+
+	def getChunk(self, timepoint, cx, cy, cz):
+		"""
+		Return a buffer holding the voxels of a chunk and the offset of the
+		chunk in it, or None if the chunk has not been written
+		"""
+		nx, ny, nz = self.chunkCounts
+		n = ((timepoint * nz + cz) * ny + cy) * nx + cx
+		offset, length = self.index[2 * n], self.index[2 * n + 1]
+		if not length:
+			return None, 0
+		if self.compression == COMPRESSION_NONE:
+			if self.map is not None:
+				return self.map, offset
+			self.file.seek(offset)
+			return self.file.read(length), 0
+
+		key = (timepoint, cx, cy, cz)
+		if key in self.decoded:
+			self.decodedOrder.remove(key)
+			self.decodedOrder.append(key)
+			return self.decoded[key], 0
+		self.file.seek(offset)
+		chunk = zlib.decompress(self.file.read(length))
+		self.decoded[key] = chunk
+		self.decodedOrder.append(key)
+		if len(self.decodedOrder) > DECODED_CHUNKS:
+			del self.decoded[self.decodedOrder.pop(0)]
+		return chunk, 0
+
+	def readExtent(self, timepoint, extent = None):
+		"""
+		Return the voxels of the given timepoint inside extent as a string,
+		reading only the chunks that intersect the extent
+		"""
+		if extent is None:
+			extent = (0, self.dimensions[0] - 1, 0, self.dimensions[1] - 1, 0, self.dimensions[2] - 1)
+		x0, x1, y0, y1, z0, z1 = clipExtent(extent, self.dimensions)
+		voxelSize = self.voxelSize
+		width, height, depth = x1 - x0 + 1, y1 - y0 + 1, z1 - z0 + 1
+		if numpy:
+			output = numpy.zeros((depth, height, width * voxelSize), numpy.uint8)
+		else:
+			output = bytearray(width * height * depth * voxelSize)
+
+		for cx, cy, cz in self.getChunksForExtent((x0, x1, y0, y1, z0, z1)):
+			chunk, base = self.getChunk(timepoint, cx, cy, cz)
+			if chunk is None:
+				continue
+			bx0, bx1, by0, by1, bz0, bz1 = self.getChunkExtent(cx, cy, cz)
+			bw, bh, bd = bx1 - bx0 + 1, by1 - by0 + 1, bz1 - bz0 + 1
+			ix0, ix1 = max(x0, bx0), min(x1, bx1)
+			iy0, iy1 = max(y0, by0), min(y1, by1)
+			iz0, iz1 = max(z0, bz0), min(z1, bz1)
+			if numpy:
+				block = numpy.frombuffer(chunk, numpy.uint8, bw * bh * bd * voxelSize, base)
+				block = block.reshape(bd, bh, bw * voxelSize)
+				output[iz0 - z0:iz1 - z0 + 1, iy0 - y0:iy1 - y0 + 1, (ix0 - x0) * voxelSize:(ix1 - x0 + 1) * voxelSize] = \
+					block[iz0 - bz0:iz1 - bz0 + 1, iy0 - by0:iy1 - by0 + 1, (ix0 - bx0) * voxelSize:(ix1 - bx0 + 1) * voxelSize]
+				continue
+			rowLength = (ix1 - ix0 + 1) * voxelSize
+			for z in range(iz0, iz1 + 1):
+				for y in range(iy0, iy1 + 1):
+					source = base + (((z - bz0) * bh + (y - by0)) * bw + (ix0 - bx0)) * voxelSize
+					target = (((z - z0) * height + (y - y0)) * width + (ix0 - x0)) * voxelSize
+					output[target:target + rowLength] = chunk[source:source + rowLength]
+		if numpy:
+			return output.tostring()
+		return str(output)
+
+	def getImageData(self, timepoint, extent = None):
+		"""
+		Return the given timepoint, or the part of it inside extent, as
+		vtkImageData whose whole extent is the extent that was read
+		"""
+		if extent is None:
+			extent = (0, self.dimensions[0] - 1, 0, self.dimensions[1] - 1, 0, self.dimensions[2] - 1)
+		extent = clipExtent(extent, self.dimensions)
+		data = self.readExtent(timepoint, extent)
+		importer = vtk.vtkImageImport()
+		importer.CopyImportVoidPointer(data, len(data))
+		importer.SetDataScalarType(self.scalarType)
+		importer.SetNumberOfScalarComponents(self.components)
+		importer.SetDataExtent(extent)
+		importer.SetWholeExtent(extent)
+		importer.SetDataSpacing(self.spacing)
+		importer.SetDataOrigin(self.origin)
+		importer.Update()
+		return importer.GetOutput()
+
+	def close(self):
+		"""
+		Close the file
+		"""
+		if self.map is not None:
+			self.map.close()
+			self.map = None
+		if self.file:
+			self.file.close()
+			self.file = None
+		self.decoded = {}
+		self.decodedOrder = []
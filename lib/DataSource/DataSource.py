@@ -32,9 +32,13 @@ import Configuration
 import Logging
 import scripting
 import lib.messenger
+import lib.LRUCache
 import platform
 import sys
 import bxdexceptions
+import lib.DataSource.PreviewPyramid
+import lib.DataSource.ReaderPool
+import lib.DataSource.ThumbnailCache
 
 class DataWriter:
 	"""
@@ -71,6 +75,132 @@ class DataWriter:
 		"""
 		raise bxdexceptions.AbstractMethodCalled("Abstract method addImageDataObjects called")
 		
+class ImageDataCache:
+	"""
+	A least recently used cache of decoded timepoints that is shared by all
+	the DataSources of the process. The cache holds copies of the image
+	data, so that the readers can be reused for other timepoints, and
+	evicts the least recently used timepoints when the total size of the
+	cached data exceeds the given limit.
+	"""
+	def __init__(self, limit):
+		"""
+		Initialization
+		@param limit The maximum size of the cached data in bytes
+		"""
+		self.cache = lib.LRUCache.LRUCache(limit)
+		self.hits = 0
+		self.misses = 0
+
+	def getLimit(self):
+		"""
+		@return the maximum size of the cached data in bytes
+		"""
+		return self.cache.limit
+
+	def setLimit(self, limit):
+		"""
+		Set the maximum size of the cached data in bytes
+		"""
+		self.cache.setLimit(limit)
+
+	def get(self, key):
+		"""
+		@return the image data stored under key, or None if it is not cached
+		"""
+		item = self.cache.get(key)
+		if item is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return item[0]
+
+	def getState(self, key):
+		"""
+		@return the state of the data source that was stored with the image
+				data under key
+		"""
+		item = self.cache.peek(key)
+		if item is None:
+			return {}
+		return item[1]
+
+	def store(self, key, data, state = None):
+		"""
+		Decode the given image data and store a copy of it under key, together
+		with the state the data source had after reading it. Returns the copy,
+		or the data unchanged if it is too large to be cached.
+		"""
+		data.UpdateInformation()
+		size = getEstimatedSize(data)
+		if not size or size > self.cache.limit:
+			return data
+		data.SetUpdateExtent(data.GetWholeExtent())
+		data.Update()
+		copy = vtk.vtkImageData()
+		copy.DeepCopy(data)
+		self.cache.add(key, (copy, state or {}), size)
+		return copy
+
+	def remove(self, key):
+		"""
+		Remove the image data stored under key
+		"""
+		self.cache.remove(key)
+
+	def removeFile(self, filename):
+		"""
+		Remove all the timepoints read from the given file
+		"""
+		for key in self.cache.keys():
+			if key[0] == filename:
+				self.cache.remove(key)
+
+	def clear(self):
+		"""
+		Remove all cached image data
+		"""
+		self.cache.clear()
+
+	def getStatistics(self):
+		"""
+		@return a dictionary with the hit, miss and eviction counts and the
+				number and size of cached timepoints
+		"""
+		return {"Hits": self.hits, "Misses": self.misses, "Evictions": self.cache.evictions,
+				"Items": len(self.cache), "Size": self.cache.totalSize, "Limit": self.cache.limit}
+
+imageDataCache = None
+
+def getImageDataCache():
+	"""
+	@return the image data cache of the process, or None if caching has been
+			disabled by setting the DataCacheSize (in megabytes) to zero
+	"""
+	global imageDataCache
+	conf = Configuration.getConfiguration()
+	try:
+		limit = int(eval(str(conf.getConfigItem("DataCacheSize", "Performance"))))
+	except:
+		limit = 256
+	limit *= 1024 * 1024
+	if limit <= 0:
+		imageDataCache = None
+		return None
+	if not imageDataCache:
+		imageDataCache = ImageDataCache(limit)
+	elif imageDataCache.getLimit() != limit:
+		imageDataCache.setLimit(limit)
+	return imageDataCache
+
+def getEstimatedSize(data):
+	"""
+	@return the size in bytes of the whole extent of an image data
+	"""
+	x0, x1, y0, y1, z0, z1 = data.GetWholeExtent()
+	voxels = max(x1 - x0 + 1, 0) * max(y1 - y0 + 1, 0) * max(z1 - z0 + 1, 0)
+	return voxels * data.GetNumberOfScalarComponents() * data.GetScalarSize()
+
 class DataSource:
 	"""
 	Description: A base class for different kinds of DataSources
@@ -104,6 +234,7 @@ class DataSource:
 		self.absoluteTimestamps = []
 		self.dimensions = None
 		self.imageName = ""
+		self.previewPyramid = None
 		
 		self.resampling = False
 
@@ -112,6 +243,7 @@ class DataSource:
 		self.autoResampleTargetDimensions = None
 		self.filePath = ""
 		self.reader = None
+		self.streamReader = None
 		self.vtkFilters = []
 		val = None
 		try:
@@ -155,6 +287,9 @@ class DataSource:
 		destroy self
 		"""
 		del self.reader
+		if self.streamReader:
+			lib.messenger.disconnect(self.streamReader)
+			self.streamReader = None
 		for i in self.vtkFilters:
 			del i
 		self.vtkFilters = []
@@ -250,10 +385,22 @@ class DataSource:
 		filename = filename.replace(":", "_")
 		return filename + "_" + chName + "_" + purpose
 		
+	def getThumbnailKey(self, datafilename, chName, purpose):
+		"""
+		Return the key under which an image is stored in the thumbnail cache.
+		The key includes the size and modification time of the file, so that
+		the images of a changed file are not used.
+		"""
+		return lib.DataSource.ThumbnailCache.getKey(datafilename, self.getPath(), self.getFileSize(0), \
+				self.getFileTimeStamp(0), self.getImageName(), chName, purpose)
+
 	def getFromCache(self, datafilename, chName, purpose):
 		"""
 		Retrieve a MIP image from cache
 		"""
+		cache = lib.DataSource.ThumbnailCache.getThumbnailCache()
+		if cache:
+			return cache.get(self.getThumbnailKey(datafilename, chName, purpose))
 		key = self.getCacheKey(datafilename, chName, purpose)
 		directory = scripting.get_preview_dir()
 		filename = "%s.png" % key
@@ -271,6 +418,10 @@ class DataSource:
 		"""
 		if imagedata.GetScalarType() not in [3, 5]:
 			return
+		cache = lib.DataSource.ThumbnailCache.getThumbnailCache()
+		if cache:
+			cache.store(self.getThumbnailKey(datafilename, chName, purpose), imagedata)
+			return
 		key = self.getCacheKey(datafilename, chName, purpose)
 		writer = vtk.vtkPNGWriter()
 		writer.SetInputConnection(imagedata.GetProducerPort())
@@ -281,16 +432,206 @@ class DataSource:
 		writer.SetFileName(filepath)
 		writer.Write()
 		
-	def getMIPdata(self, n):
+	def getDataSetCacheKey(self, i, raw = 0):
+		"""
+		Return the key under which the timepoint i is stored in the image data
+		cache. The key consists of the file, image, channel, timepoint, the
+		dimensions the data is resampled to and the intensity scaling.
+		"""
+		resampleDims = None
+		intensityScale = None
+		if not raw:
+			if self.resampling and not scripting.resamplingDisabled and self.getResampleDimensions():
+				resampleDims = tuple(self.getResampleDimensions())
+			if self.explicitScale:
+				intensityScale = (self.intensityShift, self.intensityScale)
+		if hasattr(self, "channelNum"):
+			channel = self.channelNum
+		else:
+			channel = self.getName()
+		return (self.getFileName(), self.getFileTimeStamp(i), self.getImageName(), channel, i, \
+				resampleDims, intensityScale)
+
+	def getFileTimeStamp(self, i):
+		"""
+		Return the modification time of the file timepoint i is read from, so
+		that cached timepoints are not used after the file has changed
+		"""
+		try:
+			return os.path.getmtime(self.getPath())
+		except (OSError, TypeError, UnicodeError):
+			return None
+
+	def getCachedState(self):
+		"""
+		Return the attributes that reading a timepoint sets, so that they can
+		be restored when the timepoint is taken from the image data cache
+		"""
+		return {"originalScalarRange": self.originalScalarRange}
+
+	def setCachedState(self, state):
+		"""
+		Restore the attributes returned by getCachedState
+		"""
+		for name, value in state.items():
+			setattr(self, name, value)
+
+	def getCachedDataSet(self, i, raw, readDataSet):
+		"""
+		Return the timepoint i from the image data cache, reading it with
+		readDataSet(i, raw) and storing it to the cache if it is not cached.
+		A cached timepoint is returned as a shallow copy, so that the cached
+		image data is not changed by the caller.
+		"""
+		cache = getImageDataCache()
+		if not cache or (self.mask and not raw):
+			return readDataSet(i, raw)
+		key = self.getDataSetCacheKey(i, raw)
+		data = cache.get(key)
+		if data is None:
+			readData = readDataSet(i, raw)
+			data = cache.store(key, readData, self.getCachedState())
+			if data is readData:
+				return data
+		else:
+			self.setCachedState(cache.getState(key))
+		copy = vtk.vtkImageData()
+		copy.ShallowCopy(data)
+		return copy
+
+	def getCachedTimepoint(self, i, raw = 0):
+		"""
+		Return the timepoint i if it is in the image data cache, without
+		reading it, or None if it is not
+		"""
+		cache = getImageDataCache()
+		if not cache or (self.mask and not raw):
+			return None
+		key = self.getDataSetCacheKey(i, raw)
+		data = cache.get(key)
+		if data is None:
+			return None
+		self.setCachedState(cache.getState(key))
+		copy = vtk.vtkImageData()
+		copy.ShallowCopy(data)
+		return copy
+
+	def getPooledReader(self, key, openReader):
+		"""
+		Return the reader stored under key in the reader pool, opening it with
+		openReader() if it is not open. A reader may be shared by several data
+		sources, so its progress is reported to the one that last asked for it.
+		If the data source streams its timepoints, its own reader is returned.
+		"""
+		if self.streamReader:
+			return self.streamReader
+		reader = lib.DataSource.ReaderPool.getReaderPool().get(key, openReader)
+		if reader:
+			lib.messenger.disconnect(reader)
+			lib.messenger.connect(reader, 'ProgressEvent', self.updateProgress)
+		return reader
+
+	def getPooledOutput(self, reader):
+		"""
+		Return the output of a pooled reader that has been set to the timepoint
+		to read. A timepoint that fits in the image data cache is read whole,
+		because it is cached whole, and a copy of it is returned. A larger
+		timepoint is not read here: the reader is taken out of the pool for
+		this data source and its output is returned, so that the pipeline
+		reads only the update extent it requests, for example one slice at a
+		time in optimize.execute_limited.
+		"""
+		data = reader.GetOutput()
+		data.UpdateInformation()
+		cache = getImageDataCache()
+		if cache and getEstimatedSize(data) <= cache.getLimit():
+			return lib.DataSource.ReaderPool.getOutputCopy(reader)
+		if reader is not self.streamReader:
+			Logging.info("Streaming %s, its timepoints do not fit in the cache" % self.getFileName(), kw = "io")
+			lib.DataSource.ReaderPool.getReaderPool().detach(self.getReaderKey())
+			self.streamReader = reader
+		return data
+
+	def getMIPdata(self, n, size = (128, 128)):
+		"""
+		Return a small dataset of which a MIP of the given size can be created
+		"""
+		data = None
+		factor = self.getPreviewFactor(*size)
+		if factor > 1:
+			data = self.getPreviewDataSet(n, factor)
+		if not data:
+			data = self.getDataSet(n)
+		return data
+
+	def getFileSize(self, i):
+		"""
+		Return the size of the file timepoint i is read from
+		"""
+		try:
+			return os.path.getsize(self.getPath())
+		except (OSError, TypeError, UnicodeError):
+			return None
+
+	def getPreviewPyramid(self):
+		"""
+		@return the preview pyramid of this data source, or None if the
+				pyramids have been disabled by setting PreviewPyramid to False
+		"""
+		if self.previewPyramid is None:
+			self.previewPyramid = False
+			conf = Configuration.getConfiguration()
+			if str(conf.getConfigItem("PreviewPyramid", "Performance")) in ["True", "1"]:
+				directory = os.path.join(scripting.get_preview_dir(), "Pyramids")
+				try:
+					limit = int(eval(str(conf.getConfigItem("PreviewPyramidSize", "Performance"))))
+				except:
+					limit = 512
+				try:
+					if not os.path.exists(directory):
+						os.mkdir(directory)
+					self.previewPyramid = lib.DataSource.PreviewPyramid.PreviewPyramid(self, directory, \
+											max(limit, 0) * 1024 * 1024)
+				except OSError, ex:
+					Logging.info("Cannot create the preview pyramid directory: %s" % str(ex), kw = "io")
+		return self.previewPyramid or None
+
+	def getPreviewFactor(self, width, height):
 		"""
-		Return a small resampled dataset of which a small
-					 MIP can be created.
+		Return the factor by which the timepoints are reduced when they are
+		previewed at width x height pixels
 		"""
-		return self.getDataSet(n)
-		if not self.mipData:
-			x, y, z = self.getDimensions()
-			self.mipData = self.getResampledData(self.getDataSet(n, raw = 1), n, resampleToDimensions = (128, 128, z))
-		return self.mipData
+		if self.mask or (self.resampling and not scripting.resamplingDisabled and self.getResampleDimensions()):
+			return 1
+		if not self.getPreviewPyramid():
+			return 1
+		return lib.DataSource.PreviewPyramid.getLevel(self.getDimensions(), width, height)
+
+	def getPreviewDataSet(self, i, factor, zslice = -1):
+		"""
+		Return the timepoint i, or its given z slice, reduced by factor, or
+		None if the slice cannot be read from the pyramid. If the pyramid
+		level has not been built, the whole timepoint is read, or taken from
+		the image data cache when only a slice is asked for, the pyramid is
+		built from it in the background and the data is reduced here. When
+		only a slice is asked for and the timepoint is not cached, None is
+		returned, so that the caller reads only the slice.
+		"""
+		pyramid = self.getPreviewPyramid()
+		if not pyramid or factor == 1:
+			return None
+		data = pyramid.getLevelData(i, factor, zslice)
+		if not data:
+			if zslice == -1:
+				data = self.getDataSet(i, raw = 1)
+			else:
+				data = self.getCachedTimepoint(i, raw = 1)
+				if not data:
+					return None
+			data.UpdateInformation()
+			pyramid.schedule(i, data, getEstimatedSize(data))
+			data = pyramid.getReducedData(data, factor, zslice)
+		return self.getIntensityScaledData(data)
 		
 	def getIntensityScale(self):
 		"""
@@ -500,6 +841,14 @@ class DataSource:
 		"""
 		raise bxdexceptions.AbstractMethodCalled("Abstract method getDataSet() in DataSource called")
 
+	def getSubVolume(self, i, extent):
+		"""
+		Return the part of the DataSet at the specified index that is inside
+		extent, reading only that part from the disk. Returns None if the
+		data source cannot read a part of a DataSet.
+		"""
+		return None
+
 	def getName(self):
 		"""
 		Returns the name of the dataset series which this datasource
@@ -0,0 +1,272 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: PreviewPyramid
+ Project: BioImageXD
+ Description:
+
+ A multi-resolution pyramid of the timepoints of a channel that is used for
+ drawing previews, thumbnails and gallery tiles. Every level reduces the x
+ and y dimensions of a timepoint by a factor of two, taking the maximum of
+ the reduced voxels so that small bright objects stay visible. The levels
+ are stored as chunked volumes in the preview directory and are built in a
+ background thread the first time a timepoint is read whole for a preview.
+ The modification time and size of the source file are stored with each
+ level, and a level is rebuilt if the file has changed since. When the
+ levels exceed the size limit of the directory, the least recently used
+ ones are removed.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import os
+import os.path
+import struct
+import hashlib
+import threading
+import vtk
+import Logging
+import lib.DataSource.ChunkedVolume
+import lib.DataSource.WriteQueue
+
+# The reduction factors of the levels of the pyramid
+LEVELS = (2, 4, 8)
+# The maximum size in bytes of the timepoints waiting for their pyramid to be
+# built
+PENDING_BUILD_SIZE = 128 * 1024 * 1024
+
+buildQueue = None
+pendingSize = 0
+pendingLock = threading.Lock()
+
+def getBuildQueue():
+	"""
+	@return the queue in which the pyramids are built
+	"""
+	global buildQueue
+	if not buildQueue:
+		buildQueue = lib.DataSource.WriteQueue.WriteQueue(0)
+	return buildQueue
+
+def addPendingSize(size):
+	"""
+	Add size bytes to the size of the timepoints waiting to be built. Returns
+	False without adding them if they would exceed PENDING_BUILD_SIZE.
+	"""
+	global pendingSize
+	pendingLock.acquire()
+	try:
+		if size > 0 and pendingSize + size > PENDING_BUILD_SIZE:
+			return False
+		pendingSize += size
+		return True
+	finally:
+		pendingLock.release()
+
+def removeLeastRecentlyUsed(directory, limit):
+	"""
+	Remove the least recently used levels in the directory until the levels
+	take at most limit bytes. A level is used when it is read or written.
+	"""
+	levels = []
+	totalSize = 0
+	for name in os.listdir(directory):
+		if not name.endswith(".bxv"):
+			continue
+		filename = os.path.join(directory, name)
+		try:
+			size = os.path.getsize(filename)
+			levels.append((os.path.getmtime(filename), filename, size))
+		except OSError:
+			continue
+		totalSize += size
+	levels.sort()
+	for modified, filename, size in levels:
+		if totalSize <= limit:
+			break
+		try:
+			os.remove(filename)
+		except OSError:
+			continue
+		totalSize -= size
+
+def getLevel(dimensions, width, height):
+	"""
+	Return the largest reduction factor of the pyramid for which a slice
+	of a volume with the given dimensions still covers width x height
+	pixels, or 1 if every level is smaller than that
+	"""
+	x, y = dimensions[0:2]
+	level = 1
+	for factor in LEVELS:
+		if x / factor >= width and y / factor >= height:
+			level = factor
+	return level
+
+def shrink(data):
+	"""
+	Return the data reduced by two in x and y to the next level of the
+	pyramid. The maximum of the reduced voxels is kept, so that small
+	bright objects stay visible.
+	"""
+	shrinkFilter = vtk.vtkImageShrink3D()
+	shrinkFilter.SetShrinkFactors(2, 2, 1)
+	shrinkFilter.SetMaximum(1)
+	shrinkFilter.SetInput(data)
+	shrinkFilter.Update()
+	return shrinkFilter.GetOutput()
+
+class PreviewPyramid:
+	"""
+	Builds and reads the pyramid levels of the timepoints of a data source
+	"""
+	def __init__(self, dataSource, directory, limit = 0):
+		"""
+		Initialization
+		@param limit The maximum size of the levels in the directory in bytes,
+					 or 0 if the size is not limited
+		"""
+		self.dataSource = dataSource
+		self.directory = directory
+		self.limit = limit
+		self.pending = {}
+
+	def getSourceStamp(self, timepoint):
+		"""
+		Return the modification time and size of the file the timepoint is
+		read from as a string, or None if they are not known
+		"""
+		modified = self.dataSource.getFileTimeStamp(timepoint)
+		size = self.dataSource.getFileSize(timepoint)
+		if modified is None or size is None:
+			return None
+		return "%r %r" % (modified, size)
+
+	def getFileName(self, timepoint, factor):
+		"""
+		Return the file a level of the timepoint is stored in
+		"""
+		key = self.dataSource.getDataSetCacheKey(timepoint, raw = 1)
+		# The file, image and channel, but not the modification time
+		name = hashlib.md5(repr((key[0], key[2], key[3]))).hexdigest()
+		return os.path.join(self.directory, "%s_tp%d_x%d.bxv" % (name, timepoint, factor))
+
+	def getLevelData(self, timepoint, factor, zslice = -1):
+		"""
+		Return a level of the timepoint, or only the given z slice of it, or
+		None if the level has not been built for the current source file
+		"""
+		filename = self.getFileName(timepoint, factor)
+		if not os.path.exists(filename):
+			return None
+		try:
+			volume = lib.DataSource.ChunkedVolume.ChunkedVolume(filename)
+		except (IOError, struct.error):
+			return None
+		try:
+			if volume.getSettings() != self.getSourceStamp(timepoint):
+				return None
+			try:
+				os.utime(filename, None)
+			except OSError:
+				pass
+			extent = None
+			if zslice != -1:
+				x, y, z = volume.getDimensions()
+				extent = (0, x - 1, 0, y - 1, zslice, zslice)
+			return volume.getImageData(0, extent)
+		finally:
+			volume.close()
+
+	def getReducedData(self, data, factor, zslice = -1):
+		"""
+		Return the data, or only the given z slice of it, reduced by factor
+		the same way as the levels of the pyramid are
+		"""
+		if zslice != -1:
+			x, y, z = data.GetDimensions()
+			voi = vtk.vtkExtractVOI()
+			voi.SetInput(data)
+			voi.SetVOI(0, x - 1, 0, y - 1, zslice, zslice)
+			voi.Update()
+			data = voi.GetOutput()
+		for level in LEVELS:
+			if level > factor:
+				break
+			data = shrink(data)
+		return data
+
+	def schedule(self, timepoint, data, size):
+		"""
+		Build the pyramid of the timepoint in the background from its data,
+		which has been read whole and takes size bytes. The build is skipped
+		if the timepoints waiting to be built would take more than
+		PENDING_BUILD_SIZE bytes.
+		"""
+		if timepoint in self.pending or self.getSourceStamp(timepoint) is None:
+			return
+		if not addPendingSize(size):
+			return
+		data.SetUpdateExtent(data.GetWholeExtent())
+		data.Update()
+		# The source allocates new scalars when it is updated again, so a
+		# shallow copy keeps the data that was read
+		copy = vtk.vtkImageData()
+		copy.ShallowCopy(data)
+		self.pending[timepoint] = 1
+		getBuildQueue().put(self.build, timepoint, copy, size)
+
+	def build(self, timepoint, data, size = 0):
+		"""
+		Build and store the levels of the timepoint
+		"""
+		try:
+			try:
+				self.writeLevels(timepoint, data)
+				if self.limit:
+					removeLeastRecentlyUsed(self.directory, self.limit)
+			except (IOError, OSError), ex:
+				Logging.info("Could not build the preview pyramid of timepoint %d: %s" % (timepoint, str(ex)), kw = "io")
+		finally:
+			self.pending.pop(timepoint, None)
+			addPendingSize(-size)
+
+	def writeLevels(self, timepoint, data):
+		"""
+		Reduce the data level by level and write every level to its file
+		"""
+		stamp = self.getSourceStamp(timepoint)
+		for factor in LEVELS:
+			x, y, z = data.GetDimensions()
+			if x < 2 or y < 2:
+				break
+			data = shrink(data)
+
+			filename = self.getFileName(timepoint, factor)
+			temporary = filename + ".tmp"
+			writer = lib.DataSource.ChunkedVolume.ChunkedVolumeWriter(temporary, data.GetDimensions(), \
+						data.GetScalarType(), data.GetScalarSize(), data.GetNumberOfScalarComponents(), \
+						data.GetSpacing(), data.GetOrigin(), compression = "zlib:1")
+			writer.writeImageData(0, data)
+			writer.close(stamp)
+			if os.path.exists(filename):
+				os.remove(filename)
+			os.rename(temporary, filename)
@@ -0,0 +1,174 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: ReaderPool
+ Project: BioImageXD
+ Description:
+
+ A pool of the open readers of the data files that is shared by all the
+ DataSources of the process. The channels and images of a file can share
+ a reader, so that its header is parsed only once, and the readers are
+ opened only when they are used. When more readers than the configured
+ maximum are open, the least recently used ones are closed, so that large
+ projects and long file sequences do not run out of file descriptors.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import Configuration
+import Logging
+import lib.messenger
+import lib.LRUCache
+import vtk
+
+def closeReader(reader):
+	"""
+	Close the file of a reader and disconnect it from the messenger
+	"""
+	if hasattr(reader, "CloseFile"):
+		reader.CloseFile()
+	lib.messenger.disconnect(reader)
+
+def getOutputCopy(reader, extent = None):
+	"""
+	Read the given extent of the output of a pooled reader, by default the
+	whole extent, and return a copy of it, so that the data stays valid when
+	the reader is used for another channel or closed. The copy shares the
+	scalars of the output, and the reader allocates new scalars for the next
+	read.
+	"""
+	data = reader.GetOutput()
+	data.UpdateInformation()
+	data.SetUpdateExtent(extent or data.GetWholeExtent())
+	data.Update()
+	copy = vtk.vtkImageData()
+	copy.ShallowCopy(data)
+	return copy
+
+class ReaderPool:
+	"""
+	A least recently used pool of open readers. The readers are stored under
+	keys whose first item is the name of the file they read.
+	"""
+	def __init__(self, limit):
+		"""
+		Initialization
+		@param limit The maximum number of open readers
+		"""
+		self.limit = limit
+		self.readers = lib.LRUCache.LRUCache(max(limit, 1), self.closeReader)
+		self.closers = {}
+		self.opened = 0
+
+	def setLimit(self, limit):
+		"""
+		Set the maximum number of open readers
+		"""
+		self.limit = limit
+		self.readers.setLimit(max(limit, 1))
+
+	def get(self, key, openReader, close = closeReader):
+		"""
+		@return the reader stored under key. If it is not open, it is opened
+				by calling openReader, which returns None if the file cannot be
+				read. close is called with the reader when it is evicted.
+		"""
+		reader = self.readers.get(key)
+		if reader is None:
+			reader = openReader()
+			if reader is None:
+				return None
+			self.opened += 1
+			Logging.info("Opened reader %s (%d open)" % (str(key), len(self.readers) + 1), kw = "io")
+			self.add(key, reader, close)
+		return reader
+
+	def add(self, key, reader, close = closeReader):
+		"""
+		Store an open reader under key, for example the one that was used to
+		read the header of the file when it was loaded
+		"""
+		self.readers.add(key, reader)
+		self.closers[key] = close
+
+	def closeReader(self, key, reader):
+		"""
+		Close a reader that has been removed from the pool
+		"""
+		close = self.closers.pop(key)
+		if close:
+			close(reader)
+
+	def detach(self, key):
+		"""
+		Remove the reader stored under key from the pool without closing it,
+		so that the caller can keep it open as a reader of its own
+		"""
+		if key in self.readers:
+			self.closers[key] = None
+			self.readers.remove(key)
+
+	def remove(self, key):
+		"""
+		Close the reader stored under key
+		"""
+		self.readers.remove(key)
+
+	def removeFile(self, filename):
+		"""
+		Close all the readers of the given file
+		"""
+		for key in self.readers.keys():
+			if key[0] == filename:
+				self.remove(key)
+
+	def clear(self):
+		"""
+		Close all the readers
+		"""
+		self.readers.clear()
+
+	def getStatistics(self):
+		"""
+		@return a dictionary with the number of open readers, the number of
+				times a reader was opened and the number of evictions
+		"""
+		return {"Open": len(self.readers), "Opened": self.opened, "Evictions": self.readers.evictions,
+				"Limit": self.limit}
+
+readerPool = None
+
+def getReaderPool():
+	"""
+	@return the reader pool of the process. The maximum number of open
+			readers is read from MaxOpenReaders in the configuration.
+	"""
+	global readerPool
+	conf = Configuration.getConfiguration()
+	try:
+		limit = int(eval(str(conf.getConfigItem("MaxOpenReaders", "Performance"))))
+	except:
+		limit = 32
+	if not readerPool:
+		readerPool = ReaderPool(limit)
+	elif readerPool.limit != limit:
+		readerPool.setLimit(limit)
+	return readerPool
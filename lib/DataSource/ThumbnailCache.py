@@ -0,0 +1,260 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: ThumbnailCache
+ Project: BioImageXD
+ Description:
+
+ A persistent cache of the small images, such as the MIPs, that are shown
+ for the datasets. The images are stored compressed in a single SQLite
+ database in the preview directory, under a key that includes the size and
+ modification time of the file, so that the images of a changed file are
+ not used. When the cached images exceed the size limit, the least recently
+ used ones are removed.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import os
+import time
+import zlib
+import struct
+import hashlib
+import Configuration
+import Logging
+import scripting
+import vtk
+import lib.ImageConversion
+try:
+	import sqlite3
+except ImportError:
+	sqlite3 = None
+
+# The scalar types of the images that can be cached
+SCALAR_TYPES = {3: "UnsignedChar", 5: "UnsignedShort"}
+
+thumbnailCache = None
+
+def getThumbnailCache():
+	"""
+	@return the thumbnail cache of the process, or None if the cache has been
+			disabled by setting the ThumbnailCacheSize (in megabytes) to zero
+			or SQLite is not available
+	"""
+	global thumbnailCache
+	if not sqlite3:
+		return None
+	conf = Configuration.getConfiguration()
+	try:
+		limit = int(eval(str(conf.getConfigItem("ThumbnailCacheSize", "Performance"))))
+	except:
+		limit = 64
+	limit *= 1024 * 1024
+	if limit <= 0:
+		thumbnailCache = None
+		return None
+	filename = os.path.join(scripting.get_preview_dir(), "Thumbnails.db")
+	if not thumbnailCache or thumbnailCache.filename != filename:
+		thumbnailCache = ThumbnailCache(filename, limit)
+	elif thumbnailCache.limit != limit:
+		thumbnailCache.setLimit(limit)
+	return thumbnailCache
+
+def getKey(*values):
+	"""
+	Return a key of the given values that can be stored in the cache
+	"""
+	return hashlib.sha1(repr(values)).hexdigest()
+
+def imageDataToString(data):
+	"""
+	Return the scalars of an image as a string
+	"""
+	data.SetUpdateExtent(data.GetWholeExtent())
+	data.Update()
+	if lib.ImageConversion.numpy:
+		return lib.ImageConversion.getScalars(data).tostring()
+	exporter = vtk.vtkImageExport()
+	exporter.SetInputConnection(data.GetProducerPort())
+	result = struct.pack("%ds" % exporter.GetDataMemorySize(), "")
+	exporter.SetExportVoidPointer(result)
+	exporter.Export()
+	return result
+
+def stringToImageData(dims, components, scalarType, scalars):
+	"""
+	Return an image with the given scalars returned by imageDataToString
+	"""
+	x, y, z = dims
+	importer = vtk.vtkImageImport()
+	importer.CopyImportVoidPointer(scalars, len(scalars))
+	importer.SetDataScalarType(scalarType)
+	importer.SetNumberOfScalarComponents(components)
+	importer.SetDataExtent(0, x - 1, 0, y - 1, 0, z - 1)
+	importer.SetWholeExtent(0, x - 1, 0, y - 1, 0, z - 1)
+	importer.Update()
+	data = vtk.vtkImageData()
+	data.DeepCopy(importer.GetOutput())
+	return data
+
+class ThumbnailCache:
+	"""
+	A least recently used cache of small images in an SQLite database
+	"""
+	def __init__(self, filename, limit):
+		"""
+		Initialization
+		@param limit The maximum size of the cached images in bytes
+		"""
+		self.filename = filename
+		self.limit = limit
+		self.connection = None
+		self.pid = None
+		# The access times of the images that have been read since the last
+		# write, so that reading does not need a transaction of its own
+		self.accessed = {}
+
+	def getConnection(self):
+		"""
+		Return the connection to the database, or None if it cannot be opened.
+		A connection is not shared with the processes forked from this one.
+		"""
+		if self.connection and self.pid == os.getpid():
+			return self.connection
+		self.connection = None
+		try:
+			connection = sqlite3.connect(self.filename, timeout = 10)
+			connection.text_factory = str
+			connection.execute("CREATE TABLE IF NOT EXISTS thumbnails (key TEXT PRIMARY KEY, " \
+								"x INTEGER, y INTEGER, z INTEGER, components INTEGER, type INTEGER, " \
+								"data BLOB, size INTEGER, accessed REAL)")
+			connection.execute("CREATE INDEX IF NOT EXISTS accessed ON thumbnails (accessed)")
+			connection.commit()
+		except sqlite3.Error, ex:
+			Logging.info("Cannot open the thumbnail cache %s: %s" % (self.filename, str(ex)), kw = "caching")
+			return None
+		self.connection = connection
+		self.pid = os.getpid()
+		return connection
+
+	def setLimit(self, limit):
+		"""
+		Set the maximum size of the cached images in bytes
+		"""
+		self.limit = limit
+		self.evict()
+
+	def get(self, key):
+		"""
+		@return the image stored under key, or None if it is not cached
+		"""
+		connection = self.getConnection()
+		if not connection:
+			return None
+		try:
+			row = connection.execute("SELECT x, y, z, components, type, data FROM thumbnails WHERE key = ?", \
+									(key,)).fetchone()
+			if not row:
+				return None
+		except sqlite3.Error, ex:
+			Logging.info("Cannot read the thumbnail cache: %s" % str(ex), kw = "caching")
+			return None
+		self.accessed[key] = time.time()
+		x, y, z, components, scalarType, data = row
+		return stringToImageData((x, y, z), components, scalarType, zlib.decompress(data))
+
+	def has(self, key):
+		"""
+		@return True if an image is stored under key
+		"""
+		connection = self.getConnection()
+		if not connection:
+			return False
+		try:
+			return connection.execute("SELECT 1 FROM thumbnails WHERE key = ?", (key,)).fetchone() is not None
+		except sqlite3.Error, ex:
+			Logging.info("Cannot read the thumbnail cache: %s" % str(ex), kw = "caching")
+			return False
+
+	def store(self, key, imagedata):
+		"""
+		Store an image under key. Images of other types than unsigned char or
+		unsigned short are not stored.
+		"""
+		if imagedata.GetScalarType() not in SCALAR_TYPES:
+			return
+		scalars = imageDataToString(imagedata)
+		self.storeString(key, imagedata.GetDimensions(), imagedata.GetNumberOfScalarComponents(), \
+							imagedata.GetScalarType(), scalars)
+
+	def storeString(self, key, dims, components, scalarType, scalars):
+		"""
+		Store an image given as the scalars returned by imageDataToString under key
+		"""
+		connection = self.getConnection()
+		if not connection:
+			return
+		data = zlib.compress(scalars)
+		x, y, z = dims
+		try:
+			self.writeAccessed(connection)
+			connection.execute("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", \
+								(key, x, y, z, components, scalarType, \
+								sqlite3.Binary(data), len(data), time.time()))
+			connection.commit()
+		except sqlite3.Error, ex:
+			Logging.info("Cannot write the thumbnail cache: %s" % str(ex), kw = "caching")
+			return
+		self.evict()
+
+	def writeAccessed(self, connection):
+		"""
+		Write the access times of the images read since the last write to
+		the database. The caller commits them with its own changes.
+		"""
+		if self.accessed:
+			connection.executemany("UPDATE thumbnails SET accessed = ? WHERE key = ?", \
+									[(accessed, key) for key, accessed in self.accessed.items()])
+			self.accessed = {}
+
+	def evict(self):
+		"""
+		Remove the least recently used images until the cached images fit in
+		the size limit
+		"""
+		connection = self.getConnection()
+		if not connection:
+			return
+		try:
+			totalSize = connection.execute("SELECT TOTAL(size) FROM thumbnails").fetchone()[0]
+			if totalSize <= self.limit:
+				return
+			self.writeAccessed(connection)
+			removed = []
+			for key, size in connection.execute("SELECT key, size FROM thumbnails ORDER BY accessed"):
+				if totalSize <= self.limit:
+					break
+				removed.append((key,))
+				totalSize -= size
+			connection.executemany("DELETE FROM thumbnails WHERE key = ?", removed)
+			connection.commit()
+		except sqlite3.Error, ex:
+			Logging.info("Cannot evict from the thumbnail cache: %s" % str(ex), kw = "caching")
@@ -0,0 +1,113 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: WriteQueue
+ Project: BioImageXD
+ Description:
+
+ A bounded queue of pending writes that are carried out by a background
+ thread, so that processing the next timepoint can overlap with writing
+ the previous one. When the queue is full, adding a write blocks until the
+ writer thread has caught up.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import Queue
+import threading
+import sys
+import os
+import Logging
+
+class WriteQueue:
+	"""
+	Calls the queued write functions in order in a background thread
+	"""
+	def __init__(self, size):
+		"""
+		Initialization. size is the number of writes that can be pending
+		before adding a write blocks, or 0 if adding never blocks.
+		"""
+		self.queue = Queue.Queue(max(size, 0))
+		self.thread = None
+		self.errors = []
+
+	def put(self, function, *args):
+		"""
+		Queue a call to function with the given arguments
+		"""
+		if not self.thread:
+			self.thread = threading.Thread(target = self.run, name = "WriteQueue")
+			self.thread.setDaemon(True)
+			self.thread.start()
+		self.queue.put((function, args))
+
+	def run(self):
+		"""
+		Carry out the queued writes until told to stop
+		"""
+		while 1:
+			item = self.queue.get()
+			if item is None:
+				self.queue.task_done()
+				break
+			function, args = item
+			try:
+				try:
+					function(*args)
+				except:
+					self.errors.append(sys.exc_info())
+			finally:
+				self.queue.task_done()
+
+	def flush(self):
+		"""
+		Wait until all the queued writes are done and stop the writer thread.
+		An exception raised by one of the writes is raised again here.
+		"""
+		if self.thread:
+			self.queue.put(None)
+			self.thread.join()
+			self.thread = None
+		if self.errors:
+			errors = self.errors
+			self.errors = []
+			raise errors[0][0], errors[0][1], errors[0][2]
+
+	def getNumberOfPendingWrites(self):
+		"""
+		Return the number of queued writes that have not been started
+		"""
+		return self.queue.qsize()
+
+def syncFile(filename):
+	"""
+	Force a written file to be stored on disk before returning
+	"""
+	try:
+		fd = os.open(filename, os.O_RDWR)
+	except OSError, ex:
+		Logging.info("Could not open %s for syncing: %s" % (filename, str(ex)), kw = "io")
+		return
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
@@ -32,7 +32,10 @@ from lib.DataUnit.DataUnit import DataUnit
 from lib.DataSource.BXDDataWriter import BXDDataWriter
 from lib.DataSource.BXCDataWriter import BXCDataWriter
 import lib.DataSource.DataSource
+import lib.DataSource.ReaderPool
+import lib.DataSource.ThumbnailCache
 import lib.ImageOperations
+import lib.Prefetcher
 import optimize
 import vtk
 import vtkbxd
@@ -42,6 +45,46 @@ import scripting
 import os.path
 import os
 import types
+import time
+import lib.ProcessPool
+import Configuration
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+
+# The state shared with the worker processes of a parallel doProcessing call.
+# The workers are forked, so they inherit it together with the dataunit.
+parallelContext = {}
+
+def processTimepoint(job):
+	"""
+	Process a single timepoint of the dataunit in parallelContext. This is
+	run in the worker processes.
+	"""
+	n, timePoint = job
+	return parallelContext["dataunit"].processTimepointInWorker(n, timePoint)
+
+# The dataunit whose timepoint is processed by a prefetching worker process
+prefetchContext = {}
+
+def processPrefetchedTimepoint(timePoint):
+	"""
+	Process a timepoint of the dataunit in prefetchContext. This is run in a
+	worker process of its own, so that processing another timepoint does not
+	rewire the filters of the shown one and the user interface is not blocked.
+	"""
+	return prefetchContext["dataunit"].processPrefetchedTimepoint(timePoint)
+
+def getPrefetchedImageData(prefetched):
+	"""
+	Return the image data of a timepoint returned by processPrefetchedTimepoint
+	"""
+	dims, components, scalarType, spacing, origin, scalars = prefetched
+	data = lib.DataSource.ThumbnailCache.stringToImageData(dims, components, scalarType, scalars)
+	data.SetSpacing(spacing)
+	data.SetOrigin(origin)
+	return data
 
 class CombinedDataUnit(DataUnit):
 	"""
@@ -68,6 +111,7 @@ class CombinedDataUnit(DataUnit):
 		self.currentDimensions = None
 		self.currentSpacing = None
 		self.currentTimepoints = None
+		self.prefetcher = None
 		
 	def removeAllInputs(self):
 		"""
@@ -136,6 +180,12 @@ class CombinedDataUnit(DataUnit):
 		"""
 		self.module = module
 
+	def getModule(self):
+		"""
+		Returns the module that does the calculations for this dataunit
+		"""
+		return self.module
+
 	def getSettings(self):
 		"""
 		Returns the settings object of this dataunit
@@ -181,6 +231,9 @@ class CombinedDataUnit(DataUnit):
 								settings will be written out and not the VTI 
 								files.
 				timepoints		The timepoints that should be processed
+				processes		The number of processes the timepoints are
+								processed in. By default, the number is read
+								from the configuration.
 		"""
 		if not self.module:
 			Logging.error("No module set", "No module was set for the dataunit to do processing with")		
@@ -235,7 +288,16 @@ class CombinedDataUnit(DataUnit):
 		self.guicallback = callback
 		self.module.setControlDataUnit(self)
 
-		if not settings_only:
+		workers = 1
+		if not settings_only and len(timepoints) > 1:
+			workers = lib.ProcessPool.getNumberOfWorkers(kws.get("processes", 0))
+			if workers > 1 and not (hasattr(os, "fork") and self.module.isParallelSafe(self.settings)):
+				Logging.info("Timepoints need to be processed sequentially", kw = "processing")
+				workers = 1
+
+		if not settings_only and workers > 1:
+			self.processTimepointsInParallel(timepoints, dataWriters, workers)
+		elif not settings_only:
 			for timePoint in timepoints:
 				# First we reset the module, so that we can start the operation
 				# from clean slate
@@ -262,7 +324,7 @@ class CombinedDataUnit(DataUnit):
 				
 				Logging.info("Executing with optimizations",kw="processing")
 				for i, imageData in enumerate(imageDatas):
-					imageData = optimize.optimize(image = imageData)
+					imageData = self.updateOutput(imageData)
 					Logging.info("Processing done",kw="processing")
 					lib.messenger.send(None, "update_processing_progress", timePoint, n, len(timepoints) * len(imageDatas))
 					n += 1
@@ -316,6 +378,130 @@ class CombinedDataUnit(DataUnit):
 			else:
 				return bxdWriters[0].getFilename()
 
+	def processTimepointsInParallel(self, timepoints, dataWriters, workers):
+		"""
+		Process the timepoints in a pool of worker processes. Each worker
+		writes the datasets of its timepoints to the files reserved for them
+		in the data writers, and the files are added to the writers in the
+		order of the timepoints.
+		"""
+		Logging.info("Processing %d timepoints in %d processes" % (len(timepoints), workers), kw = "processing")
+		parallelContext["dataunit"] = self
+		parallelContext["writers"] = dataWriters
+		# The numbers of the files already added to the writers
+		parallelContext["counters"] = [(writer.counter, writer.polycounter) for writer in dataWriters]
+		# Reading the source data is serialized, because the workers share the
+		# file handles opened by the readers in the main process
+		parallelContext["readLock"] = multiprocessing.Lock()
+		# The output the filters write during processing is appended to the
+		# same files by all workers, so it is written in timepoint order
+		parallelContext["outputTurn"] = multiprocessing.Condition()
+		parallelContext["nextOutput"] = multiprocessing.Value("i", 0)
+
+		jobs = list(enumerate(timepoints))
+		n = 1
+		try:
+			results = lib.ProcessPool.imapOrdered(processTimepoint, jobs, workers, initializer = lib.ProcessPool.initializeWorker)
+			for (i, timePoint), (outputs, timepointResults, filterTimes) in zip(jobs, results):
+				for j, (fileName, dims, polyFileName) in enumerate(outputs):
+					lib.messenger.send(None, "update_processing_progress", timePoint, n, len(timepoints) * len(outputs))
+					n += 1
+					dataWriters[j].addWrittenImageData(fileName, dims)
+					if polyFileName:
+						dataWriters[j].addWrittenPolyData(polyFileName)
+					self.settings.set("Dimensions", str(dims))
+				self.module.setTimepointResults(self.settings, timePoint, timepointResults)
+				self.module.addFilterTimes(filterTimes)
+		finally:
+			parallelContext.clear()
+			self.module.setDeferOutput(0)
+
+	def processTimepointInWorker(self, n, timePoint):
+		"""
+		Process the nth timepoint of a parallel doProcessing call and write
+		the results to disk. Returns the written files and their dimensions
+		for every output, and the results of the module and the time spent
+		in its filters for the timepoint.
+		"""
+		results = None
+		self.module.clearFilterTimes()
+		try:
+			results = self.writeTimepoint(n, timePoint)
+		finally:
+			outputTurn = parallelContext["outputTurn"]
+			nextOutput = parallelContext["nextOutput"]
+			outputTurn.acquire()
+			try:
+				while nextOutput.value != n:
+					outputTurn.wait()
+				try:
+					if results is not None:
+						self.module.writeDeferredOutput()
+				finally:
+					nextOutput.value += 1
+					outputTurn.notify_all()
+			finally:
+				outputTurn.release()
+		return results, self.module.getTimepointResults(timePoint), self.module.getFilterTimes()
+
+	def updateOutput(self, imageData):
+		"""
+		Execute the pipeline of an output of the module and record the time
+		it took with the times of the filters
+		"""
+		startTime = time.time()
+		imageData = optimize.optimize(image = imageData, parallel = 1)
+		self.module.addFilterTimes({"Pipeline update": time.time() - startTime})
+		return imageData
+
+	def writeTimepoint(self, n, timePoint):
+		"""
+		Process a timepoint and write the outputs to the files reserved for
+		the nth timepoint in the data writers
+		"""
+		dataWriters = parallelContext["writers"]
+		readLock = parallelContext["readLock"]
+		scripting.processingTimepoint = timePoint
+		self.module.reset()
+		self.module.setDeferOutput(1)
+		self.module.setTimepoint(timePoint)
+
+		readLock.acquire()
+		try:
+			for dataunit in self.sourceunits:
+				image = dataunit.getTimepoint(timePoint)
+				image.UpdateInformation()
+				image.SetUpdateExtent(image.GetWholeExtent())
+				image.Update()
+				copy = vtk.vtkImageData()
+				copy.DeepCopy(image)
+				self.module.addInput(dataunit, copy)
+		finally:
+			readLock.release()
+
+		imageDatas = self.module.doOperation()
+		polydatas = self.module.getPolyDataOutput()
+		if type(imageDatas) is not types.TupleType:
+			imageDatas = (imageDatas,)
+		if type(polydatas) is not types.TupleType and polydatas is not None:
+			polydatas = (polydatas,)
+
+		outputs = []
+		for i, imageData in enumerate(imageDatas):
+			imageData = self.updateOutput(imageData)
+			writer = dataWriters[i]
+			imageCounter, polyCounter = parallelContext["counters"][i]
+			Logging.info("Writing timepoint %d" % timePoint, kw = "processing")
+			fileName, path = writer.getDataFileName(imageCounter + n, "vti")
+			writer.writeImageData(imageData, path)
+			polyFileName = None
+			if polydatas is not None and i < len(polydatas):
+				polyFileName, path = writer.getDataFileName(polyCounter + n, "vtp")
+				writer.writePolyData(polydatas[i], path)
+			outputs.append((fileName, writer.getOutputDimensions(), polyFileName))
+		scripting.processingTimepoint = -1
+		return outputs
+
 	def setMask(self, mask):
 		"""
 		Set the mask applied to this dataunit
@@ -491,6 +677,9 @@ class CombinedDataUnit(DataUnit):
 						image.SetUpdateExtent(ex0, ex1, ey0, ey1, depth, depth)
 						image.Update()
 					self.module.addInput(dataunit, image)
+				if self.prefetcher and self.prefetcher.get(timePoint):
+					Logging.info("Using prefetched timepoint %d" % timePoint, kw = "dataunit")
+					self.module.setPrefetchedTimepoint(getPrefetchedImageData(self.prefetcher.get(timePoint)))
 			Logging.info("Getting preview from module %s"%str(self.module), kw="dataunit")
 			preview = self.module.getPreview(depth)
 			if type(preview) == types.TupleType:
@@ -546,6 +735,57 @@ class CombinedDataUnit(DataUnit):
 			self.doOrig = 1
 		return preview
 
+	def getPrefetcher(self):
+		"""
+		Return the prefetcher that processes the timepoints around the
+		previewed one. The number of timepoints fetched on both sides is
+		read from the PrefetchTimepoints setting.
+		"""
+		if not self.prefetcher:
+			conf = Configuration.getConfiguration()
+			try:
+				radius = int(eval(str(conf.getConfigItem("PrefetchTimepoints", "Performance"))))
+			except:
+				radius = 2
+			self.prefetcher = lib.Prefetcher.Prefetcher(self.prefetchTimepoint, radius, 2 * radius + 1)
+			lib.messenger.connect(None, "clear_cache_dataunits", self.prefetcher.clear)
+		return self.prefetcher
+
+	def prefetchTimepoint(self, timePoint):
+		"""
+		Start processing the whole volume of a timepoint in a worker process.
+		Returns the job, or None if the module cannot process it apart from
+		the preview or no worker process can be created.
+		"""
+		if not self.module or not self.module.isPrefetchable():
+			return None
+		prefetchContext["dataunit"] = self
+		try:
+			return lib.ProcessPool.applyAsync(processPrefetchedTimepoint, (timePoint,), \
+												lib.ProcessPool.initializeWorker)
+		finally:
+			prefetchContext.clear()
+
+	def processPrefetchedTimepoint(self, timePoint):
+		"""
+		Process the whole volume of a timepoint in a prefetching worker
+		process. Returns the dimensions, number of components, scalar type,
+		spacing, origin and scalars of the processed data, or None.
+		"""
+		# The files the readers of the main process have open are not shared
+		lib.DataSource.ReaderPool.getReaderPool().clear()
+		images = []
+		for dataunit in self.sourceunits:
+			image = dataunit.getTimepoint(timePoint)
+			image.SetUpdateExtent(image.GetWholeExtent())
+			image.Update()
+			images.append(image)
+		data = self.module.getProcessedTimepoint(timePoint, images)
+		if not data:
+			return None
+		return data.GetDimensions(), data.GetNumberOfScalarComponents(), data.GetScalarType(), \
+				data.GetSpacing(), data.GetOrigin(), lib.DataSource.ThumbnailCache.imageDataToString(data)
+
 	def getSettingsClass(self):
 		"""
 		Return the class that represents settings for this dataunit
@@ -29,10 +29,17 @@ __date__ = "$Date: 2005/01/13 14:09:15 $"
 
 import bxdexceptions
 import DataUnitSetting
+import hashlib
+import lib.DataSource.ThumbnailCache
 import lib.ImageOperations
+import lib.messenger
+import lib.ProcessPool
 import Logging
 import os
 
+# The data units of which MIPs are computed in worker processes
+mipContext = {}
+
 class DataUnit:
 	"""
 	Description: A class representing a timeseries of 3D data
@@ -52,7 +59,7 @@ class DataUnit:
 		self.cacheKey = None
 		self.settings = DataUnitSetting.DataUnitSettings()
 		self.mip = None
-		self.mipTimepoint = -1
+		self.mipKey = None
 		self.destroyed = 0
 
 		if initToNone:
@@ -128,32 +135,38 @@ class DataUnit:
 		"""		   
 		return self.dataSource
 		
-	def getMIP(self, mipTimepoint, color, small = 0, noColor = 0):
+	def getMIPPurpose(self, mipTimepoint, color, size):
+		"""
+		Return the purpose under which a small MIP is stored in the cache
+		"""
+		return "MIP_tp%d_%dx%d_%s" % (mipTimepoint, size[0], size[1], getColorKey(color))
+
+	def getMIP(self, mipTimepoint, color, small = 0, noColor = 0, size = (128, 128)):
 		"""
-		Returns MIP of the given timepoint
+		Returns MIP of the given timepoint. A small MIP is made from data
+		reduced to the given size, and stored in the thumbnail cache.
 		"""		   
-		if self.mip and self.mipTimepoint == mipTimepoint:
-			#Logging.info("Using existing MIP")
+		if not color and not noColor:
+			color = self.getColorTransferFunction()
+		mipKey = (mipTimepoint, small, tuple(size), getColorKey(color))
+		if self.mip and self.mipKey == mipKey:
 			return self.mip
+		if not small:
+			imagedata = self.getTimepoint(mipTimepoint)
+			imagedata.Update()
+			self.mip = lib.ImageOperations.getMIP(imagedata, color)
 		else:
-			#Logging.info("Generating MIP of timepoint = ", mitTimepoint)
-			if not small:
-				imagedata = self.getTimepoint(mipTimepoint)
+			purpose = self.getMIPPurpose(mipTimepoint, color, size)
+			cached = self.dataSource.getFromCache(self.getFileName(), self.getName(), purpose)
+			if not cached:
+				imagedata = self.dataSource.getMIPdata(mipTimepoint, size)
+				imagedata.Update()
+				self.mip = lib.ImageOperations.getMIP(imagedata, color)
+				self.dataSource.storeToCache(self.mip, self.getFileName(), self.getName(), purpose)
 			else:
-				cached = self.dataSource.getFromCache(self.getFileName(), self.getName(), "MIP")
-				if not cached:
-					imagedata = self.dataSource.getMIPdata(mipTimepoint)
-					imagedata.Update()
-		
-					if not color and not noColor:
-						color = self.getColorTransferFunction()
-					self.mip = lib.ImageOperations.getMIP(imagedata, color)
-					
-					self.dataSource.storeToCache(self.mip, self.getFileName(), self.getName(), "MIP")
-				else:
-					self.mip = cached
-					
-			return self.mip
+				self.mip = cached
+		self.mipKey = mipKey
+		return self.mip
 	
 	def storeToCache(self, imagedata, timepoint, purpose):
 		"""
@@ -259,6 +272,34 @@ class DataUnit:
 			return None
 		return self.dataSource.getDataSet(timepoint)
 
+	def getTimepointSubVolume(self, timepoint, extent):
+		"""
+		Returns the part of the requested time point inside extent, or None
+		if the data source can only read whole time points
+		"""
+		if not self.dataSource:
+			return None
+		return self.dataSource.getSubVolume(timepoint, extent)
+
+	def getPreviewFactor(self, width, height):
+		"""
+		Returns the factor by which the time points are reduced when they
+		are previewed at width x height pixels
+		"""
+		if not self.dataSource:
+			return 1
+		return self.dataSource.getPreviewFactor(width, height)
+
+	def getPreviewTimepoint(self, timepoint, factor, zslice = -1):
+		"""
+		Returns the requested time point, or its given z slice, reduced by
+		factor, or None if the time points are not previewed reduced or the
+		slice is best read with getTimepointSubVolume
+		"""
+		if not self.dataSource:
+			return None
+		return self.dataSource.getPreviewDataSet(timepoint, factor, zslice)
+
 	def getPolyDataAtTimepoint(self, timepoint):
 		"""
 		@return the vtkPolyData object representing the dataset at given timepoint
@@ -318,3 +359,57 @@ class DataUnit:
 	
 	def __repr__(self):
 		return str(self)
+
+def getColorKey(color):
+	"""
+	Return a string that identifies the colors of a MIP made with color,
+	which is either None, an RGB tuple or a color transfer function
+	"""
+	if color is None:
+		return "none"
+	if isinstance(color, tuple):
+		return "%d_%d_%d" % color
+	return hashlib.md5(lib.ImageOperations.lutToString(color, "BioImageXD")).hexdigest()
+
+def computeMIP(index):
+	"""
+	Compute the small uncolored MIP of a data unit in mipContext and return
+	its scalars. This is run in the worker processes.
+	"""
+	dataunit = mipContext["dataunits"][index]
+	imagedata = dataunit.getDataSource().getMIPdata(mipContext["timepoint"], mipContext["size"])
+	imagedata.Update()
+	mip = lib.ImageOperations.getMIP(imagedata, None)
+	return mip.GetDimensions(), mip.GetNumberOfScalarComponents(), mip.GetScalarType(), \
+			lib.DataSource.ThumbnailCache.imageDataToString(mip)
+
+def computeMIPs(dataunits, timepoint, size, workers = 0):
+	"""
+	Compute the small uncolored MIPs that are shown as the thumbnails of
+	data units, like getMIP(timepoint, None, small = 1, noColor = 1, size),
+	in a pool of worker processes and store them in the thumbnail cache.
+	The MIPs that are already cached are not computed again.
+	"""
+	cache = lib.DataSource.ThumbnailCache.getThumbnailCache()
+	if not cache:
+		return
+	keys = {}
+	for i, dataunit in enumerate(dataunits):
+		dataSource = dataunit.getDataSource()
+		key = dataSource.getThumbnailKey(dataunit.getFileName(), dataunit.getName(), \
+										dataunit.getMIPPurpose(timepoint, None, size))
+		if not cache.has(key):
+			keys[i] = key
+	indices = sorted(keys.keys())
+	if not indices:
+		return
+	mipContext.update({"dataunits": dataunits, "timepoint": timepoint, "size": size})
+	try:
+		results = lib.ProcessPool.imapOrdered(computeMIP, indices, workers, initializer = lib.ProcessPool.initializeWorker)
+		for n, (i, (dims, components, scalarType, scalars)) in enumerate(zip(indices, results)):
+			if scalarType in lib.DataSource.ThumbnailCache.SCALAR_TYPES:
+				cache.storeString(keys[i], dims, components, scalarType, scalars)
+			lib.messenger.send(None, "update_progress", float(n + 1) / len(indices), \
+								"Creating thumbnails (%d / %d)" % (n + 1, len(indices)))
+	finally:
+		mipContext.clear()
@@ -30,6 +30,7 @@ __date__ = "$Date: 2005/01/13 13:42:03 $"
 
 import Logging
 import lib.Module
+import lib.messenger
 import ConfigParser
 import Modules.DynamicLoader
 import traceback
@@ -37,6 +38,8 @@ import vtk
 import scripting
 import optimize
 import types
+import cPickle
+import time
 
 class FilterList:
 	"""
@@ -388,6 +391,71 @@ class FilterBasedModule(lib.Module.Module):
 		del self.cached
 		self.cached = None 
 		self.cachedTimepoint = -1
+		self.deferredOutput = []
+
+	def writeDeferredOutput(self):
+		"""
+		Write the output of the filters that was held back while processing
+		the current timepoint
+		"""
+		for currfilter in self.deferredOutput:
+			currfilter.writeOutput(self.controlUnit, self.timepoint)
+		self.deferredOutput = []
+
+	def getFilterList(self, settings):
+		"""
+		Return the procedure list in the given settings, or None
+		"""
+		if not settings:
+			return None
+		filterlist = settings.get("FilterList")
+		if not filterlist or type(filterlist) == types.ListType:
+			return None
+		return filterlist
+
+	def isParallelSafe(self, settings):
+		"""
+		Return whether the timepoints can be processed in separate processes,
+		which is the case if none of the enabled filters is sequential only
+		"""
+		filterlist = self.getFilterList(settings)
+		if not filterlist:
+			return True
+		for currfilter in filterlist.getEnabledFilters():
+			if currfilter.sequentialOnly:
+				return False
+		return True
+
+	def getTimepointResults(self, timePoint):
+		"""
+		Return the result variables the filters set for the given timepoint.
+		Values that cannot be passed between processes are left out.
+		"""
+		filterlist = self.getFilterList(self.settings)
+		if not filterlist:
+			return None
+		results = []
+		for currfilter in filterlist.getFilters():
+			values = {}
+			for variable, value in (currfilter.getResultVariableDict(timePoint) or {}).items():
+				try:
+					cPickle.dumps(value, 2)
+				except (cPickle.PicklingError, TypeError):
+					continue
+				values[variable] = value
+			results.append(values)
+		return results
+
+	def setTimepointResults(self, settings, timePoint, results):
+		"""
+		Store the result variables returned by getTimepointResults
+		"""
+		filterlist = self.getFilterList(settings)
+		if not filterlist or not results:
+			return
+		for currfilter, values in zip(filterlist.getFilters(), results):
+			if values:
+				currfilter.resultVar.setdefault(timePoint, {}).update(values)
 
 	def addInput(self, dataunit, data): #TODO: test
 		"""
@@ -442,6 +510,9 @@ class FilterBasedModule(lib.Module.Module):
 		else:
 			del self.cached
 			self.cached = None
+		# A changed filter list invalidates the cached and prefetched timepoints
+		if modified:
+			lib.messenger.send(None, "clear_cache_dataunits")
 	
 		Logging.info("Creating preview, filters = %s"%str(filterlist), kw="pipeline")
 
@@ -489,8 +560,12 @@ class FilterBasedModule(lib.Module.Module):
 				currfilter.setNextFilter(None)
 			Logging.info("Executing %s"%currfilter.name,kw="pipeline")
 
+			startTime = time.time()
 			data = currfilter.execute(data, update=0, last=flag)
 			polydata = currfilter.getPolyDataOutput()
+			# The VTK filters only set up their part of the pipeline here, it is
+			# executed when the output is updated
+			self.addFilterTimes({"%s (setup)" % currfilter.name: time.time() - startTime})
 
 			if not flag:
 				nextfilter = enabledFilters[i+1]
@@ -505,7 +580,10 @@ class FilterBasedModule(lib.Module.Module):
 			lastfilter = currfilter
 			
 			if not preview:
-				currfilter.writeOutput(self.controlUnit, self.timepoint)
+				if self.deferOutput:
+					self.deferredOutput.append(currfilter)
+				else:
+					currfilter.writeOutput(self.controlUnit, self.timepoint)
 			data = [data]
 			if not data:
 				self.currentExecutingFilter = None
@@ -532,10 +610,71 @@ class FilterBasedModule(lib.Module.Module):
 				copy.DeepCopy(data)
 				copy.Update()
 				key = (self.settings.dataunit, self.timepoint)
+				# Only the current timepoint is kept, the neighbouring ones
+				# are cached by the prefetcher of the dataunit
+				for oldKey in self.cacheDataUnits.keys():
+					if oldKey[1] != self.timepoint:
+						del self.cacheDataUnits[oldKey]
 				self.cacheDataUnits[key] = copy
 				Logging.info("Caching dataunit", kw="pipeline")
 
 		return data
+
+	def isPrefetchable(self):
+		"""
+		Return whether there are filters to apply to the prefetched timepoints
+		"""
+		filterlist = self.getFilterList(self.settings)
+		return bool(filterlist and filterlist.getCount())
+
+	def getProcessedTimepoint(self, timepoint, images):
+		"""
+		Process the whole volume of a timepoint and return a copy of it.
+		Returns None if there are no filters to apply. This is run in a
+		prefetching worker process, because processing the timepoint sets the
+		inputs of the filters that the preview of the shown timepoint uses.
+		"""
+		filterlist = None
+		if self.settings:
+			filterlist = self.settings.get("FilterList")
+		if not filterlist or type(filterlist) == types.ListType or filterlist.getCount() == 0:
+			return None
+		state = (self.timepoint, self.images, self.cached, self.cachedTimepoint, self.extent, \
+				self.polyDataOutput, self.cacheDataUnitsEnabled, scripting.wantWholeDataset, \
+				scripting.processingTimepoint)
+		modified = filterlist.getModified()
+		try:
+			# The filters read their other inputs and store their results by
+			# the processed timepoint
+			scripting.processingTimepoint = timepoint
+			self.timepoint = timepoint
+			self.images = images
+			self.cached = None
+			self.extent = None
+			self.cacheDataUnitsEnabled = False
+			data = self.doOperation(preview = 1)
+			if type(data) == types.TupleType:
+				data = data[0]
+			if not data:
+				return None
+			data.SetUpdateExtent(data.GetWholeExtent())
+			data.Update()
+			copy = vtk.vtkImageData()
+			copy.DeepCopy(data)
+			return copy
+		finally:
+			(self.timepoint, self.images, self.cached, self.cachedTimepoint, self.extent, \
+				self.polyDataOutput, self.cacheDataUnitsEnabled, scripting.wantWholeDataset, \
+				scripting.processingTimepoint) = state
+			filterlist.setModified(modified)
+
+	def setPrefetchedTimepoint(self, data):
+		"""
+		Use the processed data of the current timepoint returned earlier by
+		getProcessedTimepoint for the preview
+		"""
+		if self.cacheDataUnitsEnabled:
+			self.cacheDataUnits[(self.settings.dataunit, self.timepoint)] = data
 		
 	def clearCacheDataUnits(self, *args):
 		"""
@@ -0,0 +1,273 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: HistogramEngine
+ Project: BioImageXD
+ Description:
+
+ A module for computing histograms and joint histograms with vtkImageAccumulate
+ and post-processing them. When NumPy is available, the counts are exposed as
+ an array that shares memory with the accumulator output, and log scaling,
+ equalization and threshold percentages are computed in vectorized form.
+ Without NumPy, the same results are computed with Python lists.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import math
+import vtk
+try:
+	import numpy
+	from vtk.util import numpy_support
+except ImportError:
+	numpy = None
+
+class Histogram:
+	"""
+	The counts of a vtkImageAccumulate. The accumulator output is kept
+	referenced as long as this object lives, because with NumPy the counts
+	array is a view to its memory, not a copy.
+	"""
+	def __init__(self, accumulate, origin, spacing):
+		"""
+		Initialization
+		"""
+		self.accumulate = accumulate
+		self.origin = origin
+		self.spacing = spacing
+		self.data = accumulate.GetOutput()
+		x0, x1, y0, y1, z0, z1 = self.data.GetWholeExtent()
+		self.shape = (y1 - y0 + 1, x1 - x0 + 1)
+		scalars = self.data.GetPointData().GetScalars()
+		if numpy:
+			self.counts = numpy_support.vtk_to_numpy(scalars)
+			if self.shape[0] > 1:
+				self.counts = self.counts.reshape(self.shape)
+		else:
+			n = self.shape[1]
+			self.counts = [scalars.GetTuple1(i) for i in range(self.shape[0] * n)]
+			if self.shape[0] > 1:
+				self.counts = [self.counts[j * n : (j + 1) * n] for j in range(self.shape[0])]
+
+	def getCounts(self):
+		"""
+		@return the counts, indexed by [y, x] for joint histograms
+		"""
+		return self.counts
+
+	def getImageData(self):
+		"""
+		@return the accumulator output as vtkImageData
+		"""
+		return self.data
+
+	def getNumberOfBins(self):
+		"""
+		@return the number of bins along the first component
+		"""
+		return self.shape[1]
+
+	def getBinValue(self, i):
+		"""
+		@return the intensity at the start of bin i
+		"""
+		return self.origin[0] + i * self.spacing[0]
+
+	def getTotal(self):
+		"""
+		@return the number of voxels in the histogram
+		"""
+		if numpy:
+			return float(self.counts.sum(dtype = numpy.float64))
+		if self.shape[0] > 1:
+			return float(sum(map(sum, self.counts)))
+		return float(sum(self.counts))
+
+	def getRangeSum(self, lower, upper):
+		"""
+		@return the number of voxels in the bins lower..upper, inclusive
+		"""
+		return rangeSum(self.counts, lower, upper)
+
+	def toList(self):
+		"""
+		@return the counts as a list of floats, or as a list of rows of floats
+				for joint histograms
+		"""
+		if numpy:
+			return self.counts.astype(numpy.float64).tolist()
+		if self.shape[0] > 1:
+			return [[float(x) for x in row] for row in self.counts]
+		return [float(x) for x in self.counts]
+
+def accumulate(image, minval, maxval, bins = 256):
+	"""
+	Compute the histogram of image in the range minval..maxval. If bins is 0,
+	a bin is created for every integer value of the range, which keeps the
+	full resolution of 12- and 16-bit data.
+	"""
+	acc = vtk.vtkImageAccumulate()
+	acc.SetInputConnection(image.GetProducerPort())
+	if not bins:
+		bins = int(maxval - minval) + 1
+		spacing = 1
+	else:
+		spacing = (maxval - minval + 1) / float(bins)
+	acc.SetComponentExtent(0, bins - 1, 0, 0, 0, 0)
+	acc.SetComponentSpacing(spacing, 0, 0)
+	acc.SetComponentOrigin(minval, 0, 0)
+	acc.Update()
+	return Histogram(acc, (minval, ), (spacing, ))
+
+def accumulateJoint(image1, image2, range1, range2, spacing1, spacing2, bins = 256):
+	"""
+	Compute the joint histogram of image1 and image2. The counts are indexed
+	by [image2 bin, image1 bin].
+	"""
+	app = vtk.vtkImageAppendComponents()
+	app.AddInput(image1)
+	app.AddInput(image2)
+	acc = vtk.vtkImageAccumulate()
+	acc.SetComponentExtent(0, bins - 1, 0, bins - 1, 0, 0)
+	acc.SetComponentOrigin(range1[0], range2[0], 0)
+	acc.SetComponentSpacing(spacing1, spacing2, 0)
+	acc.SetInputConnection(app.GetOutputPort())
+	acc.Update()
+	return Histogram(acc, (range1[0], range2[0]), (spacing1, spacing2))
+
+def rangeSum(counts, lower, upper):
+	"""
+	@return the sum of the counts with index lower..upper, inclusive
+	"""
+	start = max(int(math.ceil(lower)), 0)
+	end = int(math.floor(upper)) + 1
+	if end <= start:
+		return 0.0
+	if numpy:
+		return float(numpy.asarray(counts)[start:end].sum(dtype = numpy.float64))
+	return float(sum(counts[start:end]))
+
+def thresholdPercentage(counts, lower, upper, offset = 0):
+	"""
+	@return the fraction of voxels in bins i for which ceil(i + offset) >= lower
+			and floor(i + offset) <= upper
+	"""
+	if numpy:
+		counts = numpy.asarray(counts, dtype = numpy.float64)
+		total = counts.sum()
+		if not total:
+			return 0.0
+		values = numpy.arange(len(counts)) + offset
+		inside = (numpy.ceil(values) >= lower) & (numpy.floor(values) <= upper)
+		return float(counts[inside].sum() / total)
+	total = float(sum(counts))
+	if not total:
+		return 0.0
+	inside = 0
+	for i, count in enumerate(counts):
+		if math.ceil(i + offset) >= lower and math.floor(i + offset) <= upper:
+			inside += count
+	return inside / total
+
+def logScale(counts, height):
+	"""
+	Take the logarithm of the counts, with empty bins treated as one, and
+	scale the result so that the largest value equals height
+	"""
+	if numpy:
+		values = numpy.log(numpy.maximum(numpy.asarray(counts, dtype = numpy.float64), 1))
+		largest = values.max()
+	else:
+		values = [math.log(max(x, 1)) for x in counts]
+		largest = max(values)
+	return scaleToHeight(values, largest, height)
+
+def linearScale(counts, height):
+	"""
+	Scale the counts, with empty bins treated as one, so that the largest
+	value equals height
+	"""
+	if numpy:
+		values = numpy.maximum(numpy.asarray(counts, dtype = numpy.float64), 1)
+		largest = values.max()
+	else:
+		values = [max(x, 1) for x in counts]
+		largest = max(values)
+	return scaleToHeight(values, largest, height)
+
+def scaleToHeight(values, largest, height):
+	"""
+	Scale values so that largest equals height
+	"""
+	if not largest:
+		largest = 1.0
+	scale = float(height) / largest
+	if numpy:
+		return (values * scale).tolist()
+	return [x * scale for x in values]
+
+def equalizationLUT(counts, maxval):
+	"""
+	Return a lookup table of len(counts) + 1 entries that maps the bins of a
+	histogram to values in 0..maxval so that the square roots of the counts
+	are spread evenly over the range
+	"""
+	histlen = len(counts)
+	if numpy:
+		counts = numpy.asarray(counts, dtype = numpy.float64)
+		weights = numpy.where(counts < 2, counts, numpy.sqrt(counts))
+		total = weights[0] + 2 * weights[1:].sum() + weights[-1]
+		scale = maxval / float(total)
+		# Running sum is the first weight, plus two times each weight before
+		# the bin, plus the weight of the bin itself
+		running = weights[0] + 2 * numpy.cumsum(weights[1:]) - weights[1:]
+		lut = numpy.zeros(histlen + 1)
+		# Round to nearest, halves down
+		lut[1:histlen] = numpy.ceil(running * scale - 0.5)
+		lut[-1] = maxval
+		return lut.tolist()
+
+	def weightedValue(x):
+		if x < 2:
+			return x
+		return math.sqrt(x)
+
+	intsum = weightedValue(counts[0])
+	for i in range(1, histlen):
+		intsum += 2 * weightedValue(counts[i])
+	intsum += weightedValue(counts[-1])
+
+	scale = maxval / float(intsum)
+	lut = [0] * (histlen + 1)
+	intsum = weightedValue(counts[0])
+	for i in range(1, histlen):
+		delta = weightedValue(counts[i])
+		intsum += delta
+		ceilValue = math.ceil(intsum * scale)
+		floorValue = math.floor(intsum * scale)
+
+		colorLookup = floorValue
+		if abs(ceilValue - intsum * scale) < abs(floorValue - intsum * scale):
+			colorLookup = ceilValue
+		lut[i] = colorLookup
+		intsum += delta
+	lut[-1] = maxval
+	return lut
@@ -0,0 +1,124 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: ImageConversion
+ Project: BioImageXD
+ Description:
+
+ Conversion of image data to RGB pixels for wxPython with NumPy. The
+ scalars of an image are used through an array that is a view to the
+ memory of the image, single component images are mapped to colors with a
+ lookup table sampled from the color transfer function, and the resulting
+ pixels are given to wx.Image with a single copy. The functions return
+ None when NumPy is not available or the image cannot be converted this
+ way, in which case the callers use VTK for the conversion.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import vtk
+import vtkbxd
+try:
+	import numpy
+	from vtk.util import numpy_support
+except ImportError:
+	numpy = None
+
+# The lookup tables sampled from color transfer functions, by the function
+# and its modification time
+lookupTables = {}
+MAX_LOOKUP_TABLES = 16
+
+def arrayToString(array):
+	"""
+	Return the values of a vtkUnsignedCharArray as a string
+	"""
+	if numpy:
+		return numpy_support.vtk_to_numpy(array).tostring()
+	return "".join([chr(int(array.GetValue(i))) for i in xrange(array.GetNumberOfTuples() * array.GetNumberOfComponents())])
+
+def getScalars(imageData):
+	"""
+	Return the scalars of an image as an array indexed by [z, y, x, component].
+	The array is a view to the memory of the image.
+	"""
+	imageData.SetUpdateExtent(imageData.GetWholeExtent())
+	imageData.Update()
+	x, y, z = imageData.GetDimensions()
+	scalars = numpy_support.vtk_to_numpy(imageData.GetPointData().GetScalars())
+	return scalars.reshape(z, y, x, imageData.GetNumberOfScalarComponents())
+
+def getLookupTable(ctf):
+	"""
+	Return the colors of a color transfer function at every integer of its
+	range as an array of n x 3 bytes, and the value of the first color
+	"""
+	key = (ctf, ctf.GetMTime())
+	if key in lookupTables:
+		return lookupTables[key]
+	minval, maxval = ctf.GetRange()
+	size = max(int(maxval - minval) + 1, 1)
+	handle = vtkbxd.vtkHandleColorTransferFunction()
+	handle.ColorTransferFunctionToString(ctf, 1, size)
+	# The table is stored as the reds, the greens and then the blues
+	table = numpy_support.vtk_to_numpy(handle.GetOutputString()).reshape(3, size).T.copy()
+	if len(lookupTables) >= MAX_LOOKUP_TABLES:
+		lookupTables.clear()
+	lookupTables[key] = (table, minval)
+	return table, minval
+
+def mapToColors(values, table, minval):
+	"""
+	Map values to the colors of a lookup table returned by getLookupTable.
+	Values outside the range of the table get the color of its nearest end,
+	like with vtkImageMapToColors.
+	"""
+	first = int(round(minval))
+	if values.dtype in (numpy.uint8, numpy.uint16):
+		# The table is expanded to every value of the type, so that the
+		# values themselves can be used as the indices
+		indices = numpy.arange(numpy.iinfo(values.dtype).max + 1) - first
+		return table[numpy.clip(indices, 0, len(table) - 1)].take(values, axis = 0)
+	indices = numpy.rint(values - minval)
+	return table.take(numpy.clip(indices, 0, len(table) - 1).astype(numpy.intp), axis = 0)
+
+def getRGB(imageData, ctf = None):
+	"""
+	Return the first slice of an image as an array of RGB bytes indexed by
+	[y, x, color], or None if the image cannot be converted with NumPy.
+	Single component images are mapped to colors with ctf, and only the
+	three first components of other unsigned char images are used.
+	"""
+	if not numpy:
+		return None
+	imageData.UpdateInformation()
+	components = imageData.GetNumberOfScalarComponents()
+	if components == 1 and ctf is None:
+		return None
+	if components > 1 and imageData.GetScalarType() != vtk.VTK_UNSIGNED_CHAR:
+		return None
+	scalars = getScalars(imageData)[0]
+	if components == 1:
+		table, minval = getLookupTable(ctf)
+		return mapToColors(scalars[..., 0], table, minval)
+	if components == 2:
+		return None
+	return numpy.ascontiguousarray(scalars[..., :3])
@@ -39,6 +39,9 @@ import struct
 import Logging
 import GUI.Dialogs 
 import optimize
+import lib.HistogramEngine
+import lib.ImageConversion
+import lib.ROIMask
 
 def paintLogarithmicScale(ctfbmp, ctf, vertical = 1):
 	"""
@@ -380,9 +383,7 @@ def lutToString(ctf, luttype = "ImageJ"):
 	
 	handle = vtkbxd.vtkHandleColorTransferFunction()
 	handle.ColorTransferFunctionToString(ctf, int(perColor), int(size))
-	ctfstr = handle.GetOutputString()
-	for i in xrange(0,ctfstr.GetNumberOfTuples()):
-		stringOfLUT += chr(ctfstr.GetValue(i))
+	stringOfLUT += lib.ImageConversion.arrayToString(handle.GetOutputString())
 		
 	#for col in range(0, 3):
 	#	for i in range(0, int(maxval) + 1, int(perColor)):
@@ -457,6 +458,14 @@ def vtkImageDataToWxImage(data, sliceNumber = -1, startpos = None, endpos = None
 	"""
 	if sliceNumber >= 0:
 		data = getSlice(data, sliceNumber, startpos, endpos)
+	# The pixels are mapped to colors with NumPy if possible and copied
+	# to the image only once
+	rgb = lib.ImageConversion.getRGB(data, ctf)
+	if rgb is not None:
+		height, width = rgb.shape[:2]
+		image = wx.EmptyImage(width, height, False)
+		image.SetData(rgb.data)
+		return image
 	if ctf != None:
 		data = imageDataTo3Component(data, ctf)
 	exporter = vtk.vtkImageExport()
@@ -485,11 +494,7 @@ def vtkImageDataToPngString(data, sliceNumber = -1, startpos = None, endpos = No
 	pngwriter.WriteToMemoryOn()
 	pngwriter.SetInputConnection(data.GetProducerPort())
 	pngwriter.Write()
-	result = pngwriter.GetResult()
-	data = ""
-	for i in range(result.GetNumberOfTuples()):
-		data += chr(result.GetValue(i))
-	return data
+	return lib.ImageConversion.arrayToString(pngwriter.GetResult())
 	
 def getMIP(imageData, color):
 	"""
@@ -550,7 +555,8 @@ def vtkImageDataToPreviewBitmap(dataunit, timepoint, color, width = 0, height =
 				 Maximum Intensity Projection that will be converted to a
 				 wxBitmap
 	"""   
-	imagedata = dataunit.getMIP(timepoint, None, small = 1, noColor = 1)
+	size = (width or height or 64, height or width or 64)
+	imagedata = dataunit.getMIP(timepoint, None, small = 1, noColor = 1, size = size)
 	vtkImg = imagedata
 
 	if not color:
@@ -567,14 +573,7 @@ def vtkImageDataToPreviewBitmap(dataunit, timepoint, color, width = 0, height =
 			red, green, blue = ctf.GetColor(i)
 			ctf2.AddRGBPoint(i / step, red, green, blue)
 		ctf = ctf2
-	maptocolor = vtk.vtkImageMapToColors()
-	maptocolor.SetInputConnection(imagedata.GetProducerPort())
-	maptocolor.SetLookupTable(ctf)
-	maptocolor.SetOutputFormatToRGB()
-	maptocolor.Update()
-	imagedata = maptocolor.GetOutput()
-	
-	image = vtkImageDataToWxImage(imagedata)
+	image = vtkImageDataToWxImage(imagedata, ctf = ctf)
 	xSize, ySize = image.GetWidth(), image.GetHeight()
 	if not width and height:
 		aspect = float(xSize) / ySize
@@ -750,59 +749,44 @@ def get_histogram(image, maxval = 0, minval = 0, maxrange = 0):
 	"""
 	Return the histogram of the image as a list of floats
 	"""
-	accu = vtk.vtkImageAccumulate()
-	accu.SetInputConnection(image.GetProducerPort())
+	return getHistogram(image, maxval, minval, maxrange).toList()
 
+def getHistogram(image, maxval = 0, minval = 0, maxrange = 0):
+	"""
+	Return the histogram of the image as a lib.HistogramEngine.Histogram. If
+	maxrange is set, every intensity value gets its own bin, otherwise the
+	range is divided into 256 bins.
+	"""
 	if maxval == 0:
 		x0, x1 = getImageScalarRange(image)
-		#x1 = int(math.floor(x1))
-		#x0 = int(math.ceil(x0))
 	else:
-		#x0, x1 = (int(math.ceil(minval)),int(math.floor(maxval)))
-		x0, x1 = (minval,maxval)
-
-	#accu.SetComponentExtent(0, x1 - x0, 0, 0, 0, 0)
-	#accu.SetComponentSpacing(1, 0, 0)
+		x0, x1 = (minval, maxval)
 	if maxrange:
-		accu.SetComponentExtent(0, x1-x0, 0, 0, 0, 0)
-		accu.SetComponentSpacing(1, 0, 0)
-	else:
-		accu.SetComponentExtent(0, 255, 0, 0, 0, 0)
-		accu.SetComponentSpacing((x1 - x0 + 1) / 256.0, 0, 0)
-
-	accu.SetComponentOrigin(x0, 0, 0)
-	accu.Update() 
-	data = accu.GetOutput()
-	
-	values = []
-	x0, x1, y0, y1, z0, z1 = data.GetWholeExtent()
-
-	for i in range(x0, x1 + 1):
-		c = data.GetScalarComponentAsDouble(i, 0, 0, 0)
-		values.append(c)
-	return values
+		return lib.HistogramEngine.accumulate(image, x0, x1, bins = 0)
+	return lib.HistogramEngine.accumulate(image, x0, x1, bins = 256)
 	
 def histogram(imagedata, colorTransferFunction = None, bg = (200, 200, 200), logarithmic = 1, \
-				ignore_border = 0, lower = 0, upper = 0, percent_only = 0, maxval = 255, minval = 0):
+				ignore_border = 0, lower = 0, upper = 0, percent_only = 0, maxval = 255, minval = 0, \
+				fullResolution = 0):
 	"""
-	Draw a histogram of a volume
+	Draw a histogram of a volume. If fullResolution is set, the histogram has
+	a bin for every intensity value instead of 256 bins.
 	"""
-	values = get_histogram(imagedata,maxval,minval)
-	sum = 0
+	hist = getHistogram(imagedata, maxval, minval, maxrange = fullResolution)
+	values = hist.getCounts()
 	xoffset = 10
-	sumth = 0
 	percent = 0
-	for i, c in enumerate(values):
-		sum += c
-		if (lower or upper):
-			if i >= lower and i <= upper:
-				sumth += c
-	retvals = values[: ]
+	total = hist.getTotal()
+	sumth = 0
+	if (lower or upper):
+		sumth = hist.getRangeSum(lower, upper)
+	retvals = hist.toList()
 	Logging.info("lower = %d, upper = %d, total amount of %d values" \
-					% (lower, upper, len(values)), sum, kw = "imageop")
+					% (lower, upper, len(retvals)), total, kw = "imageop")
 	if sumth:
-		percent = (float(sumth) / sum)
+		percent = (float(sumth) / total)
 	if ignore_border:
+		values = retvals[:]
 		ma = max(values[5:])
 		mi = min(values[:-5])
 		n = len(values)
@@ -811,15 +795,10 @@ def histogram(imagedata, colorTransferFunction = None, bg = (200, 200, 200), log
 		for i in range(n - 5, n):
 			values[i] = mi
 			
-	for i, value in enumerate(values):
-		if value == 0:
-			values[i] = 1
 	if logarithmic:
-		values = map(math.log, values)
-
-	m = max(values)
-	scale = 150.0 / m
-	values = [x * scale for x in values]
+		values = lib.HistogramEngine.logScale(values, 150)
+	else:
+		values = lib.HistogramEngine.linearScale(values, 150)
 	w = 256
 	x1 = max(values)
 	w += xoffset + 5
@@ -898,9 +877,19 @@ def getMaskFromROIs(rois, mx, my, mz, value = 255):
 	"""
 	Create a mask that contains all given Regions of Interest
 	"""
+	if lib.ROIMask.numpy:
+		mask = None
+		for shape in rois:
+			shapeMask = lib.ROIMask.getShapeMask(shape, mx, my)
+			if mask is None:
+				mask = shapeMask
+			else:
+				mask = shapeMask | mask
+		if mask is None:
+			mask = lib.ROIMask.pointsToMask({}, mx, my)
+		return int(mask.sum()), lib.ROIMask.getMaskImage(mask, mz, value)
 	insideMap = {}
 	for shape in rois:
-		print "Getting from shape",shape
 		insideMap.update(shape.getCoveredPoints())
 	coveredPointAmount = len(insideMap.keys())
 	return coveredPointAmount, getMaskFromPoints(insideMap, mx, my, mz, value)
@@ -909,6 +898,8 @@ def getMaskFromPoints(points, mx, my, mz, value = 255):
 	"""
 	Create a mask where all given points are set to value (between 0-255)
 	"""
+	if lib.ROIMask.numpy:
+		return lib.ROIMask.getMaskImage(lib.ROIMask.pointsToMask(points, mx, my), mz, value)
 	if value > 255:
 		value = 255
 	elif value < 0:
@@ -944,34 +935,7 @@ def equalize(imagedata, ctf, maxval):
 	Creates a set of lookup values from a histogram from the imagedata parameter.
 	Then creates a color transfer function from these values and returns it.
 	"""
-	histogram = get_histogram(imagedata)
-	histlen = len(histogram)
-	
-	def weightedValue(x):
-		if x < 2:
-			return x
-		return math.sqrt(x)
-	
-	intsum = weightedValue(histogram[0])
-	for i in range(1, histlen):
-		intsum += 2 * weightedValue(histogram[i])
-	intsum += weightedValue(histogram[-1])
-	
-	scale = maxval / float(intsum)
-	lut = [0] * (histlen + 1)
-	intsum = weightedValue(histogram[0])
-	for i in range(1, histlen):
-		delta = weightedValue(histogram[i])
-		intsum += delta
-		ceilValue = math.ceil(intsum * scale)
-		floorValue = math.floor(intsum * scale)
-
-		colorLookup = floorValue
-		if abs(ceilValue - intsum * scale) < abs(floorValue - intsum * scale):
-			colorLookup = ceilValue
-		lut[i] = colorLookup
-		intsum += delta
-	lut[-1] = maxval
+	lut = lib.HistogramEngine.equalizationLUT(getHistogram(imagedata).getCounts(), maxval)
 	
 	ctf2 = vtk.vtkColorTransferFunction()
 	for i, value in enumerate(lut):
@@ -1002,24 +966,8 @@ def scatterPlot(imagedata1, imagedata2, z, countVoxels = True, wholeVolume = Tru
 		spacing1 = float(2**bitDepth) / (n+1)
 		spacing2 = float(2**bitDepth) / (n+1)
 	
-	app = vtk.vtkImageAppendComponents()
-	app.AddInput(imagedata1)
-	app.AddInput(imagedata2)
-	
-	#shiftscale = vtk.vtkImageShiftScale()
-	#shiftscale.SetOutputScalarTypeToUnsignedChar()
-	#shiftscale.SetScale(d)
-	#shiftscale.SetInputConnection(app.GetOutputPort())
-	
-	acc = vtk.vtkImageAccumulate()
-	acc.SetComponentExtent(0, n, 0, n, 0, 0)
-	acc.SetComponentOrigin(range1[0], range2[0], 0)
-	acc.SetComponentSpacing(spacing1, spacing2, 0)
-	#acc.SetInputConnection(shiftscale.GetOutputPort())
-	acc.SetInputConnection(app.GetOutputPort())
-	acc.Update()
-	
-	data = acc.GetOutput()
+	hist = lib.HistogramEngine.accumulateJoint(imagedata1, imagedata2, range1, range2, spacing1, spacing2, n + 1)
+	data = hist.getImageData()
 	origData = data
 	
 	originalRange = data.GetScalarRange()
@@ -1027,7 +975,7 @@ def scatterPlot(imagedata1, imagedata2, z, countVoxels = True, wholeVolume = Tru
 	if logarithmic:
 		Logging.info("Scaling scatterplot logarithmically", kw = "imageop")
 		logscale = vtk.vtkImageLogarithmicScale()
-		logscale.SetInputConnection(acc.GetOutputPort())
+		logscale.SetInputConnection(data.GetProducerPort())
 		logscale.Update()
 		data = logscale.GetOutput()
 		
@@ -0,0 +1,135 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: LRUCache
+ Project: BioImageXD
+ Description:
+
+ A least recently used cache of items that have a size. It is used for the
+ decoded timepoints of the image data cache, the open readers of the
+ reader pool and the bitmaps of the gallery tiles.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+class LRUCache:
+	"""
+	A least recently used cache of items of a given size, one by default.
+	When the total size of the items exceeds the limit, the least recently
+	used items are removed and onRemove is called with their keys and items.
+	"""
+	def __init__(self, limit, onRemove = None):
+		"""
+		Initialization
+		@param limit The maximum total size of the items
+		"""
+		self.limit = limit
+		self.onRemove = onRemove
+		self.items = {}
+		self.sizes = {}
+		self.accessed = {}
+		self.accessCounter = 0
+		self.totalSize = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self.items)
+
+	def __contains__(self, key):
+		return key in self.items
+
+	def keys(self):
+		"""
+		@return the keys of the cached items
+		"""
+		return self.items.keys()
+
+	def setLimit(self, limit):
+		"""
+		Set the maximum total size of the items
+		"""
+		self.limit = limit
+		self.evict()
+
+	def get(self, key, default = None):
+		"""
+		@return the item stored under key, or default if it is not cached
+		"""
+		if key not in self.items:
+			return default
+		self.accessCounter += 1
+		self.accessed[key] = self.accessCounter
+		return self.items[key]
+
+	def peek(self, key, default = None):
+		"""
+		@return the item stored under key, or default if it is not cached,
+				without marking the item as used
+		"""
+		return self.items.get(key, default)
+
+	def add(self, key, item, size = 1):
+		"""
+		Store an item under key, replacing any other item stored under it.
+		The item itself is not removed to make room for others.
+		"""
+		if key in self.items:
+			if self.items[key] is not item:
+				self.remove(key)
+			else:
+				self.totalSize -= self.sizes[key]
+		self.accessCounter += 1
+		self.items[key] = item
+		self.sizes[key] = size
+		self.accessed[key] = self.accessCounter
+		self.totalSize += size
+		self.evict(key)
+
+	def remove(self, key):
+		"""
+		Remove the item stored under key
+		"""
+		if key not in self.items:
+			return
+		item = self.items.pop(key)
+		self.totalSize -= self.sizes.pop(key)
+		del self.accessed[key]
+		if self.onRemove:
+			self.onRemove(key, item)
+
+	def clear(self):
+		"""
+		Remove all the items
+		"""
+		for key in self.items.keys():
+			self.remove(key)
+
+	def evict(self, keep = None):
+		"""
+		Remove the least recently used items until the cache fits in its
+		limit. The item stored under keep is not removed.
+		"""
+		while self.totalSize > self.limit:
+			candidates = [key for key in self.accessed if key != keep]
+			if not candidates:
+				break
+			self.remove(min(candidates, key = self.accessed.get))
+			self.evictions += 1
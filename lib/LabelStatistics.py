@@ -0,0 +1,250 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: LabelStatistics
+ Project: BioImageXD
+ Description:
+
+ Intensity statistics of labeled regions computed with NumPy. The regions
+ of interest are rasterized once into a two dimensional label image that
+ applies to every slice, and the count, sum, minimum, maximum, mean and
+ standard deviation of every label are computed in a single pass over the
+ voxels. The statistics of a series of timepoints can be computed in a
+ pool of worker processes.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import os
+import math
+import threading
+import lib.ProcessPool
+import lib.ROIMask
+try:
+	import numpy
+	from vtk.util import numpy_support
+except ImportError:
+	numpy = None
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+
+# The state shared with the worker processes of imapTimepointStatistics.
+# The workers are forked, so they inherit it together with the dataunit.
+timepointContext = {}
+
+def getVolume(imageData):
+	"""
+	Return the voxels of a single component image as an array indexed by
+	[z, y, x], or None if the image has several components. The array is
+	a view to the memory of the image.
+	"""
+	imageData.SetUpdateExtent(imageData.GetWholeExtent())
+	imageData.Update()
+	if imageData.GetNumberOfScalarComponents() != 1:
+		return None
+	x, y, z = imageData.GetDimensions()
+	return numpy_support.vtk_to_numpy(imageData.GetPointData().GetScalars()).reshape(z, y, x)
+
+def hasSingleComponent(dataUnit):
+	"""
+	@return True if the timepoints of the dataunit have a single component,
+			so that their statistics can be computed from getVolume
+	"""
+	imageData = dataUnit.getTimepoint(0)
+	imageData.UpdateInformation()
+	return imageData.GetNumberOfScalarComponents() == 1
+
+def getROILabels(rois, mx, my):
+	"""
+	Rasterize the regions of interest to label images of mx x my pixels,
+	where the pixels of the region rois[i] have the label i + 1. Regions
+	that overlap are put in separate label images. Returns a list of
+	(labels, indices of the regions in the label image).
+	"""
+	layers = []
+	for i, roi in enumerate(rois):
+		mask = lib.ROIMask.getShapeMask(roi, mx, my)
+		for labels, indices in layers:
+			if not labels[mask].any():
+				break
+		else:
+			labels = numpy.zeros((my, mx), numpy.int32)
+			indices = []
+			layers.append((labels, indices))
+		labels[mask] = i + 1
+		indices.append(i)
+	return layers
+
+class LabelIndex:
+	"""
+	The pixels of a label image sorted by their label, so that the voxels of
+	each label of a slice can be reduced with a single NumPy call
+	"""
+	def __init__(self, labels):
+		"""
+		Initialization
+		"""
+		labels = labels.ravel()
+		pixels = numpy.nonzero(labels)[0]
+		self.order = pixels[numpy.argsort(labels[pixels], kind = "mergesort")]
+		self.labels, self.starts = numpy.unique(labels[self.order], return_index = True)
+		self.counts = numpy.diff(numpy.append(self.starts, len(self.order)))
+
+	def getStatistics(self, volume):
+		"""
+		Return the statistics of every label in the volume, given as an array
+		indexed by [z, y, x]
+		"""
+		statistics = LabelStatistics(self.labels)
+		if not len(self.order):
+			return statistics
+		for plane in volume:
+			values = plane.ravel()[self.order]
+			statistics.add(self.starts, self.counts, values)
+		return statistics
+
+class LabelStatistics:
+	"""
+	The count, sum, minimum, maximum, mean and standard deviation of the
+	voxels of every label
+	"""
+	def __init__(self, labels):
+		"""
+		Initialization
+		"""
+		self.labels = {}
+		for i, label in enumerate(labels):
+			self.labels[int(label)] = i
+		n = len(labels)
+		self.counts = numpy.zeros(n, numpy.int64)
+		self.sums = numpy.zeros(n, numpy.float64)
+		self.squares = numpy.zeros(n, numpy.float64)
+		self.minimums = numpy.zeros(n, numpy.float64)
+		self.maximums = numpy.zeros(n, numpy.float64)
+
+	def add(self, starts, counts, values):
+		"""
+		Add the voxels of one slice, sorted by label. The voxels of the label
+		i start at starts[i].
+		"""
+		values = values.astype(numpy.float64)
+		minimums = numpy.minimum.reduceat(values, starts)
+		maximums = numpy.maximum.reduceat(values, starts)
+		if self.counts.any():
+			minimums = numpy.minimum(minimums, self.minimums)
+			maximums = numpy.maximum(maximums, self.maximums)
+		self.minimums = minimums
+		self.maximums = maximums
+		self.counts += counts
+		self.sums += numpy.add.reduceat(values, starts)
+		self.squares += numpy.add.reduceat(values * values, starts)
+
+	def getCount(self, label):
+		"""
+		@return the number of voxels with the label
+		"""
+		if label not in self.labels:
+			return 0
+		return int(self.counts[self.labels[label]])
+
+	def getSum(self, label):
+		"""
+		@return the sum of the voxels with the label
+		"""
+		if label not in self.labels:
+			return 0.0
+		return float(self.sums[self.labels[label]])
+
+	def getMinimum(self, label):
+		"""
+		@return the smallest voxel with the label
+		"""
+		if label not in self.labels:
+			return 0.0
+		return float(self.minimums[self.labels[label]])
+
+	def getMaximum(self, label):
+		"""
+		@return the largest voxel with the label
+		"""
+		if label not in self.labels:
+			return 0.0
+		return float(self.maximums[self.labels[label]])
+
+	def getMean(self, label):
+		"""
+		@return the mean of the voxels with the label
+		"""
+		count = self.getCount(label)
+		if not count:
+			return 0.0
+		return self.getSum(label) / count
+
+	def getSigma(self, label):
+		"""
+		@return the sample standard deviation of the voxels with the label,
+				as computed by itk::LabelStatisticsImageFilter
+		"""
+		count = self.getCount(label)
+		if count < 2:
+			return 0.0
+		i = self.labels[label]
+		variance = (self.squares[i] - self.sums[i] * self.sums[i] / count) / (count - 1)
+		return math.sqrt(max(variance, 0.0))
+
+def getTimepointStatistics(timepoint):
+	"""
+	Read a timepoint of the dataunit in timepointContext and return the
+	statistics of its labels. This is run in the worker processes.
+	"""
+	timepointContext["readLock"].acquire()
+	try:
+		imageData = timepointContext["dataunit"].getTimepoint(timepoint)
+		volume = getVolume(imageData)
+	finally:
+		timepointContext["readLock"].release()
+	return timepointContext["index"].getStatistics(volume)
+
+def imapTimepointStatistics(dataUnit, index, timepoints, workers = 0):
+	"""
+	Yield the statistics of the labels of the label index for every given
+	timepoint of the dataunit, in the order of the timepoints. The
+	timepoints are processed in a pool of worker processes when more than
+	one process is configured. Reading the data is serialized, because the
+	workers share the file handles of the readers.
+	"""
+	workers = lib.ProcessPool.getNumberOfWorkers(workers)
+	if workers > 1 and hasattr(os, "fork") and multiprocessing:
+		lock = multiprocessing.Lock()
+	else:
+		workers = 1
+		lock = threading.Lock()
+	timepointContext["dataunit"] = dataUnit
+	timepointContext["index"] = index
+	timepointContext["readLock"] = lock
+	try:
+		for statistics in lib.ProcessPool.imapOrdered(getTimepointStatistics, timepoints, workers, \
+														initializer = lib.ProcessPool.initializeWorker):
+			yield statistics
+	finally:
+		timepointContext.clear()
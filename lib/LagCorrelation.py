@@ -0,0 +1,163 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: LagCorrelation
+ Project: BioImageXD
+ Description:
+
+ Pearson correlation between the timepoints of a series as a function of
+ the lag between them. The timepoints are streamed in order and each is
+ read only once. The sum and sum of squares of every timepoint are kept,
+ and the timepoints within the largest lag are kept centered in a bounded
+ window, so that a new timepoint is correlated with all of them with a
+ single matrix product.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import math
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# The default maximum size in bytes of the timepoints kept for correlating
+# them with the later ones
+WINDOW_SIZE = 512 * 1024 * 1024
+
+class LagCorrelation:
+	"""
+	The correlations of all pairs of timepoints (tp, tp + lag) for the lags
+	1 ... maxLag
+	"""
+	def __init__(self, maxLag, downsample = 1, windowSize = WINDOW_SIZE):
+		"""
+		Initialization
+		@param maxLag the largest lag to compute
+		@param downsample only every downsample'th voxel along x and y is used
+		@param windowSize the maximum size in bytes of the maxLag timepoints
+						  that are kept. If they do not fit, the timepoints
+						  are downsampled more than asked for.
+		"""
+		self.maxLag = max(int(maxLag), 1)
+		self.downsample = max(int(downsample), 1)
+		self.windowSize = windowSize
+		self.window = None
+		self.slots = [None] * self.maxLag
+		self.sums = {}
+		self.squares = {}
+		self.deviations = {}
+		self.count = 0
+		self.correlations = {}
+
+	def getDownsample(self, shape):
+		"""
+		Return the smallest downsampling, at least the one asked for, with
+		which maxLag timepoints of the given shape fit in the window size.
+		Raises MemoryError if they do not fit even with one voxel per slice.
+		"""
+		z, y, x = shape[0:3]
+		downsample = self.downsample
+		while 1:
+			count = z * ((y + downsample - 1) / downsample) * ((x + downsample - 1) / downsample)
+			if self.maxLag * count * 8 <= self.windowSize:
+				return downsample
+			if downsample >= max(x, y):
+				raise MemoryError("%d timepoints of %d slices do not fit in %d MB. Use a smaller largest lag." % \
+									(self.maxLag, z, self.windowSize / (1024 * 1024)))
+			downsample += 1
+
+	def getSample(self, volume):
+		"""
+		Return the voxels of a volume indexed by [z, y, x] that are used for
+		the correlation, as a flat array
+		"""
+		if self.downsample > 1:
+			volume = volume[:, ::self.downsample, ::self.downsample]
+		return numpy.array(volume, numpy.float64).ravel()
+
+	def add(self, timepoint, volume):
+		"""
+		Add a timepoint, given as an array indexed by [z, y, x], and correlate
+		it with the earlier timepoints within the largest lag. The timepoints
+		need to be added in increasing order.
+		"""
+		if self.window is None:
+			self.downsample = self.getDownsample(volume.shape)
+		values = self.getSample(volume)
+		if self.window is None:
+			self.count = len(values)
+			self.window = numpy.zeros((self.maxLag, self.count), numpy.float64)
+		elif len(values) != self.count:
+			raise ValueError("Timepoint %d has %d voxels instead of %d" % (timepoint, len(values), self.count))
+		total = values.sum()
+		squares = numpy.dot(values, values)
+		self.sums[timepoint] = float(total)
+		self.squares[timepoint] = float(squares)
+		values -= total / self.count
+		self.deviations[timepoint] = float(numpy.dot(values, values))
+
+		previous = [(slot, tp) for slot, tp in enumerate(self.slots) \
+					if tp is not None and 0 < timepoint - tp <= self.maxLag]
+		if previous:
+			products = numpy.dot(self.window, values)
+			for slot, tp in previous:
+				self.correlations[(tp, timepoint)] = self.getPearson(products[slot], tp, timepoint)
+
+		slot = timepoint % self.maxLag
+		self.window[slot] = values
+		self.slots[slot] = timepoint
+
+	def setCorrelation(self, tp1, tp2, correlation):
+		"""
+		Set the correlation of two timepoints that was computed elsewhere
+		"""
+		self.correlations[(tp1, tp2)] = correlation
+
+	def getPearson(self, product, tp1, tp2):
+		"""
+		Return the Pearson correlation of two timepoints from the product of
+		their centered voxels
+		"""
+		denominator = math.sqrt(self.deviations[tp1] * self.deviations[tp2])
+		if not denominator:
+			return 0.0
+		return float(product) / denominator
+
+	def getCorrelations(self):
+		"""
+		@return a sorted list of (tp1, tp2, correlation) for every pair of timepoints
+		"""
+		return [(tp1, tp2, self.correlations[(tp1, tp2)]) for (tp1, tp2) in sorted(self.correlations.keys())]
+
+	def getCurve(self):
+		"""
+		@return a list of (lag, mean correlation, number of pairs) for every lag
+		"""
+		byLag = {}
+		for (tp1, tp2), correlation in self.correlations.items():
+			byLag.setdefault(tp2 - tp1, []).append(correlation)
+		curve = []
+		for lag in range(1, self.maxLag + 1):
+			values = byLag.get(lag, [])
+			if values:
+				curve.append((lag, sum(values) / len(values), len(values)))
+		return curve
@@ -52,6 +52,8 @@ class Module:
 
 		self.eventDesc = "Processing data"
 		self.controlUnit = None
+		self.deferOutput = 0
+		self.filterTimes = {}
 		# If we enable this, then ITK starts eating memory like crazy
 		#import itkConfig
 		#itkConfig.ProgressCallback = self.updateITKProgress
@@ -73,6 +75,8 @@ class Module:
 		"""
 		update the progress from the itk side
 		"""
+		if not scripting.mainWindow:
+			return
 		progress = self.shift + itkprogress * self.scale
 		scripting.mainWindow.updateProgressBar(None, "ProgressEvent", progress, self.getEventDesc(), 0)
 
@@ -80,6 +84,8 @@ class Module:
 		"""
 		New progress object based progress report
 		"""
+		if not scripting.mainWindow:
+			return
 		progress = self.shift + progressObj.getProgress() * self.scale
 		scripting.mainWindow.updateProgressBar(None, "ProgressEvent", progress, self.getEventDesc(), 0)
 		
@@ -102,6 +108,8 @@ class Module:
 		# The shift and scale variables allow the processing method to affect the reported progress
 		# since it may combine several different VTK classes that will each report progress from 
 		# 0% to 100%
+		if not scripting.mainWindow:
+			return
 		progress = self.shift + obj.GetProgress() * self.scale
 		txt = obj.GetProgressText()
 		if not txt:
@@ -115,6 +123,77 @@ class Module:
 		"""
 		self.timepoint = timePoint
 		
+	def setDeferOutput(self, flag):
+		"""
+		Set whether the output written during processing is held back until
+		writeDeferredOutput is called
+		"""
+		self.deferOutput = flag
+
+	def writeDeferredOutput(self):
+		"""
+		Write the output that was held back while processing a timepoint
+		"""
+		pass
+
+	def isParallelSafe(self, settings):
+		"""
+		Return whether the timepoints can be processed independently of each
+		other in separate processes with the given settings
+		"""
+		return True
+
+	def getTimepointResults(self, timePoint):
+		"""
+		Return the results of processing the given timepoint that need to be
+		passed from a worker process back to the controlling process
+		"""
+		return None
+
+	def setTimepointResults(self, settings, timePoint, results):
+		"""
+		Store results returned by getTimepointResults in a worker process
+		"""
+		pass
+
+	def isPrefetchable(self):
+		"""
+		Return whether getProcessedTimepoint can process timepoints apart from
+		the preview
+		"""
+		return False
+
+	def getProcessedTimepoint(self, timepoint, images):
+		"""
+		Return a processed copy of another timepoint for prefetching, or None
+		if the module cannot process timepoints apart from its preview. This
+		is run in a prefetching worker process.
+		"""
+		return None
+
+	def getFilterTimes(self):
+		"""
+		Return the time in seconds spent in each step of the processing by
+		name. The time of each filter is only the time of setting it up,
+		because the VTK filters are executed together when the pipeline is
+		updated, and that time is reported as a whole as "Pipeline update".
+		"""
+		return self.filterTimes
+
+	def clearFilterTimes(self):
+		"""
+		Start measuring the time spent in the filters anew
+		"""
+		self.filterTimes = {}
+
+	def addFilterTimes(self, filterTimes):
+		"""
+		Add the times measured when executing the filters elsewhere, such as
+		in a worker process
+		"""
+		for name, seconds in filterTimes.items():
+			self.filterTimes[name] = self.filterTimes.get(name, 0.0) + seconds
+
 	def setSettings(self, settings):
 		"""
 		Sets the settings object of this module
@@ -0,0 +1,205 @@
+"""
+ Unit: ObjectSurface.py
+ Project: BioImageXD
+ Description:
+
+ A module for calculating the surface area and the smoothed surface area of
+ labeled objects. Each object is meshed only inside its own bounding box,
+ padded by one voxel, so the cost is proportional to the size of the object
+ instead of the size of the whole label image. The objects can optionally
+ be spread over a pool of worker processes.
+
+ Copyright (C) 2005	 BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307	 USA
+
+"""
+__author__ = "BioImageXD Project <http://www.bioimagexd.net/>"
+__version__ = "$Revision$"
+__date__ = "$Date$"
+
+import struct
+import vtk
+import lib.ProcessPool
+
+def getPaddedExtent(index, size, wholeExtent, padding = 1):
+	"""
+	Return the VTK extent of a bounding box given as an ITK style index and
+	size, grown by padding voxels and clipped to wholeExtent
+	"""
+	extent = []
+	for i in range(3):
+		if i < len(index):
+			start = int(index[i]) - padding
+			end = int(index[i]) + int(size[i]) - 1 + padding
+		else:
+			start, end = wholeExtent[2 * i], wholeExtent[2 * i + 1]
+		extent.append(max(start, wholeExtent[2 * i]))
+		extent.append(min(end, wholeExtent[2 * i + 1]))
+	return tuple(extent)
+
+def getLabelObjectExtent(labelObject, wholeExtent, padding = 1):
+	"""
+	Return the padded extent of an ITK label object, or the whole extent
+	if the label object does not know its bounding box
+	"""
+	try:
+		region = labelObject.GetRegion()
+	except AttributeError:
+		return tuple(wholeExtent)
+	return getRegionExtent(region, wholeExtent, padding)
+
+def getRegionExtent(region, wholeExtent, padding = 1):
+	"""
+	Return the padded extent of an ITK image region
+	"""
+	index = region.GetIndex()
+	size = region.GetSize()
+	dim = size.GetSizeDimension()
+	return getPaddedExtent([index.GetElement(i) for i in range(dim)], \
+							[size.GetElement(i) for i in range(dim)], wholeExtent, padding)
+
+class ObjectSurface:
+	"""
+	Calculates the surface area of single labels of a label image with
+	marching cubes, optionally also the area of the surface decimated with
+	vtkDecimatePro that is used for the smoothness factor
+	"""
+	def __init__(self, labelImage = None, smoothness = False):
+		"""
+		Initialization
+		"""
+		self.smoothness = smoothness
+		self.voi = vtk.vtkExtractVOI()
+		self.objectThreshold = vtk.vtkImageThreshold()
+		self.objectThreshold.SetInputConnection(self.voi.GetOutputPort())
+		self.objectThreshold.SetOutputScalarTypeToUnsignedChar()
+		self.objectThreshold.SetInValue(255)
+		self.objectThreshold.SetOutValue(0)
+		self.marchingCubes = vtk.vtkMarchingCubes()
+		self.marchingCubes.SetInputConnection(self.objectThreshold.GetOutputPort())
+		self.marchingCubes.SetValue(0, 255)
+		self.massProperties = vtk.vtkMassProperties()
+		self.massProperties.SetInputConnection(self.marchingCubes.GetOutputPort())
+		self.smoothDecimate = None
+		self.smoothProperties = None
+		if smoothness:
+			self.smoothDecimate = vtk.vtkDecimatePro()
+			self.smoothDecimate.SetTargetReduction(0.9)
+			self.smoothDecimate.PreserveTopologyOff()
+			self.smoothDecimate.SetInputConnection(self.marchingCubes.GetOutputPort())
+			self.smoothProperties = vtk.vtkMassProperties()
+			self.smoothProperties.SetInputConnection(self.smoothDecimate.GetOutputPort())
+		if labelImage:
+			self.setLabelImage(labelImage)
+
+	def setLabelImage(self, labelImage):
+		"""
+		Set the label image from which the objects are meshed
+		"""
+		labelImage.SetUpdateExtent(labelImage.GetWholeExtent())
+		labelImage.Update()
+		self.voi.SetInput(labelImage)
+
+	def calculate(self, label, extent):
+		"""
+		Return the surface area of the object with the given label inside
+		extent and the area of the smoothed surface. The areas are None if
+		no surface was found.
+		"""
+		self.voi.SetVOI(extent)
+		self.objectThreshold.ThresholdBetween(label, label)
+		polydata = self.marchingCubes.GetOutput()
+		polydata.Update()
+		area = None
+		smoothArea = None
+		if polydata.GetNumberOfPolys() > 0:
+			self.massProperties.Update()
+			area = self.massProperties.GetSurfaceArea()
+		if self.smoothness:
+			polydata = self.smoothDecimate.GetOutput()
+			polydata.Update()
+			if polydata.GetNumberOfPolys() > 0:
+				self.smoothProperties.Update()
+				smoothArea = self.smoothProperties.GetSurfaceArea()
+		return area, smoothArea
+
+def exportSubVolume(labelImage, extent):
+	"""
+	Return the voxels of labelImage inside extent as a string, together with
+	the geometry needed to import it again in another process
+	"""
+	voi = vtk.vtkExtractVOI()
+	voi.SetInput(labelImage)
+	voi.SetVOI(extent)
+	exporter = vtk.vtkImageExport()
+	exporter.SetInputConnection(voi.GetOutputPort())
+	exporter.Update()
+	dataMemorySize = exporter.GetDataMemorySize()
+	structString = struct.pack("%ds" % dataMemorySize, "")
+	exporter.SetExportVoidPointer(structString)
+	exporter.Export()
+	return (structString, tuple(extent), labelImage.GetScalarType(), \
+			tuple(labelImage.GetSpacing()), tuple(labelImage.GetOrigin()))
+
+def importSubVolume(structString, extent, scalarType, spacing, origin):
+	"""
+	Create a vtkImageData from a sub-volume exported with exportSubVolume
+	"""
+	importer = vtk.vtkImageImport()
+	importer.CopyImportVoidPointer(structString, len(structString))
+	importer.SetDataScalarType(scalarType)
+	importer.SetNumberOfScalarComponents(1)
+	importer.SetDataExtent(extent)
+	importer.SetWholeExtent(extent)
+	importer.SetDataSpacing(spacing)
+	importer.SetDataOrigin(origin)
+	importer.Update()
+	return importer.GetOutput()
+
+def calculateSubVolume(job):
+	"""
+	Calculate the surface areas of a single label from an exported
+	sub-volume. This is run in the worker processes.
+	"""
+	label, smoothness, subVolume = job
+	image = importSubVolume(*subVolume)
+	surface = ObjectSurface(image, smoothness)
+	return surface.calculate(label, image.GetWholeExtent())
+
+def calculateSurfaces(labelImage, labelExtents, smoothness = False, workers = 0):
+	"""
+	Calculate the surface areas of the given labels. labelExtents is a list
+	of (label, extent) pairs. Returns a dictionary that maps each label to
+	a tuple of its surface area and smoothed surface area. By default the
+	number of worker processes is read from the configuration.
+	"""
+	results = {}
+	workers = lib.ProcessPool.getNumberOfWorkers(workers)
+	if workers <= 1 or len(labelExtents) < 2:
+		surface = ObjectSurface(labelImage, smoothness)
+		for label, extent in labelExtents:
+			results[label] = surface.calculate(label, extent)
+		return results
+
+	labelImage.SetUpdateExtent(labelImage.GetWholeExtent())
+	labelImage.Update()
+	jobs = ((label, smoothness, exportSubVolume(labelImage, extent)) for label, extent in labelExtents)
+	labels = [label for label, extent in labelExtents]
+	areas = lib.ProcessPool.imapOrdered(calculateSubVolume, jobs, workers, chunksize = 16)
+	for label, area in zip(labels, areas):
+		results[label] = area
+	return results
@@ -3,8 +3,18 @@
  Project: BioImageXD
  Description:
 
- A module containing classes related to particle tracking
-							
+ An array-backed particle tracking engine. The particles of each timepoint
+ are stored as arrays of positions, volumes and intensities, the candidate
+ particles within the search radius are found with a uniform grid over the
+ positions, and the candidate pairs are scored in vectorized batches with
+ the same criteria and weights as lib.Particle.ParticleTracker. The
+ particles of consecutive timepoints are linked either greedily, like
+ lib.Particle.ParticleTracker does, or globally by solving a sparse linear
+ assignment problem per timepoint, optionally closing gaps of a few
+ timepoints. The tracks consist of lib.Particle.Particle objects, so they
+ are written and read with ParticleWriter and ParticleReader as before.
+ Without NumPy, the tracking is done by lib.Particle.ParticleTracker.
+
  Copyright (C) 2005	 BioImageXD Project
  See CREDITS.txt for details
 
@@ -27,510 +37,584 @@ __author__ = "BioImageXD Project < http://www.bioimagexd.org/>"
 __version__ = "$Revision: 1.42 $"
 __date__ = "$Date: 2005 / 01 / 13 14:52:39 $"
 
-import ParticleReader
-import Particle
-import os
+import lib.Particle
 import math
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
-class DimensionMapper:
-	def __init__(self):
-		pass
-		
-	def calculateInitialInfo(self, timepoint, pointA, pointB):
+# The largest number of grid cells along an axis. When the search radius is
+# small compared to the extent of the particles, the cells are made larger
+# than the radius so that the cell indices stay small.
+MAX_CELLS_PER_AXIS = 1024
+
+# The number of rows of the distance matrix computed at a time in getStats()
+STATS_BLOCK_SIZE = 256
+
+# In global linking, the cost of leaving a track unlinked relative to the
+# cost of the worst acceptable link
+NO_LINK_COST_FACTOR = 1.05
+
+# The cost of a pair that is not a candidate link
+UNLINKABLE_COST = 1e12
+
+class ParticleArrays:
+	"""
+	The particles of one timepoint in structure-of-arrays form
+	"""
+	def __init__(self, particles, voxelSize):
+		"""
+		Initialization. The physical positions are the pixel positions
+		scaled with voxelSize.
+		"""
+		self.particles = particles
+		n = len(particles)
+		self.voxelSize = numpy.array(voxelSize, dtype = numpy.float64)
+		self.pixelPositions = numpy.array([particle.posInPixels for particle in particles], \
+											dtype = numpy.float64).reshape(n, 3)
+		self.positions = self.pixelPositions * self.voxelSize
+		self.volumes = numpy.array([particle.volume for particle in particles], dtype = numpy.float64)
+		self.intensities = numpy.array([particle.averageIntensity for particle in particles], dtype = numpy.float64)
+		self.objects = numpy.array([particle.intval for particle in particles], dtype = numpy.int64)
+
+	def __len__(self):
 		"""
-		This method is given all the points in each timepoint, that the DimensionMapper can use to calculate
-		any global statistics on the search space that it requires to operate
+		@return the number of particles
 		"""
-		pass
-		
-	def value(self, point):
+		return len(self.particles)
+
+class GridIndex:
+	"""
+	A uniform grid over a set of points for finding the points within a
+	radius of many query points at once. The points are sorted by the index
+	of the cell they are in, so a cell is a run of the sorted points that is
+	found with a binary search.
+	"""
+	def __init__(self, positions, radius):
+		"""
+		Initialization
+		"""
+		self.positions = positions
+		self.radius = float(radius)
+		if len(positions):
+			self.origin = positions.min(axis = 0)
+			extent = positions.max(axis = 0) - self.origin
+		else:
+			self.origin = numpy.zeros(3)
+			extent = numpy.zeros(3)
+		# A point within the radius is always in one of the 27 neighboring
+		# cells as long as the cells are at least as large as the radius
+		self.cellSize = max(self.radius * (1 + 1e-9), extent.max() / MAX_CELLS_PER_AXIS, 1e-12)
+		self.cellCounts = (extent / self.cellSize).astype(numpy.int64) + 1
+		keys = self.getKeys(self.getCells(positions))
+		self.order = numpy.argsort(keys, kind = "mergesort")
+		self.sortedKeys = keys[self.order]
+
+	def getCells(self, positions):
 		"""
-		Return the value of a point in this DimensionMapper as a coordinate scaled to [0, 1]
+		@return the cells the given positions are in
 		"""
-		return 0
-		
-class DistanceDimensionMapper(DimensionMapper):
+		return numpy.floor((positions - self.origin) / self.cellSize).astype(numpy.int64)
+
+	def getKeys(self, cells):
+		"""
+		@return the linear indices of the given cells
+		"""
+		return (cells[:, 2] * self.cellCounts[1] + cells[:, 1]) * self.cellCounts[0] + cells[:, 0]
+
+	def queryPairs(self, points):
+		"""
+		Find the indexed points that are within the radius of the query points
+		@return arrays of the query point indices, the indexed point indices and
+				the distances of the pairs
+		"""
+		empty = numpy.zeros(0, dtype = numpy.int64)
+		if not len(points) or not len(self.positions):
+			return empty, empty, numpy.zeros(0)
+		cells = self.getCells(points)
+		queries = []
+		found = []
+		for offset in [(dx, dy, dz) for dz in (-1, 0, 1) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]:
+			neighbors = cells + offset
+			inside = numpy.all((neighbors >= 0) & (neighbors < self.cellCounts), axis = 1)
+			indices = numpy.nonzero(inside)[0]
+			if not len(indices):
+				continue
+			keys = self.getKeys(neighbors[indices])
+			start = numpy.searchsorted(self.sortedKeys, keys, "left")
+			counts = numpy.searchsorted(self.sortedKeys, keys, "right") - start
+			total = counts.sum()
+			if not total:
+				continue
+			queries.append(numpy.repeat(indices, counts))
+			# The position of each pair within the run of points of its cell
+			runs = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+			found.append(self.order[numpy.repeat(start, counts) + runs])
+		if not queries:
+			return empty, empty, numpy.zeros(0)
+		queries = numpy.concatenate(queries)
+		found = numpy.concatenate(found)
+		distances = getDistances(self.positions[found], points[queries])
+		inRange = distances <= self.radius
+		return queries[inRange], found[inRange], distances[inRange]
+
+def getDistances(positions1, positions2):
 	"""
-	A DimensionMapper that maps the physical position of a particle into a 3D space with values in range [0,1]
+	@return the distances between the rows of two arrays of positions, summed
+			in the same order as lib.Particle.Particle.distance()
 	"""
-	def __init__(self):
-		self.maxDistance = 0
-		self.minDistance = 9999999999999
-		self.minX, self.minY, self.minZ = 99999999,99999999,999999999
-		self.maxX, self.maxY, self.maxZ = 0,0,0
-		
-	def calculateInitialInfo(self, timepoint, pointA, pointB):
-		#d = dist2(pointA.physicalPosition, pointB.physicalPosition)
-		#self.minDistance = min(d, self.minDistance)
-		#self.maxDistance = max(d, self.maxDistance)
-		#self.minX = min(self.minX, pointA.physicalPosition[0], pointB.physicalPosition[0])
-		#self.minY = min(self.minY, pointA.physicalPosition[1], pointB.physicalPosition[1])
-		#self.minZ = min(self.minZ, pointA.physicalPosition[2], pointB.physicalPosition[2])
-		self.maxX = max(self.maxX, pointA.physicalPosition[0], pointB.physicalPosition[0])
-		self.maxY = max(self.maxY, pointA.physicalPosition[1], pointB.physicalPosition[1])
-		self.maxZ = max(self.maxZ, pointA.physicalPosition[2], pointB.physicalPosition[2])
-		self.maxPos = (self.maxX, self.maxY, self.maxZ)
-		
-	def value(self, point):
-		"""
-		Scale the position coordinates to range 0-1
-		"""
-		return [point.physicalPosition[i] / self.maxPos[i] for i in range(0,3)]
-
-class SizeDimensionMapper(DimensionMapper):
+	diff = positions2 - positions1
+	return numpy.sqrt(diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1] + diff[:, 2] * diff[:, 2])
+
+def solveAssignment(rows, columns, costs, noLinkCost):
 	"""
-	A DimensionMapper that maps the physical size of the particle into a dimension with values in range [0,1]
+	Solve the linear assignment problem given as the candidate pairs of rows
+	and columns and their costs. A row may also be left unlinked at the cost
+	noLinkCost. The pairs are split into connected components, so that the
+	time taken grows with the size of the largest group of competing
+	candidates, not with the total number of rows and columns.
+	@return a list of the (row, column, cost) links
 	"""
-	def __init__(self):
-		self.maxSize = 0
-		
-	def calculateInitialInfo(self, timepoint, pointA, pointB):
-		self.maxSize = max(self.maxSize, pointA.size, pointB.size)
-		
-	def value(self, point):
-		"""
-		Scale the size to range [0-1]
-		"""
-		return [point.size / float(self.maxSize)]
-		
-class IntensityDimensionMapper(DimensionMapper):
+	parents = {}
+	def find(node):
+		root = node
+		while parents[root] != root:
+			root = parents[root]
+		while parents[node] != root:
+			parents[node], node = root, parents[node]
+		return root
+
+	for row, column in zip(rows, columns):
+		rowNode = (0, row)
+		columnNode = (1, column)
+		parents.setdefault(rowNode, rowNode)
+		parents.setdefault(columnNode, columnNode)
+		rowRoot = find(rowNode)
+		columnRoot = find(columnNode)
+		if rowRoot != columnRoot:
+			parents[columnRoot] = rowRoot
+
+	components = {}
+	for i, row in enumerate(rows):
+		components.setdefault(find((0, row)), []).append(i)
+
+	links = []
+	for pairs in components.values():
+		if len(pairs) == 1:
+			i = pairs[0]
+			if costs[i] < noLinkCost:
+				links.append((rows[i], columns[i], costs[i]))
+			continue
+		componentRows = sorted(set([rows[i] for i in pairs]))
+		componentColumns = sorted(set([columns[i] for i in pairs]))
+		rowIndices = dict([(row, n) for n, row in enumerate(componentRows)])
+		columnIndices = dict([(column, n) for n, column in enumerate(componentColumns)])
+		nrows = len(componentRows)
+		ncolumns = len(componentColumns)
+		# Every row has a column of its own for leaving it unlinked
+		matrix = numpy.empty((nrows, ncolumns + nrows))
+		matrix[:] = UNLINKABLE_COST
+		matrix[:, ncolumns:][numpy.diag_indices(nrows)] = noLinkCost
+		for i in pairs:
+			matrix[rowIndices[rows[i]], columnIndices[columns[i]]] = costs[i]
+		for n, column in enumerate(minimizeAssignment(matrix)):
+			if column < ncolumns:
+				links.append((componentRows[n], componentColumns[column], matrix[n, column]))
+	return links
+
+def minimizeAssignment(matrix):
 	"""
-	A DimensionMapper that maps the average intensity of the particle into range [0,1]
+	Solve the assignment of the rows of a cost matrix to distinct columns
+	with the smallest total cost, using the shortest augmenting path
+	version of the Hungarian method. There must be at least as many columns
+	as rows.
+	@return the column assigned to each row
 	"""
-	def __init__(self):
-		self.maxIntensity = 0
-		
-	def calculateInitialInfo(self, timepoint, pointA, pointB):
-		self.maxIntensity = max(self.maxIntensity, pointA.intensityValue, pointB.intensityValue)
-		
-	def value(self, point):
-		return [point.intensityValue / float(self.maxIntensity)]
-		
-def dist2(p,q):
-	"""Squared distance between p and q."""
-	d = 0
-	for i in range(len(p)):
-		d += (p[i]-q[i])**2
-	return d
-
-def dist(p, q):
-	d = 0
-	for i in range(len(p)):
-		d += (p[i]-q[i])**2
-	return math.sqrt(d)
-
-class KDTree:
-	count=0
-	def __init__(self,dim=2,index=0, pointList = []):
-		self.dim = dim
-		self.index = index
-		self.split = None
-		if pointList:
-			k = len(pointList[0])
-			pointList.sort(cmp=lambda y,x: cmp(x[self.index], y[self.index]))
-			median = len(pointList)/2
-			self.split = pointList[median]
-			self.left = KDTree(self.dim, (self.index+1)%self.dim, pointList[0:median])
-			self.right = KDTree(self.dim, (self.index+1)%self.dim, pointList[median+1:])
-
-	def addPoint(self, p):
-		"""Include another point in the kD-tree."""
-		if self.split is None:
-			self.split = p
-			self.left = KDTree(self.dim, (self.index + 1) % self.dim)
-			self.right = KDTree(self.dim, (self.index + 1) % self.dim)
-		elif self.split[self.index] < p[self.index]:
-			self.left.addPoint(p)
+	nrows, ncolumns = matrix.shape
+	# The potentials and the assignment use 1-based indices, 0 is a virtual column
+	rowPotentials = numpy.zeros(nrows + 1)
+	columnPotentials = numpy.zeros(ncolumns + 1)
+	assigned = numpy.zeros(ncolumns + 1, dtype = numpy.int64)
+	way = numpy.zeros(ncolumns + 1, dtype = numpy.int64)
+	# Start from the cheapest column of each row. A row gets its cheapest
+	# column if no earlier row took it, so only the rows that compete for a
+	# column need augmenting paths.
+	cheapest = matrix.argmin(axis = 1)
+	rowPotentials[1:] = matrix[numpy.arange(nrows), cheapest]
+	unassigned = []
+	for row, column in enumerate(cheapest.tolist()):
+		if assigned[column + 1]:
+			unassigned.append(row + 1)
 		else:
-			self.right.addPoint(p)
-		
-	def inCircle(self, searchNode, radius, testNode):
-		return (dist2(searchNode, testNode)<radius*radius)
-		
-	def neighborsInRange(self, point, radius):
-		KDTree.count = 0
-		return self.nearestNeighborsAll(point, radius)
-
-	def nearestNeighborsAll(self,q,radius):
-		"""Find pair (d,p) where p is nearest neighbor and d is squared
-		distance to p. Returned distance must be within maxdist2; if
-		not, no point itself is returned.
-		"""
-		results = []
-		if self.split is not None:
-			KDTree.count+=1
-			if self.inCircle(q, radius, self.split):
-				results.append(self.split)
-
-			splitdist = (self.split[self.index] - q[self.index])
-
-			# Determine whether the searched node lies to the left or to the right
-			trees = [self.right, self.left]
-			if self.split[self.index] < q[self.index]:
-				# If this node's coord in current axis is smaller than the searched
-				# node's, then search left first
-				trees = [self.left, self.right]
-				
-			# Pick the minimum of the current solution and a search of the
-			# subtree 
-			results.extend(trees[0].nearestNeighborsAll(q,radius))
-			
-			# If the distance in the current axis is smaller than the solution we found
-			# then we search the other side of the tree as well
-			if splitdist < radius:
-				results.extend(trees[1].nearestNeighborsAll(q,radius))
-		return results
-		
-	def nearestNeighbor(self,q,maxdist2):
-		"""Find pair (d,p) where p is nearest neighbor and d is squared
-		distance to p. Returned distance must be within maxdist2; if
-		not, no point itself is returned.
-		"""
-		solution = (maxdist2+1,None)
-		if self.split is not None:
-			KDTree.count+=1
-			# Pick a minimum of the current solution and the split
-			solution = min(solution, (dist2(self.split,q),self.split))
-			
-			# This is a distance^2 in the current axis 
-			# from the split point to the target node
-			d2split = (self.split[self.index] - q[self.index])**2
-
-			# Determine whether the searched node lies to the left or to the right
-			trees = [self.right, self.left]
-			if self.split[self.index] < q[self.index]:
-				# If this node's coord in current axis is smaller than the searched
-				# node's, then search left first
-				trees = [self.left, self.right]
-				
-			# Pick the minimum of the current solution and a search of the
-			# subtree 
-			solution = min(solution,
-				trees[0].nearestNeighbor(q,solution[0]))
-			
-			# If the distance in the current axis is smaller than the solution we found
-			# then we search the other side of the tree as well
-			if d2split < solution[0]:
-				solution = min(solution,
-					trees[1].nearestNeighbor(q,solution[0]))
-		return solution
-
-class ParticleTracker:
+			assigned[column + 1] = row + 1
+	for row in unassigned:
+		assigned[0] = row
+		column = 0
+		minimum = numpy.empty(ncolumns + 1)
+		minimum[:] = numpy.inf
+		used = numpy.zeros(ncolumns + 1, dtype = bool)
+		while 1:
+			used[column] = True
+			currentRow = assigned[column]
+			reduced = matrix[currentRow - 1] - rowPotentials[currentRow] - columnPotentials[1:]
+			free = ~used[1:]
+			better = free & (reduced < minimum[1:])
+			minimum[1:][better] = reduced[better]
+			way[1:][better] = column
+			candidates = numpy.where(free, minimum[1:], numpy.inf)
+			nextColumn = int(candidates.argmin()) + 1
+			delta = candidates[nextColumn - 1]
+			rowPotentials[assigned[used]] += delta
+			columnPotentials[used] -= delta
+			minimum[1:][free] -= delta
+			column = nextColumn
+			if not assigned[column]:
+				break
+		while column:
+			previous = way[column]
+			assigned[column] = assigned[previous]
+			column = previous
+	result = [0] * nrows
+	for column in range(1, ncolumns + 1):
+		if assigned[column]:
+			result[assigned[column] - 1] = column - 1
+	return result
+
+class ParticleTracker(lib.Particle.ParticleTracker):
 	"""
-	A class that will utilize the different tracking related
-				 classes to create tracks of a set of particles
+	A particle tracker that scores the candidate particles of a timepoint
+	in vectorized batches
 	"""
 	def __init__(self):
+		"""
+		Initialization
+		"""
+		lib.Particle.ParticleTracker.__init__(self)
+		self.arrays = {}
+		self.trackLengths = {}
+		self.globalLinking = False
+		self.gapFrames = 0
 
-		self.velocityWeight = 0.25
-		self.directionWeight = 0.25
-		self.sizeWeight = 0.25
-		self.intensityWeight = 0.25
-		self.minSpeed = 5
-		self.maxSpeed = 25
-		self.speedDeviation = 0.3
-		self.distanceChange = None
-		self.sizeChange = None
-		self.intensityChange = None
-		self.angleChange = None
-	
-		self.filterObjectSize = 2  
-
-		self.maxIntensity = None
-		self.maxSize = None
-		self.maxVelocity = None
-
-		self.reader = None
-		self.particles = None	 
-		self.tracks = []
-		
-		self.measures = [DistanceDimensionMapper(), SizeDimensionMapper(), IntensityDimensionMapper()]
-		self.kdTrees = []
-		
-	def setWeights(self, velocityWeight, sizeWeight, intensityWeight, directionWeight): 
-
-		"""
-		Set the weighting factors for velocity change, 
-					size change, intensity change and direction change
-		"""
-		self.velocityWeight = velocityWeight
-		self.sizeWeight = sizeWeight
-		self.intensityWeight = intensityWeight
-		self.directionWeight = directionWeight
-		
-	def getReader(self):	
-		"""
-		Return the particle reader
-		"""
-		return self.reader
-		
-	def readFromFile(self, filename, statsTimepoint = 0):
+	def setGlobalLinking(self, globalLinking):
 		"""
-		Read the particles from a given .CSV filename
+		Set whether the particles of consecutive timepoints are linked by
+		solving a linear assignment problem instead of greedily
+		"""
+		self.globalLinking = globalLinking
+
+	def setGapFrames(self, gapFrames):
 		"""
-		self.particles = []
-		#n = 999
-		print "Reading from file = '%s'"%filename
-		
-		if os.path.exists(filename):
-			self.reader = ParticleReader.ParticleReader(filename, filterObjectSize = self.filterObjectSize)
-			self.particles = self.reader.read(statsTimepoint = statsTimepoint)
-				
-	def getParticles(self, timepoint, objs):
+		Set the number of missing timepoints a track may skip in global linking
 		"""
-		return the particles in given timepoint with given int.values
+		self.gapFrames = gapFrames
+
+	def readFromFile(self, filename, statsTimepoint = 0):
+		"""
+		Read the particles from a given .CSV filename
 		"""
-		# Return all the particles in given timepoint where the object number is within the given
-		# objects
-		return [i for i in self.particles[timepoint] if i.objectNumber() in objs]
+		lib.Particle.ParticleTracker.readFromFile(self, filename, statsTimepoint)
+		self.arrays = {}
 
-	def getTracks(self):
+	def getArrays(self, timepoint):
 		"""
-		@return the tracks
+		@return the particles of the given timepoint as ParticleArrays
 		"""
-		return self.tracks
+		if timepoint not in self.arrays:
+			self.arrays[timepoint] = self.createArrays(self.particles[timepoint])
+		return self.arrays[timepoint]
 
-	def setFilterObjectSize(self, filterSize):
+	def createArrays(self, particles):
 		"""
-		Set the minimum size (in pixels) objects must have to be
-					 considered for the tracking
+		@return the given particles as ParticleArrays. The physical positions
+				use the voxel size of the particles, as Particle.distance() does.
 		"""
-		self.filterObjectSize = filterSize
+		voxelSize = self.voxelSize
+		if particles:
+			voxelSize = particles[0].voxelSize
+		return ParticleArrays(particles, voxelSize)
 
 	def getStats(self):
 		"""
 		Given a set of particles, calculate their minimum, maximum and
 					 average distances in each timepoint
 		"""
+		if not numpy:
+			return lib.Particle.ParticleTracker.getStats(self)
+		mindists = []
+		maxdists = []
+		avgdists = []
 		for i, pts in enumerate(self.particles):
-			print "There are %d particles in timepoint %d" % (len(pts), i)
-			for particle in pts:
-				#print "Calculating initial information for timepoint %d"%i
-				#for particle2 in pts:
-				#	if particle.intensityValue == particle2.intensityValue:
-				#		continue
-					#for measure in self.measures:
-					#	measure.calculateInitialInfo(i, particle, particle2)
-				self.maxIntensity = max(self.maxIntensity, particle.intensityValue)#, particle2.intensityValue)
-
-			print "Creating KD-tree"
-			kdTree = KDTree(2, 0, pts)
-			self.kdTrees.append(kdTree)
-			
-	def setDistanceChange(self, distChange):
-		"""
-		Set the parameter that defines maximum change in the distance (in percents
-					 of the maximum change) of two particles that will still be considered to be
-					 able to belong to the same track.
-		"""
-		self.distanceChange = distChange
-		
-	def setMaxSpeed(self, maxSpeed):
-		"""
-		Set the maximum speed (in um) of an object between timepoints
-		"""
-		self.maxSpeed = maxSpeed
-		
-	def setMinSpeed(self, minSpeed):
-		"""
-		Set the minimum speed (in um) of an object between timepoints
-		"""
-		self.minSpeed = minSpeed
-		
-	def setSpeedDeviation(self, dev):
-		"""
-		Set the deviation (in percentage) allowed from min or max
-		"""
-		self.speedDeviation = dev
-	
-	def setSizeChange(self, sizeChange):
-		"""
-		Set the parameter that defines maximum change in the size (in percents
-					 of the maximum change) of two particles that will still be considered to be
-					 able to belong to the same track.
-		"""
-		self.sizeChange = sizeChange
-		
-	def setIntensityChange(self, intChange):
-		"""
-		Set the parameter that defines maximum change in the average intensity
-					 (in percents of the maximum change) of two particles that will still
-					 be considered to be able to belong to the same track.
-		"""
-		self.intensityChange = intChange
-		
-	def setAngleChange(self, angleChange):	
-		"""
-		Set the parameter that defines maximum change in the angle of the track
-					 (in degrees) that is calculated betwee two particles so  that the particles
-					 will still be considered to be able to belong to the same track.
-					 The angle is the total "cone of change", so if the track can veer 15 degrees
-					 in either direction, then the Angle Change should be set to 30 degrees
-		"""
-		self.angleChange = angleChange
-		
-	def score(self, testParticle, oldParticle, track):
-		"""
-		Measure the match score between two particles. Returns 
-					 a 3 - tuple (distFactor, sizeFactor, intFactor )if there's a match
-					and none otherwise	  
-		"""
-		sizeChange = float(abs(testParticle.size - oldParticle.size))
-		sizeFactor = sizeChange / oldParticle.size
-		
-		if sizeFactor > self.sizeChange:
-			return 99999999999999
-		
-		intFactor = float(abs(testParticle.averageIntensity - oldParticle.averageIntensity))
-		intFactor /= self.maxIntensity
-
-		angleFactor = 1
-		if len(track)>1:
-			angleFactor = self.calculateAngleFactor(testParticle, track)
-#			
-			if angleFactor==-1:
-				return 9999999
-				
-		if intFactor > self.intensityChange:
-			return 9999999999
-
-		return self.sizeWeight * sizeFactor + self.intensityWeight * intFactor + self.directionWeight * angleFactor
-#		return angleFactor+abs(float(testParticle.size-oldParticle.size))/oldParticle.size+abs(float(testParticle.averageIntensity-oldParticle.averageIntensity))/oldParticle.averageIntensity
-		
-	@staticmethod
-	def angle(particle1, particle2):
-		"""
-		Measure the "angle" between horizontal axis and the line defined
-					 by the two particles
-		"""
-		particle1X, particle1Y = particle1.pixelPosition[0:2]
-		particle2X, particle2Y = particle2.pixelPosition[0:2]
-		ang = math.atan2(particle2Y - particle1Y, particle2X - particle1X) * 180.0 / math.pi
-		ang2 = ang
-		if ang < 0:
-			ang2 = 180 + ang
-		return ang,ang2
-		
-	def toScore(self, distFactor, sizeFactor, intFactor, angleFactor = 1):	
-		"""
-		Return a score that unifies the different factors into a single score
-		"""
-		return self.velocityWeight * distFactor + \
-				self.sizeWeight * sizeFactor + \
-				self.intensityWeight * intFactor + \
-				self.directionWeight * angleFactor
-	
-	def getParticlesFromSeedpoints(self, fromTimepoint, seedParticles):
-		"""
-		get the particle list based on the given seed particles
-		"""
-		# The seed particles are organized as follows:
-		#[ [t1_p1, t1_p2, t1_p3], [t2_p1,t2_p2, t2_p3], ...]
-		# where t1_p1 = first particle in timepoint 1,
-		# t1_p2 = second particle in timepoint 1 etc
-		# Therefore, we can determine e.g. how many tracks there are to be calculated
-		# by looking at how many seed particles we are given
-
-		self.trackCount = len(seedParticles[0])
-		tracks = []
-		for i in range(self.trackCount):
-			tracks.append([])
-		particleList = copy.deepcopy(self.particles)
-		toRemove = []
-		
-		# First remove all particles in the seed timepoints
-		# that are not listed as seed points
-		for timePoint, col in enumerate(seedParticles):
-			fromTimepoint = timePoint 
-			toRemove = []
-			objToParticle = {}
-			for i in particleList[timePoint]:
-				objval = i.objectNumber()
-				if objval not in col:
-					toRemove.append(i)
-				else:
-					objToParticle[objval] = i
-					
-			# remove the non-seed objects from the timepoint timePoint
-			for i in toRemove:
-				particleList[timePoint].remove(i)
-			for tracknum, objVal in enumerate(col):
-				if objVal not in objToParticle:
-					print "Object", objVal, "not found"
-					if objVal in toRemove:
-						print objVal, "was removed"
-					continue
-				particle = objToParticle[objVal]
-				particle.inTrack = True
-				particle.trackNum = tracknum
-				print "Adding particle", objVal, "to track", tracknum
-				tracks[tracknum].append(particle)
-		return tracks, particleList
-		
-	def calculateAngleFactor(self, testParticle, track):
-		print track
-		lastItem = track[-1]
-		secondLast = track[-2]
-		rangle, absang = self.angle(secondLast, lastItem)
-		rangle2, absang2 = self.angle(lastItem, testParticle)
-		
-		#print "angles=",absang, absang2
-		angdiff = abs(absang - absang2)
-		# If angle*angle2 < 0 then either (but not both) of the angles 
-		# is negative, so the particle being tested is in wrong direction
-		#print angle, angle2
-		if rangle * rangle2 < 0:
-			return -1
-		elif  angdiff > self.angleChange:
-			return -1
-		else: 
-			angleFactor = float(angdiff) / self.angleChange
-		return angleFactor
-		
-	def track(self, fromTimepoint = 0, seedParticles = []):# TODO: Test for this
+			arrays = self.createArrays(pts)
+			mindist = 999999999
+			maxdist = 0
+			total = 0.0
+			count = 0
+			for start in range(0, len(arrays), STATS_BLOCK_SIZE):
+				block = arrays.positions[start:start + STATS_BLOCK_SIZE]
+				diff = block[:, numpy.newaxis, :] - arrays.positions[numpy.newaxis, :, :]
+				distances = numpy.sqrt((diff * diff).sum(axis = 2))
+				# Particles are not compared with themselves
+				other = arrays.objects[start:start + STATS_BLOCK_SIZE, numpy.newaxis] != arrays.objects[numpy.newaxis, :]
+				distances = distances[other]
+				if len(distances):
+					mindist = min(mindist, distances.min())
+					maxdist = max(maxdist, distances.max())
+					total += distances.sum()
+					count += len(distances)
+			if not count:
+				mindists.append(0)
+				maxdists.append(0)
+				avgdists.append(0)
+			else:
+				mindists.append(float(mindist))
+				maxdists.append(float(maxdist))
+				avgdists.append(total / count)
+		minSize, maxSize, minInt, maxInt = self.getRanges()
+		return mindists, maxdists, avgdists, minSize, maxSize, minInt, maxInt
+
+	def getRanges(self):
+		"""
+		@return the minimum and maximum volume and average intensity of the particles
+		"""
+		volumes = [self.getArrays(i).volumes for i in range(len(self.particles))]
+		intensities = [self.getArrays(i).intensities for i in range(len(self.particles))]
+		volumes = numpy.concatenate(volumes or [numpy.zeros(1)])
+		intensities = numpy.concatenate(intensities or [numpy.zeros(1)])
+		if not len(volumes):
+			return 0, 0, 0, 0
+		return int(volumes.min()), int(volumes.max()), float(intensities.min()), float(intensities.max())
+
+	def scorePairs(self, distances, oldVolumes, volumes, oldIntensities, intensities, directions):
+		"""
+		Vectorized version of score(), calculateAngleFactor() and toScore()
+		for a batch of pairs of an old and a tested particle. directions is a
+		tuple (previous, last, tested, mask) of the pixel positions of the two
+		last particles of the track, the tested particle, and a mask of the
+		pairs whose track has a direction.
+		@return the scores and a mask of the pairs that passed all the criteria
+		"""
+		olderr = numpy.seterr(divide = "ignore", invalid = "ignore")
+		try:
+			valid = (distances <= self.maxSpeed * (1 + self.speedDeviation))
+			valid &= (distances >= self.minSpeed * (1 - self.speedDeviation))
+			distFactors = numpy.ones(len(distances))
+			fast = distances > self.maxSpeed
+			distFactors[fast] = self.maxSpeed / distances[fast]
+			slow = distances < self.minSpeed
+			distFactors[slow] = distances[slow] / self.minSpeed
+
+			sizeFactors = numpy.abs(volumes - oldVolumes) / oldVolumes
+			valid &= ~(sizeFactors > self.sizeChange)
+			sizeFactors = numpy.abs(sizeFactors / self.sizeChange - 1)
+
+			valid &= (oldIntensities != 0)
+			intFactors = numpy.abs(intensities - oldIntensities) / oldIntensities
+			valid &= ~(intFactors > self.intensityChange)
+			intFactors = numpy.abs(intFactors / self.intensityChange - 1)
+
+			angleFactors = self.getAngleFactors(*directions)
+			valid &= (angleFactors != -1)
+		finally:
+			numpy.seterr(**olderr)
+		scores = self.velocityWeight * distFactors + \
+				self.sizeWeight * sizeFactors + \
+				self.intensityWeight * intFactors + \
+				self.directionWeight * angleFactors
+		return scores, valid
+
+	def getAngleFactors(self, previous, last, tested, mask):
+		"""
+		Vectorized version of calculateAngleFactor(). The factor is 0 for the
+		pairs not in mask and -1 for the pairs whose direction changes more
+		than the allowed angle.
+		"""
+		voxelSize = numpy.array(self.voxelSize, dtype = numpy.float64)
+		vector1 = (last - previous) * voxelSize
+		vector2 = (tested - last) * voxelSize
+		length1 = numpy.sqrt(vector1[:, 0] ** 2 + vector1[:, 1] ** 2 + vector1[:, 2] ** 2)
+		length2 = numpy.sqrt(vector2[:, 0] ** 2 + vector2[:, 1] ** 2 + vector2[:, 2] ** 2)
+		vector1 /= length1[:, numpy.newaxis]
+		vector2 /= length2[:, numpy.newaxis]
+		inner = vector1[:, 0] * vector2[:, 0] + vector1[:, 1] * vector2[:, 1] + vector1[:, 2] * vector2[:, 2]
+		# lib.Math.angle() returns 0 when rounding takes the inner product out of range
+		angles = numpy.where(numpy.abs(inner) <= 1, numpy.abs(numpy.arccos(inner) * 180 / math.pi), 0.0)
+		factors = numpy.where(angles > self.angleChange, -1.0, numpy.abs(angles / self.angleChange - 1))
+		mask = mask & (length1 != 0) & (length2 != 0)
+		return numpy.where(mask, factors, 0.0)
+
+	def getDirections(self, tracks):
+		"""
+		@return the pixel positions of the last two particles of the given
+				tracks and a mask of the tracks whose direction is known
+		"""
+		n = len(tracks)
+		previous = numpy.zeros((n, 3))
+		last = numpy.zeros((n, 3))
+		mask = numpy.zeros(n, dtype = bool)
+		for i, track in enumerate(tracks):
+			last[i] = track[-1].posInPixels
+			if len(track) > 1:
+				x, y, z = track[-2].posInPixels
+				# A track that starts with placeholders has no direction
+				if x and y and z:
+					previous[i] = (x, y, z)
+					mask[i] = True
+		return previous, last, mask
+
+	def getTrackLength(self, trackNum, track):
+		"""
+		@return the number of particles of the track that are not placeholders,
+				counting only the particles added since the last call
+		"""
+		known, count = self.trackLengths.get(trackNum, (0, 0))
+		for particle in track[known:]:
+			x, y, z = particle.posInPixels
+			if x and y and z:
+				count += 1
+		self.trackLengths[trackNum] = (len(track), count)
+		return count
+
+	def createMatch(self, particle, score, trackNum):
+		"""
+		@return a copy of the particle that is added to a track
+		"""
+		matchParticle = lib.Particle.Particle()
+		matchParticle.copy(particle)
+		matchParticle.inTrack = True
+		matchParticle.matchScore = score
+		matchParticle.trackNum = trackNum
+		return matchParticle
+
+	def createPlaceholder(self, timePoint, trackNum, voxelSize):
+		"""
+		@return a particle that marks a timepoint in which the track has no particle
+		"""
+		noneParticle = lib.Particle.Particle()
+		noneParticle.inTrack = True
+		noneParticle.matchScore = 0
+		noneParticle.trackNum = trackNum
+		noneParticle.intval = None
+		noneParticle.timePoint = timePoint
+		noneParticle.posInPixels = [None, None, None]
+		noneParticle.voxelSize = voxelSize
+		return noneParticle
+
+	def track(self, fromTimepoint = 0, seedParticles = []):
 		"""
 		Perform the actual tracking using the given particles and tracking
-		parameters.
+		parameters. Unlike lib.Particle.ParticleTracker, the distances between
+		all the particles of a timepoint are not calculated, because they are
+		not used in the tracking.
 		"""
+		if not numpy:
+			return lib.Particle.ParticleTracker.track(self, fromTimepoint, seedParticles)
 		tracks = []
 		self.trackCount = 0
 		self.totalTimepoints = len(self.particles)
 		self.seedParticles = seedParticles
-		searchOn = False
-		foundOne = False
-#		minDists, maxDists, avgDist, minSiz, maxSiz, minInt, maxInt = self.getStats()
-		self.getStats()
-
-#		maxDist = max(maxDists)
-#		minDist = min(minDists)
-#		print "minDist=",minDist,"maxDist=",maxDist
-#		self.maxVelocity = maxDist - minDist
-#		self.maxSize = maxSiz - minSiz
-#		self.maxIntensity = maxInt - minInt
+		self.trackLengths = {}
+		minSiz, maxSiz, minInt, maxInt = self.getRanges()
+		self.maxSize = maxSiz - minSiz
+		self.maxIntensity = maxInt - minInt
 
 		if seedParticles:
 			tracks, self.particleList = self.getParticlesFromSeedpoints(fromTimepoint, seedParticles)
+			if self.globalLinking:
+				self.linkTimepoints(fromTimepoint, tracks, False)
+			else:
+				for particle in self.particleList[fromTimepoint]:
+					self.trackParticle(particle, fromTimepoint, tracks)
 		else:
 			self.particleList = self.particles
-
-		timePoint = fromTimepoint
-		# Iterate over all particles in given timepoint
-		print "There are ",len(self.particleList), "timepoints"
-		print len(self.particleList[0]), "objects in timepoint 0"
-		for i, particle in enumerate(self.particleList[timePoint]):
-			print "\nTracking particle %d / %d in timepoint %d" % (i, len(self.particleList[timePoint]), timePoint)
-			self.trackParticle(particle, fromTimepoint, tracks)
+			if self.globalLinking:
+				self.trackTimepointParticles(0, tracks)
+				self.linkTimepoints(0, tracks, True)
+			else:
+				for i in range(self.totalTimepoints):
+					self.trackTimepointParticles(i, tracks)
 		self.tracks = tracks
-		print "Generated tracks=",tracks
-			
+
+	def getNoLinkCost(self):
+		"""
+		@return the cost of leaving a track unlinked in global linking. The
+				cost of a link is the best possible score minus its score.
+		"""
+		bestScore = self.velocityWeight + self.sizeWeight + self.intensityWeight + self.directionWeight
+		return max(bestScore, 1e-9) * NO_LINK_COST_FACTOR
+
+	def linkTimepoints(self, fromTimepoint, tracks, createTracks):
+		"""
+		Link the tracks to the particles of each following timepoint so that
+		the total cost of the links is the smallest possible. A track that
+		was not continued may be linked again within gapFrames timepoints, and
+		the skipped timepoints are filled with placeholders.
+		@param createTracks start new tracks from the particles that were not linked
+		"""
+		bestScore = self.velocityWeight + self.sizeWeight + self.intensityWeight + self.directionWeight
+		noLinkCost = self.getNoLinkCost()
+		maxDistance = self.maxSpeed * (1 + self.speedDeviation)
+		lastSeen = {}
+		for trackNum, track in enumerate(tracks):
+			if track:
+				lastSeen[trackNum] = fromTimepoint
+
+		for timePoint in range(fromTimepoint + 1, self.totalTimepoints):
+			particles = self.particleList[timePoint]
+			arrays = self.createArrays(particles)
+			rows = []
+			columns = []
+			costs = []
+			for gap in range(self.gapFrames + 1):
+				group = [trackNum for trackNum, seen in sorted(lastSeen.items()) if timePoint - seen - 1 == gap]
+				if not group or not len(arrays):
+					continue
+				oldParticles = [tracks[trackNum][-1] for trackNum in group]
+				oldPixels = numpy.array([particle.posInPixels for particle in oldParticles], dtype = numpy.float64)
+				# Across a gap, the speed is the distance divided by the time
+				index = GridIndex(arrays.positions, maxDistance * (gap + 1))
+				oldNums, testNums, distances = index.queryPairs(oldPixels * arrays.voxelSize)
+				oldVolumes = numpy.array([particle.volume for particle in oldParticles], dtype = numpy.float64)
+				oldIntensities = numpy.array([particle.averageIntensity for particle in oldParticles], dtype = numpy.float64)
+				previous, last, mask = self.getDirections([tracks[trackNum] for trackNum in group])
+				directions = (previous[oldNums], last[oldNums], arrays.pixelPositions[testNums], mask[oldNums])
+				scores, valid = self.scorePairs(distances / (gap + 1), oldVolumes[oldNums], arrays.volumes[testNums], \
+												oldIntensities[oldNums], arrays.intensities[testNums], directions)
+				rows.extend(numpy.array(group, dtype = numpy.int64)[oldNums[valid]].tolist())
+				columns.extend(testNums[valid].tolist())
+				costs.extend((bestScore - scores[valid]).tolist())
+
+			linked = {}
+			for trackNum, particleNum, cost in solveAssignment(rows, columns, costs, noLinkCost):
+				track = tracks[trackNum]
+				for tp in range(lastSeen[trackNum] + 1, timePoint):
+					track.append(self.createPlaceholder(tp, trackNum, particles[particleNum].voxelSize))
+				track.append(self.createMatch(particles[particleNum], bestScore - cost, trackNum))
+				lastSeen[trackNum] = timePoint
+				linked[particleNum] = True
+
+			if not createTracks:
+				continue
+			for i, particle in enumerate(particles):
+				if i in linked:
+					continue
+				trackNum = len(tracks)
+				newTrack = [self.createPlaceholder(tp, trackNum, particle.voxelSize) for tp in range(timePoint)]
+				newTrack.append(self.createMatch(particle, 0, trackNum))
+				tracks.append(newTrack)
+				lastSeen[trackNum] = timePoint
+
 	def trackParticle(self, particle, timePoint, tracks):
 		"""
 		Track the given particle from given timepoint on
 		@param particle the particle to track
-		@param timepoint track from this timepoint on 
+		@param timepoint track from this timepoint on
 		"""
+		if not numpy:
+			return lib.Particle.ParticleTracker.trackParticle(self, particle, timePoint, tracks)
+		oldParticle = lib.Particle.Particle()
+		oldParticle.copy(particle)
 		if not self.seedParticles:
-			print "New track starts"
 			track = []
 			self.trackCount += 1
 			particle.inTrack = True
@@ -542,44 +626,128 @@ class ParticleTracker:
 			for ctrack in tracks:
 				if particle in ctrack:
 					track = ctrack
-			
+
 			if not track:
 				raise "Did not find track for seed particle", particle
-		searchOn = True
-		# Search the next timepoints for more particles
-		for search_timePoint in range(timePoint + 1, self.totalTimepoints):
-			# If no match was found, then this track is over
-			if not searchOn:
+
+		for searchTimepoint in range(timePoint + 1, self.totalTimepoints):
+			arrays = self.getArrays(searchTimepoint)
+			n = len(arrays)
+			if not n:
 				break
-			foundOne = False
-			possibleParticles = self.kdTrees[search_timePoint].neighborsInRange(particle, self.maxSpeed)
-			if not possibleParticles:
-				print "No possible particles within distance", self.maxSpeed
+			oldPosition = numpy.array(oldParticle.posInPixels, dtype = numpy.float64) * arrays.voxelSize
+			distances = getDistances(numpy.tile(oldPosition, (n, 1)), arrays.positions)
+			previous, last, mask = self.getDirections([track])
+			directions = (numpy.tile(previous, (n, 1)), numpy.tile(last, (n, 1)), \
+							arrays.pixelPositions, numpy.repeat(mask, n))
+			scores, valid = self.scorePairs(distances, oldParticle.volume, arrays.volumes, \
+											float(oldParticle.averageIntensity), arrays.intensities, directions)
+			candidates = numpy.nonzero(valid)[0].tolist()
+			if not candidates:
 				break
-#			print "Found",len(possibleParticles),"candidates in range",self.maxSpeed
-			matching = []
-			for matchParticle in possibleParticles:
-				if dist2(matchParticle,particle) >= self.minSpeed**2:
-					matching.append(matchParticle)
-			possibleParticles = matching
-			match = None
-			matchScore = 9999
-			print "Evaluating", len(possibleParticles),"particles"
-			for matchParticle in possibleParticles:
-				if matchParticle.inTrack: continue
-				
-				currentScore = self.score(matchParticle, particle,  track)
-#				print "Score with distance",particle.physdist(matchParticle),"=",currentScore
-				if currentScore < matchScore:
-					match = matchParticle
-					matchScore = currentScore
-				
-			if match:
-				print "Found match with distance=", match.physdist(particle), "score=", matchScore
-				track.append(match)
-				match.inTrack = True
-				match.trackNum = self.trackCount
-				searchOn = True
-		print "Generated track of length",len(track)
-		tracks.append(track)
-		
+			scores = scores.tolist()
+			# Every candidate replaces the previous one, so the last candidate
+			# is the match and the others are flagged
+			candidate = None
+			for index in candidates:
+				testParticle = arrays.particles[index]
+				if candidate:
+					testParticle.flag = True
+					candidate.inTrack = False
+					candidate.trackNum = -1
+				testParticle.inTrack = True
+				testParticle.matchScore = scores[index]
+				testParticle.trackNum = self.trackCount
+				candidate = testParticle
+			currentMatch = lib.Particle.Particle()
+			currentMatch.setVoxelSize(self.voxelSize)
+			currentMatch.copy(candidate)
+			track.append(currentMatch)
+			oldParticle.copy(currentMatch)
+
+	def trackTimepointParticles(self, timePoint, tracks):
+		"""
+		Match the particles of the given timepoint to the tracks that reached
+		the previous timepoint, and start new tracks from the particles that
+		were not matched
+		"""
+		if not numpy or timePoint == 0:
+			return lib.Particle.ParticleTracker.trackTimepointParticles(self, timePoint, tracks)
+
+		particles = self.particleList[timePoint]
+		for testParticle in particles:
+			testParticle.inTrack = False
+		live = [j for j, track in enumerate(tracks) if len(track) >= timePoint]
+		arrays = self.createArrays(particles)
+
+		trackNums = []
+		testNums = []
+		scores = []
+		if live and len(arrays):
+			oldParticles = [tracks[j][timePoint - 1] for j in live]
+			oldPixels = numpy.array([particle.posInPixels for particle in oldParticles], dtype = numpy.float64)
+			index = GridIndex(arrays.positions, self.maxSpeed * (1 + self.speedDeviation))
+			oldNums, testNums, distances = index.queryPairs(oldPixels * arrays.voxelSize)
+
+			oldVolumes = numpy.array([particle.volume for particle in oldParticles], dtype = numpy.float64)
+			oldIntensities = numpy.array([particle.averageIntensity for particle in oldParticles], dtype = numpy.float64)
+			previous, last, mask = self.getDirections([tracks[j] for j in live])
+			directions = (previous[oldNums], last[oldNums], arrays.pixelPositions[testNums], mask[oldNums])
+			scores, valid = self.scorePairs(distances, oldVolumes[oldNums], arrays.volumes[testNums], \
+											oldIntensities[oldNums], arrays.intensities[testNums], directions)
+			oldNums = oldNums[valid]
+			testNums = testNums[valid]
+			scores = scores[valid]
+			trackNums = numpy.array(live, dtype = numpy.int64)[oldNums]
+			trackLengths = numpy.array([self.getTrackLength(j, tracks[j]) for j in live])[oldNums]
+
+			# Best score first, then the longest track, then in the order the
+			# pairs were scored in, which is by particle and then by track
+			order = numpy.lexsort((testNums * len(tracks) + trackNums, -trackLengths, -scores))
+			trackNums = trackNums[order].tolist()
+			testNums = testNums[order].tolist()
+			scores = scores[order].tolist()
+
+		trackUsage = {}
+		particleUsage = {}
+		usedOldPositions = {}
+		bestScores = {}
+		for trackNum, particleNum, score in zip(trackNums, testNums, scores):
+			if trackNum not in bestScores:
+				bestScores[trackNum] = (score, particleNum)
+			if trackNum in trackUsage or particleNum in particleUsage:
+				continue
+			if not score > 0.75 * bestScores[trackNum][0]:
+				continue
+			# Only one track continues from a particle that several tracks share
+			position = tuple(tracks[trackNum][timePoint - 1].posInPixels)
+			if position in usedOldPositions:
+				trackUsage[trackNum] = 0
+				continue
+			usedOldPositions[position] = 1
+			trackUsage[trackNum] = particleNum
+			particleUsage[particleNum] = True
+			tracks[trackNum].append(self.createMatch(particles[particleNum], score, trackNum))
+
+		# Try to add particle on tracks that don't have any yet
+		for trackNum in range(len(tracks)):
+			if trackNum in trackUsage or trackNum not in bestScores:
+				continue
+			score, particleNum = bestScores[trackNum]
+			position = tuple(tracks[trackNum][timePoint - 1].posInPixels)
+			if position in usedOldPositions:
+				trackUsage[trackNum] = 0
+				continue
+			usedOldPositions[position] = 1
+			trackUsage[trackNum] = particleNum
+			particleUsage[particleNum] = True
+			tracks[trackNum].append(self.createMatch(particles[particleNum], score, trackNum))
+
+		# Add new tracks for particles that are not used on any track
+		for i, particle in enumerate(particles):
+			if i in particleUsage:
+				continue
+			trackNum = len(tracks)
+			newTrack = [self.createPlaceholder(tp, trackNum, particle.voxelSize) for tp in range(timePoint)]
+			newTrack.append(self.createMatch(particle, 0, trackNum))
+			tracks.append(newTrack)
@@ -0,0 +1,178 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: Prefetcher
+ Project: BioImageXD
+ Description:
+
+ Fetches the timepoints around the shown one ahead of time into a bounded
+ cache, so that moving to the next or previous timepoint can be served
+ from memory. The timepoints are fetched one at a time by jobs that run
+ outside the user interface, such as worker processes. The jobs are
+ started and their results collected in steps that are scheduled with a
+ function given by the user interface. When the shown timepoint changes,
+ the pending timepoints outside the new window are cancelled, together
+ with the running job if its timepoint is one of them.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import sys
+import Logging
+
+def getWindow(timepoint, count, radius):
+	"""
+	Return the timepoints within radius of a timepoint in the order they
+	are fetched: the nearest first and the next before the previous
+	"""
+	window = []
+	for distance in range(1, radius + 1):
+		for tp in (timepoint + distance, timepoint - distance):
+			if 0 <= tp < count:
+				window.append(tp)
+	return window
+
+class Prefetcher:
+	"""
+	Fetches the neighbours of the shown timepoint with a given function
+	"""
+	def __init__(self, fetch, radius = 2, size = 5):
+		"""
+		Initialization
+		@param fetch a function that starts fetching the data of a timepoint
+					and returns the job, which has the methods ready(), get()
+					and cancel() like lib.ProcessPool.AsyncJob, or None if
+					the timepoint cannot be fetched
+		@param radius the number of timepoints fetched before and after the shown one
+		@param size the largest number of timepoints kept in the cache
+		"""
+		self.fetch = fetch
+		self.radius = max(int(radius), 0)
+		self.size = max(int(size), 1)
+		self.schedule = None
+		self.cache = {}
+		self.pending = []
+		self.window = []
+		self.timepoint = -1
+		self.scheduled = 0
+		self.job = None
+		self.jobTimepoint = -1
+
+	def setScheduler(self, schedule):
+		"""
+		Set the function that is called with a function to run it later, for
+		example with wx.CallAfter. Without one the steps are only taken when
+		step() is called.
+		"""
+		self.schedule = schedule
+
+	def setTimepoint(self, timepoint, count):
+		"""
+		Set the shown timepoint and start fetching its neighbours. The pending
+		timepoints that are not near the shown one anymore are cancelled.
+		@param count the number of timepoints in the dataset
+		"""
+		self.timepoint = timepoint
+		self.window = getWindow(timepoint, count, self.radius)
+		if self.job and self.jobTimepoint not in self.window:
+			self.cancel()
+		self.pending = [tp for tp in self.window if tp not in self.cache and \
+						not (self.job and tp == self.jobTimepoint)]
+		self.trim()
+		self.scheduleStep()
+
+	def scheduleStep(self):
+		"""
+		Schedule the next step if there is a job running or timepoints to fetch
+		"""
+		if (self.job or self.pending) and self.schedule and not self.scheduled:
+			self.scheduled = 1
+			self.schedule(self.step)
+
+	def step(self):
+		"""
+		Collect the data of the running job when it is ready, or start fetching
+		the next pending timepoint
+		@return True if there is a job running or timepoints left to fetch
+		"""
+		self.scheduled = 0
+		if self.job:
+			if self.job.ready():
+				job, timepoint = self.job, self.jobTimepoint
+				self.job = None
+				try:
+					data = job.get()
+				except:
+					Logging.info("Prefetching timepoint %d failed: %s" % (timepoint, sys.exc_info()[1]), kw = "processing")
+					data = None
+				# The shown timepoint may have moved while the timepoint was fetched
+				if data is not None and timepoint in self.window:
+					self.cache[timepoint] = data
+					self.trim()
+		elif self.pending:
+			timepoint = self.pending.pop(0)
+			try:
+				self.job = self.fetch(timepoint)
+			except:
+				Logging.info("Prefetching timepoint %d failed: %s" % (timepoint, sys.exc_info()[1]), kw = "processing")
+				self.job = None
+			self.jobTimepoint = timepoint
+		self.scheduleStep()
+		return bool(self.job or self.pending)
+
+	def cancel(self):
+		"""
+		Cancel the running job
+		"""
+		if self.job:
+			self.job.cancel()
+			self.job = None
+
+	def trim(self):
+		"""
+		Remove the timepoints farthest from the shown one until the cache fits
+		in its size
+		"""
+		timepoints = sorted(self.cache.keys(), key = lambda tp: -abs(tp - self.timepoint))
+		for tp in timepoints[:max(len(timepoints) - self.size, 0)]:
+			del self.cache[tp]
+
+	def get(self, timepoint):
+		"""
+		@return the fetched data of a timepoint, or None if it has not been fetched
+		"""
+		return self.cache.get(timepoint)
+
+	def isRunning(self):
+		"""
+		@return True while a timepoint is being fetched
+		"""
+		return bool(self.job)
+
+	def clear(self, *args):
+		"""
+		Empty the cache and cancel the pending timepoints and the running job,
+		for example when the processing settings have changed
+		"""
+		self.cancel()
+		self.cache = {}
+		self.pending = []
+		self.window = []
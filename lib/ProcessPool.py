@@ -0,0 +1,209 @@
+"""
+ Unit: ProcessPool.py
+ Project: BioImageXD
+ Description:
+
+ A module that contains helpers for spreading independent pieces of work
+ over a pool of worker processes. If the multiprocessing module is not
+ available or only one worker is requested, the work is done serially
+ in the calling process. It also contains the helpers that are shared by
+ the modules that use the pools, such as the initializer of the worker
+ processes.
+
+ Copyright (C) 2005	 BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307	 USA
+
+"""
+__author__ = "BioImageXD Project <http://www.bioimagexd.net/>"
+__version__ = "$Revision$"
+__date__ = "$Date$"
+
+import Configuration
+import Logging
+import scripting
+import lib.messenger
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+
+def initializeWorker():
+	"""
+	Detach a forked worker process from the user interface of the main
+	process. This is the initializer of the pools that process data whose
+	state the workers inherit from module level context dictionaries.
+	"""
+	scripting.mainWindow = None
+	lib.messenger.disconnectAll()
+
+def getNumberOfCPUs():
+	"""
+	Return the number of processors on this machine
+	"""
+	if not multiprocessing:
+		return 1
+	try:
+		return multiprocessing.cpu_count()
+	except NotImplementedError:
+		return 1
+
+def getNumberOfWorkers(requested = 0):
+	"""
+	Return the number of worker processes to use. If requested is zero or
+	negative, the number is read from the configuration (Performance /
+	NumberOfProcesses). An unset value means one process, zero means one
+	process per processor.
+	"""
+	if not multiprocessing:
+		return 1
+	if requested > 0:
+		return requested
+	conf = Configuration.getConfiguration()
+	value = conf.getConfigItem("NumberOfProcesses", "Performance")
+	if value is None:
+		return 1
+	try:
+		value = int(eval(str(value)))
+	except:
+		return 1
+	if value <= 0:
+		value = getNumberOfCPUs()
+	return value
+
+def createPool(workers, initializer = None):
+	"""
+	Create a pool of worker processes, or return None if work should be
+	done in the calling process. initializer is called once in every
+	worker process when it starts.
+	"""
+	if not multiprocessing or workers <= 1:
+		return None
+	try:
+		return multiprocessing.Pool(workers, initializer)
+	except (OSError, ImportError, AssertionError), ex:
+		# AssertionError is raised in daemonic worker processes, which are
+		# not allowed to have children
+		Logging.info("Could not create a pool of %d processes: %s" % (workers, str(ex)), kw = "processing")
+		return None
+
+def imapOrdered(function, jobs, workers = 0, chunksize = 1, initializer = None):
+	"""
+	Apply function to every item in jobs and yield the results in the order
+	of the jobs. The work is spread over a pool of workers when possible.
+	function needs to be a module level function so that it can be pickled.
+	initializer is only called in worker processes, never in the calling
+	process.
+	"""
+	workers = getNumberOfWorkers(workers)
+	pool = None
+	if workers > 1:
+		jobs = list(jobs)
+		if len(jobs) > 1:
+			pool = createPool(min(workers, len(jobs)), initializer)
+	if not pool:
+		for job in jobs:
+			yield function(job)
+		return
+	try:
+		for result in pool.imap(function, jobs, chunksize):
+			yield result
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
+
+def imapUnordered(function, jobs, workers = 0, chunksize = 1, initializer = None):
+	"""
+	Apply function to every item in jobs and yield the results as soon as
+	they are completed, which is not necessarily in the order of the jobs.
+	The restrictions of imapOrdered apply.
+	"""
+	workers = getNumberOfWorkers(workers)
+	pool = None
+	if workers > 1:
+		jobs = list(jobs)
+		if len(jobs) > 1:
+			pool = createPool(min(workers, len(jobs)), initializer)
+	if not pool:
+		for job in jobs:
+			yield function(job)
+		return
+	try:
+		for result in pool.imap_unordered(function, jobs, chunksize):
+			yield result
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
+
+def mapOrdered(function, jobs, workers = 0, chunksize = 1, initializer = None):
+	"""
+	Apply function to every item in jobs and return a list of the results
+	in the order of the jobs
+	"""
+	return list(imapOrdered(function, jobs, workers, chunksize, initializer))
+
+class AsyncJob:
+	"""
+	A function running in a worker process of its own, see applyAsync
+	"""
+	def __init__(self, pool, result):
+		"""
+		Initialization
+		"""
+		self.pool = pool
+		self.result = result
+
+	def ready(self):
+		"""
+		@return True when the function has returned
+		"""
+		return self.result.ready()
+
+	def get(self):
+		"""
+		Return the value the function returned, or raise the exception it
+		raised. The worker process is stopped.
+		"""
+		try:
+			return self.result.get()
+		finally:
+			self.cancel()
+
+	def cancel(self):
+		"""
+		Stop the worker process
+		"""
+		if self.pool:
+			self.pool.terminate()
+			self.pool.join()
+			self.pool = None
+
+def applyAsync(function, args = (), initializer = None):
+	"""
+	Run function with the given arguments in a worker process that is forked
+	for it, so that it sees the current state of this process. Returns an
+	AsyncJob, or None if a worker process cannot be created.
+	"""
+	if not multiprocessing:
+		return None
+	try:
+		pool = multiprocessing.Pool(1, initializer)
+	except (OSError, ImportError, AssertionError), ex:
+		Logging.info("Could not create a worker process: %s" % str(ex), kw = "processing")
+		return None
+	return AsyncJob(pool, pool.apply_async(function, args))
@@ -49,6 +49,10 @@ class ProcessingFilter:
 	category = "No category"
 	name = "Generic Filter"
 	level = scripting.COLOR_EXPERIENCED
+	# Filters that carry state from one timepoint to the next, or that read
+	# other timepoints than the one being processed, set this so that the
+	# timepoints are never processed in parallel
+	sequentialOnly = False
 
 	def __init__(self, numberOfInputs = (1, 1), changeCallback = None, requireWholeDataset = False):
 		"""
@@ -0,0 +1,225 @@
+# -*- coding: iso-8859-1 -*-
+"""
+ Unit: ROIMask
+ Project: BioImageXD
+ Description:
+
+ Rasterization of regions of interest to mask images. A region of interest
+ is described by its geometry, a tuple such as ("RECTANGLE", x0, y0, x1, y1),
+ and is filled into a two dimensional mask with NumPy, one row or one shape
+ at a time. The masks are cached by geometry and image size, because the
+ same regions are used for every timepoint of a dataset.
+
+ Copyright (C) 2005  BioImageXD Project
+ See CREDITS.txt for details
+
+ This program is free software; you can redistribute it and / or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 2 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111 - 1307  USA
+"""
+
+__author__ = "BioImageXD Project < http: //www.bioimagexd.org/>"
+__version__ = "$Revision: 1.21 $"
+__date__ = "$Date: 2005 / 01 / 13 13: 42: 03 $"
+
+import math
+import vtk
+try:
+	import numpy
+	from vtk.util import numpy_support
+except ImportError:
+	numpy = None
+
+# The number of masks kept in the cache
+CACHED_MASKS = 16
+
+maskCache = {}
+maskOrder = []
+
+def getMask(geometry, mx, my):
+	"""
+	Return the mask of a region of interest with the given geometry in an
+	image of mx x my pixels as a read-only boolean array indexed by [y, x]
+	"""
+	key = (geometry, mx, my)
+	if key in maskCache:
+		maskOrder.remove(key)
+		maskOrder.append(key)
+		return maskCache[key]
+	mask = rasterize(geometry, mx, my)
+	mask.flags.writeable = False
+	maskCache[key] = mask
+	maskOrder.append(key)
+	if len(maskOrder) > CACHED_MASKS:
+		del maskCache[maskOrder.pop(0)]
+	return mask
+
+def getShapeMask(shape, mx, my):
+	"""
+	Return the mask of a region of interest shape. Shapes that do not
+	describe their geometry are rasterized from their covered points.
+	"""
+	geometry = None
+	if hasattr(shape, "getMaskGeometry"):
+		geometry = shape.getMaskGeometry()
+	if geometry:
+		return getMask(geometry, mx, my)
+	return pointsToMask(shape.getCoveredPoints(), mx, my)
+
+def rasterize(geometry, mx, my):
+	"""
+	Fill the region of interest with the given geometry into a new mask
+	"""
+	mask = numpy.zeros((my, mx), numpy.bool_)
+	kind = geometry[0]
+	if kind == "RECTANGLE":
+		fillRectangle(mask, *geometry[1:])
+	elif kind == "ELLIPSE":
+		fillEllipse(mask, *geometry[1:])
+	elif kind == "POLYGON":
+		fillPolygon(mask, *geometry[1:])
+	else:
+		raise ValueError("Unknown region of interest %s" % kind)
+	return mask
+
+def clipRange(start, end, size):
+	"""
+	Clip the range start..end - 1 to 0..size - 1
+	"""
+	return min(max(int(start), 0), size), min(max(int(end), 0), size)
+
+def fillRectangle(mask, x0, y0, x1, y1):
+	"""
+	Fill the pixels x0 <= x < x1, y0 <= y < y1
+	"""
+	my, mx = mask.shape
+	x0, x1 = clipRange(x0, x1, mx)
+	y0, y1 = clipRange(y0, y1, my)
+	mask[y0:y1, x0:x1] = True
+
+def fillEllipse(mask, width, height, cx, cy):
+	"""
+	Fill the pixels whose summed distance to the foci of the ellipse is
+	less than its major axis
+	"""
+	my, mx = mask.shape
+	a = max(width, height) / 2
+	b = min(width, height) / 2
+	c = math.sqrt(a ** 2 - b ** 2)
+	if width > height:
+		f1, f2 = (cx - c, cy), (cx + c, cy)
+	else:
+		f1, f2 = (cx, cy - c), (cx, cy + c)
+	x0, x1 = clipRange(cx - width // 2, cx + width // 2, mx)
+	y0, y1 = clipRange(cy - height // 2, cy + height // 2, my)
+	if x0 >= x1 or y0 >= y1:
+		return
+	xs = numpy.arange(x0, x1, dtype = numpy.float64)[numpy.newaxis, :]
+	ys = numpy.arange(y0, y1, dtype = numpy.float64)[:, numpy.newaxis]
+	distances = numpy.sqrt((xs - f1[0]) ** 2 + (ys - f1[1]) ** 2) + \
+				numpy.sqrt((xs - f2[0]) ** 2 + (ys - f2[1]) ** 2)
+	mask[y0:y1, x0:x1] |= distances < a * 2
+
+def fillPolygon(mask, points, x0, y0, x1, y1):
+	"""
+	Fill the pixels x0 <= x < x1, y0 <= y < y1 that are inside the polygon
+	by the even-odd rule. Every edge that crosses a row toggles the pixels
+	left of the crossing, which is counted for all rows at once with a
+	running sum.
+	"""
+	my, mx = mask.shape
+	x0, x1 = clipRange(x0, x1, mx)
+	y0, y1 = clipRange(y0, y1, my)
+	width = x1 - x0
+	if width <= 0 or y1 <= y0:
+		return
+	ys = numpy.arange(y0, y1, dtype = numpy.float64)
+	crossings = numpy.zeros((y1 - y0, width + 1), numpy.int32)
+	for i in range(len(points)):
+		xi, yi = points[i]
+		xj, yj = points[(i + 1) % len(points)]
+		if yi == yj:
+			continue
+		rows = numpy.nonzero(((yi <= ys) & (ys < yj)) | ((yj <= ys) & (ys < yi)))[0]
+		if not len(rows):
+			continue
+		crossing = (xj - xi) * (ys[rows] - yi) / float(yj - yi) + xi
+		# The pixels x < crossing are toggled
+		ends = numpy.clip(numpy.ceil(crossing) - x0, 0, width).astype(numpy.int32)
+		crossings[rows, 0] += 1
+		crossings[rows, ends] -= 1
+	inside = numpy.cumsum(crossings[:, :width], axis = 1) & 1
+	mask[y0:y1, x0:x1] |= inside.astype(numpy.bool_)
+
+def pointsToMask(points, mx, my):
+	"""
+	Return a mask where the given (x, y) points are set
+	"""
+	mask = numpy.zeros((my, mx), numpy.bool_)
+	if points:
+		coordinates = numpy.array(list(points), numpy.int64).reshape(-1, 2)
+		inside = (coordinates[:, 0] >= 0) & (coordinates[:, 0] < mx) & \
+					(coordinates[:, 1] >= 0) & (coordinates[:, 1] < my)
+		coordinates = coordinates[inside]
+		mask[coordinates[:, 1], coordinates[:, 0]] = True
+	return mask
+
+def maskVolume(voxels, mask, value = 0):
+	"""
+	Set the voxels outside the mask to value in every slice of an array
+	indexed by [z, y, x] or [z, y, x, component]. The mask is broadcast
+	over the slices, so no mask volume is built.
+	"""
+	voxels[:, ~mask] = value
+
+def applyMask(imageData, mask, value = 0):
+	"""
+	Return a copy of the image where the voxels outside the two
+	dimensional mask are set to value on every slice, as vtkImageMask
+	does with a mask volume
+	"""
+	imageData.SetUpdateExtent(imageData.GetWholeExtent())
+	imageData.Update()
+	copy = vtk.vtkImageData()
+	copy.DeepCopy(imageData)
+	x, y, z = copy.GetDimensions()
+	components = copy.GetNumberOfScalarComponents()
+	voxels = numpy_support.vtk_to_numpy(copy.GetPointData().GetScalars())
+	maskVolume(voxels.reshape(z, y, x, components), mask, value)
+	copy.Modified()
+	return copy
+
+def getMaskImage(mask, mz, value = 255):
+	"""
+	Return a mask image of mz slices where the pixels of the mask are set
+	to value. The mask is imported as a single slice that is repeated
+	along z by the pipeline, so it is not stacked in Python. Filters that
+	only mask the data use applyMask instead, which needs no mask volume.
+	"""
+	my, mx = mask.shape
+	value = min(max(int(value), 0), 255)
+	data = (mask.astype(numpy.uint8) * value).tostring()
+	importer = vtk.vtkImageImport()
+	importer.CopyImportVoidPointer(data, len(data))
+	importer.SetDataScalarTypeToUnsignedChar()
+	importer.SetNumberOfScalarComponents(1)
+	importer.SetDataExtent(0, mx - 1, 0, my - 1, 0, 0)
+	importer.SetWholeExtent(0, mx - 1, 0, my - 1, 0, 0)
+	importer.Update()
+	if mz <= 1:
+		return importer.GetOutput()
+	pad = vtk.vtkImageWrapPad()
+	pad.SetInputConnection(importer.GetOutputPort())
+	pad.SetOutputWholeExtent(0, mx - 1, 0, my - 1, 0, mz - 1)
+	pad.Update()
+	return pad.GetOutput()
@@ -32,10 +32,24 @@ __date__ = "$Date: 2005/01/13 13:42:03 $"
 import math
 import csv
 import os
+import lib.LabelStatistics
 import lib.Math
+import lib.messenger
+import lib.ProcessPool
 import re
 import scripting
 import vtk
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# The header of the binary track files
+BINARY_HEADER = "BXDTRACKS1\n"
+
+# The reader and the objects to search shared with the worker processes of
+# calculateFrontsAndRears. The workers are forked, so they inherit them.
+frontRearContext = {}
 
 class Track:
 	"""
@@ -350,6 +364,468 @@ class Track:
 		return [xAvg, yAvg, zAvg]
 
 
+class TrackTable:
+	"""
+	The points of a set of tracks in arrays with a row for every point,
+	sorted by track and timepoint. The rows of the track i are
+	offsets[i] ... offsets[i + 1] - 1. The kinematics of all the tracks are
+	computed at once from the differences of adjacent rows.
+	"""
+	def __init__(self, trackIds, timepoints, objects, positions, fronts = None, rears = None):
+		"""
+		Initialization
+		@param trackIds, timepoints, objects the track, timepoint and object of every point
+		@param positions the coordinates of every point in pixels
+		@param fronts, rears the front and rear of the object of every point, or nan where not known
+		"""
+		order = numpy.lexsort((numpy.asarray(timepoints), numpy.asarray(trackIds)))
+		self.trackIds = numpy.asarray(trackIds, numpy.int64)[order]
+		self.timepoints = numpy.asarray(timepoints, numpy.int64)[order]
+		self.objects = numpy.asarray(objects, numpy.int64)[order]
+		self.positions = numpy.asarray(positions, numpy.float64).reshape(-1, 3)[order]
+		self.fronts = self.getCoordinates(fronts, order)
+		self.rears = self.getCoordinates(rears, order)
+
+		self.ids, starts = numpy.unique(self.trackIds, return_index = True)
+		self.offsets = numpy.append(starts, len(self.trackIds))
+		# The index of the track of every point
+		self.index = numpy.repeat(numpy.arange(len(self.ids)), numpy.diff(self.offsets))
+		self.voxelSize = numpy.ones(3)
+		self.timeStamps = []
+
+	def getCoordinates(self, coordinates, order):
+		"""
+		Return coordinates given for every point in the order of the rows
+		"""
+		if coordinates is None:
+			return numpy.empty((len(order), 3)) + numpy.nan
+		return numpy.asarray(coordinates, numpy.float64).reshape(-1, 3)[order]
+
+	def __len__(self):
+		return len(self.ids)
+
+	@staticmethod
+	def fromRows(rows):
+		"""
+		Return a table of rows (track, timepoint, object, x, y, z)
+		"""
+		rows = numpy.array(rows, numpy.float64).reshape(-1, 6)
+		return TrackTable(rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3:])
+
+	@staticmethod
+	def fromTracks(tracks):
+		"""
+		Return a table of Track objects. The tracks are numbered in order.
+		"""
+		rows, fronts, rears = [], [], []
+		missing = (numpy.nan, numpy.nan, numpy.nan)
+		for i, track in enumerate(tracks):
+			for timepoint in sorted(track.points.keys()):
+				rows.append((i, timepoint, track.values.get(timepoint, 0)) + tuple(track.points[timepoint]))
+				fronts.append(track.fronts.get(timepoint, missing))
+				rears.append(track.rears.get(timepoint, missing))
+		rows = numpy.array(rows, numpy.float64).reshape(-1, 6)
+		table = TrackTable(rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3:], fronts, rears)
+		if tracks:
+			table.setVoxelSize(tracks[0].voxelSize)
+			table.setTimeStamps(tracks[0].timeStamps)
+		return table
+
+	@staticmethod
+	def readCSV(filename):
+		"""
+		Read a table from a track file written by ParticleWriter. The rows of
+		the points that are not objects are left out like in Track.
+		"""
+		rows = []
+		fp = open(filename, "rb")
+		try:
+			for row in csv.reader(fp, dialect = "excel", delimiter = ";"):
+				try:
+					track, objval, timepoint = int(row[0]), int(row[1]), int(row[2])
+					x, y, z = float(row[3]), float(row[4]), float(row[5])
+				except (ValueError, IndexError):
+					continue
+				if objval:
+					rows.append((track, timepoint, objval, x, y, z))
+		finally:
+			fp.close()
+		return TrackTable.fromRows(rows)
+
+	def writeCSV(self, filename):
+		"""
+		Write the points to a track file in the format of ParticleWriter
+		"""
+		fp = open(filename, "wb")
+		try:
+			writer = csv.writer(fp, dialect = "excel", delimiter = ";")
+			writer.writerow(["Track #", "Object #", "Timepoint", "X", "Y", "Z"])
+			for i in range(len(self.timepoints)):
+				x, y, z = self.positions[i]
+				writer.writerow([str(self.trackIds[i]), str(self.objects[i]), str(self.timepoints[i]), \
+								repr(x), repr(y), repr(z)])
+		finally:
+			fp.close()
+
+	@staticmethod
+	def getRecordType():
+		"""
+		Return the type of the records of the binary track files
+		"""
+		return numpy.dtype([("track", "<i4"), ("timepoint", "<i4"), ("object", "<i4"),
+							("x", "<f8"), ("y", "<f8"), ("z", "<f8")])
+
+	@staticmethod
+	def readBinary(filename):
+		"""
+		Read a table written by writeBinary
+		"""
+		fp = open(filename, "rb")
+		try:
+			if fp.read(len(BINARY_HEADER)) != BINARY_HEADER:
+				raise IOError("%s is not a binary track file" % filename)
+			points, stamps = numpy.fromfile(fp, "<i4", 2)
+			voxelSize = numpy.fromfile(fp, "<f8", 3)
+			timeStamps = numpy.fromfile(fp, "<f8", stamps)
+			records = numpy.fromfile(fp, TrackTable.getRecordType(), points)
+		finally:
+			fp.close()
+		if len(records) != points:
+			raise IOError("The binary track file %s is truncated" % filename)
+		positions = numpy.column_stack([records["x"], records["y"], records["z"]])
+		table = TrackTable(records["track"], records["timepoint"], records["object"], positions)
+		table.setVoxelSize(voxelSize)
+		table.setTimeStamps(timeStamps.tolist())
+		return table
+
+	def writeBinary(self, filename):
+		"""
+		Write the points, the voxel size and the time stamps to a binary file
+		"""
+		records = numpy.zeros(len(self.timepoints), self.getRecordType())
+		records["track"], records["timepoint"], records["object"] = self.trackIds, self.timepoints, self.objects
+		records["x"], records["y"], records["z"] = self.positions.T
+		fp = open(filename, "wb")
+		try:
+			fp.write(BINARY_HEADER)
+			numpy.array([len(records), len(self.timeStamps)], "<i4").tofile(fp)
+			numpy.asarray(self.voxelSize, "<f8").tofile(fp)
+			numpy.asarray(self.timeStamps, "<f8").tofile(fp)
+			records.tofile(fp)
+		finally:
+			fp.close()
+
+	def setVoxelSize(self, voxelSize):
+		"""
+		Set the voxel size of the image in um
+		"""
+		if len(voxelSize) == 3:
+			self.voxelSize = numpy.array(voxelSize, numpy.float64)
+
+	def setTimeStamps(self, timeStamps):
+		"""
+		Set the times of the timepoints in seconds
+		"""
+		self.timeStamps = list(timeStamps)
+
+	def select(self, selected):
+		"""
+		Return a table of the tracks for which selected is true
+		"""
+		rows = numpy.asarray(selected)[self.index]
+		table = TrackTable(self.trackIds[rows], self.timepoints[rows], self.objects[rows], self.positions[rows], \
+							self.fronts[rows], self.rears[rows])
+		table.setVoxelSize(self.voxelSize)
+		table.setTimeStamps(self.timeStamps)
+		return table
+
+	def getTracks(self):
+		"""
+		Return the tracks as Track objects
+		"""
+		tracks = []
+		for i in range(len(self)):
+			track = Track()
+			for row in range(self.offsets[i], self.offsets[i + 1]):
+				timepoint = int(self.timepoints[row])
+				track.addTrackPoint(timepoint, int(self.objects[row]), tuple(self.positions[row].tolist()))
+				if not numpy.isnan(self.fronts[row]).any():
+					track.fronts[timepoint] = tuple(self.fronts[row].tolist())
+				if not numpy.isnan(self.rears[row]).any():
+					track.rears[timepoint] = tuple(self.rears[row].tolist())
+			track.setVoxelSize(list(self.voxelSize))
+			track.setTimeStamps(self.timeStamps)
+			tracks.append(track)
+		return tracks
+
+	def getNumberOfPoints(self):
+		"""
+		Return the number of points of every track
+		"""
+		return numpy.diff(self.offsets)
+
+	def getTimeRanges(self):
+		"""
+		Return the first and last timepoint of every track
+		"""
+		return self.timepoints[self.offsets[:-1]], self.timepoints[self.offsets[1:] - 1]
+
+	def getLengths(self, positions = None):
+		"""
+		Return the length of every track in um. Only the steps between
+		consecutive timepoints are counted, like in Track.getLength.
+		@param positions the positions of the points, by default their centers
+		"""
+		if positions is None:
+			positions = self.positions
+		steps = (self.index[1:] == self.index[:-1]) & (numpy.diff(self.timepoints) == 1)
+		distances = numpy.sqrt(((numpy.diff(positions, axis = 0) * self.voxelSize) ** 2).sum(1))
+		steps &= ~numpy.isnan(distances)
+		return numpy.bincount(self.index[1:][steps], distances[steps], len(self))
+
+	def getDurations(self):
+		"""
+		Return the time every track takes in seconds, or in timepoints if
+		there are no time stamps for all the timepoints
+		"""
+		mintp, maxtp = self.getTimeRanges()
+		if not len(self):
+			return numpy.zeros(0)
+		if len(self.timeStamps) > maxtp.max() and mintp.min() >= 0:
+			timeStamps = numpy.array(self.timeStamps, numpy.float64)
+			return timeStamps[maxtp] - timeStamps[mintp]
+		return (maxtp - mintp).astype(numpy.float64)
+
+	def getSpeeds(self, positions = None):
+		"""
+		Return the average speed of every track in um/s
+		"""
+		lengths, durations = self.getLengths(positions), self.getDurations()
+		speeds = numpy.zeros(len(self))
+		moving = durations != 0
+		speeds[moving] = lengths[moving] / durations[moving]
+		return speeds
+
+	def getDirectionalPersistences(self):
+		"""
+		Return the distance between the ends of every track divided by its
+		length, or one for tracks that do not move
+		"""
+		lengths = self.getLengths()
+		ends = (self.positions[self.offsets[1:] - 1] - self.positions[self.offsets[:-1]]) * self.voxelSize
+		persistences = numpy.ones(len(self))
+		moving = lengths != 0
+		persistences[moving] = numpy.sqrt((ends[moving] ** 2).sum(1)) / lengths[moving]
+		return persistences
+
+	def getAverageAngles(self):
+		"""
+		Return the mean, standard deviation and standard error of the angles
+		in degrees between the successive steps of every track
+		"""
+		turns = (self.index[2:] == self.index[:-2]) & (self.timepoints[2:] - self.timepoints[:-2] == 2)
+		steps = numpy.diff(self.positions, axis = 0) * self.voxelSize
+		before, after = steps[:-1][turns], steps[1:][turns]
+		lengths = numpy.sqrt((before ** 2).sum(1) * (after ** 2).sum(1))
+		angles = numpy.zeros(len(lengths))
+		inner = (before * after).sum(1)[lengths != 0] / lengths[lengths != 0]
+		# Rounding may take the cosine past one, which Math.angle takes as zero
+		angles[lengths != 0] = numpy.where(numpy.abs(inner) <= 1, \
+								numpy.degrees(numpy.arccos(numpy.clip(inner, -1, 1))), 0.0)
+
+		index = self.index[2:][turns]
+		counts = numpy.bincount(index, minlength = len(self)).astype(numpy.float64)
+		means = numpy.zeros(len(self))
+		stds = numpy.zeros(len(self))
+		turning = counts != 0
+		means[turning] = numpy.bincount(index, angles, len(self))[turning] / counts[turning]
+		deviations = numpy.bincount(index, (angles - means[index]) ** 2, len(self))
+		stds[turning] = numpy.sqrt(deviations[turning] / counts[turning])
+		errors = numpy.zeros(len(self))
+		errors[turning] = stds[turning] / numpy.sqrt(counts[turning])
+		return means, stds, errors
+
+	def getMeanSquareDisplacements(self, maxLag):
+		"""
+		Return the mean square displacement in um^2 of every track for the
+		lags of 1 ... maxLag timepoints as an array indexed by [track, lag - 1],
+		where the lags a track does not have are nan, and the mean over the
+		displacements of all the tracks for every lag
+		"""
+		if not len(self):
+			return numpy.zeros((0, maxLag)), numpy.empty(maxLag) + numpy.nan
+		span = int(self.timepoints.max() - self.timepoints.min()) + maxLag + 1
+		keys = self.index * span + (self.timepoints - self.timepoints.min())
+		displacements = numpy.empty((len(self), maxLag)) + numpy.nan
+		pooled = numpy.empty(maxLag) + numpy.nan
+		for lag in range(1, maxLag + 1):
+			later = numpy.minimum(numpy.searchsorted(keys, keys + lag), len(keys) - 1)
+			found = keys[later] == keys + lag
+			squares = (((self.positions[later[found]] - self.positions[found]) * self.voxelSize) ** 2).sum(1)
+			index = self.index[found]
+			counts = numpy.bincount(index, minlength = len(self))
+			sums = numpy.bincount(index, squares, len(self))
+			displacements[counts != 0, lag - 1] = sums[counts != 0] / counts[counts != 0]
+			if len(squares):
+				pooled[lag - 1] = squares.mean()
+		return displacements, pooled
+
+	def getStatistics(self):
+		"""
+		Return the statistics of getTrackStatistics
+		"""
+		means, stds, errors = self.getAverageAngles()
+		return {"Length": self.getLengths().tolist(), "Speed": self.getSpeeds().tolist(),
+				"DirectionalPersistence": self.getDirectionalPersistences().tolist(),
+				"Angle": zip(means.tolist(), stds.tolist(), errors.tolist()),
+				"FrontSpeed": self.getSpeeds(self.fronts).tolist(),
+				"RearSpeed": self.getSpeeds(self.rears).tolist()}
+
+def getTrackStatistics(tracks):
+	"""
+	Return the length, speed, directional persistence, mean, standard
+	deviation and standard error of the angles, and the front and rear
+	speed of every track in a dictionary of lists
+	"""
+	if numpy and tracks:
+		return TrackTable.fromTracks(tracks).getStatistics()
+	return {"Length": [track.getLength() for track in tracks],
+			"Speed": [track.getSpeed() for track in tracks],
+			"DirectionalPersistence": [track.getDirectionalPersistence() for track in tracks],
+			"Angle": [track.getAverageAngle() for track in tracks],
+			"FrontSpeed": [track.getFrontSpeed() for track in tracks],
+			"RearSpeed": [track.getRearSpeed() for track in tracks]}
+
+def getSurfaces(labels, spacing = (1.0, 1.0, 1.0)):
+	"""
+	Return the surface voxels of the objects of a label image, indexed by
+	[z, y, x], as the sorted labels of the voxels and their coordinates
+	(x, y, z) multiplied by the spacing. A voxel of an object is on its
+	surface if one of its six neighbours is not in the object.
+	"""
+	surface = labels != 0
+	inner = numpy.zeros(labels.shape, numpy.bool_)
+	core = [slice(1, -1)] * 3
+	inner[tuple(core)] = True
+	for axis in range(3):
+		for shift in (-1, 1):
+			before = list(core)
+			before[axis] = slice(1 + shift, labels.shape[axis] - 1 + shift)
+			inner[tuple(core)] &= labels[tuple(core)] == labels[tuple(before)]
+	surface &= ~inner
+	z, y, x = numpy.nonzero(surface)
+	values = labels[z, y, x]
+	order = numpy.argsort(values, kind = "mergesort")
+	points = numpy.column_stack([x, y, z])[order] * numpy.asarray(spacing, numpy.float64)
+	return values[order], points
+
+def locateOutmostPoints(surfaces, labels, centers, directions, tolerance = 0.5):
+	"""
+	Return the outmost points of objects in the given directions from their
+	centers, one for every query. The outmost point is the average of the
+	surface voxels of the object that are within tolerance of the farthest
+	one along the direction. The points of the queries whose object has no
+	surface voxels or whose direction is zero are nan.
+	@param surfaces the surface voxels returned by getSurfaces
+	@param labels, centers, directions the object, center and direction of every query
+	"""
+	surfaceLabels, points = surfaces
+	labels = numpy.asarray(labels)
+	centers = numpy.asarray(centers, numpy.float64).reshape(-1, 3)
+	directions = numpy.asarray(directions, numpy.float64).reshape(-1, 3)
+	result = numpy.empty((len(labels), 3)) + numpy.nan
+	norms = numpy.sqrt((directions ** 2).sum(1))
+	starts = numpy.searchsorted(surfaceLabels, labels, "left")
+	counts = numpy.searchsorted(surfaceLabels, labels, "right") - starts
+	counts[norms == 0] = 0
+	if not counts.sum():
+		return result
+
+	# The surface voxels of the objects of all the queries one after another
+	query = numpy.repeat(numpy.arange(len(labels)), counts)
+	firsts = numpy.cumsum(counts) - counts
+	rows = numpy.arange(counts.sum()) - firsts[query] + starts[query]
+	units = directions / numpy.maximum(norms, 1e-300)[:, numpy.newaxis]
+	projections = ((points[rows] - centers[query]) * units[query]).sum(1)
+	searched = counts > 0
+	farthest = numpy.zeros(len(labels))
+	farthest[searched] = numpy.maximum.reduceat(projections, firsts[searched])
+	near = projections >= farthest[query] - tolerance
+	found = numpy.bincount(query[near], minlength = len(labels)).astype(numpy.float64)
+	for axis in range(3):
+		sums = numpy.bincount(query[near], points[rows[near], axis], len(labels))
+		result[searched, axis] = sums[searched] / found[searched]
+	return result
+
+def locateFrontsAndRears(timepoint):
+	"""
+	Return the fronts and rears of the objects of the queries of a timepoint
+	in frontRearContext. This is run in the worker processes.
+	"""
+	queries = frontRearContext["queries"][timepoint]
+	spacing = frontRearContext["spacing"]
+	volume = lib.LabelStatistics.getVolume(frontRearContext["reader"].getDataSet(timepoint))
+	if volume is None:
+		missing = numpy.empty((len(queries), 3)) + numpy.nan
+		return missing, missing
+	surfaces = getSurfaces(volume, spacing)
+	labels = [objval for (i, objval, center, direction) in queries]
+	centers = numpy.array([center for (i, objval, center, direction) in queries]) * spacing
+	directions = numpy.array([direction for (i, objval, center, direction) in queries]) * spacing
+	tolerance = frontRearContext["tolerance"]
+	fronts = locateOutmostPoints(surfaces, labels, centers, directions, tolerance) / spacing
+	rears = locateOutmostPoints(surfaces, labels, centers, -directions, tolerance) / spacing
+	return fronts, rears
+
+def calculateFrontsAndRears(tracks, reader, tolerance = 0.5, workers = 0):
+	"""
+	Calculate the front and rear of the objects of tracks in the direction
+	of their motion, like Track.calculateFrontAndRear. The surfaces of the
+	objects of a timepoint are found once for all the tracks, and the
+	timepoints are processed in a pool of worker processes. Without NumPy
+	the tracks are processed one by one with Track.calculateFrontAndRear.
+	@param reader a data source of the segmented objects
+	@param tolerance the thickness of the surface averaged into the front or rear in pixels
+	"""
+	if not numpy:
+		for track in tracks:
+			track.calculateFrontAndRear(reader, 10.0, 0.01)
+		return
+	if not tracks:
+		return
+
+	# The objects to search at every timepoint, with the direction to the
+	# next point of the track. The last point uses the direction of the
+	# previous step.
+	queries = {}
+	for i, track in enumerate(tracks):
+		timepoints = sorted(track.points.keys())
+		direction = None
+		for j, timepoint in enumerate(timepoints):
+			center = numpy.array(track.points[timepoint], numpy.float64)
+			if j + 1 < len(timepoints):
+				direction = numpy.array(track.points[timepoints[j + 1]], numpy.float64) - center
+			if direction is not None:
+				queries.setdefault(timepoint, []).append((i, track.values[timepoint], center, direction))
+
+	voxelSize = numpy.array(tracks[0].voxelSize, numpy.float64)
+	timepoints = sorted(queries.keys())
+	frontRearContext.update({"reader": reader, "queries": queries, "tolerance": tolerance,
+							"spacing": voxelSize / voxelSize[0]})
+	try:
+		results = lib.ProcessPool.imapOrdered(locateFrontsAndRears, timepoints, workers, \
+												initializer = lib.ProcessPool.initializeWorker)
+		for n, (timepoint, (fronts, rears)) in enumerate(zip(timepoints, results)):
+			for (i, objval, center, direction), front, rear in zip(queries[timepoint], fronts, rears):
+				if not numpy.isnan(front).any():
+					tracks[i].fronts[timepoint] = tuple(front.tolist())
+				if not numpy.isnan(rear).any():
+					tracks[i].rears[timepoint] = tuple(rear.tolist())
+			lib.messenger.send(None, "update_progress", float(n + 1) / len(timepoints), \
+								"Locating fronts and rears (timepoint %d / %d)" % (n + 1, len(timepoints)))
+	finally:
+		frontRearContext.clear()
+
 class TrackReader:
 	"""
 	Created: 12.07.2006, KP
@@ -363,6 +839,8 @@ class TrackReader:
 		self.tracks = []
 		self.maxLength = -1
 		self.reader = None
+		self.table = None
+		self.trackLists = {}
 		if os.path.exists(filename):
 			self.readFromFile(filename)		   
 				
@@ -371,6 +849,8 @@ class TrackReader:
 		Return the number of tracks
 		""" 
 		self.maxLength = -1
+		self.table = None
+		self.trackLists = {}
 		try:
 			csvfileObject = open(filename)
 			self.reader = csv.reader(csvfileObject, dialect = "excel", delimiter = ";")
@@ -385,18 +865,28 @@ class TrackReader:
 			self.parser = None
 		
 		if self.reader and self.parser:
-			self.tracks = self.readTracks(self.reader)
+			if numpy:
+				csvfileObject.close()
+				self.table = TrackTable.readCSV(filename)
+				self.tracks = []
+			else:
+				self.tracks = self.readTracks(self.reader)
 			try:
 				timeStamps = eval(self.parser.get("TimeStamps", "TimeStamps"))
 				voxelSize = eval(self.parser.get("VoxelSize", "VoxelSize"))
 				for i in range(len(voxelSize)):
 					voxelSize[i] *= 1000000.0
 
+				if self.table is not None:
+					self.table.setVoxelSize(voxelSize)
+					self.table.setTimeStamps(timeStamps)
 				for track in self.tracks:
 					track.setVoxelSize(voxelSize)
 					track.setTimeStamps(timeStamps)
 			except:
 				pass
+			if self.table is not None:
+				self.tracks = self.table.getTracks()
 			
 			self.getMaximumTrackLength()
 			
@@ -440,7 +930,19 @@ class TrackReader:
 		if not self.tracks:
 			return []
 		
-		return [trackObject for trackObject in self.tracks if isLongerThanOrEqual(trackObject, minLength)]
+		# The tracks are selected only once for every minimum length
+		if minLength not in self.trackLists:
+			self.trackLists[minLength] = [trackObject for trackObject in self.tracks \
+											if isLongerThanOrEqual(trackObject, minLength)]
+		return self.trackLists[minLength][:]
+
+	def getTable(self, minLength = 3):
+		"""
+		Return the tracks with length >= minLength as a TrackTable
+		"""
+		if self.table is not None:
+			return self.table.select(self.table.getNumberOfPoints() >= minLength)
+		return TrackTable.fromTracks(self.getTracks(minLength))
 
 	@staticmethod
 	def readTracks(reader):
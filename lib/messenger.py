@@ -306,5 +306,11 @@ def send(obj, event, *args, **kw_args):
 	_messenger.send(obj, event, *args, **kw_args)
 send.__doc__ = _messenger.send.__doc__
 
+def disconnectAll():
+	"""Remove all the registered handlers. This is used in worker
+	processes that must not call back into the handlers they inherited
+	from the main process."""
+	_messenger._signals.clear()
+
 del _saved
 
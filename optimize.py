@@ -29,11 +29,25 @@ __author__ = "BioImageXD Project <http://www.bioimagexd.org/>"
 __version__ = "$Revision: 1.21 $"
 __date__ = "$Date: 2005/01/13 13:42:03 $"
 
+import os
+import math
 import scripting
 import Configuration
 import Logging
+import lib.ProcessPool
 import vtk
 import vtkbxd
+try:
+	import numpy
+	from vtk.util import numpy_support
+except ImportError:
+	numpy = None
+
+# Outputs smaller than this (in bytes) are not worth splitting over processes
+MIN_PARALLEL_SIZE = 16 * 1024 * 1024
+# The pipeline executed by the worker processes of execute_parallel. The
+# workers are forked, so they inherit it together with its input data.
+parallelPipeline = {}
 
 currentPipeline = []
 memLimit = None
@@ -65,9 +79,11 @@ def set_target_size(xDimension, yDimension, zDimension = 0):
 	for dataUnit in sources:
 		dataUnit.dataSource.setResampleDimensions((xDimension, yDimension, zDimension))
 
-def optimize(image = None, vtkFilter = None, updateExtent = None, releaseData = 0):
+def optimize(image = None, vtkFilter = None, updateExtent = None, releaseData = 0, parallel = 0):
 	"""
-	Execute a pipeline and optimize it
+	Execute a pipeline and optimize it. If parallel is set, the pipeline may
+	be executed in worker processes, which is meant for processing the data
+	and not for the previews.
 	"""
 	if image:
 		filterInUse = image.GetProducerPort().GetProducer()
@@ -80,7 +96,7 @@ def optimize(image = None, vtkFilter = None, updateExtent = None, releaseData =
 		Logging.info("Using update extent %s"%str(updateExtent),kw="pipeline")
 		filterInUse.GetOutput().SetUpdateExtent(updateExtent)
 	
-	img = execute_limited(filterInUse, updateExtent = updateExtent)
+	img = execute_limited(filterInUse, updateExtent = updateExtent, parallel = parallel)
 	#if numFilters != 0:
 	#	img = execute_limited(val, updateExtent = updateExtent) 
 	#else:
@@ -88,9 +104,10 @@ def optimize(image = None, vtkFilter = None, updateExtent = None, releaseData =
 
 	return img
 	
-def execute_limited(pipeline, updateExtent = None):
+def execute_limited(pipeline, updateExtent = None, parallel = 0):
 	"""
-	
+	Execute a pipeline within the memory limits, in worker processes if
+	parallel is set and more than one process is configured
 	"""
 	global memLimit, noLimits, alwaysSplit
 	global numberOfDivisions
@@ -103,6 +120,13 @@ def execute_limited(pipeline, updateExtent = None):
 
 	if not memLimit:
 		get_memory_limit()
+	workers = 1
+	if parallel:
+		workers = get_number_of_workers()
+	if workers > 1:
+		retval = execute_parallel(pipeline, updateExtent, workers)
+		if retval:
+			return retval
 	if noLimits or (not memLimit and not alwaysSplit):
 		streamer = vtk.vtkImageDataStreamer()
 		streamer.SetNumberOfStreamDivisions(1)
@@ -132,6 +156,190 @@ def execute_limited(pipeline, updateExtent = None):
 	executing = 0
 	return retval
 
+def get_number_of_workers():
+	"""
+	Return the number of processes the pipelines are executed in
+	"""
+	if not numpy or not hasattr(os, "fork"):
+		return 1
+	return lib.ProcessPool.getNumberOfWorkers()
+
+def execute_parallel(pipeline, updateExtent, workers):
+	"""
+	Execute the pipeline by splitting the update extent into pieces that
+	are updated in a pool of worker processes, each with its own copy of
+	the pipeline. The pieces are copied into the output image as they
+	arrive. Returns None if the output is too small to be worth splitting
+	or the pipeline could not be executed in parallel.
+	"""
+	global executing
+	output = pipeline.GetOutput()
+	output.UpdateInformation()
+	if not updateExtent or scripting.wantWholeDataset:
+		updateExtent = output.GetWholeExtent()
+	x0, x1, y0, y1, z0, z1 = updateExtent
+	dimensions = (x1 - x0 + 1, y1 - y0 + 1, z1 - z0 + 1)
+	voxelSize = max(output.GetScalarSize(), 1) * max(output.GetNumberOfScalarComponents(), 1)
+	size = dimensions[0] * dimensions[1] * dimensions[2] * voxelSize
+	if size < MIN_PARALLEL_SIZE:
+		return None
+
+	sources, filters, radius = get_pipeline_sources(pipeline)
+	pieces = get_pieces(updateExtent, get_number_of_pieces(size, filters, workers))
+	if len(pieces) < 2:
+		return None
+	# Every piece is updated with a halo of the voxels the filters read
+	# around it, so that the pieces are the same as the parts of an unsplit
+	# update also with filters that do not enlarge their input extent
+	pieces = [(piece, get_padded_extent(piece, radius, output.GetWholeExtent())) for piece in pieces]
+	Logging.info("Executing %d pieces of extent %s in %d processes" % (len(pieces), str(updateExtent), workers), kw = "pipeline")
+	# Read the input data once here instead of in every worker, because the
+	# workers would share the file handles of the readers
+	for source in sources:
+		source.UpdateWholeExtent()
+
+	executing = 1
+	parallelPipeline["pipeline"] = pipeline
+	image = None
+	try:
+		try:
+			results = lib.ProcessPool.imapOrdered(execute_piece, pieces, workers, initializer = lib.ProcessPool.initializeWorker)
+			for extent, scalarType, components, voxels in results:
+				if not image:
+					image = vtk.vtkImageData()
+					image.SetSpacing(output.GetSpacing())
+					image.SetOrigin(output.GetOrigin())
+					image.SetExtent(updateExtent)
+					image.SetWholeExtent(updateExtent)
+					image.SetScalarType(scalarType)
+					image.SetNumberOfScalarComponents(components)
+					image.AllocateScalars()
+					target = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+					target = target.reshape(dimensions[2], dimensions[1], dimensions[0], components)
+				px0, px1, py0, py1, pz0, pz1 = extent
+				piece = numpy.fromstring(voxels, target.dtype)
+				target[pz0 - z0:pz1 - z0 + 1, py0 - y0:py1 - y0 + 1, px0 - x0:px1 - x0 + 1] = \
+					piece.reshape(pz1 - pz0 + 1, py1 - py0 + 1, px1 - px0 + 1, components)
+		except (EnvironmentError, MemoryError), ex:
+			Logging.info("Executing the pipeline in parallel failed: %s" % str(ex), kw = "pipeline")
+			return None
+	finally:
+		parallelPipeline.clear()
+		executing = 0
+	image.Modified()
+	return image
+
+def get_pipeline_sources(pipeline):
+	"""
+	Return the algorithms of the pipeline that read data, the number of
+	filters in the pipeline and the sum of the kernel radii of the filters
+	"""
+	sources = []
+	filters = 0
+	radius = [0, 0, 0]
+	stack = [pipeline]
+	seen = {}
+	while stack:
+		algorithm = stack.pop()
+		if algorithm.GetAddressAsString("vtkAlgorithm") in seen:
+			continue
+		seen[algorithm.GetAddressAsString("vtkAlgorithm")] = 1
+		filters += 1
+		radius = [r + kernel for r, kernel in zip(radius, get_kernel_radius(algorithm))]
+		hasInputs = 0
+		for i in range(algorithm.GetNumberOfInputPorts()):
+			for j in range(algorithm.GetNumberOfInputConnections(i)):
+				producer = algorithm.GetInputConnection(i, j).GetProducer()
+				if producer:
+					stack.append(producer)
+					hasInputs = 1
+		if not hasInputs and not algorithm.IsA("vtkTrivialProducer"):
+			sources.append(algorithm)
+	return sources, filters, radius
+
+def get_kernel_radius(algorithm):
+	"""
+	Return the number of voxels in x, y and z around a voxel of the output
+	that a filter reads from its input
+	"""
+	if algorithm.IsA("vtkImageGaussianSmooth"):
+		deviations = algorithm.GetStandardDeviations()
+		factors = algorithm.GetRadiusFactors()
+		return [int(math.ceil(deviation * factor)) for deviation, factor in zip(deviations, factors)]
+	if algorithm.IsA("vtkImageAnisotropicDiffusion2D") or algorithm.IsA("vtkImageAnisotropicDiffusion3D"):
+		return [algorithm.GetNumberOfIterations()] * 3
+	if hasattr(algorithm, "GetKernelSize"):
+		kernelSize = algorithm.GetKernelSize()
+		if len(kernelSize) == 3:
+			return [size / 2 for size in kernelSize]
+	return [0, 0, 0]
+
+def get_padded_extent(extent, radius, wholeExtent):
+	"""
+	Return extent enlarged by radius voxels in each direction, inside wholeExtent
+	"""
+	padded = []
+	for i in range(3):
+		padded.append(max(extent[2 * i] - radius[i], wholeExtent[2 * i]))
+		padded.append(min(extent[2 * i + 1] + radius[i], wholeExtent[2 * i + 1]))
+	return tuple(padded)
+
+def get_number_of_pieces(size, filters, workers):
+	"""
+	Return the number of pieces an output of the given size is split to.
+	Every worker gets at least one piece, and the pieces that are updated at
+	the same time, with the intermediate data of every filter, fit in the
+	memory limit.
+	"""
+	pieces = workers
+	if memLimit and not noLimits:
+		limit = memLimit * 1024.0 * 1024.0
+		pieces = max(pieces, int(math.ceil(workers * size * (filters + 1) / limit)))
+	if alwaysSplit and numberOfDivisions:
+		pieces = max(pieces, numberOfDivisions)
+	# Give every worker the same number of pieces
+	return int(math.ceil(pieces / float(workers))) * workers
+
+def get_pieces(extent, pieces):
+	"""
+	Split extent into the given number of pieces, in z slabs if there are
+	enough slices and in blocks otherwise
+	"""
+	translator = vtk.vtkExtentTranslator()
+	translator.SetWholeExtent(extent)
+	translator.SetNumberOfPieces(pieces)
+	translator.SetGhostLevel(0)
+	if extent[5] - extent[4] + 1 >= pieces:
+		translator.SetSplitModeToZSlab()
+	else:
+		translator.SetSplitModeToBlock()
+	extents = []
+	for piece in range(pieces):
+		translator.SetPiece(piece)
+		translator.PieceToExtent()
+		x0, x1, y0, y1, z0, z1 = translator.GetExtent()
+		if x1 >= x0 and y1 >= y0 and z1 >= z0:
+			extents.append((x0, x1, y0, y1, z0, z1))
+	return extents
+
+def execute_piece(piece):
+	"""
+	Update the output of the pipeline in parallelPipeline inside the padded
+	extent of a piece and return the voxels inside the extent of the piece
+	as a string. This is run in the worker processes.
+	"""
+	extent, paddedExtent = piece
+	output = parallelPipeline["pipeline"].GetOutput()
+	output.SetUpdateExtent(paddedExtent)
+	output.Update()
+	x0, x1, y0, y1, z0, z1 = output.GetExtent()
+	components = output.GetNumberOfScalarComponents()
+	voxels = numpy_support.vtk_to_numpy(output.GetPointData().GetScalars())
+	voxels = voxels.reshape(z1 - z0 + 1, y1 - y0 + 1, x1 - x0 + 1, components)
+	px0, px1, py0, py1, pz0, pz1 = extent
+	voxels = voxels[pz0 - z0:pz1 - z0 + 1, py0 - y0:py1 - y0 + 1, px0 - x0:px1 - x0 + 1]
+	return extent, output.GetScalarType(), components, voxels.tostring()
+
 def get_memory_limit():
 	"""
 	Get memory limits from configuration
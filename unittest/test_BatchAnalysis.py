@@ -0,0 +1,42 @@
+# TestCase for lib.BatchAnalysis
+
+import os
+import tempfile
+import unittest
+import lib.BatchAnalysis
+
+class TestBatchJournal(unittest.TestCase):
+
+	def setUp(self):
+		fd, self.filename = tempfile.mkstemp(".journal")
+		os.close(fd)
+		os.remove(self.filename)
+
+	def tearDown(self):
+		if os.path.exists(self.filename):
+			os.remove(self.filename)
+
+	def testResume(self):
+		journal = lib.BatchAnalysis.BatchJournal(self.filename, "a")
+		self.assertEquals(journal.read(), {})
+		journal.open({})
+		journal.add(("List", (("a.lsm", "Ch1"),)), ("a.bxd", [["a.lsm", "Ch1", 1, 2.5]]))
+		journal.close()
+		# A record that was cut off when the analysis stopped is ignored
+		fp = open(self.filename, "ab")
+		fp.write("\x80\x02(U")
+		fp.close()
+		completed = lib.BatchAnalysis.BatchJournal(self.filename, "a").read()
+		self.assertEquals(completed.keys(), [("List", (("a.lsm", "Ch1"),))])
+		self.assertEquals(lib.BatchAnalysis.BatchJournal(self.filename, "b").read(), {})
+
+		journal = lib.BatchAnalysis.BatchJournal(self.filename, "a")
+		journal.open(completed)
+		journal.add(("List", (("b.lsm", "Ch1"),)), ("b.bxd", []))
+		journal.close()
+		self.assertEquals(len(journal.read()), 2)
+		journal.close(remove = 1)
+		self.failIf(os.path.exists(self.filename))
+
+if __name__ == "__main__":
+	unittest.main()
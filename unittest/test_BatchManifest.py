@@ -0,0 +1,67 @@
+# TestCase for lib.BatchManifest
+
+import os
+import shutil
+import tempfile
+import unittest
+import lib.BatchManifest
+
+class TestBatchManifest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def writeManifest(self, name, text):
+		filename = os.path.join(self.directory, name)
+		fp = open(filename, "w")
+		fp.write(text)
+		fp.close()
+		return filename
+
+	def testJSON(self):
+		filename = self.writeManifest("campaign.json", """{
+			"bba": "analysis.bba", "timepoints": "0-2,5", "output": "/results",
+			"jobs": ["a.lsm",
+				{"input": ["b.lif"], "channels": ["Ch1", 2], "timepoints": [3], "bba": "/other.bba"}]
+		}""")
+		first, second = lib.BatchManifest.readManifest(filename)
+		self.assertEquals(first["input"], [os.path.join(self.directory, "a.lsm")])
+		self.assertEquals(first["bba"], os.path.join(self.directory, "analysis.bba"))
+		self.assertEquals(first["timepoints"], [0, 1, 2, 5])
+		self.assertEquals(first["output"], "/results")
+		self.assertEquals(first["channels"], None)
+		self.assertEquals(second["channels"], ["Ch1", "2"])
+		self.assertEquals(second["timepoints"], [3])
+		self.assertEquals(second["bba"], "/other.bba")
+
+	def testCSV(self):
+		filename = self.writeManifest("campaign.csv", "input,channels,filters,timepoints\n" \
+													"a.lsm,\"0,1\",Median,\n" \
+													"b.lsm,,\"Median,Threshold\",1-2\n")
+		first, second = lib.BatchManifest.readManifest(filename)
+		self.assertEquals(first["channels"], ["0", "1"])
+		self.assertEquals(first["timepoints"], [])
+		self.assertEquals(first["output"], self.directory)
+		self.assertEquals(second["filters"], ["Median", "Threshold"])
+		self.assertEquals(second["timepoints"], [1, 2])
+
+	def testInvalid(self):
+		filename = self.writeManifest("bad.json", """{"jobs": [{"input": "a.lsm", "bba": "x.bba", "color": 1}]}""")
+		self.assertRaises(ValueError, lib.BatchManifest.readManifest, filename)
+		filename = self.writeManifest("bad.json", """{"jobs": [{"input": "a.lsm"}]}""")
+		self.assertRaises(ValueError, lib.BatchManifest.readManifest, filename)
+
+	def testShard(self):
+		jobs = range(10)
+		self.assertEquals(lib.BatchManifest.parseShard("2/4"), (2, 4))
+		self.assertRaises(ValueError, lib.BatchManifest.parseShard, "4/4")
+		self.assertRaises(ValueError, lib.BatchManifest.parseShard, "1")
+		shards = [lib.BatchManifest.getShard(jobs, i, 4) for i in range(4)]
+		self.assertEquals(shards[2], [2, 6])
+		self.assertEquals(sorted(sum(shards, [])), jobs)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,64 @@
+# TestCase for lib.ColocalizationStatistics
+
+import math
+import unittest
+import lib.ColocalizationStatistics
+
+class TestColocalizationStatistics(unittest.TestCase):
+
+	def getPearson(self, x, y):
+		numpy = lib.ColocalizationStatistics.numpy
+		x, y = x.astype(numpy.float64), y.astype(numpy.float64)
+		n = numpy.count_nonzero(x + y)
+		covariance = numpy.dot(x, y) - x.sum() * y.sum() / n
+		return covariance / math.sqrt((numpy.dot(x, x) - x.sum() ** 2 / n) * (numpy.dot(y, y) - y.sum() ** 2 / n))
+
+	def checkStatistics(self, ch1, ch2, lower1, upper1, lower2, upper2):
+		numpy = lib.ColocalizationStatistics.numpy
+		histogram = lib.ColocalizationStatistics.JointHistogram(ch1, ch2)
+		results = histogram.getStatistics(lower1, upper1, lower2, upper2)
+		x, y = ch1.ravel().astype(numpy.float64), ch2.ravel().astype(numpy.float64)
+		over1 = (x >= lower1) & (x <= upper1)
+		over2 = (y >= lower2) & (y <= upper2)
+		coloc = over1 & over2
+		below = (x <= lower1) | (y <= lower2)
+		self.assertEquals(results["ColocAmount"], coloc.sum())
+		self.assertEquals(results["OverThresholdCh1"], over1.sum())
+		self.assertEquals(results["NonZeroCh2"], numpy.count_nonzero(y))
+		self.assertEquals(results["SumOverThresholdCh2"], y[over2].sum())
+		self.assertAlmostEquals(results["M1"], x[y > 0].sum() / x.sum())
+		self.assertAlmostEquals(results["ThresholdM2"], y[over1].sum() / y.sum())
+		self.assertAlmostEquals(results["PercentageMaterialCh1"], x[coloc].sum() / x[over1].sum())
+		self.assertAlmostEquals(results["DiffStainIntCh2"], y[over2].sum() / (x[over1].sum() - x[coloc].sum()))
+		self.assertAlmostEquals(results["PearsonWholeImage"], self.getPearson(x, y))
+		self.assertAlmostEquals(results["PearsonImageAbove"], numpy.corrcoef(x[coloc], y[coloc])[0, 1])
+		self.assertAlmostEquals(results["PearsonImageBelow"], self.getPearson(x[below], y[below]))
+
+	def testStatistics(self):
+		numpy = lib.ColocalizationStatistics.numpy
+		if not numpy:
+			return
+		randomState = numpy.random.RandomState(5)
+		ch1 = randomState.randint(0, 256, (3, 20, 30)).astype(numpy.uint8)
+		ch2 = ((ch1 + randomState.randint(0, 100, ch1.shape)) % 256).astype(numpy.uint8)
+		ch1[0, :5] = ch2[0, :5] = 0
+		self.checkStatistics(ch1, ch2, 50, 255, 80, 200)
+		self.checkStatistics(ch1, ch2, 0, 100, 120, 255)
+
+	def testSparse(self):
+		numpy = lib.ColocalizationStatistics.numpy
+		if not numpy:
+			return
+		randomState = numpy.random.RandomState(7)
+		ch1 = randomState.randint(0, 65536, (2, 30, 30)).astype(numpy.uint16)
+		ch2 = (ch1 / 2 + randomState.randint(0, 30000, ch1.shape)).astype(numpy.uint16)
+		self.checkStatistics(ch1, ch2, 20000, 65535, 10000, 50000)
+		self.checkStatistics(ch1, ch2, 30000, 30500, 40000, 60000)
+		self.checkStatistics(ch1, ch2, 1000, 60000, 33333, 33500)
+		histogram = lib.ColocalizationStatistics.JointHistogram(ch1, ch2)
+		results = histogram.getStatistics(70000, 80000, 0, 65535)
+		self.assertEquals(results["Ch1ThresholdMax"], 65535)
+		self.assertEquals(results["PercentageVolumeCh1"], 0.0)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,97 @@
+# TestCase for lib.ColocalizationTest
+
+import unittest
+import lib.ColocalizationTest
+
+class TestColocalizationTest(unittest.TestCase):
+
+	def setUp(self):
+		numpy = lib.ColocalizationTest.numpy
+		if not numpy:
+			return
+		randomState = numpy.random.RandomState(5)
+		self.ch1 = randomState.randint(0, 256, (4, 24, 32)).astype(numpy.uint8)
+		noise = randomState.randint(0, 60, self.ch1.shape)
+		self.ch2 = numpy.clip(self.ch1 * 0.7 + noise, 0, 255).astype(numpy.uint8)
+		self.ch1[:, :4, :] = 0
+		self.ch2[:, :4, :] = 0
+
+	def testObserved(self):
+		numpy = lib.ColocalizationTest.numpy
+		if not numpy:
+			return
+		results = lib.ColocalizationTest.calculatePValue(self.ch1, self.ch2, lib.ColocalizationTest.METHOD_STEENSEL, \
+															workers = 1)
+		x = self.ch1.astype(numpy.float64)
+		y = self.ch2.astype(numpy.float64)
+		used = (x + y) != 0
+		self.assertAlmostEquals(results["RObserved"], numpy.corrcoef(x[used], y[used])[0, 1])
+		self.assertEquals(results["NumIterations"], 41)
+		self.assertEquals(results["Method"], lib.ColocalizationTest.METHOD_STEENSEL)
+
+	def testShift(self):
+		numpy = lib.ColocalizationTest.numpy
+		if not numpy:
+			return
+		image = numpy.arange(12).reshape(3, 4)
+		shifted = lib.ColocalizationTest.shiftSlice(image, 1, -1)
+		self.assertEquals(shifted.tolist(), [[0, 0, 0, 0], [1, 2, 3, 0], [5, 6, 7, 0]])
+		slices, shifts = lib.ColocalizationTest.getShifts(lib.ColocalizationTest.METHOD_FAY, 5)
+		self.assertEquals(slices, [1, 2, 3])
+		self.assertEquals(len(shifts), 75)
+		self.assertEquals(shifts[0], (-10, -10, -1))
+		self.assertEquals(shifts[25], (-10, -10, 0))
+
+	def testErf(self):
+		erf = lib.ColocalizationTest.erf
+		# Values of the error function from tables
+		for z, value in [(0.0, 0.0), (0.5, 0.5204999), (1.0, 0.8427008), (2.0, 0.9953223)]:
+			self.assertAlmostEquals(erf(z), value, 6)
+			self.assertAlmostEquals(erf(-z), -value, 6)
+
+	def testKernel(self):
+		numpy = lib.ColocalizationTest.numpy
+		if not numpy:
+			return
+		kernel, offsets = lib.ColocalizationTest.getKernel(1.5)
+		self.assertEquals(offsets.tolist(), [-2, -1, 0, 1, 2])
+		radius = 2.5
+		for y in range(5):
+			for x in range(5):
+				v = numpy.exp(-0.5 * (((x - radius) / (radius * 2)) ** 2 + ((y - radius) / (radius * 2)) ** 2) / 0.04)
+				self.assertAlmostEquals(kernel[y, x] / kernel[2, 2], v / numpy.exp(-0.5 * 0.02 / 0.04))
+		self.assertAlmostEquals(kernel.sum(), 1.0)
+
+		# The smoothing with and without values cut from the kernel is the
+		# same as a direct convolution with the edges clamped
+		image = numpy.random.RandomState(2).randint(0, 256, (7, 9)).astype(numpy.float64)
+		cut = kernel.copy()
+		cut[0, 0] = cut[4, 4] = 0
+		for k in (kernel, cut):
+			expected = numpy.zeros(image.shape)
+			for y in range(7):
+				for x in range(9):
+					for v in range(5):
+						for u in range(5):
+							ny = min(max(y + v - 2, 0), 6)
+							nx = min(max(x + u - 2, 0), 8)
+							expected[y, x] += image[ny, nx] * k[v, u]
+			smoothed = lib.ColocalizationTest.smoothSlice(image, k, offsets)
+			self.assertEquals(smoothed.tolist(), numpy.floor(expected + 0.5).tolist())
+
+	def testCostes(self):
+		numpy = lib.ColocalizationTest.numpy
+		if not numpy:
+			return
+		serial = lib.ColocalizationTest.calculatePValue(self.ch1, self.ch2, lib.ColocalizationTest.METHOD_COSTES, \
+														20, 1.0, workers = 1, seed = 3)
+		parallel = lib.ColocalizationTest.calculatePValue(self.ch1, self.ch2, lib.ColocalizationTest.METHOD_COSTES, \
+														20, 1.0, workers = 2, seed = 3)
+		self.assertEquals(serial, parallel)
+		self.assertEquals(serial["NumIterations"], 20)
+		self.assertEquals(serial["ColocCount"], 20)
+		self.assertTrue(abs(serial["RRandMean"]) < 0.2)
+		self.assertEquals(serial["PValue"], 1.0)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -1,5 +1,13 @@
 import unittest
+import os
+import shutil
+import tempfile
+import vtk
 from lib.DataSource.DataSource import DataSource
+from lib.DataSource.DataSource import ImageDataCache
+import lib.DataSource.PreviewPyramid
+import lib.DataSource.ReaderPool
+import lib.DataSource.ThumbnailCache
 
 class TestSample(unittest.TestCase):
 
@@ -21,5 +29,203 @@ class TestSample(unittest.TestCase):
 		self.assertEquals(DataSource.getCacheKey(unixFileName, channelName, purpose), resultKey)
 		self.assertEquals(DataSource.getCacheKey(winFileName, channelName, purpose), resultKey)
 
+class TestImageDataCache(unittest.TestCase):
+
+	def createImage(self, value):
+		image = vtk.vtkImageData()
+		image.SetDimensions(10, 10, 10)
+		image.SetScalarTypeToUnsignedChar()
+		image.SetNumberOfScalarComponents(1)
+		image.AllocateScalars()
+		image.GetPointData().GetScalars().FillComponent(0, value)
+		return image
+
+	def testLeastRecentlyUsedEviction(self):
+		# Room for two 1000 byte timepoints
+		cache = ImageDataCache(2500)
+		cache.store(("file", 0), self.createImage(1))
+		cache.store(("file", 1), self.createImage(2))
+		self.assertEquals(cache.get(("file", 0)).GetScalarComponentAsDouble(0, 0, 0, 0), 1)
+		cache.store(("file", 2), self.createImage(3))
+		self.assertEquals(cache.get(("file", 1)), None)
+		self.assertNotEquals(cache.get(("file", 0)), None)
+		self.assertNotEquals(cache.get(("file", 2)), None)
+		stats = cache.getStatistics()
+		self.assertEquals(stats["Hits"], 3)
+		self.assertEquals(stats["Misses"], 1)
+		self.assertEquals(stats["Evictions"], 1)
+		self.assertEquals(stats["Size"], 2000)
+
+	def testTooLargeIsNotCached(self):
+		cache = ImageDataCache(500)
+		image = self.createImage(1)
+		self.assertEquals(cache.store(("file", 0), image), image)
+		self.assertEquals(cache.get(("file", 0)), None)
+
+	def testStateIsStoredWithData(self):
+		cache = ImageDataCache(10000)
+		cache.store(("file", 0), self.createImage(1), {"originalScalarRange": (0, 4095)})
+		self.assertEquals(cache.getState(("file", 0)), {"originalScalarRange": (0, 4095)})
+		cache.remove(("file", 0))
+		self.assertEquals(cache.getState(("file", 0)), {})
+
+	def testRemoveFile(self):
+		cache = ImageDataCache(10000)
+		cache.store(("file1", 0), self.createImage(1))
+		cache.store(("file2", 0), self.createImage(1))
+		cache.removeFile("file1")
+		self.assertEquals(cache.get(("file1", 0)), None)
+		self.assertEquals(cache.getStatistics()["Size"], 1000)
+
+class TestThumbnailCache(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def testKeyChangesWithFile(self):
+		getKey = lib.DataSource.ThumbnailCache.getKey
+		self.assertEquals(getKey("file", 100, 1.0, "MIP"), getKey("file", 100, 1.0, "MIP"))
+		self.assertNotEquals(getKey("file", 100, 1.0, "MIP"), getKey("file", 100, 2.0, "MIP"))
+
+	def testLeastRecentlyUsedEviction(self):
+		# Room for two thumbnails of 1000 incompressible bytes
+		cache = lib.DataSource.ThumbnailCache.ThumbnailCache(os.path.join(self.directory, "Thumbnails.db"), 2100)
+		for key in ["a", "b"]:
+			cache.storeString(key, (10, 10, 10), 1, 3, os.urandom(1000))
+		cache.connection.execute("UPDATE thumbnails SET accessed = 0 WHERE key = 'b'")
+		cache.storeString("c", (10, 10, 10), 1, 3, os.urandom(1000))
+		self.assertTrue(cache.has("a"))
+		self.assertFalse(cache.has("b"))
+		self.assertTrue(cache.has("c"))
+
+	def testReadIsWrittenWithNextStore(self):
+		cache = lib.DataSource.ThumbnailCache.ThumbnailCache(os.path.join(self.directory, "Thumbnails.db"), 2100)
+		for key in ["a", "b"]:
+			cache.storeString(key, (10, 10, 10), 1, 3, os.urandom(1000))
+		cache.connection.execute("UPDATE thumbnails SET accessed = 0 WHERE key = 'a'")
+		cache.connection.commit()
+		changes = cache.connection.total_changes
+		self.assertTrue(cache.get("a"))
+		self.assertEquals(cache.connection.total_changes, changes)
+		# The read of a is stored before the eviction, so b is evicted
+		cache.storeString("c", (10, 10, 10), 1, 3, os.urandom(1000))
+		self.assertTrue(cache.has("a"))
+		self.assertFalse(cache.has("b"))
+
+class PyramidSource:
+	"""
+	The parts of a data source that a preview pyramid uses
+	"""
+	def __init__(self, filename):
+		self.filename = filename
+
+	def getFileTimeStamp(self, i):
+		return os.path.getmtime(self.filename)
+
+	def getFileSize(self, i):
+		return os.path.getsize(self.filename)
+
+	def getDataSetCacheKey(self, i, raw = 0):
+		return (self.filename, self.getFileTimeStamp(i), "", 0, i, None, None)
+
+class TestPreviewPyramid(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.filename = os.path.join(self.directory, "source")
+		open(self.filename, "w").write("data")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def testGetLevel(self):
+		getLevel = lib.DataSource.PreviewPyramid.getLevel
+		self.assertEquals(getLevel((2048, 2048, 200), 128, 128), 8)
+		self.assertEquals(getLevel((2048, 1024, 200), 512, 512), 2)
+		self.assertEquals(getLevel((512, 512, 10), 512, 512), 1)
+
+	def testBuildAndInvalidate(self):
+		image = vtk.vtkImageData()
+		image.SetDimensions(16, 8, 2)
+		image.SetScalarTypeToUnsignedChar()
+		image.SetNumberOfScalarComponents(1)
+		image.AllocateScalars()
+		image.GetPointData().GetScalars().FillComponent(0, 0)
+		image.SetScalarComponentFromDouble(5, 3, 1, 0, 200)
+		pyramid = lib.DataSource.PreviewPyramid.PreviewPyramid(PyramidSource(self.filename), self.directory)
+		pyramid.build(0, image)
+		level = pyramid.getLevelData(0, 4, 1)
+		self.assertEquals(level.GetDimensions(), (4, 2, 1))
+		# The bright voxel is kept in the reduced data
+		self.assertEquals(level.GetScalarComponentAsDouble(1, 0, 1, 0), 200)
+		open(self.filename, "w").write("changed data")
+		self.assertEquals(pyramid.getLevelData(0, 4), None)
+
+	def testReducedDataMatchesLevel(self):
+		image = vtk.vtkImageData()
+		image.SetDimensions(16, 8, 2)
+		image.SetScalarTypeToUnsignedChar()
+		image.SetNumberOfScalarComponents(1)
+		image.AllocateScalars()
+		image.GetPointData().GetScalars().FillComponent(0, 0)
+		image.SetScalarComponentFromDouble(5, 3, 1, 0, 200)
+		pyramid = lib.DataSource.PreviewPyramid.PreviewPyramid(PyramidSource(self.filename), self.directory)
+		reduced = pyramid.getReducedData(image, 4, 1)
+		pyramid.build(0, image)
+		level = pyramid.getLevelData(0, 4, 1)
+		self.assertEquals(reduced.GetDimensions(), level.GetDimensions())
+		self.assertEquals(reduced.GetScalarComponentAsDouble(1, 0, 1, 0), 200)
+
+	def testPendingBuildsAreBoundedBySize(self):
+		addPendingSize = lib.DataSource.PreviewPyramid.addPendingSize
+		limit = lib.DataSource.PreviewPyramid.PENDING_BUILD_SIZE
+		self.assertTrue(addPendingSize(limit - 10))
+		self.assertFalse(addPendingSize(11))
+		self.assertTrue(addPendingSize(10))
+		addPendingSize(-limit)
+		self.assertEquals(lib.DataSource.PreviewPyramid.pendingSize, 0)
+
+	def testLeastRecentlyUsedLevelsAreRemoved(self):
+		for i, name in enumerate(["a.bxv", "b.bxv", "c.bxv"]):
+			filename = os.path.join(self.directory, name)
+			open(filename, "wb").write("x" * 100)
+			os.utime(filename, (1000 + i, 1000 + i))
+		os.utime(os.path.join(self.directory, "a.bxv"), (2000, 2000))
+		lib.DataSource.PreviewPyramid.removeLeastRecentlyUsed(self.directory, 250)
+		self.assertEquals(sorted(os.listdir(self.directory)), ["a.bxv", "c.bxv", "source"])
+
+class TestReaderPool(unittest.TestCase):
+
+	def setUp(self):
+		self.closed = []
+
+	def testReaderIsShared(self):
+		pool = lib.DataSource.ReaderPool.ReaderPool(2)
+		reader = pool.get(("file", "LIF"), lambda: ["reader"], self.closed.append)
+		self.assertTrue(pool.get(("file", "LIF"), lambda: ["other"], self.closed.append) is reader)
+		self.assertEquals(pool.getStatistics()["Opened"], 1)
+
+	def testLeastRecentlyUsedIsClosed(self):
+		pool = lib.DataSource.ReaderPool.ReaderPool(2)
+		for name in ["a", "b"]:
+			pool.get((name, "LSM", 0), lambda: name, self.closed.append)
+		pool.get(("a", "LSM", 0), lambda: "a", self.closed.append)
+		pool.get(("c", "LSM", 0), lambda: "c", self.closed.append)
+		self.assertEquals(self.closed, ["b"])
+		pool.removeFile("a")
+		self.assertEquals(self.closed, ["b", "a"])
+		self.assertEquals(pool.getStatistics()["Open"], 1)
+
+	def testDetachedReaderIsNotClosed(self):
+		pool = lib.DataSource.ReaderPool.ReaderPool(2)
+		pool.get(("a", "LIF"), lambda: "a", self.closed.append)
+		pool.detach(("a", "LIF"))
+		pool.clear()
+		self.assertEquals(self.closed, [])
+		self.assertEquals(pool.get(("a", "LIF"), lambda: "new a", self.closed.append), "new a")
+
 if __name__ == "__main__":
 	unittest.main()
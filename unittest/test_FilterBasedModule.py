@@ -3,6 +3,44 @@
 import unittest
 
 import lib.FilterBasedModule
+import scripting
+
+class ChannelDataUnit:
+	"""
+	A data unit that returns its name and the timepoint asked for
+	"""
+	def __init__(self, name):
+		self.name = name
+
+	def isProcessed(self):
+		return 0
+
+	def getTimepoint(self, timepoint):
+		return (self.name, timepoint)
+
+class CombinedDataUnit:
+	def __init__(self, sourceUnits):
+		self.sourceUnits = sourceUnits
+
+	def isProcessed(self):
+		return 1
+
+	def getSourceDataUnits(self):
+		return self.sourceUnits
+
+class FilterList:
+	def getCount(self):
+		return 1
+
+	def getModified(self):
+		return 0
+
+	def setModified(self, flag):
+		pass
+
+class Settings:
+	def get(self, name):
+		return FilterList()
 
 class FilterBasedModuleTest(unittest.TestCase):
 
@@ -71,6 +109,27 @@ class FilterBasedModuleTest(unittest.TestCase):
 		self.assertEqual(self.testFilterBasedModule.scale, 1)
 
 
+	def testPrefetchReadsOtherChannelsOfPrefetchedTimepoint(self):
+		"""
+		Testing getProcessedTimepoint()
+
+		A filter that reads a second channel must get it from the timepoint
+		that is prefetched, not from the one that is shown
+		"""
+		import lib.ProcessingFilter
+		processingFilter = lib.ProcessingFilter.ProcessingFilter()
+		processingFilter.dataUnit = CombinedDataUnit([ChannelDataUnit("ch1"), ChannelDataUnit("ch2")])
+		inputs = []
+		def doOperation(preview = 0):
+			inputs.append(processingFilter.getInputFromChannel(1))
+			return None
+		self.testFilterBasedModule.settings = Settings()
+		self.testFilterBasedModule.doOperation = doOperation
+		scripting.processingTimepoint = -1
+		self.testFilterBasedModule.getProcessedTimepoint(5, ["ch1"])
+		self.assertEqual(inputs, [("ch2", 5)])
+		self.assertEqual(scripting.processingTimepoint, -1)
+
 	def testAddInput(self):
 		"""
 		Description:
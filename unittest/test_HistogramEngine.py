@@ -0,0 +1,147 @@
+# TestCase for lib.HistogramEngine
+
+import math
+import random
+import unittest
+import vtk
+import lib.HistogramEngine
+
+def createImage(values, scalarType):
+	"""
+	An image of a single row with the given values
+	"""
+	image = vtk.vtkImageData()
+	image.SetDimensions(len(values), 1, 1)
+	image.SetScalarType(scalarType)
+	image.SetNumberOfScalarComponents(1)
+	image.AllocateScalars()
+	for i, value in enumerate(values):
+		image.SetScalarComponentFromDouble(i, 0, 0, 0, value)
+	return image
+
+def oldHistogram(image, x0, x1, maxrange = 0):
+	"""
+	The histogram as get_histogram read it from vtkImageAccumulate before
+	"""
+	accu = vtk.vtkImageAccumulate()
+	accu.SetInputConnection(image.GetProducerPort())
+	if maxrange:
+		accu.SetComponentExtent(0, x1 - x0, 0, 0, 0, 0)
+		accu.SetComponentSpacing(1, 0, 0)
+	else:
+		accu.SetComponentExtent(0, 255, 0, 0, 0, 0)
+		accu.SetComponentSpacing((x1 - x0 + 1) / 256.0, 0, 0)
+	accu.SetComponentOrigin(x0, 0, 0)
+	accu.Update()
+	data = accu.GetOutput()
+	x0, x1, y0, y1, z0, z1 = data.GetWholeExtent()
+	return [data.GetScalarComponentAsDouble(i, 0, 0, 0) for i in range(x0, x1 + 1)]
+
+def oldEqualizationLUT(histogram, maxval):
+	"""
+	The lookup table as equalize computed it before
+	"""
+	histlen = len(histogram)
+	def weightedValue(x):
+		if x < 2:
+			return x
+		return math.sqrt(x)
+	intsum = weightedValue(histogram[0])
+	for i in range(1, histlen):
+		intsum += 2 * weightedValue(histogram[i])
+	intsum += weightedValue(histogram[-1])
+	scale = maxval / float(intsum)
+	lut = [0] * (histlen + 1)
+	intsum = weightedValue(histogram[0])
+	for i in range(1, histlen):
+		delta = weightedValue(histogram[i])
+		intsum += delta
+		ceilValue = math.ceil(intsum * scale)
+		floorValue = math.floor(intsum * scale)
+		colorLookup = floorValue
+		if abs(ceilValue - intsum * scale) < abs(floorValue - intsum * scale):
+			colorLookup = ceilValue
+		lut[i] = colorLookup
+		intsum += delta
+	lut[-1] = maxval
+	return lut
+
+def oldLogScale(values, height):
+	"""
+	The logarithmic scaling histogram did before
+	"""
+	values = [math.log(max(x, 1)) for x in values]
+	scale = float(height) / max(values)
+	return [x * scale for x in values]
+
+class TestHistogramEngine(unittest.TestCase):
+
+	def setUp(self):
+		self.numpy = lib.HistogramEngine.numpy
+		self.random = random.Random(3)
+
+	def tearDown(self):
+		lib.HistogramEngine.numpy = self.numpy
+
+	def getEngines(self):
+		"""
+		Run a test with both the NumPy and the list implementation
+		"""
+		if self.numpy:
+			return [self.numpy, None]
+		return [None]
+
+	def checkHistogram(self, values, scalarType, x0, x1):
+		image = createImage(values, scalarType)
+		for engine in self.getEngines():
+			lib.HistogramEngine.numpy = engine
+			hist = lib.HistogramEngine.accumulate(image, x0, x1, bins = 256)
+			self.assertEquals(hist.toList(), oldHistogram(image, x0, x1))
+			self.assertEquals(hist.getTotal(), len(values))
+			hist = lib.HistogramEngine.accumulate(image, x0, x1, bins = 0)
+			self.assertEquals(hist.toList(), oldHistogram(image, x0, x1, maxrange = 1))
+
+	def testHistogram8Bit(self):
+		values = [self.random.randint(0, 255) for i in range(500)]
+		self.checkHistogram(values, vtk.VTK_UNSIGNED_CHAR, 0, 255)
+
+	def testHistogram16Bit(self):
+		values = [self.random.randint(0, 4095) for i in range(500)]
+		self.checkHistogram(values, vtk.VTK_UNSIGNED_SHORT, 0, 4095)
+
+	def testJointHistogram(self):
+		ch1 = [self.random.randint(0, 4095) for i in range(300)]
+		ch2 = [self.random.randint(0, 4095) for i in range(300)]
+		image1 = createImage(ch1, vtk.VTK_UNSIGNED_SHORT)
+		image2 = createImage(ch2, vtk.VTK_UNSIGNED_SHORT)
+		spacing = 4096 / 256.0
+		app = vtk.vtkImageAppendComponents()
+		app.AddInput(image1)
+		app.AddInput(image2)
+		acc = vtk.vtkImageAccumulate()
+		acc.SetComponentExtent(0, 255, 0, 255, 0, 0)
+		acc.SetComponentOrigin(0, 0, 0)
+		acc.SetComponentSpacing(spacing, spacing, 0)
+		acc.SetInputConnection(app.GetOutputPort())
+		acc.Update()
+		old = acc.GetOutput()
+		for engine in self.getEngines():
+			lib.HistogramEngine.numpy = engine
+			hist = lib.HistogramEngine.accumulateJoint(image1, image2, (0, 4095), (0, 4095), spacing, spacing)
+			counts = hist.toList()
+			for j in range(256):
+				for i in range(256):
+					self.assertEquals(counts[j][i], old.GetScalarComponentAsDouble(i, j, 0, 0))
+			self.assertEquals(hist.getTotal(), 300)
+
+	def testEqualizationAndScaling(self):
+		for bins in (256, 4096):
+			counts = [float(self.random.choice([0, 1, 2, 3, 50, 1000])) for i in range(bins)]
+			for engine in self.getEngines():
+				lib.HistogramEngine.numpy = engine
+				self.assertEquals(lib.HistogramEngine.equalizationLUT(counts, 255), oldEqualizationLUT(counts, 255))
+				for new, old in zip(lib.HistogramEngine.logScale(counts, 150), oldLogScale(counts, 150)):
+					self.assertAlmostEquals(new, old)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,24 @@
+# TestCase for lib.ImageConversion
+
+import unittest
+import lib.ImageConversion
+
+class TestImageConversion(unittest.TestCase):
+
+	def testMapToColors(self):
+		numpy = lib.ImageConversion.numpy
+		if not numpy:
+			return
+		table = numpy.array([[0, 0, 0], [10, 20, 30], [40, 50, 60]], numpy.uint8)
+		values = numpy.array([[0, 3, 4], [5, 6, 200]], numpy.uint8)
+		colors = lib.ImageConversion.mapToColors(values, table, 4.0)
+		self.assertEquals(colors.shape, (2, 3, 3))
+		self.assertEquals(colors[0].tolist(), [[0, 0, 0]] * 3)
+		self.assertEquals(colors[1].tolist(), [[10, 20, 30], [40, 50, 60], [40, 50, 60]])
+		floats = lib.ImageConversion.mapToColors(numpy.array([3.6, 4.8, -1.0]), table, 4.0)
+		self.assertEquals(floats.tolist(), [[0, 0, 0], [10, 20, 30], [0, 0, 0]])
+		signed = lib.ImageConversion.mapToColors(numpy.array([-5, 5], numpy.int16), table, 4.0)
+		self.assertEquals(signed.tolist(), [[0, 0, 0], [10, 20, 30]])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,54 @@
+# TestCase for lib.LRUCache
+
+import unittest
+import lib.LRUCache
+
+class LRUCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.removed = []
+		self.cache = lib.LRUCache.LRUCache(3, lambda key, item: self.removed.append(key))
+
+	def testLeastRecentlyUsedIsRemoved(self):
+		for key in ["a", "b", "c"]:
+			self.cache.add(key, key.upper())
+		self.assertEquals(self.cache.get("a"), "A")
+		self.cache.add("d", "D")
+		self.assertEquals(self.removed, ["b"])
+		self.assertEquals(self.cache.get("b"), None)
+		self.assertEquals(sorted(self.cache.keys()), ["a", "c", "d"])
+		self.assertEquals(self.cache.evictions, 1)
+
+	def testPeekDoesNotMarkAsUsed(self):
+		for key in ["a", "b", "c"]:
+			self.cache.add(key, key.upper())
+		self.assertEquals(self.cache.peek("a"), "A")
+		self.assertEquals(self.cache.peek("x", "X"), "X")
+		self.cache.add("d", "D")
+		self.assertEquals(self.removed, ["a"])
+
+	def testSizes(self):
+		self.cache.add("a", "A", 2)
+		self.cache.add("b", "B", 1)
+		self.cache.add("c", "C", 2)
+		self.assertEquals(self.removed, ["a"])
+		self.assertEquals(self.cache.totalSize, 3)
+		# An item larger than the limit is kept until the next one is added
+		self.cache.add("d", "D", 5)
+		self.assertTrue("d" in self.cache)
+		self.assertEquals(len(self.cache), 1)
+
+	def testReplace(self):
+		item = ["A"]
+		self.cache.add("a", item)
+		self.cache.add("a", item)
+		self.assertEquals(self.removed, [])
+		self.cache.add("a", ["other"])
+		self.assertEquals(self.removed, ["a"])
+		self.assertEquals(self.cache.totalSize, 1)
+		self.cache.clear()
+		self.assertEquals(self.removed, ["a", "a"])
+		self.assertEquals(self.cache.totalSize, 0)
+
+if __name__ == "__main__":
+	unittest.main()
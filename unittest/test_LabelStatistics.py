@@ -0,0 +1,90 @@
+# TestCase for lib.LabelStatistics
+
+import unittest
+import lib.LabelStatistics
+
+class Shape:
+	def __init__(self, geometry):
+		self.geometry = geometry
+
+	def getMaskGeometry(self):
+		return self.geometry
+
+class ImageData:
+	def __init__(self, components):
+		self.components = components
+
+	def GetWholeExtent(self):
+		return (0, 15, 0, 11, 0, 4)
+
+	def SetUpdateExtent(self, extent):
+		pass
+
+	def UpdateInformation(self):
+		pass
+
+	def Update(self):
+		pass
+
+	def GetNumberOfScalarComponents(self):
+		return self.components
+
+class DataUnit:
+	def __init__(self, components):
+		self.components = components
+
+	def getTimepoint(self, timepoint):
+		return ImageData(self.components)
+
+class TestLabelStatistics(unittest.TestCase):
+
+	def testStatistics(self):
+		numpy = lib.LabelStatistics.numpy
+		if not numpy:
+			return
+		volume = numpy.random.RandomState(7).randint(0, 4096, (5, 12, 16)).astype(numpy.uint16)
+		labels = numpy.zeros((12, 16), numpy.int32)
+		labels[1:4, 2:9] = 1
+		labels[6:11, 5:6] = 3
+		labels[0, 15] = 4
+		stats = lib.LabelStatistics.LabelIndex(labels).getStatistics(volume)
+		for label in (1, 3, 4):
+			values = volume[:, labels == label].astype(numpy.float64)
+			self.assertEquals(stats.getCount(label), values.size)
+			self.assertEquals(stats.getSum(label), values.sum())
+			self.assertEquals(stats.getMinimum(label), values.min())
+			self.assertEquals(stats.getMaximum(label), values.max())
+			self.assertAlmostEquals(stats.getMean(label), values.mean())
+			if values.size > 1:
+				self.assertAlmostEquals(stats.getSigma(label), values.std(ddof = 1), 6)
+		# Label 4 is a single pixel, but it has a voxel in each of the 5 slices,
+		# so its sigma is compared to NumPy above. The sigma of a label with
+		# fewer than two voxels is 0.
+		self.assertEquals(stats.getCount(2), 0)
+		self.assertEquals(stats.getSigma(2), 0.0)
+		stats = lib.LabelStatistics.LabelIndex(labels).getStatistics(volume[:1])
+		self.assertEquals(stats.getCount(4), 1)
+		self.assertEquals(stats.getSigma(4), 0.0)
+
+	def testOverlappingROIs(self):
+		if not lib.LabelStatistics.numpy:
+			return
+		rois = [Shape(("RECTANGLE", 0, 0, 6, 6)), Shape(("RECTANGLE", 8, 0, 10, 3)), \
+				Shape(("RECTANGLE", 4, 4, 9, 9))]
+		layers = lib.LabelStatistics.getROILabels(rois, 10, 10)
+		self.assertEquals([indices for labels, indices in layers], [[0, 1], [2]])
+		first, second = layers[0][0], layers[1][0]
+		self.assertEquals((first == 1).sum(), 36)
+		self.assertEquals((first == 2).sum(), 6)
+		self.assertEquals((second == 3).sum(), 25)
+
+	def testMultiComponentImage(self):
+		"""
+		The statistics of multi-component images are left to the VTK path
+		"""
+		self.assertEquals(lib.LabelStatistics.getVolume(ImageData(3)), None)
+		self.failIf(lib.LabelStatistics.hasSingleComponent(DataUnit(3)))
+		self.failUnless(lib.LabelStatistics.hasSingleComponent(DataUnit(1)))
+
+if __name__ == "__main__":
+	unittest.main()
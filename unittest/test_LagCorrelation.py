@@ -0,0 +1,54 @@
+# TestCase for lib.LagCorrelation
+
+import unittest
+import lib.LagCorrelation
+
+class TestLagCorrelation(unittest.TestCase):
+
+	def testCorrelations(self):
+		numpy = lib.LagCorrelation.numpy
+		if not numpy:
+			return
+		randomState = numpy.random.RandomState(3)
+		base = randomState.randint(0, 256, (4, 10, 12))
+		volumes = [(base + randomState.randint(0, 40 * (i + 1), base.shape)).astype(numpy.uint8) for i in range(7)]
+		sweep = lib.LagCorrelation.LagCorrelation(3, 2)
+		for tp, volume in enumerate(volumes):
+			sweep.add(tp, volume)
+		correlations = sweep.getCorrelations()
+		self.assertEquals(len(correlations), 6 + 5 + 4)
+		for tp1, tp2, correlation in correlations:
+			a = volumes[tp1][:, ::2, ::2].ravel().astype(numpy.float64)
+			b = volumes[tp2][:, ::2, ::2].ravel().astype(numpy.float64)
+			self.assertAlmostEquals(correlation, numpy.corrcoef(a, b)[0, 1])
+		self.assertEquals(sweep.sums[2], float(volumes[2][:, ::2, ::2].sum()))
+		curve = sweep.getCurve()
+		self.assertEquals([(lag, n) for lag, mean, n in curve], [(1, 6), (2, 5), (3, 4)])
+		lag1 = [correlation for tp1, tp2, correlation in correlations if tp2 - tp1 == 1]
+		self.assertAlmostEquals(curve[0][1], sum(lag1) / 6)
+
+	def testConstant(self):
+		numpy = lib.LagCorrelation.numpy
+		if not numpy:
+			return
+		sweep = lib.LagCorrelation.LagCorrelation(1)
+		sweep.add(0, numpy.ones((2, 3, 3), numpy.uint8))
+		sweep.add(1, numpy.arange(18).reshape(2, 3, 3))
+		self.assertEquals(sweep.getCorrelations(), [(0, 1, 0.0)])
+		self.assertRaises(ValueError, sweep.add, 2, numpy.ones((2, 2, 2)))
+
+	def testWindowSize(self):
+		numpy = lib.LagCorrelation.numpy
+		if not numpy:
+			return
+		# 3 timepoints of 2 x 10 x 10 voxels take 4800 bytes, and 1200 bytes
+		# with every other voxel
+		sweep = lib.LagCorrelation.LagCorrelation(3, 1, 1200)
+		sweep.add(0, numpy.ones((2, 10, 10)))
+		self.assertEquals(sweep.downsample, 2)
+		self.assertEquals(sweep.count, 50)
+		sweep = lib.LagCorrelation.LagCorrelation(3, 1, 40)
+		self.assertRaises(MemoryError, sweep.add, 0, numpy.ones((2, 10, 10)))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,97 @@
+# TestCase for Modules.Filters.ParticleSimulation
+
+import os.path
+import sys
+import unittest
+
+runningScriptPath = os.path.abspath(sys.argv[0])
+unittestPath = os.path.dirname(runningScriptPath)
+bioimagepath = os.path.abspath(os.path.join(unittestPath, ".."))
+
+# The filters are loaded by their basenames like Modules.DynamicLoader does
+sys.path.insert(0, os.path.join(bioimagepath, "Modules", "Filters"))
+
+import lib.ProcessPool
+import ParticleSimulation
+
+class ParticleSimulationTest(unittest.TestCase):
+
+	def setUp(self):
+		"""
+		Create a small simulation with a fixed seed
+		"""
+		self.simulation = ParticleSimulation.ParticleSimulationFilter()
+		for parameter, value in [("X", 48), ("Y", 40), ("Z", 14), ("Time", 4), ("Seed", 17), \
+								("NumberOfObjectsStart", 10), ("NumberOfObjectsEnd", 15), \
+								("ObjSizeStart", 5), ("ObjSizeEnd", 40), ("CreateNoise", True), \
+								("ShotNoiseAmount", 2), ("Clustering", False)]:
+			self.simulation.setParameter(parameter, value)
+		self.simulation.createTimeSeries()
+
+	def render(self, workers):
+		"""
+		Render all the timepoints of the simulation with the given number of
+		worker processes
+		"""
+		ParticleSimulation.renderContext["filter"] = self.simulation
+		try:
+			return list(lib.ProcessPool.imapOrdered(ParticleSimulation.renderTimepoint, range(4), workers, \
+													initializer = lib.ProcessPool.initializeWorker))
+		finally:
+			ParticleSimulation.renderContext.clear()
+
+	def testSerialAndParallelAreEqual(self):
+		"""
+		The same seed gives the same volumes and objects whether the
+		timepoints are rendered in one process or in several
+		"""
+		if not ParticleSimulation.numpy:
+			return
+		serial = self.render(1)
+		parallel = self.render(2)
+		self.assertEquals(len(serial), 4)
+		for (volume1, objects1), (volume2, objects2) in zip(serial, parallel):
+			self.assertEquals(volume1.tolist(), volume2.tolist())
+			self.assertTrue(objects1)
+			self.assertEquals(len(objects1), len(objects2))
+			for obj1, obj2 in zip(objects1, objects2):
+				self.assertEquals(obj1[:4], obj2[:4])
+				self.assertEquals(obj1[4].tolist(), obj2[4].tolist())
+
+	def testStampObject(self):
+		"""
+		A stamped object has the requested size, its voxels are distinct and
+		6-connected and they have intensities within 5% of the object's
+		"""
+		numpy = ParticleSimulation.numpy
+		if not numpy:
+			return
+		randomState = numpy.random.RandomState(3)
+		for x0, y0, z0, size in [(10, 10, 3, 30), (0, 0, 0, 3), (19, 15, 5, 1)]:
+			volume = numpy.zeros((6, 16, 20), numpy.uint8)
+			com, intensities, voxels = ParticleSimulation.stampObject(volume, x0, y0, z0, size, 200, randomState)
+			voxels = map(tuple, voxels.tolist())
+			self.assertEquals(len(voxels), size)
+			self.assertEquals(len(set(voxels)), size)
+			self.assertEquals(numpy.count_nonzero(volume), size)
+			self.assertTrue(intensities.min() >= 190 and intensities.max() <= 210)
+
+			reached = set([voxels[0]])
+			current = [voxels[0]]
+			while current:
+				x, y, z = current.pop()
+				for voxel in ((x-1,y,z), (x+1,y,z), (x,y-1,z), (x,y+1,z), (x,y,z-1), (x,y,z+1)):
+					if voxel in voxels and voxel not in reached:
+						reached.add(voxel)
+						current.append(voxel)
+			self.assertEquals(len(reached), size)
+
+	def testGrowObject(self):
+		"""
+		An object that fills the image stops growing
+		"""
+		added = ParticleSimulation.growObject([(0, 0, 0)], 10, (2, 2, 1), lambda n: 0)
+		self.assertEquals(sorted(added), [(0, 1, 0), (1, 0, 0), (1, 1, 0)])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,140 @@
+# TestCase for lib.ParticleTracker
+
+import copy
+import itertools
+import random
+import unittest
+import lib.Particle
+import lib.ParticleTracker
+
+def createParticles(timepoints = 8, count = 60, seed = 1):
+	"""
+	Create particles that drift across a volume, with some of them
+	disappearing and new ones appearing
+	"""
+	rand = random.Random(seed)
+	objects = [[rand.uniform(10, 200), rand.uniform(10, 200), rand.uniform(1, 20), \
+				rand.randint(20, 200), rand.uniform(50, 150)] for i in range(count)]
+	particles = []
+	for tp in range(timepoints):
+		current = []
+		for obj, (x, y, z, volume, intensity) in enumerate(objects):
+			if rand.random() < 0.05:
+				continue
+			particle = lib.Particle.Particle((x, y, z), (x, y, z), tp, volume, intensity, obj + 1)
+			particle.setVoxelSize([0.5, 0.5, 1.0])
+			current.append(particle)
+		particles.append(current)
+		for values in objects:
+			values[0] += rand.uniform(2, 8)
+			values[1] += rand.uniform(-3, 3)
+			values[2] += rand.uniform(-1, 1)
+			values[3] = max(1, int(values[3] * rand.uniform(0.8, 1.2)))
+			values[4] *= rand.uniform(0.8, 1.2)
+	return particles
+
+def configure(tracker, particles):
+	"""
+	Set the same parameters for a tracker
+	"""
+	tracker.particles = copy.deepcopy(particles)
+	tracker.setVoxelSize([0.5, 0.5, 1.0])
+	tracker.setMinSpeed(1)
+	tracker.setMaxSpeed(4)
+	tracker.setSpeedDeviation(0.3)
+	tracker.setSizeChange(0.5)
+	tracker.setIntensityChange(0.5)
+	tracker.setAngleChange(90)
+	tracker.setWeights(0.4, 0.2, 0.2, 0.2)
+
+def describe(tracks):
+	"""
+	Return the object numbers, timepoints and scores of the tracks
+	"""
+	return [[(particle.intval, particle.timePoint, round(particle.matchScore, 9)) for particle in track] \
+			for track in tracks]
+
+class ParticleTrackerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.particles = createParticles()
+
+	def testGridIndex(self):
+		if not lib.ParticleTracker.numpy:
+			return
+		numpy = lib.ParticleTracker.numpy
+		rand = numpy.random.RandomState(2)
+		points = rand.uniform(0, 50, (300, 3))
+		queries = rand.uniform(-5, 55, (40, 3))
+		index = lib.ParticleTracker.GridIndex(points, 6.0)
+		queryNums, pointNums, distances = index.queryPairs(queries)
+		found = sorted(zip(queryNums.tolist(), pointNums.tolist()))
+		expected = []
+		for i, query in enumerate(queries):
+			for j, point in enumerate(points):
+				if numpy.sqrt(((point - query) ** 2).sum()) <= 6.0:
+					expected.append((i, j))
+		self.assertEquals(found, expected)
+
+	def testSameTracksAsParticleTracker(self):
+		reference = lib.Particle.ParticleTracker()
+		configure(reference, self.particles)
+		reference.track()
+		tracker = lib.ParticleTracker.ParticleTracker()
+		configure(tracker, self.particles)
+		tracker.track()
+		self.assertEquals(describe(tracker.getTracks()), describe(reference.getTracks()))
+
+	def testSameTracksFromSeeds(self):
+		seeds = [2, 5, 11, 17, 30]
+		reference = lib.Particle.ParticleTracker()
+		configure(reference, self.particles)
+		reference.track(fromTimepoint = 1, seedParticles = seeds)
+		tracker = lib.ParticleTracker.ParticleTracker()
+		configure(tracker, self.particles)
+		tracker.track(fromTimepoint = 1, seedParticles = seeds)
+		self.assertEquals(describe(tracker.getTracks()), describe(reference.getTracks()))
+
+	def testMinimizeAssignment(self):
+		if not lib.ParticleTracker.numpy:
+			return
+		numpy = lib.ParticleTracker.numpy
+		rand = random.Random(3)
+		for nrows, ncolumns in [(1, 1), (3, 3), (3, 5), (5, 6)]:
+			matrix = numpy.array([[rand.randint(0, 20) for j in range(ncolumns)] for i in range(nrows)], dtype = float)
+			columns = lib.ParticleTracker.minimizeAssignment(matrix)
+			self.assertEquals(len(set(columns)), nrows)
+			best = min([sum([matrix[i, perm[i]] for i in range(nrows)]) \
+						for perm in itertools.permutations(range(ncolumns), nrows)])
+			self.assertEquals(sum([matrix[i, columns[i]] for i in range(nrows)]), best)
+
+	def testSolveAssignment(self):
+		if not lib.ParticleTracker.numpy:
+			return
+		# Rows 1 and 2 compete for column 10, row 3 is alone and too expensive
+		links = lib.ParticleTracker.solveAssignment([1, 1, 2, 3], [10, 11, 10, 12], [1.0, 2.0, 1.5, 5.0], 4.0)
+		self.assertEquals(sorted([(row, column) for row, column, cost in links]), [(1, 11), (2, 10)])
+
+	def testGlobalLinkingClosesGaps(self):
+		if not lib.ParticleTracker.numpy:
+			return
+		particles = createParticles(timepoints = 8, count = 40, seed = 4)
+		tracker = lib.ParticleTracker.ParticleTracker()
+		configure(tracker, particles)
+		tracker.setGlobalLinking(True)
+		tracker.setGapFrames(2)
+		tracker.track()
+		links = 0
+		for track in tracker.getTracks():
+			objects = [particle.intval for particle in track if particle.intval]
+			links += len(objects) - 1
+			# Every track follows a single object
+			self.assertEquals(len(set(objects)), 1)
+			# Placeholders fill the gaps, so the index is the timepoint
+			for tp, particle in enumerate(track):
+				self.assertEquals(particle.timePoint, tp)
+		detections = sum([len(current) for current in particles])
+		self.assert_(links > 0.9 * (detections - 40))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,93 @@
+# TestCase for lib.Prefetcher
+
+import unittest
+import lib.Prefetcher
+
+class Job:
+	"""
+	A job that is ready when done is set
+	"""
+	def __init__(self, value, done = 1):
+		self.value = value
+		self.done = done
+		self.cancelled = 0
+
+	def ready(self):
+		return self.done
+
+	def get(self):
+		return self.value
+
+	def cancel(self):
+		self.cancelled = 1
+
+class TestPrefetcher(unittest.TestCase):
+
+	def setUp(self):
+		self.jobs = {}
+		self.done = 1
+		self.scheduled = []
+
+	def fetch(self, timepoint):
+		self.jobs[timepoint] = Job("tp%d" % timepoint, self.done)
+		return self.jobs[timepoint]
+
+	def runSteps(self):
+		while self.scheduled:
+			self.scheduled.pop()()
+
+	def testWindow(self):
+		self.assertEquals(lib.Prefetcher.getWindow(5, 10, 2), [6, 4, 7, 3])
+		self.assertEquals(lib.Prefetcher.getWindow(0, 3, 2), [1, 2])
+
+	def testPrefetch(self):
+		prefetcher = lib.Prefetcher.Prefetcher(self.fetch, 1, 3)
+		prefetcher.setScheduler(self.scheduled.append)
+		prefetcher.setTimepoint(4, 10)
+		self.assertEquals(len(self.scheduled), 1)
+		# The first step starts the job and the next one collects its data
+		self.assertEquals(self.scheduled.pop()(), True)
+		self.assertTrue(prefetcher.isRunning())
+		self.assertEquals(self.scheduled.pop()(), True)
+		self.assertEquals(prefetcher.get(5), "tp5")
+		# Moving on cancels the previous timepoint that was not fetched yet
+		prefetcher.setTimepoint(5, 10)
+		self.assertEquals(prefetcher.pending, [6, 4])
+		prefetcher.setTimepoint(7, 10)
+		self.runSteps()
+		self.assertEquals(sorted(self.jobs.keys()), [5, 6, 8])
+		self.assertEquals(sorted(prefetcher.cache.keys()), [5, 6, 8])
+		prefetcher.setTimepoint(9, 10)
+		self.assertEquals(self.scheduled, [])
+		# The timepoints farthest from the shown one are dropped from the cache
+		prefetcher.setTimepoint(1, 10)
+		self.runSteps()
+		self.assertEquals(sorted(prefetcher.cache.keys()), [0, 2, 5])
+		prefetcher.clear()
+		self.assertEquals(prefetcher.get(0), None)
+
+	def testRunningJobIsCancelled(self):
+		self.done = 0
+		prefetcher = lib.Prefetcher.Prefetcher(self.fetch, 1, 3)
+		prefetcher.setScheduler(self.scheduled.append)
+		prefetcher.setTimepoint(4, 10)
+		self.scheduled.pop()()
+		self.assertEquals(self.scheduled.pop()(), True)
+		# The job of timepoint 5 is cancelled when it leaves the window
+		prefetcher.setTimepoint(5, 10)
+		self.assertTrue(self.jobs[5].cancelled)
+		self.assertFalse(prefetcher.isRunning())
+		self.scheduled.pop()()
+		# The job of timepoint 6 goes on, because 6 is still near the shown one
+		prefetcher.setTimepoint(7, 10)
+		self.assertEquals(prefetcher.pending, [8])
+		self.assertFalse(self.jobs[6].cancelled)
+		self.jobs[6].done = 1
+		self.scheduled.pop()()
+		self.assertEquals(prefetcher.get(6), "tp6")
+		self.scheduled.pop()()
+		prefetcher.clear()
+		self.assertTrue(self.jobs[8].cancelled)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,26 @@
+# TestCase for lib.ProcessPool
+
+import time
+import unittest
+import lib.ProcessPool
+
+class ApplyAsyncTest(unittest.TestCase):
+
+	def testResult(self):
+		job = lib.ProcessPool.applyAsync(pow, (2, 10))
+		if not job:
+			return
+		while not job.ready():
+			time.sleep(0.01)
+		self.assertEquals(job.get(), 1024)
+		self.assertEquals(job.pool, None)
+
+	def testCancel(self):
+		job = lib.ProcessPool.applyAsync(time.sleep, (60,))
+		if not job:
+			return
+		job.cancel()
+		self.assertFalse(job.ready())
+
+if __name__ == "__main__":
+	unittest.main()
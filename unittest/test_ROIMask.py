@@ -0,0 +1,105 @@
+# TestCase for lib.ROIMask
+
+import math
+import unittest
+import lib.ROIMask
+
+def coveredEllipse(w, h, cx, cy):
+	"""
+	The points of an ellipse as MyCircle.getCoveredPoints finds them
+	"""
+	a = max(w, h) / 2
+	b = min(w, h) / 2
+	c = math.sqrt(a ** 2 - b ** 2)
+	if w > h:
+		f1, f2 = (cx - c, cy), (cx + c, cy)
+	else:
+		f1, f2 = (cx, cy - c), (cx, cy + c)
+	def d(x, y):
+		return math.sqrt((x[0] - y[0]) ** 2 + ((x[1] - y[1]) ** 2))
+	pts = {}
+	for x in range(int(cx - w // 2), int(cx + w // 2)):
+		for y in range(int(cy - h // 2), int(cy + h // 2)):
+			if (d((x, y), f1) + d((x, y), f2)) < a * 2:
+				pts[(x, y)] = 1
+	return pts
+
+def coveredPolygon(poly, x0, y0, x1, y1):
+	"""
+	The points of a polygon by the even-odd rule of MyPolygon.collidepoint
+	"""
+	pts = {}
+	for x in range(x0, x1):
+		for y in range(y0, y1):
+			c = 0
+			for i in range(len(poly)):
+				(xi, yi), (xj, yj) = poly[i], poly[(i + 1) % len(poly)]
+				if ((yi <= y < yj) or (yj <= y < yi)) and x < (xj - xi) * (y - yi) / float(yj - yi) + xi:
+					c = not c
+			if c:
+				pts[(x, y)] = 1
+	return pts
+
+class Shape:
+	def __init__(self, geometry, points = None):
+		self.geometry = geometry
+		self.points = points
+
+	def getMaskGeometry(self):
+		return self.geometry
+
+	def getCoveredPoints(self):
+		return self.points
+
+class TestROIMask(unittest.TestCase):
+
+	def assertMaskEquals(self, mask, points):
+		my, mx = mask.shape
+		inside = [(x, y) for (x, y) in points if 0 <= x < mx and 0 <= y < my]
+		ys, xs = mask.nonzero()
+		self.assertEquals(sorted(zip(xs.tolist(), ys.tolist())), sorted(inside))
+
+	def testRectangle(self):
+		if not lib.ROIMask.numpy:
+			return
+		mask = lib.ROIMask.rasterize(("RECTANGLE", -3, 5, 12, 9), 10, 20)
+		points = [(x, y) for x in range(-3, 12) for y in range(5, 9)]
+		self.assertMaskEquals(mask, points)
+
+	def testEllipse(self):
+		if not lib.ROIMask.numpy:
+			return
+		for w, h, cx, cy in [(30, 12, 20, 15), (9, 25, 5, 10), (17, 17, 16, 16), (31.0, 20.0, 28.5, 3.0)]:
+			mask = lib.ROIMask.rasterize(("ELLIPSE", w, h, cx, cy), 40, 30)
+			self.assertMaskEquals(mask, coveredEllipse(w, h, cx, cy))
+
+	def testPolygon(self):
+		if not lib.ROIMask.numpy:
+			return
+		# A concave polygon with a horizontal edge and a vertex on a row
+		poly = ((2, 2), (30, 4.5), (18, 12), (30, 25), (2, 25), (10, 12))
+		mask = lib.ROIMask.rasterize(("POLYGON", poly, 2, 2, 30, 25), 32, 24)
+		self.assertMaskEquals(mask, coveredPolygon(poly, 2, 2, 30, 25))
+
+	def testCacheAndPoints(self):
+		if not lib.ROIMask.numpy:
+			return
+		shape = Shape(("RECTANGLE", 1, 1, 4, 4))
+		mask = lib.ROIMask.getShapeMask(shape, 8, 8)
+		self.assert_(lib.ROIMask.getShapeMask(shape, 8, 8) is mask)
+		self.assertRaises(ValueError, mask.__setitem__, (0, 0), True)
+		points = {(0, 0): 1, (7, 3): 1, (9, 9): 1}
+		self.assertMaskEquals(lib.ROIMask.getShapeMask(Shape(None, points), 8, 8), points)
+
+	def testMaskVolume(self):
+		numpy = lib.ROIMask.numpy
+		if not numpy:
+			return
+		mask = lib.ROIMask.rasterize(("RECTANGLE", 2, 1, 5, 3), 6, 4)
+		voxels = numpy.arange(3 * 4 * 6 * 2).reshape(3, 4, 6, 2)
+		expected = voxels * mask[numpy.newaxis, :, :, numpy.newaxis]
+		lib.ROIMask.maskVolume(voxels, mask)
+		self.assert_((voxels == expected).all())
+
+if __name__ == "__main__":
+	unittest.main()
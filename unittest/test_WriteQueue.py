@@ -0,0 +1,41 @@
+import unittest
+import threading
+from lib.DataSource.WriteQueue import WriteQueue
+
+class TestWriteQueue(unittest.TestCase):
+
+	def testWritesInOrder(self):
+		written = []
+		queue = WriteQueue(2)
+		for i in range(10):
+			queue.put(written.append, i)
+		queue.flush()
+		self.assertEquals(written, range(10))
+
+	def testBackpressure(self):
+		release = threading.Event()
+		queue = WriteQueue(1)
+		queue.put(release.wait)
+		queue.put(lambda: None)
+		# The writer thread is blocked and the queue is full, so a third
+		# write has to wait until the first one finishes
+		blocked = threading.Thread(target = queue.put, args = (lambda: None,))
+		blocked.start()
+		blocked.join(0.2)
+		self.assert_(blocked.isAlive())
+		release.set()
+		blocked.join()
+		queue.flush()
+		self.assertEquals(queue.getNumberOfPendingWrites(), 0)
+
+	def testErrorIsRaisedOnFlush(self):
+		def fail():
+			raise IOError("disk full")
+		written = []
+		queue = WriteQueue(2)
+		queue.put(fail)
+		queue.put(written.append, 1)
+		self.assertRaises(IOError, queue.flush)
+		self.assertEquals(written, [1])
+		# The error is only reported once
+		queue.flush()
@@ -2,7 +2,9 @@
 
 import math
 import os.path
+import shutil
 import sys
+import tempfile
 import unittest
 
 runningScriptPath = sys.argv[0]
@@ -268,6 +270,105 @@ class TrackReaderTest(unittest.TestCase):
 		"""
 		self.assertEqual(bool(self.testTrackReader.tracks), True)
 
+class TrackTableTest(unittest.TestCase):
+
+	def setUp(self):
+		"""
+		Create random tracks with gaps
+		"""
+		self.numpy = lib.Track.numpy
+		if not self.numpy:
+			return
+		randomState = self.numpy.random.RandomState(2)
+		self.tracks = []
+		for i in range(6):
+			track = lib.Track.Track()
+			for tp in range(i % 3, 12 - i):
+				if tp != 7 or i != 2:
+					track.addTrackPoint(tp, tp + 1, tuple(randomState.uniform(0, 50, 3)))
+			if i == 4:
+				track.fronts = dict([(tp, (1.0 * tp, 2.0, 3.0)) for tp in track.points.keys()])
+			track.setVoxelSize([0.5, 0.5, 2.0])
+			track.setTimeStamps([1.5 * tp for tp in range(12)])
+			self.tracks.append(track)
+		self.table = lib.Track.TrackTable.fromTracks(self.tracks)
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		if self.numpy:
+			shutil.rmtree(self.directory)
+
+	def testStatistics(self):
+		"""
+		Test that the statistics of the table are those of the tracks
+		"""
+		if not self.numpy:
+			return
+		statistics = self.table.getStatistics()
+		for i, track in enumerate(self.tracks):
+			self.assertAlmostEqual(statistics["Length"][i], track.getLength())
+			self.assertAlmostEqual(statistics["Speed"][i], track.getSpeed())
+			self.assertAlmostEqual(statistics["DirectionalPersistence"][i], track.getDirectionalPersistence())
+			self.assertAlmostEqual(statistics["FrontSpeed"][i], track.getFrontSpeed())
+			for value, expected in zip(statistics["Angle"][i], track.getAverageAngle()):
+				self.assertAlmostEqual(value, expected)
+
+	def testMeanSquareDisplacements(self):
+		"""
+		Test the mean square displacements against the definition
+		"""
+		if not self.numpy:
+			return
+		displacements, pooled = self.table.getMeanSquareDisplacements(3)
+		track = self.tracks[2]
+		squares = []
+		for tp in track.points.keys():
+			if tp + 2 in track.points:
+				squares.append(track.distance(tp, tp + 2, track.points) ** 2)
+		self.assertAlmostEqual(displacements[2, 1], sum(squares) / len(squares))
+		self.assertEqual(displacements.shape, (6, 3))
+
+	def testFiles(self):
+		"""
+		Test writing and reading the track files
+		"""
+		if not self.numpy:
+			return
+		filename = os.path.join(self.directory, "tracks.csv")
+		self.table.writeCSV(filename)
+		table = lib.Track.TrackTable.readCSV(filename)
+		self.assertEqual(len(table), 6)
+		self.assertTrue((table.positions == self.table.positions).all())
+		filename = os.path.join(self.directory, "tracks.bin")
+		self.table.writeBinary(filename)
+		table = lib.Track.TrackTable.readBinary(filename)
+		self.assertEqual(table.timeStamps, self.table.timeStamps)
+		self.assertTrue((table.getSpeeds() == self.table.getSpeeds()).all())
+		tracks = table.select(table.getNumberOfPoints() >= 9).getTracks()
+		self.assertEqual([len(track) for track in tracks], [12, 10, 9])
+
+	def testOutmostPoints(self):
+		"""
+		Test the functions getSurfaces() and locateOutmostPoints(). The
+		outmost point of an object is found along the given direction, and it
+		is NaN for a zero direction or a missing label.
+		"""
+		numpy = lib.Track.numpy
+		if not numpy:
+			return
+		labels = numpy.zeros((6, 10, 12), numpy.uint16)
+		labels[1:5, 2:6, 3:9] = 1
+		labels[2:4, 7:9, 1:3] = 2
+		surfaces = lib.Track.getSurfaces(labels)
+		self.assertEqual(list(numpy.bincount(surfaces[0])), [0, 4 * 4 * 6 - 2 * 2 * 4, 8])
+		centers = [(5.5, 3.5, 2.5), (5.5, 3.5, 2.5), (1.5, 7.5, 2.5), (1.5, 7.5, 2.5), (0, 0, 0)]
+		directions = [(1, 0, 0), (0, -2, 0), (0, 0, 1), (0, 0, 0), (1, 0, 0)]
+		points = lib.Track.locateOutmostPoints(surfaces, [1, 1, 2, 2, 3], centers, directions, 0.5)
+		self.assertEqual(list(points[0]), [8.0, 3.5, 2.5])
+		self.assertEqual(list(points[1]), [5.5, 2.0, 2.5])
+		self.assertEqual(list(points[2]), [1.5, 7.5, 3.0])
+		self.assertTrue(numpy.isnan(points[3:]).all())
+
 #run
 if __name__ == "__main__":
 	unittest.main()